@@ -64,9 +64,9 @@ class SqliteSessionStore:
                     )
                 ''')
 
-    def purge_expired(self):
+    def purge_expired(self) -> int:
         with sqlite3.connect(self.db_path, timeout=5.0) as conn:
-            conn.execute("DELETE FROM sessions WHERE json_extract(data, '$.expires_at') < ?", (time.time(),))
+            return conn.execute("DELETE FROM sessions WHERE json_extract(data, '$.expires_at') < ?", (time.time(),)).rowcount
     
     def __setitem__(self, key, value):
         with sqlite3.connect(self.db_path, timeout=5.0) as conn:
@@ -103,12 +103,10 @@ def login_page(request: Request):
 def login_submit(request: Request, username: str = Form(...), password: str = Form(...)):
     if username in USERS and USERS[username]["password"] == password:
         session_id = secrets.token_hex(16)
-        
-        # OOM Memory Fix: Reaper to remove expired sessions natively via SQLite
         now = time.time()
-        SESSIONS.purge_expired()
-            
-        # 7-day expiry
+
+        # 7-day expiry. OOM Memory Fix: expired sessions are reaped by the
+        # maintenance scheduler (purge_sessions job), not on every login
         SESSIONS[session_id] = {
             "username": username, 
             "role": USERS[username]["role"],
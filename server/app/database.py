@@ -1,15 +1,77 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
 # Phase 9 Fix: Use absolute path for database file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'SpatikaHealth.db')}"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "SPATIKA_DB_URL", f"sqlite:///{os.path.join(BASE_DIR, 'SpatikaHealth.db')}"
 )
+
+# ── SQLite profile ────────────────────────────────────────────────────────────
+# "wal"    : WAL journal so dashboard reads / CSV exports never block the ingest
+#            writer (and vice versa), plus the pragmas below on every connection.
+# "legacy" : SQLite defaults (rollback journal) — what we ran before.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+
+SQLITE_PRAGMAS = {
+    # Only takes effect on a new, empty file; lets the maintenance job hand
+    # pages freed by retention back to the filesystem (services/maintenance.py)
+    "auto_vacuum":  os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # NORMAL is durable across app crashes in WAL mode; only an OS crash /
+    # power cut can lose the last few commits
+    "synchronous":  os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "cache_size":   -int(os.getenv("SQLITE_CACHE_KB", "65536")),             # negative = KiB
+    "mmap_size":    int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024,
+    "temp_store":   "MEMORY",
+}
+
+WRITE_POOL_SIZE = int(os.getenv("SQLITE_WRITE_POOL", "8"))
+READ_POOL_SIZE  = int(os.getenv("SQLITE_READ_POOL", "4"))
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL, read_only: bool = False,
+                profile: str = None, pool_size: int = None):
+    """
+    SQLite engine with the configured profile applied to every new connection.
+    read_only engines also set PRAGMA query_only, so a page handler can never
+    take the write lock by accident.
+    """
+    profile = profile or SQLITE_PROFILE
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+    if pool_size is None:
+        pool_size = READ_POOL_SIZE if read_only else WRITE_POOL_SIZE
+    connect_args = {"check_same_thread": False}
+    if profile == "wal":
+        connect_args["timeout"] = BUSY_TIMEOUT_MS / 1000
+    engine = create_engine(url, connect_args=connect_args,
+                           pool_size=pool_size, max_overflow=pool_size)
+
+    if profile == "wal":
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+    return engine
+
+
+# Writes (ingest, commands, OTA admin, startup jobs, scripts)
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only pages and exports: own pool, so a slow export never holds a
+# connection the writers need
+read_engine = make_engine(read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
@@ -3,44 +3,117 @@ from fastapi.responses import RedirectResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.database import engine
 from app.models import Base
-from app.routers import health, dashboard, ota, commands, summary, demo
+from app.routers import health, dashboard, ota, commands, summary, demo, builds
 from app.auth import router as auth_router, SESSIONS
-import aiofiles
+import os
 
 # Ensure all DB tables exist at startup
 Base.metadata.create_all(bind=engine)
 
+# Versioned schema steps (services/migrations.py): column adds run here,
+# table rebuilds continue online as the leader's "migrations" job
+from app.services.migrations import apply_light, migration_runner, MIGRATE_ONLINE, MIGRATE_INTERVAL_S
+apply_light(engine)
+
+from app.services.eval_store import rescorer, RESCORE_INTERVAL_S
+
 
 app = FastAPI(title="Spatika Health API v3.0")
 
-# Phase 8/9 Fix: Stop command_queue from growing infinitely over years of operation
-from sqlalchemy import text
+# Periodic housekeeping (services/maintenance.py). Leader jobs run on one
+# worker at a time; "worker" jobs warm each process's own caches.
 from app.database import SessionLocal
+from app.services import retention
+from app.services.retention import retention_job
+from app.services.maintenance import scheduler, in_session, analyze, incremental_vacuum, MAINTENANCE
+from app.services.ota_cache import warm as warm_ota_cache
+from app.services import delta_ota, ota_rollout, build_store, indexes
+from app.services.ota_telemetry import download_stats, FLUSH_S as DOWNLOAD_FLUSH_S
+from functools import partial
+
+# Phase 8/9 Fix: Stop command_queue from growing infinitely over years of operation
+scheduler.add("prune_commands", retention.PRUNE_INTERVAL_H * 3600, in_session(SessionLocal, retention.prune_commands))
+scheduler.add("purge_sessions", float(os.getenv("SESSION_PURGE_INTERVAL_S", "900")), SESSIONS.purge_expired)
+if retention.RAW_DAYS > 0:
+    scheduler.add("retention", retention.INTERVAL_H * 3600, partial(retention_job.run_pass, SessionLocal))
+scheduler.add("analyze", float(os.getenv("ANALYZE_INTERVAL_H", "24")) * 3600, partial(analyze, engine))
+# Existing DBs: composite indexes declared after their tables were created
+scheduler.add("build_indexes", indexes.INTERVAL_H * 3600, partial(indexes.ensure_indexes, engine))
+if MIGRATE_ONLINE:
+    # Stops between chunks once this worker loses the lease; the next leader resumes
+    scheduler.add("migrations", MIGRATE_INTERVAL_S,
+                  partial(migration_runner.run_pass, engine, should_stop=lambda: not scheduler.is_leader))
+# Stored verdicts up to the current health_eval.RULES_VERSION, from the saved cursor
+scheduler.add("rescore", RESCORE_INTERVAL_S,
+              partial(rescorer.run_pass, SessionLocal, should_stop=lambda: not scheduler.is_leader))
+scheduler.add("incremental_vacuum", float(os.getenv("VACUUM_INTERVAL_H", "6")) * 3600, partial(incremental_vacuum, engine))
+scheduler.add("warm_column_cache", float(os.getenv("WARM_INTERVAL_S", "300")), health.warm_column_cache, scope="worker")
+scheduler.add("warm_ota_cache", float(os.getenv("OTA_CACHE_WARM_S", "60")), warm_ota_cache, scope="worker")
+scheduler.add("build_store", build_store.INTERVAL_H * 3600, in_session(SessionLocal, build_store.adopt))
+scheduler.add("delta_patches", float(os.getenv("DELTA_INTERVAL_H", "1")) * 3600, in_session(SessionLocal, delta_ota.refresh))
+scheduler.add("ota_rollout", ota_rollout.TICK_S, in_session(SessionLocal, ota_rollout.tick))
+scheduler.add("ota_telemetry", DOWNLOAD_FLUSH_S, in_session(SessionLocal, download_stats.flush), scope="worker")
+
+@app.on_event("startup")
+async def start_maintenance():
+    if MAINTENANCE:
+        scheduler.start(engine)
+
+@app.on_event("shutdown")
+async def stop_maintenance():
+    # A rebuild in flight saves its cursor before the lease goes to another worker
+    await migration_runner.stop()
+    # Releases the lease so another worker can take over right away
+    await scheduler.stop()
+    # This worker's buffered /builds requests (services/ota_telemetry.py)
+    try:
+        in_session(SessionLocal, download_stats.flush)()
+    except Exception as e:
+        print(f"[Telemetry] Shutdown flush failed: {e}")
+
+from app.services.station_latest import ensure_backfilled
 
 @app.on_event("startup")
-async def prune_old_commands():
+async def backfill_station_latest():
+    # First boot after upgrade: station_latest exists (create_all) but is empty
     db = SessionLocal()
     try:
-        db.execute(text("DELETE FROM command_queue WHERE created_at < datetime('now', '-30 days')"))
-        db.commit()
+        ensure_backfilled(db)
     except Exception as e:
-        print(f"Startup Command Queue Prune Error: {e}")
+        print(f"Startup station_latest Backfill Error: {e}")
     finally:
         db.close()
 
+from app.services.ingest_queue import ingest_queue, WRITE_BEHIND
+
+@app.on_event("startup")
+async def start_ingest_writer():
+    if WRITE_BEHIND:
+        await ingest_queue.start()
+
+@app.on_event("shutdown")
+async def drain_ingest_writer():
+    # Flush every queued health report before the worker exits
+    await ingest_queue.stop()
+
 class AuthMiddleware(BaseHTTPMiddleware):
+    async def __call__(self, scope, receive, send):
+        # Skip auth for builds (so ESP32 can download binaries). Bypassed at the
+        # ASGI level: no BaseHTTPMiddleware stream between FirmwareResponse and
+        # the server, so zero-copy / pathsend messages reach it untouched
+        if scope["type"] == "http" and scope["path"].startswith("/builds"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
     async def dispatch(self, request: Request, call_next):
         # 1. Skip auth for APIs: /health, /trg_gprs, /tws_gprs (if handled differently)
         # But wait, these API routes are usually just public without auth for the IoT devices.
         # We need to protect UI routes: /, /dashboard, /station, /cmd, /ota, /delete
         
         # Determine if path is protected UI route
-        protected_prefixes = ("/dashboard", "/station", "/cmd", "/ota", "/delete", "/clear-queue", "/clear-ota-queue", "/toggle-ota-lock", "/summary", "/csv")
+        protected_prefixes = ("/dashboard", "/station", "/cmd", "/ota", "/delete", "/clear-queue", "/clear-ota-queue", "/toggle-ota-lock", "/summary", "/csv", "/metrics", "/export", "/maintenance")
         
-        # Skip auth for builds (so ESP32 can download binaries)
-        if request.url.path.startswith("/builds"):
-            return await call_next(request)
-
         # Is the requested URL one of the protected ones?
         is_protected = any(request.url.path.startswith(p) for p in protected_prefixes)
         
@@ -86,100 +159,9 @@ app.include_router(commands.router)
 app.include_router(summary.router)
 app.include_router(demo.router)
 
-# Serve the firmware builds directory via a Range-aware endpoint instead of StaticFiles
-import os
-import mimetypes
-from fastapi.responses import Response, StreamingResponse
-
-os.makedirs("/app/builds", exist_ok=True)
-
-@app.api_route("/builds/{filename}", methods=["GET", "HEAD"])
-async def serve_firmware(filename: str, request: Request):
-    """Range-aware firmware file server for ESP32 OTA downloads."""
-    # Security: only serve .bin files, no path traversal
-    if not filename.endswith(".bin") or "/" in filename or ".." in filename:
-        from fastapi import Response
-        return Response(status_code=403)
-
-    filepath = os.path.realpath(os.path.join(BUILDS_DIR, filename))
-    if not filepath.startswith(os.path.realpath(BUILDS_DIR)):
-        from fastapi import Response
-        return Response(status_code=403)
-    if not os.path.exists(filepath):
-        from fastapi import Response
-        return Response(status_code=404)
-
-    file_size = os.path.getsize(filepath)
-    if request.method == "HEAD":
-        from fastapi import Response
-        return Response(
-            status_code=200,
-            headers={
-                "Content-Length": str(file_size),
-                "Accept-Ranges": "bytes",
-                "Content-Type": "application/octet-stream",
-            }
-        )
-
-    range_header = request.headers.get("Range")
-
-    if range_header:
-        # Parse "bytes=start-end"
-        try:
-            range_val = range_header.replace("bytes=", "")
-            start_str, end_str = range_val.split("-")
-            start = int(start_str)
-            end = int(end_str) if end_str else file_size - 1
-        except Exception:
-            return Response(status_code=400)
-
-        end = min(end, file_size - 1)
-        chunk_size = end - start + 1
-
-        async def iter_file():
-            async with aiofiles.open(filepath, "rb") as f:
-                await f.seek(start)
-                remaining = chunk_size
-                while remaining > 0:
-                    import asyncio
-                    # Phase 7 Fix: Maximize 2G band delivery. Expanded to 32KB bursts.
-                    data = await f.read(min(32768, remaining)) 
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-                    # Phase 7 Fix: Removed artificial 500ms 4KB/s server throttle to save battery!
-
-        return StreamingResponse(
-            iter_file(),
-            status_code=206,
-            headers={
-                "Content-Range": f"bytes {start}-{end}/{file_size}",
-                "Content-Length": str(chunk_size),
-                "Accept-Ranges": "bytes",
-                "Content-Type": "application/octet-stream",
-            }
-        )
-    else:
-        # Full file request (e.g. for size check via HEAD/GET)
-        async def iter_full():
-            async with aiofiles.open(filepath, "rb") as f:
-                while True:
-                    import asyncio
-                    data = await f.read(32768)
-                    if not data:
-                        break
-                    yield data
-
-        return StreamingResponse(
-            iter_full(),
-            status_code=200,
-            headers={
-                "Content-Length": str(file_size),
-                "Accept-Ranges": "bytes",
-                "Content-Type": "application/octet-stream",
-            }
-        )
+# Firmware builds for ESP32 OTA: Range-aware, served from shared in-memory
+# images (routers/builds.py, services/firmware_store.py)
+app.include_router(builds.router)
 
 
 @app.get("/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, func
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, Text, UniqueConstraint, func, text
 from .database import Base
 
 
@@ -11,6 +11,7 @@ class FirmwareRegistry(Base):
     system_mode  = Column(Integer)
     current_ver  = Column(String(16), default="5.77")
     filename     = Column(String(128), default="firmware.bin")
+    sha256       = Column(String(64), nullable=True)     # object the filename points at (services/build_store.py)
     total_target = Column(Integer, default=0)
     updated_at   = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -18,7 +19,7 @@ class FirmwareRegistry(Base):
 class HealthReport(Base):
     __tablename__ = "health_reports"
     id               = Column(Integer, primary_key=True, index=True)
-    stn_id           = Column(String, index=True)
+    stn_id           = Column(String)           # indexed via ix_health_reports_stn_reported
     unit_type        = Column(String)
     system           = Column(Integer, default=-1)
     health_sts       = Column(String)
@@ -65,19 +66,200 @@ class HealthReport(Base):
     mutex_fail       = Column(Integer, default=0) # v5.55
     last_cmd_id      = Column(Integer, default=0) # v7.92
     last_cmd_res     = Column(String, default="N/A") # v7.92
+    # Server verdict computed once at ingest (services/health_eval.stored_fields)
+    eval_verdict     = Column(String)
+    eval_score       = Column(Integer)
+    eval_reasons     = Column(String)    # JSON list
+    eval_rev         = Column(Integer)   # health_eval.RULES_VERSION it was scored under
     reported_at      = Column(DateTime, server_default=func.now())
+    # Query shapes these serve: services/indexes.py (built online on existing DBs)
+    __table_args__ = (
+        # DESC matches the newest-first history pages and exports
+        Index("ix_health_reports_stn_reported", "stn_id", reported_at.desc()),
+        Index("ix_health_reports_reported_at", "reported_at"),
+    )
+
+
+class HealthDaily(Base):
+    """
+    One row per station per UTC day for reports older than the raw retention
+    window (services/retention.py): the day's last report, column for column
+    under the health_reports names, plus battery / signal aggregates.
+    """
+    __tablename__ = "health_daily"
+    stn_id      = Column(String, primary_key=True)
+    day         = Column(Date, primary_key=True)
+    reports     = Column(Integer, default=0)    # raw reports folded into this row
+    first_at    = Column(DateTime)
+    report_id   = Column(Integer)               # id the day's last report had in health_reports
+    bat_v_min   = Column(Float)
+    bat_v_max   = Column(Float)
+    bat_v_mean  = Column(Float)
+    signal_min  = Column(Integer)
+    signal_max  = Column(Integer)
+    signal_mean = Column(Float)
+
+    is_rollup = True    # templates: no per-record delete / select
+
+
+# The day's last report — every health_reports column except its own id / stn_id
+for _col in HealthReport.__table__.columns:
+    if _col.name not in ("id", "stn_id"):
+        setattr(HealthDaily, _col.name, Column(_col.type))
+Index("ix_health_daily_stn_reported", HealthDaily.stn_id, HealthDaily.reported_at.desc())
+
+
+class StationLatest(Base):
+    """One row per station pointing at its newest health_reports row (upserted at ingest)."""
+    __tablename__ = "station_latest"
+    stn_id      = Column(String, primary_key=True)
+    report_id   = Column(Integer, index=True)
+    reported_at = Column(DateTime)
+
+
+class StationGps(Base):
+    """Last known good GPS fix per station, parsed to numbers (upserted at ingest)."""
+    __tablename__ = "station_gps"
+    stn_id       = Column(String, primary_key=True)
+    lat          = Column(Float)
+    lon          = Column(Float)
+    fix_at       = Column(DateTime)   # reported_at of the report that carried the fix
+    requested_at = Column(DateTime)   # last auto GET_GPS sent to the station
+    __table_args__ = (Index("ix_station_gps_lat_lon", "lat", "lon"),)
 
 
 class CommandQueue(Base):
     __tablename__ = "command_queue"
     id          = Column(Integer, primary_key=True, index=True)
-    stn_id      = Column(String, index=True)
+    stn_id      = Column(String)                # indexed via the composites below
     cmd         = Column(String)
     cmd_param   = Column(String, default="")
     created_at  = Column(DateTime, server_default=func.now())
     executed_at = Column(DateTime, nullable=True) # Sent to device
     result      = Column(String, default="SENT")
     completed_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_command_queue_stn_pending", "stn_id", "executed_at"),
+        Index("ix_command_queue_stn_cmd_created", "stn_id", "cmd", "created_at"),
+        Index("ix_command_queue_stn_unacked", "stn_id", "result", "completed_at", "executed_at"),
+        # Partial: only unsent commands, so it stays tiny as the queue grows
+        Index("ix_command_queue_pending", "id", sqlite_where=text("executed_at IS NULL")),
+    )
+
+
+class SchemaMigration(Base):
+    """One row per versioned schema step (services/migrations.py)."""
+    __tablename__ = "schema_migrations"
+    version     = Column(Integer, primary_key=True)
+    name        = Column(String(128))
+    state       = Column(String(16), default="running")   # running | done
+    cursor_id   = Column(Integer, default=0)    # table rebuilds: last id copied
+    target_id   = Column(Integer, default=0)    # table rebuilds: max id when the copy began
+    rows_done   = Column(Integer, default=0)
+    detail      = Column(String)                # JSON scratch state for resuming
+    started_at  = Column(DateTime, server_default=func.now())
+    applied_at  = Column(DateTime, nullable=True)
+
+
+class MaintenanceLease(Base):
+    """Leader lease for the maintenance scheduler — one row, held by one worker at a time."""
+    __tablename__ = "maintenance_lease"
+    name        = Column(String(32), primary_key=True)
+    holder      = Column(String(128), default="")
+    expires_at  = Column(Float, default=0)          # epoch seconds
+    acquired_at = Column(Float, default=0)
+
+
+class MaintenanceJob(Base):
+    """Run history of each leader-only maintenance job (services/maintenance.py)."""
+    __tablename__ = "maintenance_jobs"
+    name          = Column(String(64), primary_key=True)
+    runs          = Column(Integer, default=0)
+    failures      = Column(Integer, default=0)
+    last_started  = Column(Float, nullable=True)    # epoch seconds
+    last_seconds  = Column(Float, nullable=True)
+    max_seconds   = Column(Float, nullable=True)
+    last_result   = Column(String)                  # JSON
+    last_error    = Column(String)
+    holder        = Column(String(128))             # worker that ran it last
+    requested_at  = Column(Float, nullable=True)    # trigger() on a non-leader worker: the leader runs it next
+    cursor        = Column(String)                  # JSON resume point of a long job (save_cursor())
+
+
+class CacheGeneration(Base):
+    """Bumped with every change a worker-local cache depends on (services/ota_cache.py)."""
+    __tablename__ = "cache_generation"
+    name = Column(String(32), primary_key=True)
+    gen  = Column(Integer, default=0)
+
+
+class OtaPatch(Base):
+    """Binary patch from an archived firmware version to a group's target (services/delta_ota.py)."""
+    __tablename__ = "ota_patches"
+    id          = Column(Integer, primary_key=True)
+    category_id = Column(Integer, index=True)
+    filename    = Column(String(128))           # target image, e.g. FW_S5_KSNDMC_TRG.bin
+    from_ver    = Column(String(16))            # delta_ota.ver_key() form
+    to_ver      = Column(String(16))
+    patch_file  = Column(String(128))           # served from /builds like any image
+    image_size  = Column(Integer)
+    patch_size  = Column(Integer)
+    seconds     = Column(Float)                 # time to build the patch
+    created_at  = Column(DateTime, server_default=func.now())
+    __table_args__ = (UniqueConstraint("filename", "from_ver", "to_ver", name="uq_ota_patches_pair"),)
+
+
+class OtaRollout(Base):
+    """Staged rollout of a group's target version (services/ota_rollout.py). No row = everyone at once."""
+    __tablename__ = "ota_rollouts"
+    category_id     = Column(Integer, primary_key=True)
+    to_ver          = Column(String(16))
+    state           = Column(String(16), default="active")     # active | paused | done
+    wave            = Column(Integer, default=0)               # current wave, 1-based once started
+    wave_size       = Column(Integer)
+    max_inflight    = Column(Integer)
+    order_by        = Column(String(16))                       # signal | battery
+    pause_fail_rate = Column(Float)
+    paused_reason   = Column(String)
+    started_at      = Column(DateTime, server_default=func.now())
+    updated_at      = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class OtaRolloutStation(Base):
+    """A station admitted to a rollout wave and how its OTA ended."""
+    __tablename__ = "ota_rollout_stations"
+    id             = Column(Integer, primary_key=True)
+    category_id    = Column(Integer)
+    to_ver         = Column(String(16))
+    stn_id         = Column(String)
+    wave           = Column(Integer)
+    admitted_at    = Column(DateTime)
+    fails_at_admit = Column(Integer, default=0)      # ota_fails when admitted; a rise = failed
+    outcome        = Column(String(16), nullable=True)   # None (in flight) | ok | failed | timeout
+    finished_at    = Column(DateTime, nullable=True)
+    __table_args__ = (
+        UniqueConstraint("category_id", "to_ver", "stn_id", name="uq_ota_rollout_stations"),
+    )
+
+
+class OtaDownload(Base):
+    """Firmware downloads per station and file, merged from /builds requests (services/ota_telemetry.py)."""
+    __tablename__ = "ota_downloads"
+    id           = Column(Integer, primary_key=True)
+    stn_id       = Column(String)
+    filename     = Column(String(128))
+    encoding     = Column(String(16), default="")        # "" (plain) | heatshrink
+    size         = Column(Integer)                       # bytes the device needs (encoded size if encoded)
+    attempts     = Column(Integer, default=0)
+    resumes      = Column(Integer, default=0)
+    requests     = Column(Integer, default=0)
+    bytes_sent   = Column(Integer, default=0)            # re-sent bytes included
+    covered      = Column(Text)                          # JSON [[start, end], ...] of the current attempt
+    started_at   = Column(DateTime)
+    last_at      = Column(DateTime, index=True)
+    completed_at = Column(DateTime, nullable=True)
+    seconds      = Column(Float, nullable=True)          # started_at → last byte
+    __table_args__ = (UniqueConstraint("stn_id", "filename", name="uq_ota_downloads"),)
 
 
 class StationSettings(Base):
@@ -85,3 +267,17 @@ class StationSettings(Base):
     stn_id      = Column(String, primary_key=True, index=True)
     ota_exempt  = Column(Integer, default=0) # 1 means OTA is disabled for this station
     updated_at  = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class OtaBuild(Base):
+    """An uploaded firmware image and what it was uploaded as (services/build_store.py)."""
+    __tablename__ = "ota_builds"
+    id          = Column(Integer, primary_key=True)
+    sha256      = Column(String(64), index=True)       # object in BUILDS_DIR/objects/
+    size        = Column(Integer)
+    filename    = Column(String(128), index=True)      # alias, e.g. FW_S5_KSNDMC_TRG.bin / FW_CUSTOM_KA1234.bin
+    category_id = Column(Integer, nullable=True)       # group build
+    stn_id      = Column(String, nullable=True)        # custom build for one station
+    ver         = Column(String(16))
+    source      = Column(String(16), default="upload")  # upload | adopted (found in BUILDS_DIR)
+    created_at  = Column(DateTime, server_default=func.now())
@@ -0,0 +1,156 @@
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from app.services.firmware_store import firmware_store, FirmwareResponse
+from app.services import conditional, ota_encoding, ota_manifest
+from app.services.ota_telemetry import download_stats
+from functools import partial
+import os
+
+router = APIRouter()
+
+BUILDS_DIR = "/app/builds"
+
+os.makedirs(BUILDS_DIR, exist_ok=True)
+
+
+def _parse_range(header: str, size: int):
+    """(start, end) for a single "bytes=start-end" / "bytes=start-" range; None if malformed."""
+    try:
+        start_str, end_str = header.replace("bytes=", "").split("-")
+        start = int(start_str)
+        end   = int(end_str) if end_str else size - 1
+    except Exception:
+        return None
+    return start, min(end, size - 1)
+
+
+def _image_path(filename: str):
+    """Real path of a .bin in BUILDS_DIR, or None if the name is not allowed."""
+    # Security: only serve .bin files, no path traversal
+    if not filename.endswith(".bin") or "/" in filename or ".." in filename:
+        return None
+    filepath = os.path.realpath(os.path.join(BUILDS_DIR, filename))
+    if not filepath.startswith(os.path.realpath(BUILDS_DIR)):
+        return None
+    return filepath
+
+
+async def _manifest(image) -> dict:
+    # Loading may hash the image (sidecar missing / stale) — keep that off the loop
+    return await run_in_threadpool(lambda: image.manifest)
+
+
+def _accepts(header: str, coding: str) -> bool:
+    """True if an Accept-Encoding header lists `coding` with a non-zero q."""
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+async def _encoded(image, filepath: str):
+    """(heatshrink variant, its index) (services/ota_encoding.py) if the image has one, else (None, None)."""
+    index = await run_in_threadpool(lambda: image.encoding)
+    if not index["used"]:
+        return None, None
+    try:
+        encoded = await firmware_store.load(ota_encoding.variant_path(filepath))
+    except FileNotFoundError:
+        return None, None
+    # Index and variant are two files: only serve a pair that belongs together
+    return (encoded, index) if encoded.size == index["size"] else (None, None)
+
+
+def _variant(index: dict) -> str:
+    """ETag suffix of an encoded variant: same image, same codec settings = same bytes."""
+    return f"{ota_encoding.ENCODING}{index['window_sz2']}.{index['lookahead_sz2']}.{index['chunk_size'] // 1024}"
+
+
+@router.api_route("/builds/{filename}", methods=["GET", "HEAD"])
+async def serve_firmware(filename: str, request: Request):
+    """Range-aware firmware file server for ESP32 OTA downloads (services/firmware_store.py)."""
+    filepath = _image_path(filename)
+    if filepath is None:
+        return Response(status_code=403)
+    try:
+        image = await firmware_store.load(filepath)
+    except FileNotFoundError:
+        return Response(status_code=404)
+    manifest = await _manifest(image)
+
+    # v= pin from the OTA_CHECK parameter (services/ota_manifest.py): the image was
+    # replaced since — fail now instead of mixing bytes of two builds on the device
+    pinned = request.query_params.get("v")
+    if pinned and not manifest["sha256"].startswith(pinned.lower()):
+        return Response(status_code=412, headers={"ETag": ota_manifest.etag(manifest)})
+
+    # Precompressed variant on request; Content-Length / Range then count encoded bytes
+    body, variant, coding = image, "", {}
+    if ota_encoding.available() and ota_encoding.applies(filename) \
+            and _accepts(request.headers.get("Accept-Encoding"), ota_encoding.ENCODING):
+        encoded, index = await _encoded(image, filepath)
+        if encoded is not None:
+            body, variant = encoded, _variant(index)
+            coding = {"Content-Encoding": ota_encoding.ENCODING, "X-Decoded-Length": str(image.size)}
+
+    # Strong validators: the SHA-256 hashed at upload, when the file last changed
+    etag          = ota_manifest.etag(manifest, variant)
+    last_modified = body.changed
+    headers       = dict(conditional.validators(etag, last_modified),
+                         **{"Vary": "Accept-Encoding", "Cache-Control": "no-cache"})
+    if conditional.not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    headers.update(coding)
+
+    # Download telemetry (services/ota_telemetry.py): stn= comes from the tagged OTA_CHECK parameter
+    stn_id   = request.query_params.get("stn") or request.headers.get("X-Station-Id")
+    encoding = headers.get("Content-Encoding", "")
+    record   = partial(download_stats.record, stn_id, filename, encoding, body.size)
+
+    range_header = request.headers.get("Range")
+    if range_header and not conditional.range_still_valid(request, etag):
+        range_header = None     # If-Range failed: the file changed, send all of the new one
+    if request.method == "HEAD" or not range_header:
+        if request.method == "HEAD":
+            record(0, 0, head=True)
+        # Full file (HEAD is the device's size check): whole-image hashes for Update.setMD5
+        return FirmwareResponse(body, headers=dict(headers, **{
+            "X-Firmware-MD5": manifest["md5"], "X-Firmware-SHA256": manifest["sha256"],
+            "X-Content-CRC32": body.crc32(0, body.size - 1),
+        }), on_sent=partial(record, 0))
+
+    parsed = _parse_range(range_header, body.size)
+    if parsed is None:
+        return Response(status_code=400)
+    start, end = parsed
+    if start > end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{body.size}"})
+    # Lets the device check this chunk before writing it to flash
+    return FirmwareResponse(body, start, end, status_code=206,
+                            headers=dict(headers, **{"X-Content-CRC32": body.crc32(start, end)}),
+                            on_sent=partial(record, start))
+
+
+@router.get("/builds/{filename}/manifest")
+async def firmware_manifest(filename: str, request: Request):
+    """Whole-image SHA-256 / MD5 and a CRC32 per OTA_CHUNK_KB chunk (services/ota_manifest.py)."""
+    filepath = _image_path(filename)
+    if filepath is None:
+        return Response(status_code=403)
+    try:
+        image = await firmware_store.load(filepath)
+    except FileNotFoundError:
+        return Response(status_code=404)
+    manifest = await _manifest(image)
+    index    = await run_in_threadpool(lambda: image.encoding) if ota_encoding.applies(filename) else None
+    variant  = f"manifest{manifest['chunk_size'] // 1024}"
+    if index and index["used"]:
+        manifest = dict(manifest, encodings={ota_encoding.ENCODING: ota_encoding.public(index)})
+        variant += f"-{_variant(index)}"
+    etag    = ota_manifest.etag(manifest, variant)
+    headers = dict(conditional.validators(etag, image.changed), **{"Cache-Control": "no-cache"})
+    if conditional.not_modified(request, etag, image.changed):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(manifest, headers=headers)
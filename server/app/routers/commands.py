@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
-from app.models import CommandQueue, StationSettings, HealthReport
+from app.models import CommandQueue, StationSettings, HealthReport, HealthDaily
+from app.services.station_latest import refresh_station_latest
+from app.services.ota_cache import bump as bump_ota_cache
 from pydantic import BaseModel
 from typing import List
 
@@ -68,7 +70,8 @@ def toggle_ota_lock(stn_id: str, db: Session = Depends(get_db)):
     # If we are locking it, clear any existing pending OTA_CHECK in the queue just in case
     if setting.ota_exempt == 1:
         db.query(CommandQueue).filter_by(stn_id=stn_id, cmd="OTA_CHECK", executed_at=None).delete()
-        
+
+    bump_ota_cache(db)
     db.commit()
     return RedirectResponse(url=f"/station/{stn_id}")
 
@@ -77,7 +80,9 @@ def toggle_ota_lock(stn_id: str, db: Session = Depends(get_db)):
 def delete_station(stn_id: str, db: Session = Depends(get_db)):
     from app.models import HealthReport
     db.query(HealthReport).filter_by(stn_id=stn_id).delete()
+    db.query(HealthDaily).filter_by(stn_id=stn_id).delete()
     db.query(CommandQueue).filter_by(stn_id=stn_id).delete()
+    refresh_station_latest(db, [stn_id])
     db.commit()
     return RedirectResponse(url="/dashboard")
 
@@ -86,6 +91,8 @@ def delete_station_category(stn_id: str, unit_type: str, system: int, db: Sessio
     """Surgical delete: Removes a station only from a specific category (e.g. KSNDMC_TWS)."""
     from app.models import HealthReport
     db.query(HealthReport).filter_by(stn_id=stn_id, unit_type=unit_type, system=system).delete()
+    db.query(HealthDaily).filter_by(stn_id=stn_id, unit_type=unit_type, system=system).delete()
+    refresh_station_latest(db, [stn_id])
     db.commit()
     return RedirectResponse(url="/summary")
 
@@ -95,6 +102,8 @@ def delete_record(report_id: int, db: Session = Depends(get_db)):
     if record:
         stn_id = record.stn_id
         db.delete(record)
+        db.flush()
+        refresh_station_latest(db, [stn_id])
         db.commit()
         return RedirectResponse(url=f"/station/{stn_id}")
     return RedirectResponse(url="/dashboard")
@@ -107,7 +116,9 @@ class BulkDeleteStations(BaseModel):
 
 @router.post("/delete/bulk-records")
 def delete_bulk_records(payload: BulkDeleteRecords, db: Session = Depends(get_db)):
+    affected = {s for (s,) in db.query(HealthReport.stn_id).filter(HealthReport.id.in_(payload.ids)).distinct()}
     db.query(HealthReport).filter(HealthReport.id.in_(payload.ids)).delete(synchronize_session=False)
+    refresh_station_latest(db, affected)
     db.commit()
     return {"status": "ok", "deleted": len(payload.ids)}
 
@@ -119,7 +130,9 @@ def delete_bulk_stations(payload: BulkDeleteStations, db: Session = Depends(get_
     print(f"[AUTH-OP] Bulk deletion requested for: {payload.stn_ids}")
     try:
         db.query(HealthReport).filter(HealthReport.stn_id.in_(payload.stn_ids)).delete(synchronize_session=False)
+        db.query(HealthDaily).filter(HealthDaily.stn_id.in_(payload.stn_ids)).delete(synchronize_session=False)
         db.query(CommandQueue).filter(CommandQueue.stn_id.in_(payload.stn_ids)).delete(synchronize_session=False)
+        refresh_station_latest(db, payload.stn_ids)
         db.commit()
         print(f"  ✓ Successfully deleted {len(payload.stn_ids)} stations.")
         return {"status": "ok", "deleted": len(payload.stn_ids)}
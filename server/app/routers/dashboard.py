@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Request, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Request, Depends, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from app.database import SessionLocal
-from app.models import HealthReport, FirmwareRegistry, CommandQueue, StationSettings
-from app.services.health_eval import evaluate, ist_filter
-import csv, io, datetime
+from sqlalchemy import desc, select
+from app.database import ReadSessionLocal
+from app.models import HealthReport, HealthDaily, FirmwareRegistry, CommandQueue, StationSettings, StationGps, StationLatest
+from app.services.health_eval import evaluate_stored, historical_now, ist_filter, OFFLINE_MINS, RULES_VERSION
+from app.services import conditional
+from app.services.station_latest import latest_reports_query, stations_in_bbox, NO_GPS
+from app.services import history_export
+from app.services.offload import run_read
+import csv, io, datetime, hashlib, heapq, itertools, operator, time
 
 router = APIRouter()
 import os
@@ -16,7 +20,8 @@ templates.env.filters["ist"] = ist_filter
 
 
 def get_db():
-    db = SessionLocal()
+    # Every route here only reads — use the read-only pool
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -25,50 +30,64 @@ def get_db():
 
 def get_latest_per_station(db):
     """Returns exactly one (latest) record per unique station ID."""
-    subq = db.query(
-        HealthReport.stn_id,
-        func.max(HealthReport.reported_at).label("m")
-    ).group_by(HealthReport.stn_id).subquery()
-    return db.query(HealthReport).join(
-        subq,
-        (HealthReport.stn_id == subq.c.stn_id) &
-        (HealthReport.reported_at == subq.c.m)
-    ).order_by(HealthReport.reported_at.desc()).all()
-
+    # Reads the station_latest pointers maintained at ingest — O(fleet), not O(history)
+    return latest_reports_query(db).order_by(HealthReport.reported_at.desc()).all()
+
+
+def get_pending_commands(db) -> dict:
+    """{stn_id: oldest unsent CommandQueue row} for the whole fleet in ONE query."""
+    pending = {}
+    for c in (db.query(CommandQueue)
+                .filter(CommandQueue.executed_at.is_(None))
+                .order_by(CommandQueue.id)):
+        pending.setdefault(c.stn_id, c)
+    return pending
+
+
+def get_known_fixes(db) -> dict:
+    """{stn_id: StationGps} — last known good fix per station, maintained at ingest."""
+    return {g.stn_id: g for g in db.query(StationGps).filter(StationGps.fix_at.isnot(None))}
+
+
+# (attribute, default) for every CSV column between the timestamp and the verdict —
+# the default covers columns not yet in the DB model
+_ALL_FIELDS = (
+    ("stn_id", None), ("unit_type", None), ("system", None),
+    ("health_sts", None), ("sensor_sts", None),
+    ("bat_v", None), ("sol_v", None), ("signal", None),
+    ("net_cnt", None), ("net_cnt_prev", None),
+    ("prev_stored", None),
+    ("reg_fails", None), ("consec_reg_fails", None),
+    ("http_fails", None), ("http_fail_reason", None),
+    ("http_suc_cnt", None), ("http_suc_cnt_prev", None),
+    ("http_ret_cnt", None), ("http_ret_cnt_prev", None),
+    ("http_present_fails", 0), ("http_cum_fails", 0),    # v7.70
+    ("ftp_suc_cnt", None), ("ftp_suc_cnt_prev", None),
+    ("ndm_cnt", None), ("pd_cnt", None), ("cdm_sts", None), ("first_http", None),
+    ("unsent_count", None),
+    ("reset_reason", None), ("rtc_ok", None),
+    ("spiffs_kb", None), ("spiffs_total_kb", None),
+    ("sd_sts", None), ("calib", None), ("ver", None), ("carrier", None), ("iccid", None), ("gps", None),
+    ("ota_fails", None), ("ota_fail_reason", None),
+    ("consec_http_fails", None), ("consec_sim_fails", None),
+    ("http_backlog_cnt", 0), ("mutex_fail", 0),    # v5.56
+)
+_IST = datetime.timedelta(hours=5, minutes=30)
+
+
+def _all_fields_row(r, ev):
+    """Returns a flat list of all health report fields for CSV export (ev = its evaluation)."""
+    # v7.86: Offset to IST
+    ist_time = r.reported_at + _IST if r.reported_at else None
 
-def _g(r, attr, default=None):
-    """Safe getattr — returns default if column not yet in DB model."""
-    return getattr(r, attr, default)
+    row = [ist_time]
+    row += [getattr(r, attr, default) for attr, default in _ALL_FIELDS]
+    row.append(_verdict_text(ev))
+    return row
 
 
-def _all_fields_row(r, now=None):
-    """Returns a flat list of all health report fields for CSV export."""
-    # v7.86: Offset to IST
-    ist_time = r.reported_at + datetime.timedelta(hours=5, minutes=30) if r.reported_at else None
-    
-    ev = evaluate(r, now)
-    return [
-        ist_time, _g(r, "stn_id"), _g(r, "unit_type"), _g(r, "system"),
-        _g(r, "health_sts"), _g(r, "sensor_sts"),
-        _g(r, "bat_v"), _g(r, "sol_v"), _g(r, "signal"),
-        _g(r, "net_cnt"), _g(r, "net_cnt_prev"),
-        _g(r, "prev_stored"),
-        _g(r, "reg_fails"), _g(r, "consec_reg_fails"),
-        _g(r, "http_fails"), _g(r, "http_fail_reason"),
-        _g(r, "http_suc_cnt"), _g(r, "http_suc_cnt_prev"),
-        _g(r, "http_ret_cnt"), _g(r, "http_ret_cnt_prev"),
-        _g(r, "http_present_fails", 0), _g(r, "http_cum_fails", 0),    # v7.70
-        _g(r, "ftp_suc_cnt"), _g(r, "ftp_suc_cnt_prev"),
-        _g(r, "ndm_cnt"), _g(r, "pd_cnt"), _g(r, "cdm_sts"), _g(r, "first_http"),
-        _g(r, "unsent_count"),
-        _g(r, "reset_reason"), _g(r, "rtc_ok"),
-        _g(r, "spiffs_kb"), _g(r, "spiffs_total_kb"),
-        _g(r, "sd_sts"), _g(r, "calib"), _g(r, "ver"), _g(r, "carrier"), _g(r, "iccid"), _g(r, "gps"),
-        _g(r, "ota_fails"), _g(r, "ota_fail_reason"),
-        _g(r, "consec_http_fails"), _g(r, "consec_sim_fails"),
-        _g(r, "http_backlog_cnt", 0), _g(r, "mutex_fail", 0),    # v5.56
-        " | ".join(ev.get("reasons", [])) if "reasons" in ev and ev["reasons"] else ev.get("verdict", "OK")
-    ]
+def _verdict_text(ev):
+    return " | ".join(ev["reasons"]) if ev.get("reasons") else ev.get("verdict", "OK")
 
 
 ALL_FIELDS_HEADER = [
@@ -97,10 +116,14 @@ ALL_FIELDS_HEADER = [
 
 
 from app.services.ota_service import needs_ota
-from app.services.health_eval import evaluate
 
 @router.get("/dashboard")
 async def dashboard(request: Request, db: Session = Depends(get_db)):
+    # Queries and template rendering run on a read thread, not the event loop
+    return await run_read(_render_dashboard, request, db)
+
+
+def _render_dashboard(request: Request, db: Session):
     try:
         reports = get_latest_per_station(db)
         fw_map  = {
@@ -119,7 +142,14 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         settings_rows = db.query(StationSettings).all()
         exempt_map    = {s.stn_id: s.ota_exempt for s in settings_rows}
 
-        for r in reports:
+        # Set-based loading: one query each instead of one (or two) per station row
+        pending_map = get_pending_commands(db)
+        gps_map     = get_known_fixes(db)
+
+        # Objective Health Evaluation — stored verdicts, re-scored only if stale
+        evals = [evaluate_stored(r, now) for r in reports]
+
+        for r, ev in zip(reports, evals):
             key        = (r.unit_type or "") + str(r.system or 0)
             r.fw_group = fw_map.get(key)
             r.is_exempt = (exempt_map.get(r.stn_id, 0) == 1)
@@ -131,8 +161,7 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
                     r.ota_needed = True
                     ota_pending += 1
 
-            # Objective Health Evaluation
-            r.eval = evaluate(r, now)
+            r.eval = ev
             if r.eval["verdict"] in ("CRITICAL", "WARN", "OFFLINE"):
                 alarms += 1
             if any("BATT" in str(reason) for reason in r.eval["reasons"]):
@@ -161,20 +190,15 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
 
 
             # Pending command badge
-            r.pending = db.query(CommandQueue).filter_by(
-                stn_id=r.stn_id, executed_at=None
-            ).first()
+            r.pending = pending_map.get(r.stn_id)
 
             # GPS Fallback: If latest report has no GPS (e.g. older firmware sends NA during non-GPS wakeups),
-            # search history for the last known good coordinate.
-            if not r.gps or str(r.gps).strip() in ("NA", "0.000000,0.000000", "", "0,0", "None"):
-                last_good = db.query(HealthReport).filter(
-                    HealthReport.stn_id == r.stn_id,
-                    HealthReport.gps.isnot(None),
-                    HealthReport.gps.notin_(("NA", "0.000000,0.000000", "", "0,0"))
-                ).order_by(HealthReport.reported_at.desc()).first()
-                if last_good:
-                    r.gps = last_good.gps
+            # use the last known good coordinate. The map plots the numeric fix.
+            fix = gps_map.get(r.stn_id)
+            r.gps_lat = fix.lat if fix else None
+            r.gps_lon = fix.lon if fix else None
+            if fix and (not r.gps or str(r.gps).strip() in NO_GPS + ("None",)):
+                r.gps = f"{fix.lat:.6f},{fix.lon:.6f}"
 
         # Final Sort: priority, then station ID
         reports.sort(key=lambda x: (x.sort_priority, x.stn_id))
@@ -189,9 +213,22 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         return templates.TemplateResponse(request, "error.html", {"request": request}, status_code=500)
 
 
+@router.get("/dashboard/stations_in_bbox")
+def dashboard_bbox(south: float, west: float, north: float, east: float, db: Session = Depends(get_db)):
+    """Stations whose last known fix lies inside the given lat/lon box (map viewport)."""
+    return [
+        {"stn_id": g.stn_id, "lat": g.lat, "lon": g.lon, "fix_at": g.fix_at}
+        for g in stations_in_bbox(db, south, west, north, east)
+    ]
+
+
 @router.get("/station/{stn_id}")
 async def station_detail(stn_id: str, request: Request, db: Session = Depends(get_db)):
     """Full history page with de-cluttered daily trends."""
+    return await run_read(_render_station, stn_id, request, db)
+
+
+def _render_station(stn_id: str, request: Request, db: Session):
     try:
         raw_history = (
             db.query(HealthReport)
@@ -219,6 +256,16 @@ async def station_detail(stn_id: str, request: Request, db: Session = Depends(ge
         # Trim to a reasonable view (e.g., last 40 entries/days)
         history = history[:40]
 
+        # Days past the raw retention window live in health_daily (one row per day)
+        if len(history) < 40:
+            daily = db.query(HealthDaily).filter_by(stn_id=stn_id)
+            if history:
+                daily = daily.filter(HealthDaily.reported_at < history[-1].reported_at)
+            for d in daily.order_by(HealthDaily.reported_at.desc()).limit(40 - len(history)):
+                if d.day not in seen_dates:
+                    history.append(d)
+                    seen_dates.add(d.day)
+
         commands = (
             db.query(CommandQueue)
             .filter_by(stn_id=stn_id)
@@ -233,15 +280,12 @@ async def station_detail(stn_id: str, request: Request, db: Session = Depends(ge
         
         now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
         today = datetime.date.today()
-        for r in history:
-            if r.reported_at and r.reported_at.date() < today:
-                # Historical record: evaluate relative to report time + 1h
-                # This preserves the health verdict as it was when filed,
-                # instead of always showing OFFLINE for old records.
-                eval_now = r.reported_at + datetime.timedelta(hours=1)
-            else:
-                eval_now = now   # Today's records: use real wall clock
-            r.eval = evaluate(r, eval_now)
+        # Historical records are evaluated relative to report time + 1h
+        # This preserves the health verdict as it was when filed,
+        # instead of always showing OFFLINE for old records.
+        evals = [evaluate_stored(r, historical_now(r.reported_at, now, today)) for r in history]
+        for r, ev in zip(history, evals):
+            r.eval = ev
 
         # v7.93: Determine category for 'Back to Fleet' deep-linking
         category_id = None
@@ -271,79 +315,222 @@ async def station_detail(stn_id: str, request: Request, db: Session = Depends(ge
 
 # ── CSV Downloads ─────────────────────────────────────────────────────────────
 
+# (etag, first seen) of the last /csv/summary validator this worker computed
+_summary_seen = (None, 0.0)
+
+
+def _summary_etag(db, now) -> str:
+    """
+    Weak ETag of the summary CSV without building it: the latest report per
+    station plus the only clock-dependent part of a row — its OFFLINE reason
+    ("No report for {N}h"), which changes every hour once a station is offline.
+    """
+    digest = hashlib.sha1(f"{RULES_VERSION}|{OFFLINE_MINS}".encode())
+    for stn_id, report_id, reported_at in (db.query(StationLatest.stn_id, StationLatest.report_id,
+                                                     StationLatest.reported_at).order_by(StationLatest.stn_id)):
+        mins  = (now - reported_at).total_seconds() / 60 if reported_at else None
+        state = "-" if mins is None else int(mins / 60) if mins > OFFLINE_MINS else ""
+        digest.update(f"{stn_id}:{report_id}:{state};".encode())
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
 @router.get("/csv/summary")
-def csv_summary(db: Session = Depends(get_db)):
+def csv_summary(request: Request, db: Session = Depends(get_db)):
     """
     Summary CSV: One row per station (latest report only), all fields.
     Good for sharing fleet status snapshots.
+    ETag / Last-Modified: an unchanged fleet answers 304 without re-scoring it.
     """
+    global _summary_seen
+    now  = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    etag = _summary_etag(db, now)
+    if _summary_seen[0] != etag:
+        # Backlog reports carry old timestamps, so the data can't date itself:
+        # Last-Modified is when this worker first saw this state (never too early)
+        _summary_seen = (etag, time.time())
+    headers = dict(conditional.validators(etag, _summary_seen[1]), **{"Cache-Control": "no-cache"})
+    if conditional.not_modified(request, etag, _summary_seen[1]):
+        return Response(status_code=304, headers=headers)
+
     reports = get_latest_per_station(db)
-    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
     output  = io.StringIO()
     writer  = csv.writer(output)
     writer.writerow(ALL_FIELDS_HEADER)
     for r in reports:
-        writer.writerow(_all_fields_row(r, now))
+        writer.writerow(_all_fields_row(r, evaluate_stored(r, now)))
     output.seek(0)
     return StreamingResponse(
         output, media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=spatika_fleet_summary.csv"}
+        headers=dict(headers, **{"Content-Disposition": "attachment; filename=spatika_fleet_summary.csv"})
     )
 
 
+# Rows fetched, evaluated and written per chunk by the streaming exports
+CSV_CHUNK_ROWS    = int(os.getenv("CSV_CHUNK_ROWS", "2000"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))   # = one Parquet row group
+
+
+def _daily_select():
+    """health_daily under the health_reports column names (id = the day's last report id)."""
+    c = HealthDaily.__table__.c
+    return select(*[(c.report_id if col.name == "id" else c[col.name]).label(col.name)
+                    for col in HealthReport.__table__.columns])
+
+
+def _newest_first(r):
+    """Sort key matching ORDER BY stn_id, reported_at DESC (NULL times last)."""
+    ts = r.reported_at
+    return r.stn_id, -(ts - datetime.datetime.min).total_seconds() if ts else float("inf")
+
+
+def _merged_partitions(result, daily, chunk_rows: int):
+    """Both tiers interleaved in stn_id / newest-first order, re-chunked."""
+    raw  = (r for part in result.partitions() for r in part)
+    rows = heapq.merge(raw, (r for part in daily.partitions() for r in part), key=_newest_first)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _history_chunks(stmt, chunk_rows: int, with_eval: bool = True, daily_stmt=None):
+    """
+    Runs `stmt` (a SELECT over health_reports) on a server-side cursor and
+    yields (keys, rows, evals) `chunk_rows` at a time, so memory stays flat
+    whatever the history size. Runs in its own session: the request's session
+    is closed before the body is sent. Historical records are evaluated
+    relative to report time + 1h.
+
+    daily_stmt: the same filter over _daily_select(), both ordered by
+    stn_id, reported_at DESC — rolled-up days are merged into the stream.
+    """
+    db = ReadSessionLocal()
+    try:
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        today = datetime.date.today()
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        keys = list(result.keys())
+        partitions = result.partitions()
+        if daily_stmt is not None and db.execute(daily_stmt.limit(1)).first() is not None:
+            daily = db.execute(daily_stmt.execution_options(yield_per=chunk_rows))
+            partitions = _merged_partitions(result, daily, chunk_rows)
+        for rows in partitions:
+            evals = None
+            if with_eval:
+                evals = [evaluate_stored(r, historical_now(r.reported_at, now, today)) for r in rows]
+            yield keys, rows, evals
+    finally:
+        db.close()
+
+
+def _stream_history_csv(stmt, daily_stmt=None):
+    """Streams `stmt` (+ rolled-up days) as CSV, CSV_CHUNK_ROWS rows at a time (header first)."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(ALL_FIELDS_HEADER)
+    yield output.getvalue()
+
+    pick = None
+    for keys, rows, evals in _history_chunks(stmt, CSV_CHUNK_ROWS, daily_stmt=daily_stmt):
+        if pick is None:
+            # Same columns as _all_fields_row(), picked by position: Row attribute
+            # lookups were the bulk of the per-row cost on large exports
+            pick = operator.itemgetter(*(keys.index(attr) for attr, _ in _ALL_FIELDS))
+        output.seek(0)
+        output.truncate()
+        for r, ev in zip(rows, evals):
+            writer.writerow((r.reported_at + _IST if r.reported_at else None,
+                             *pick(r), _verdict_text(ev)))
+        yield output.getvalue()
+
+
 @router.get("/csv/full_history")
-def csv_full_history(db: Session = Depends(get_db)):
+def csv_full_history():
     """
     Full History CSV: Every health report for every station.
     Use for audits or deep analysis.
     """
-    records = (
-        db.query(HealthReport)
+    stmt = (
+        select(HealthReport.__table__)
         .order_by(HealthReport.stn_id, HealthReport.reported_at.desc())
-        .all()
     )
-    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-    today = datetime.date.today()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(ALL_FIELDS_HEADER)
-    for r in records:
-        if r.reported_at and r.reported_at.date() < today:
-            eval_now = r.reported_at + datetime.timedelta(hours=1)
-        else:
-            eval_now = now
-        writer.writerow(_all_fields_row(r, eval_now))
-    output.seek(0)
+    daily = _daily_select().order_by(HealthDaily.stn_id, HealthDaily.reported_at.desc())
     return StreamingResponse(
-        output, media_type="text/csv",
+        _stream_history_csv(stmt, daily), media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=spatika_full_history.csv"}
     )
 
 
 @router.get("/station/{stn_id}/csv")
-def station_csv(stn_id: str, db: Session = Depends(get_db)):
+def station_csv(stn_id: str):
     """
     Station CSV: Full history for ONE station, all fields.
     """
-    history = (
-        db.query(HealthReport)
-        .filter_by(stn_id=stn_id)
+    stmt = (
+        select(HealthReport.__table__)
+        .where(HealthReport.stn_id == stn_id)
         .order_by(HealthReport.reported_at.desc())
-        .all()
     )
-    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
-    today = datetime.date.today()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(ALL_FIELDS_HEADER)
-    for r in history:
-        if r.reported_at and r.reported_at.date() < today:
-            eval_now = r.reported_at + datetime.timedelta(hours=1)
-        else:
-            eval_now = now
-        writer.writerow(_all_fields_row(r, eval_now))
-    output.seek(0)
+    daily = (
+        _daily_select()
+        .where(HealthDaily.stn_id == stn_id)
+        .order_by(HealthDaily.reported_at.desc())
+    )
     return StreamingResponse(
-        output, media_type="text/csv",
+        _stream_history_csv(stmt, daily), media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={stn_id}_history.csv"}
     )
+
+
+# ── Columnar export ───────────────────────────────────────────────────────────
+
+def _parse_ist(value: str, end: bool = False):
+    """'YYYY-MM-DD' or ISO datetime in IST -> naive UTC bound (a bare end date is inclusive)."""
+    ts = datetime.datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        ts += datetime.timedelta(days=1)
+    return ts - _IST
+
+
+@router.get("/export/history")
+def export_history(stn_id: str = None, start: str = None, end: str = None,
+                   format: str = "parquet", verdict: int = 0):
+    """
+    Typed columnar history for offline analysis (Parquet, or Arrow IPC stream).
+    Filters: stn_id, start / end (IST date or datetime; end date inclusive).
+    verdict=1 adds the server verdict, score and reasons.
+    """
+    if not history_export.available():
+        return JSONResponse({"error": "pyarrow is not installed on this server"}, status_code=501)
+    if format not in history_export.FORMATS:
+        return JSONResponse({"error": f"format must be one of {history_export.FORMATS}"}, status_code=400)
+
+    stmt, daily = select(HealthReport.__table__), _daily_select()
+    try:
+        if start:
+            stmt  = stmt.where(HealthReport.reported_at >= _parse_ist(start))
+            daily = daily.where(HealthDaily.reported_at >= _parse_ist(start))
+        if end:
+            stmt  = stmt.where(HealthReport.reported_at < _parse_ist(end, end=True))
+            daily = daily.where(HealthDaily.reported_at < _parse_ist(end, end=True))
+    except ValueError:
+        return JSONResponse({"error": "start / end must be YYYY-MM-DD or ISO datetime"}, status_code=400)
+    if stn_id:
+        stmt  = stmt.where(HealthReport.stn_id == stn_id)
+        daily = daily.where(HealthDaily.stn_id == stn_id)
+    stmt  = stmt.order_by(HealthReport.stn_id, HealthReport.reported_at.desc())
+    daily = daily.order_by(HealthDaily.stn_id, HealthDaily.reported_at.desc())
+
+    fmt    = history_export.resolve_format(format)
+    fields = [(name, attr) for name, (attr, _) in zip(ALL_FIELDS_HEADER[1:], _ALL_FIELDS)]
+    body   = history_export.stream_columnar(
+        _history_chunks(stmt, EXPORT_CHUNK_ROWS, with_eval=bool(verdict), daily_stmt=daily),
+        fields, HealthReport.__table__, fmt, bool(verdict),
+    )
+    name = f"{stn_id}_history" if stn_id else "spatika_full_history"
+    ext  = "parquet" if fmt == "parquet" else "arrows"
+    return StreamingResponse(
+        body, media_type=history_export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}.{ext}"}
+    )
@@ -1,10 +1,20 @@
 from fastapi import APIRouter, Request, Depends, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import text, inspect as sa_inspect
-from app.database import SessionLocal
-from app.models import HealthReport, FirmwareRegistry, CommandQueue, StationSettings
-from app.services.ota_service import needs_ota
-import datetime, json, re, os
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.database import SessionLocal, engine
+from app.models import CommandQueue, StationSettings, StationGps
+from app.services.ota_service import needs_ota, download_param
+from app.services.ota_cache import ota_cache, bump as bump_ota_cache
+from app.services import delta_ota, ota_rollout, ota_telemetry, build_store, indexes
+from app.services.ingest_queue import ingest_queue
+from app.services.eval_store import rescorer, stale_count
+from app.services.retention import retention_job
+from app.services.maintenance import scheduler
+from app.services.migrations import migration_runner, rebuilding as _rebuilding, status as migration_status
+from app.services.offload import run_ingest, stats as offload_stats
+from app.services.station_latest import insert_reports, mark_gps_requested, NO_GPS
+import datetime, json, re
 
 # Define IST timezone explicitly to prevent "name 'ist_tz' is not defined" error
 ist_tz = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
@@ -17,7 +27,8 @@ BUILDS_DIR = "/app/builds"
 _SAFE_COL = re.compile(r'^[a-z][a-z0-9_]{0,63}$')
 
 # Fields never treated as data columns in HealthReport model
-_SKIP_FIELDS = {"id", "reported_at"}
+# ota_delta: capability flag read by _decide_command (services/delta_ota.py), not stored
+_SKIP_FIELDS = {"id", "reported_at", "ts", "ota_delta"}
 
 # Phase 6 Fix: Strict whitelist outlaws Database Schema Poisoning
 _ALLOWED_FIELDS = {
@@ -81,39 +92,306 @@ def get_carrier_from_iccid(iccid: str) -> str:
 
 
 
+# Process-wide column cache: {table: (schema_version, frozenset(columns))}.
+# Keyed on SQLite's PRAGMA schema_version, which every ALTER TABLE bumps, so a
+# worker whose snapshot predates another worker's migration detects it on the
+# first unknown whitelisted key and re-reads the table instead of trusting a
+# stale copy (the Phase 6 multi-worker concern).
+_COLUMN_CACHE = {}
+
+
+def _schema_version(db: Session) -> int:
+    """Returns SQLite's schema cookie — changes whenever any table is altered."""
+    return db.execute(text("PRAGMA schema_version")).scalar()
+
+
 def _get_db_columns(db: Session, table: str) -> set:
     """Returns the set of column names currently in the table."""
-    inspector = sa_inspect(db.bind)
-    return {col["name"] for col in inspector.get_columns(table)}
+    rows = db.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return {row[1] for row in rows}
+
+
+def _cached_columns(db: Session, table: str) -> frozenset:
+    """Returns the column set for `table`, re-reading it only if the schema cookie moved."""
+    version = _schema_version(db)
+    cached  = _COLUMN_CACHE.get(table)
+    if cached and cached[0] == version:
+        return cached[1]
+    cols = frozenset(_get_db_columns(db, table))
+    _COLUMN_CACHE[table] = (version, cols)
+    return cols
+
+
+def warm_column_cache() -> dict:
+    """Maintenance job (every worker): re-reads the column set if another worker migrated."""
+    db = SessionLocal()
+    try:
+        return {table: len(_cached_columns(db, table)) for table in ("health_reports",)}
+    finally:
+        db.close()
 
 
 def _auto_migrate(db: Session, data: dict, table: str = "health_reports"):
     """
     For each key in `data` that does not yet exist as a column in `table`,
     auto-add the column via ALTER TABLE.
+
+    The common case (every whitelisted key already known) is answered from
+    _COLUMN_CACHE without touching the database.
     """
-    # Phase 6 Fix: Avoid python-level caching which fractures across ASGI workers.
-    # Querying SQLite directly is thread-safe and guarantees schema parity.
-    existing_cols = _get_db_columns(db, table)
-        
-    for key, val in data.items():
-        if key in _SKIP_FIELDS or key in existing_cols:
+    candidates = []
+    for key in data:
+        if key in _SKIP_FIELDS:
             continue
         if not _SAFE_COL.match(key) or key not in _ALLOWED_FIELDS:
             print(f"[AutoMigrate] Blocked unwhitelisted arbitrary column: {key!r}")
             continue
-        col_type = _infer_sql_type(key, val)
+        candidates.append(key)
+
+    cached = _COLUMN_CACHE.get(table)
+    if cached and all(key in cached[1] for key in candidates):
+        return cached[1]
+
+    # Slow path: a whitelisted key is unknown to this worker. Re-check the
+    # schema cookie (another worker may already have added it) before ALTERing.
+    existing_cols = _cached_columns(db, table)
+    missing = [key for key in candidates if key not in existing_cols]
+    if not missing:
+        return existing_cols
+
+    if _rebuilding(db, table):
+        # An online rebuild's copy only carries the columns it started with
+        print(f"[AutoMigrate] Deferred {', '.join(missing)}: {table} is being rebuilt")
+        return existing_cols
+
+    for key in missing:
+        col_type = _infer_sql_type(key, data[key])
         default  = "0" if col_type in ("INTEGER","REAL") else "''"
         try:
             db.execute(text(f"ALTER TABLE {table} ADD COLUMN {key} {col_type} DEFAULT {default}"))
             db.commit()
-            existing_cols.add(key)
             print(f"[AutoMigrate] ✅ Added column '{key}' ({col_type}) to {table}")
         except Exception as e:
+            db.rollback()
             if "duplicate" not in str(e).lower():
                 print(f"[AutoMigrate] ⚠️  Could not add column '{key}': {e}")
-            existing_cols.add(key)   # treat as existing to avoid retry loops
-    return existing_cols
+    # Refresh from the DB so the cache only ever holds columns that really exist
+    return _cached_columns(db, table)
+
+
+def _build_report_kwargs(data: dict, existing_cols, stn_id: str, now_utc) -> dict:
+    """Type-casts the whitelisted fields of one payload into HealthReport kwargs."""
+    report_kwargs = {"stn_id": stn_id, "reported_at": now_utc}
+
+    for key, val in data.items():
+        if key in _SKIP_FIELDS:
+            continue
+        if key not in existing_cols:
+            continue
+        if not _SAFE_COL.match(key):
+            continue
+        # Type-safe cast
+        try:
+            if key in _INT_FIELDS:
+                report_kwargs[key] = int(val) if val not in (None, "") else None
+            elif key in _FLOAT_FIELDS or isinstance(val, float):
+                report_kwargs[key] = float(val) if val not in (None, "") else None
+            else:
+                report_kwargs[key] = str(val) if val is not None else None
+        except (ValueError, TypeError):
+            report_kwargs[key] = None
+
+    # Override stn_id to always be uppercased
+    report_kwargs["stn_id"] = stn_id
+
+    # ── Carrier Verification / Decoding ───────────────────────────────────
+    carrier = str(data.get("carrier", "")).strip().upper()
+    iccid = str(data.get("iccid", "")).strip()
+    if carrier in ("", "NA", "SIM OK", "UNKNOWN") or "SEARCH" in carrier:
+        carrier = get_carrier_from_iccid(iccid)
+    report_kwargs["carrier"] = carrier
+
+    # Safe defaults for fields that firmware may not always send
+    report_kwargs.setdefault("spiffs_total_kb", 4640)
+    report_kwargs.setdefault("calib", "NA")
+    return report_kwargs
+
+
+def _apply_cmd_feedback(db: Session, data: dict, stn_id: str, now_utc):
+    """Marks the command the device reports as executed (last_cmd_id/last_cmd_res)."""
+    last_cmd_id = data.get("last_cmd_id")
+    last_cmd_res = data.get("last_cmd_res", "N/A")
+    if last_cmd_id and str(last_cmd_id).isdigit():
+        cmd_id_int = int(last_cmd_id)
+        if cmd_id_int > 0:
+            cmd_entry = db.query(CommandQueue).filter_by(id=cmd_id_int).first()
+            if cmd_entry:
+                cmd_entry.result = str(last_cmd_res)[:64]
+                cmd_entry.completed_at = now_utc
+                print(f"[CMD FEEDBACK] {stn_id} ID:{cmd_id_int} -> {cmd_entry.result}")
+
+
+def _apply_ota_lock(db: Session, stn_id: str, ota_fails: int) -> bool:
+    """Auto-locks OTA for a station after 3 failed attempts. Returns True if it locked it now."""
+    # Already locked (the common case for a failing station) — answered from the cache
+    if ota_fails >= 3 and not ota_cache.view(db).is_exempt(stn_id):
+        setting = db.query(StationSettings).filter_by(stn_id=stn_id).first()
+        if not setting:
+            setting = StationSettings(stn_id=stn_id, ota_exempt=1)
+            db.add(setting)
+            bump_ota_cache(db)
+            print(f"[OTA LOCK] New setting created for {stn_id}")
+            return True
+        elif setting.ota_exempt == 0:
+            setting.ota_exempt = 1
+            bump_ota_cache(db)
+            print(f"[OTA LOCK] {stn_id} locked after {ota_fails} failures")
+            return True
+    return False
+
+
+def _ota_param(db: Session, filename: str, stn_id: str) -> str:
+    """The OTA_CHECK parameter a device downloads: file, image pin, station tag."""
+    return download_param(filename, stn_id if ota_telemetry.ENABLED else None, ota_cache.view(db).pin(filename))
+
+
+def _decide_command(db: Session, data: dict, stn_id: str, now_utc, ota_locked: bool = False) -> tuple:
+    """
+    Picks the command to piggyback on the check-in response.
+    Priority: Manual CMD > OTA_CHECK > TIMED_OUT_RETRY > CLEAR_FTP_QUEUE > GET_GPS
+    ota_locked: _apply_ota_lock locked the station in this (uncommitted) check-in.
+    Returns (cmd, cmd_param, cmd_id).
+    """
+    unit_type = str(data.get("unit_type", "UNKNOWN"))
+    sys_mode  = int(data.get("system", 0))
+    ver       = str(data.get("ver", "5.00")).strip()
+
+    cmd, cmd_param = "", ""
+    pending = db.query(CommandQueue).filter_by(stn_id=stn_id, executed_at=None).first()
+    if pending:
+        cmd       = pending.cmd
+        cmd_param = pending.cmd_param
+        cmd_id    = pending.id
+        pending.executed_at = now_utc
+        print(f"[CMD] {stn_id} → {cmd} (ID:{cmd_id})")
+        if cmd == "OTA_CHECK":
+            cmd_param = _ota_param(db, cmd_param, stn_id)
+        return cmd, cmd_param, cmd_id
+
+    cmd_id = 0
+    # ── Auto-Command Priority Chain ──────────────────────────────────────
+    # Firmware targets, OTA locks and the builds listing come from the
+    # worker's snapshot (services/ota_cache.py) — no queries, no stat()
+    ota = ota_cache.view(db)
+
+    if not (ota_locked or ota.is_exempt(stn_id)):
+        target = ota.target(unit_type, sys_mode)
+        if target and needs_ota(ver, target[0]):
+            target_ver, filename = target
+            if not ota.admitted(unit_type, sys_mode, stn_id):
+                # Staged rollout (services/ota_rollout.py): not this station's wave yet
+                print(f"[OTA] {stn_id}: {ver} → {target_ver} waiting for its rollout wave")
+            elif ota.has_build(filename):
+                cmd       = "OTA_CHECK"
+                cmd_param = filename
+                # Delta OTA (services/delta_ota.py): only firmware that can apply
+                # a patch, and never again after a failed OTA on this version
+                if str(data.get("ota_delta", "")).strip() == "1" and not int(data.get("ota_fails", 0) or 0):
+                    patch = ota.patch(filename, delta_ota.ver_key(ver), delta_ota.ver_key(target_ver))
+                    if patch and ota.has_build(patch):
+                        cmd_param = patch
+                print(f"[OTA] {stn_id}: {ver} → {target_ver}{' (delta)' if cmd_param != filename else ''}")
+                # v= pin and stn= tag for /builds (services/ota_manifest.py, ota_telemetry.py)
+                cmd_param = _ota_param(db, cmd_param, stn_id)
+            else:
+                print(f"[OTA] {stn_id}: firmware file {filename} not found on disk — skipping OTA_CHECK")
+    else:
+        print(f"[OTA] {stn_id} is EXEMPT from OTA.")
+
+    # v5.57 Fix S4: Re-queue commands stuck as 'SENT' with no device feedback for 3h.
+    # Happens when device reboots mid-command (WDT, brown-out) and never sends result back.
+    # Only fires after OTA check so OTA always takes priority.
+    if not cmd:
+        three_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
+        timed_out = db.query(CommandQueue).filter(
+            CommandQueue.stn_id == stn_id,
+            CommandQueue.executed_at.isnot(None),
+            CommandQueue.completed_at.is_(None),
+            CommandQueue.result == "SENT",
+            CommandQueue.executed_at < three_hours_ago
+        ).order_by(CommandQueue.executed_at.asc()).first()
+        if timed_out:
+            print(f"[CMD RETRY] {stn_id}: Re-queuing {timed_out.cmd} ID:{timed_out.id} — no feedback in 3h")
+            cmd       = timed_out.cmd
+            cmd_param = timed_out.cmd_param or ""
+            cmd_id    = timed_out.id
+            if cmd == "OTA_CHECK":
+                cmd_param = _ota_param(db, cmd_param, stn_id)
+            timed_out.executed_at = now_utc  # Re-mark as sent now
+
+    # CLEAR_FTP_QUEUE: if backlog > 400 records (approx 4 days), server triggers a clear
+    if not cmd:
+        unsent = int(data.get("unsent_count", 0) or 0)
+        if unsent > 400:
+            cmd = "CLEAR_FTP_QUEUE"
+            print(f"[CMD] {stn_id}: FTP backlog={unsent} > 400 → CLEAR_FTP_QUEUE")
+
+    # v5.57 Fix S3: GET_GPS with 24h cooldown.
+    # Previously fired on EVERY health report if GPS was missing, causing
+    # 24 x 30-90s GPS acquisition attempts per day — draining battery on
+    # stations in no-fix locations (indoor/metal enclosure deployments).
+    # The cooldown also counts a valid fix received in the last 24h (NA on a
+    # non-GPS wakeup) and auto GET_GPS dispatches, both kept in station_gps.
+    if not cmd:
+        gps_val = str(data.get("gps", "") or "").strip()
+        if gps_val in NO_GPS:
+            last_gps = db.query(CommandQueue).filter_by(
+                stn_id=stn_id, cmd="GET_GPS"
+            ).order_by(CommandQueue.created_at.desc()).first()
+            known = db.query(StationGps).filter_by(stn_id=stn_id).first()
+            stamps = [last_gps.created_at if last_gps else None]
+            if known:
+                stamps += [known.fix_at, known.requested_at]
+            gps_elapsed = 999999
+            for stamp in stamps:
+                if stamp is None:
+                    continue
+                if hasattr(stamp, 'tzinfo') and stamp.tzinfo is not None:
+                    stamp = stamp.replace(tzinfo=None)
+                gps_elapsed = min(gps_elapsed, (datetime.datetime.utcnow() - stamp).total_seconds())
+            if gps_elapsed > 86400:  # 24h cooldown
+                cmd = "GET_GPS"
+                mark_gps_requested(db, stn_id, now_utc)
+                print(f"[CMD] {stn_id}: GPS missing ({gps_val!r}) → GET_GPS")
+            else:
+                print(f"[CMD] {stn_id}: GPS missing but fix/GET_GPS {gps_elapsed/3600:.1f}h ago — cooldown active")
+
+    return cmd, cmd_param, cmd_id
+
+
+def _json_response(resp_data: dict, status_code: int = 200) -> Response:
+    content = json.dumps(resp_data)
+    return Response(
+        content=content,
+        media_type="application/json",
+        status_code=status_code,
+        headers={"Content-Length": str(len(content))}
+    )
+
+
+def _parse_report_ts(val, now_utc):
+    """
+    Parses an optional per-report timestamp sent with backlogged reports.
+    Same format as the "tm" field the server returns ("%y%m%d%H%M%S", UTC).
+    Falls back to `now_utc` when missing, malformed, or in the future.
+    """
+    if not val:
+        return now_utc
+    try:
+        ts = datetime.datetime.strptime(str(val).strip(), "%y%m%d%H%M%S")
+    except ValueError:
+        return now_utc
+    return ts if ts <= now_utc else now_utc
 
 
 @router.post("/health")
@@ -136,183 +414,231 @@ async def health(request: Request, db: Session = Depends(get_db)):
                 media_type="application/json", status_code=400
             )
 
-        stn_id    = str(data.get("stn_id", "UNKNOWN")).strip().upper()
-        unit_type = str(data.get("unit_type", "UNKNOWN"))
-        sys_mode  = int(data.get("system", 0))
-        ver       = str(data.get("ver", "5.00")).strip()
-        ota_fails = int(data.get("ota_fails", 0))
+        # Blocking SQLAlchemy work runs on an ingest thread, never on the event loop
+        return await run_ingest(_store_report, db, data)
 
-        # ── Step 1: Auto-migrate any new columns ─────────────────────────────
-        existing_cols = _auto_migrate(db, data)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _json_response({"status": "err", "msg": str(e)[:80], "stored": False})
 
-        # ── Step 2: Build a HealthReport from all matching fields ─────────────
-        # v7.94: Store in UTC (Standard). Display filters will add +5:30 offset.
-        now_utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
-        report_kwargs = {"stn_id": stn_id, "reported_at": now_utc}
-
-        for key, val in data.items():
-            if key in _SKIP_FIELDS:
-                continue
-            if key not in existing_cols:
-                continue
-            if not _SAFE_COL.match(key):
-                continue
-            # Type-safe cast
-            try:
-                if key in _INT_FIELDS:
-                    report_kwargs[key] = int(val) if val not in (None, "") else None
-                elif key in _FLOAT_FIELDS or isinstance(val, float):
-                    report_kwargs[key] = float(val) if val not in (None, "") else None
-                else:
-                    report_kwargs[key] = str(val) if val is not None else None
-            except (ValueError, TypeError):
-                report_kwargs[key] = None
-
-        # Override stn_id to always be uppercased
-        report_kwargs["stn_id"] = stn_id
-
-        # ── Step 2.1: Carrier Verification / Decoding ─────────────────────────
-        carrier = str(data.get("carrier", "")).strip().upper()
-        iccid = str(data.get("iccid", "")).strip()
-        if carrier in ("", "NA", "SIM OK", "UNKNOWN") or "SEARCH" in carrier:
-            carrier = get_carrier_from_iccid(iccid)
-        report_kwargs["carrier"] = carrier
-
-
-        # Safe defaults for fields that firmware may not always send
-        report_kwargs.setdefault("spiffs_total_kb", 4640)
-        report_kwargs.setdefault("calib", "NA")
-
-        report = HealthReport(**report_kwargs)
-        db.add(report)
-
-        # ── Step 2.5: Command Feedback Processing ────────────────────────────
-        last_cmd_id = data.get("last_cmd_id")
-        last_cmd_res = data.get("last_cmd_res", "N/A")
-        if last_cmd_id and str(last_cmd_id).isdigit():
-            cmd_id_int = int(last_cmd_id)
-            if cmd_id_int > 0:
-                cmd_entry = db.query(CommandQueue).filter_by(id=cmd_id_int).first()
-                if cmd_entry:
-                    cmd_entry.result = str(last_cmd_res)[:64]
-                    cmd_entry.completed_at = now_utc
-                    print(f"[CMD FEEDBACK] {stn_id} ID:{cmd_id_int} -> {cmd_entry.result}")
-
-        # ── Step 3: Handle OTA Auto-Lock ──────────────────────────────────────
-        if ota_fails >= 3:
-            setting = db.query(StationSettings).filter_by(stn_id=stn_id).first()
-            if not setting:
-                setting = StationSettings(stn_id=stn_id, ota_exempt=1)
-                db.add(setting)
-                print(f"[OTA LOCK] New setting created for {stn_id}")
-            elif setting.ota_exempt == 0:
-                setting.ota_exempt = 1
-                print(f"[OTA LOCK] {stn_id} locked after {ota_fails} failures")
-
-        # ── Step 4: Command / OTA check ───────────────────────────────────────
-        cmd, cmd_param = "", ""
-        pending = db.query(CommandQueue).filter_by(stn_id=stn_id, executed_at=None).first()
-        if pending:
-            cmd       = pending.cmd
-            cmd_param = pending.cmd_param
-            cmd_id    = pending.id
-            pending.executed_at = now_utc
-            print(f"[CMD] {stn_id} → {cmd} (ID:{cmd_id})")
-        else:
-            cmd_id = 0
-            # ── Auto-Command Priority Chain ──────────────────────────────────
-            # Priority: Manual CMD > OTA_CHECK > TIMED_OUT_RETRY > CLEAR_FTP_QUEUE > GET_GPS
-            setting  = db.query(StationSettings).filter_by(stn_id=stn_id).first()
-            is_exempt = setting and setting.ota_exempt == 1
-
-            if not is_exempt:
-                fw = db.query(FirmwareRegistry).filter_by(
-                    unit_type=unit_type, system_mode=sys_mode
-                ).first()
-                if fw and needs_ota(ver, fw.current_ver):
-                    fw_path = os.path.join(BUILDS_DIR, fw.filename)
-                    if os.path.exists(fw_path):
-                        cmd       = "OTA_CHECK"
-                        cmd_param = fw.filename
-                        print(f"[OTA] {stn_id}: {ver} → {fw.current_ver}")
-                    else:
-                        print(f"[OTA] {stn_id}: firmware file {fw.filename} not found on disk — skipping OTA_CHECK")
-            else:
-                print(f"[OTA] {stn_id} is EXEMPT from OTA.")
-
-            # v5.57 Fix S4: Re-queue commands stuck as 'SENT' with no device feedback for 3h.
-            # Happens when device reboots mid-command (WDT, brown-out) and never sends result back.
-            # Only fires after OTA check so OTA always takes priority.
-            if not cmd:
-                three_hours_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=3)
-                timed_out = db.query(CommandQueue).filter(
-                    CommandQueue.stn_id == stn_id,
-                    CommandQueue.executed_at.isnot(None),
-                    CommandQueue.completed_at.is_(None),
-                    CommandQueue.result == "SENT",
-                    CommandQueue.executed_at < three_hours_ago
-                ).order_by(CommandQueue.executed_at.asc()).first()
-                if timed_out:
-                    print(f"[CMD RETRY] {stn_id}: Re-queuing {timed_out.cmd} ID:{timed_out.id} — no feedback in 3h")
-                    cmd       = timed_out.cmd
-                    cmd_param = timed_out.cmd_param or ""
-                    cmd_id    = timed_out.id
-                    timed_out.executed_at = now_utc  # Re-mark as sent now
-
-            # CLEAR_FTP_QUEUE: if backlog > 400 records (approx 4 days), server triggers a clear
-            if not cmd:
-                unsent = int(data.get("unsent_count", 0) or 0)
-                if unsent > 400:
-                    cmd = "CLEAR_FTP_QUEUE"
-                    print(f"[CMD] {stn_id}: FTP backlog={unsent} > 400 → CLEAR_FTP_QUEUE")
-
-            # v5.57 Fix S3: GET_GPS with 24h cooldown.
-            # Previously fired on EVERY health report if GPS was missing, causing
-            # 24 x 30-90s GPS acquisition attempts per day — draining battery on
-            # stations in no-fix locations (indoor/metal enclosure deployments).
-            if not cmd:
-                gps_val = str(data.get("gps", "") or "").strip()
-                if gps_val in ("NA", "0.000000,0.000000", "", "0,0"):
-                    last_gps = db.query(CommandQueue).filter_by(
-                        stn_id=stn_id, cmd="GET_GPS"
-                    ).order_by(CommandQueue.created_at.desc()).first()
-                    gps_elapsed = 999999
-                    if last_gps and last_gps.created_at:
-                        created = last_gps.created_at
-                        if hasattr(created, 'tzinfo') and created.tzinfo is not None:
-                            created = created.replace(tzinfo=None)
-                        gps_elapsed = (datetime.datetime.utcnow() - created).total_seconds()
-                    if gps_elapsed > 86400:  # 24h cooldown
-                        cmd = "GET_GPS"
-                        print(f"[CMD] {stn_id}: GPS missing ({gps_val!r}) → GET_GPS")
-                    else:
-                        print(f"[CMD] {stn_id}: GPS missing but GET_GPS sent {gps_elapsed/3600:.1f}h ago — cooldown active")
+def _store_rows(db, rows: list):
+    """
+    Hands `rows` to the write-behind queue, or inserts and commits them here
+    when it will not take them. Raises if they were not stored — the only
+    case a check-in answers "stored": false.
+    """
+    if not ingest_queue.submit(rows):
+        # Own transaction: a failing follow-up write must not take the rows back with it
+        insert_reports(db, rows)
+        db.commit()
 
 
+def _after_store(db, stn_id: str, follow_up) -> tuple:
+    """
+    Runs the check-in's follow-up writes (command feedback, OTA lock, command
+    decision) and commits; returns (cmd, cmd_param, cmd_id). The report is
+    stored by now, so a failure here only costs this check-in its command —
+    answering "stored": false would make the device resend a duplicate. A
+    command that was not marked sent stays pending for the next check-in.
+    """
+    try:
+        result = follow_up()
         db.commit()
+        return result
+    except OperationalError as e:
+        db.rollback()
+        print(f"[Health] ⚠️  {stn_id}: report stored, command step skipped ({getattr(e, 'orig', e)})")
+    except Exception:
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+        print(f"[Health] ⚠️  {stn_id}: report stored, command step failed")
+    return "", "", 0
+
 
-        resp_data = {
+def _store_report(db, data: dict):
+    """POST /health after parsing: store the row, decide the command, commit."""
+    stn_id    = str(data.get("stn_id", "UNKNOWN")).strip().upper()
+    ota_fails = int(data.get("ota_fails", 0))
+
+    # ── Step 1: Auto-migrate any new columns ─────────────────────────────
+    existing_cols = _auto_migrate(db, data)
+
+    # ── Step 2: Build a HealthReport from all matching fields ─────────────
+    # v7.94: Store in UTC (Standard). Display filters will add +5:30 offset.
+    now_utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    # Write-behind: the row is group-committed by the ingest writer task.
+    # Only the command decision below stays on the request path.
+    row = _build_report_kwargs(data, existing_cols, stn_id, now_utc)
+    _store_rows(db, [row])
+
+    def follow_up():
+        # ── Step 2.5: Command Feedback Processing ────────────────────────
+        _apply_cmd_feedback(db, data, stn_id, now_utc)
+        # ── Step 3: Handle OTA Auto-Lock ──────────────────────────────────
+        locked = _apply_ota_lock(db, stn_id, ota_fails)
+        # ── Step 4: Command / OTA check ───────────────────────────────────
+        return _decide_command(db, data, stn_id, now_utc, locked)
+
+    cmd, cmd_param, cmd_id = _after_store(db, stn_id, follow_up)
+
+    return _json_response({
+        "status": "ok",
+        "stored": True,
+        "tm": now_utc.strftime("%y%m%d%H%M%S"),
+        "cmd": cmd,
+        "p": cmd_param,
+        "id": cmd_id
+    })
+
+
+# Upper bound on reports per /health/batch call (~2 days of 15-min backlog)
+_MAX_BATCH = 200
+
+
+@router.post("/health/batch")
+async def health_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    Backlog check-in: a station that reconnects after an outage pushes all of
+    its queued health reports in ONE request instead of one POST per report.
+
+    Body: a JSON array of reports in the /health schema (or {"reports": [...]}).
+    Each report may carry "ts" ("%y%m%d%H%M%S" UTC, same format as "tm") so
+    history keeps its original timing. All rows are written with a single bulk
+    INSERT in one transaction; one command/OTA decision is returned, based on
+    the newest report.
+    """
+    try:
+        try:
+            payload = await request.json()
+        except Exception:
+            return _json_response({"status": "err", "msg": "invalid json", "stored": False}, 400)
+
+        items = payload.get("reports") if isinstance(payload, dict) else payload
+        if not isinstance(items, list) or not items:
+            return _json_response({"status": "err", "msg": "empty batch", "stored": False}, 400)
+        if len(items) > _MAX_BATCH:
+            return _json_response({"status": "err", "msg": f"batch > {_MAX_BATCH}", "stored": False}, 413)
+        if not all(isinstance(item, dict) and item for item in items):
+            return _json_response({"status": "err", "msg": "malformed report", "stored": False}, 400)
+
+        stn_ids = {str(item.get("stn_id", "UNKNOWN")).strip().upper() for item in items}
+        if len(stn_ids) != 1:
+            return _json_response({"status": "err", "msg": "mixed stn_id in batch", "stored": False}, 400)
+        stn_id = stn_ids.pop()
+        print(f"[Health] Batch of {len(items)} reports from {stn_id}")
+
+        # Blocking SQLAlchemy work runs on an ingest thread, never on the event loop
+        return await run_ingest(_store_batch, db, items, stn_id)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return _json_response({"status": "err", "msg": str(e)[:80], "stored": False})
+
+
+def _store_batch(db, items: list, stn_id: str):
+    """POST /health/batch after validation: one bulk insert, one command decision, commit."""
+    try:
+        # ── Step 1: Auto-migrate the union of keys across the batch ──────────
+        merged = {}
+        for item in items:
+            for key, val in item.items():
+                merged.setdefault(key, val)
+        existing_cols = _auto_migrate(db, merged)
+
+        # ── Step 2: Cast every report, then ONE bulk insert ───────────────────
+        now_utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        rows = [
+            _build_report_kwargs(item, existing_cols, stn_id, _parse_report_ts(item.get("ts"), now_utc))
+            for item in items
+        ]
+        # Submitted as one unit, so the whole batch lands in the same group commit
+        _store_rows(db, rows)
+
+        def follow_up():
+            # ── Step 2.5 / 3: Feedback for every report, OTA lock on the worst ─
+            for item in items:
+                _apply_cmd_feedback(db, item, stn_id, now_utc)
+            locked = _apply_ota_lock(db, stn_id, max(int(item.get("ota_fails", 0) or 0) for item in items))
+            # ── Step 4: One decision, from the newest report (ties → last sent) ─
+            newest = max(range(len(items)), key=lambda i: (rows[i]["reported_at"], i))
+            return _decide_command(db, items[newest], stn_id, now_utc, locked)
+
+        cmd, cmd_param, cmd_id = _after_store(db, stn_id, follow_up)
+
+        return _json_response({
             "status": "ok",
             "stored": True,
+            "count": len(rows),
             "tm": now_utc.strftime("%y%m%d%H%M%S"),
             "cmd": cmd,
             "p": cmd_param,
             "id": cmd_id
-        }
-        content = json.dumps(resp_data)
-        return Response(
-            content=content,
-            media_type="application/json",
-            headers={"Content-Length": str(len(content))}
-        )
+        })
+    except Exception:
+        db.rollback()
+        raise
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        content = json.dumps({"status": "err", "msg": str(e)[:80], "stored": False})
-        return Response(
-            content=content,
-            media_type="application/json",
-            headers={"Content-Length": str(len(content))}
-        )
+
+@router.get("/metrics/ingest")
+def ingest_metrics():
+    """Write-behind queue depth, group-commit batch sizes, flush latency, worker-thread use, OTA cache."""
+    return dict(ingest_queue.stats(), threads=offload_stats(), ota_cache=ota_cache.stats())
+
+
+@router.get("/metrics/eval")
+def eval_metrics(db: Session = Depends(get_db)):
+    """Stored-verdict re-score progress and rows still scored under older rules."""
+    return dict(rescorer.stats(db), stale_rows=stale_count(db))
+
+
+@router.get("/metrics/indexes")
+def index_metrics():
+    """Managed command_queue / health_reports indexes still missing, and the one building now."""
+    return indexes.status(engine)
+
+
+@router.get("/metrics/retention")
+def retention_metrics():
+    """Raw-report retention: last compaction pass, totals, and freed space."""
+    return retention_job.stats()
+
+
+@router.get("/metrics/maintenance")
+def maintenance_metrics(db: Session = Depends(get_db)):
+    """Scheduler leader, and each maintenance job's schedule, run times and last result / error."""
+    return scheduler.status(db)
+
+
+@router.get("/metrics/delta")
+def delta_metrics(db: Session = Depends(get_db)):
+    """Delta OTA: per group, each (from, to) patch with its size and compression ratio."""
+    return {"available": delta_ota.available(), "max_ratio": delta_ota.MAX_RATIO, "groups": delta_ota.report(db)}
+
+
+@router.get("/metrics/downloads")
+def download_metrics(days: int = ota_telemetry.KEEP_DAYS, stn_id: str = None, db: Session = Depends(get_db)):
+    """Firmware download telemetry: throughput / duration / resume percentiles per carrier, one station's downloads."""
+    return dict(ota_telemetry.report(db, days, stn_id), enabled=ota_telemetry.ENABLED)
+
+
+@router.get("/metrics/rollout")
+def rollout_metrics(db: Session = Depends(get_db)):
+    """Staged OTA rollouts per group: state, wave, settings, in-flight / ok / failed / timeout per wave."""
+    return {"enabled": ota_rollout.ENABLED, "rollouts": ota_rollout.status(db)}
+
+
+@router.get("/metrics/builds")
+def build_metrics(db: Session = Depends(get_db)):
+    """Content-addressed firmware store: builds recorded, objects kept, each group's current hash."""
+    return build_store.report(db, BUILDS_DIR)
+
+
+@router.get("/metrics/migrations")
+def migration_metrics():
+    """Applied / pending schema migrations and online table-rebuild progress."""
+    return dict(migration_runner.stats(), migrations=migration_status(engine))
@@ -2,13 +2,17 @@ from fastapi import APIRouter, Request, Form, File, UploadFile, Depends
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import SessionLocal
-from app.models import FirmwareRegistry, HealthReport, CommandQueue
+from app.database import SessionLocal, ReadSessionLocal
+from app.models import FirmwareRegistry, HealthReport, CommandQueue, OtaPatch
 from app.services.health_eval import ist_filter
 from app.services.ota_service import get_numeric_ver
-from app.services.ota_service import get_numeric_ver
-import os, shutil, re
+from app.services.station_latest import latest_reports_query
+from app.services.offload import run_read
+from app.services.ota_cache import bump as bump_ota_cache
+from app.services.firmware_store import firmware_store
+from app.services import ota_manifest, ota_encoding, delta_ota, ota_rollout, ota_telemetry, build_store
+from app.services.maintenance import scheduler
+import os, re
 from fastapi import HTTPException
 
 router    = APIRouter()
@@ -27,27 +31,45 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 @router.get("/ota")
-async def ota_page(request: Request, db: Session = Depends(get_db)):
+async def ota_page(request: Request, db: Session = Depends(get_read_db)):
+    return await run_read(_render_ota, request, db)
+
+
+def _render_ota(request: Request, db: Session):
     try:
         fws = db.query(FirmwareRegistry).order_by(FirmwareRegistry.category_id).all()
+        rollouts = ota_rollout.status(db)
         for fw in fws:
             # Count stations in this group and how many are on the target version
             stations = (
-                db.query(HealthReport.stn_id, func.max(HealthReport.reported_at), HealthReport.ver)
-                .filter_by(unit_type=fw.unit_type, system=fw.system_mode)
-                .group_by(HealthReport.stn_id)
+                latest_reports_query(db)
+                .with_entities(HealthReport.stn_id, HealthReport.ver)
+                .filter(HealthReport.unit_type == fw.unit_type,
+                        HealthReport.system == fw.system_mode)
                 .all()
             )
             fw.total_stations = len(stations)
             fw.converted = sum(
                 1 for s in stations
-                if s[2] and get_numeric_ver(s[2]) >= get_numeric_ver(fw.current_ver)
+                if s.ver and get_numeric_ver(s.ver) >= get_numeric_ver(fw.current_ver)
             )
             # Check if file exists in builds folder
             dest = os.path.join(BUILDS_DIR, f"FW_S{fw.category_id}_{fw.unit_type}.bin")
             fw.file_exists = os.path.exists(dest)
-        return templates.TemplateResponse(request, "ota.html", {"request": request, "fws": fws})
+            fw.rollout = rollouts.get(fw.category_id)
+            fw.patches = db.query(OtaPatch).filter_by(category_id=fw.category_id).order_by(OtaPatch.from_ver).all()
+            fw.builds = build_store.history(db, fw.category_id)
+        downloads = ota_telemetry.report(db)
+        return templates.TemplateResponse(request, "ota.html", {"request": request, "fws": fws, "downloads": downloads})
     except Exception as e:
         return {"OTA Error": str(e)}
 
@@ -62,6 +84,7 @@ async def ota_upload(
     """Set a new target version for a firmware group and optionally upload the .bin."""
     fw = db.query(FirmwareRegistry).filter_by(category_id=cat_id).first()
     if fw:
+        old_ver = fw.current_ver
         fw.current_ver = ver
         # Always set the canonical filename, even without an upload
         fw_filename = f"FW_S{cat_id}_{fw.unit_type}.bin"
@@ -70,22 +93,49 @@ async def ota_upload(
             os.makedirs(BUILDS_DIR, exist_ok=True)
             dest = os.path.join(BUILDS_DIR, fw_filename)
             tmp  = dest + ".tmp"
-            with open(tmp, "wb") as b:
-                size = 0
-                while True:
-                    chunk = await file.read(64 * 1024)
-                    if not chunk:
-                        break
-                    size += len(chunk)
-                    if size > 2.5 * 1024 * 1024:
-                        b.close()
-                        if os.path.exists(tmp): os.remove(tmp)
-                        raise HTTPException(status_code=413, detail="Payload too large. Max 2.5MB strict ceiling.")
-                    b.write(chunk)
-            shutil.move(tmp, dest)  # Atomic rename — safe even if upload fails mid-way
-        
+            # One pass: temp file + SHA-256 / MD5 / chunk CRCs (services/build_store.py)
+            hasher = await build_store.receive(file, tmp)
+            if hasher is None:
+                raise HTTPException(status_code=413, detail="Payload too large. Max 2.5MB strict ceiling.")
+            manifest = hasher.manifest(fw_filename)
+            delta_ota.archive(dest, old_ver)    # stations still on it get a patch from it
+            # Stored under its hash (dropped if those bytes are there already), then the
+            # group's filename is pointed at it — an atomic rename, safe mid-download
+            fw.sha256, _ = build_store.store(tmp, manifest, BUILDS_DIR)
+            build_store.point(dest, fw.sha256, BUILDS_DIR)
+            build_store.record(db, fw.sha256, manifest["size"], fw_filename, ver, category_id=cat_id)
+            delta_ota.archive(dest, ver, replace=True)
+
         fw.filename = fw_filename
+        delta_ota.discard(db, cat_id)       # patches to the previous target
+        ota_rollout.start(db, fw)           # stations get the new target wave by wave
+        bump_ota_cache(db)
+        db.commit()
+        # Patches to the new target are built off the request path; first wave admitted now
+        scheduler.trigger("delta_patches")
+        scheduler.trigger("ota_rollout")
+    return RedirectResponse(url="/ota", status_code=303)
+
+
+@router.post("/ota/rollback/{cat_id}")
+async def ota_rollback(
+    cat_id:   int,
+    build_id: int     = Form(...),
+    db:       Session = Depends(get_db)
+):
+    """Point the group back at an earlier build: target version and image, no re-upload."""
+    fw = db.query(FirmwareRegistry).filter_by(category_id=cat_id).first()
+    if fw and fw.filename:
+        delta_ota.archive(os.path.join(BUILDS_DIR, fw.filename), fw.current_ver)
+    fw = build_store.rollback(db, cat_id, build_id, BUILDS_DIR)
+    if fw:
+        delta_ota.archive(os.path.join(BUILDS_DIR, fw.filename), fw.current_ver, replace=True)
+        delta_ota.discard(db, cat_id)
+        ota_rollout.start(db, fw)
+        bump_ota_cache(db)
         db.commit()
+        scheduler.trigger("delta_patches")
+        scheduler.trigger("ota_rollout")
     return RedirectResponse(url="/ota", status_code=303)
 
 
@@ -102,13 +152,45 @@ async def ota_delete(
     fw = db.query(FirmwareRegistry).filter_by(category_id=cat_id).first()
     if fw:
         fw.current_ver = ""
+        fw.sha256      = None       # the stored build stays: rollback can bring it back
         dest = os.path.join(BUILDS_DIR, f"FW_S{cat_id}_{fw.unit_type}.bin")
         if os.path.exists(dest):
             os.remove(dest)
+        firmware_store.invalidate(dest)
+        ota_manifest.remove(dest)
+        ota_encoding.remove(dest)
+        delta_ota.discard(db, cat_id)
+        ota_rollout.stop(db, cat_id)
+        bump_ota_cache(db)
         db.commit()
     return RedirectResponse(url="/ota", status_code=303)
 
 
+@router.post("/ota/rollout/{cat_id}")
+async def ota_rollout_settings(
+    cat_id:          int,
+    wave_size:       int   = Form(ota_rollout.WAVE_SIZE),
+    max_inflight:    int   = Form(ota_rollout.MAX_INFLIGHT),
+    order_by:        str   = Form(ota_rollout.ORDER_BY),
+    pause_fail_rate: float = Form(ota_rollout.PAUSE_FAIL_RATE),
+    db:              Session = Depends(get_db)
+):
+    """Wave size / in-flight cap / order / auto-pause threshold; starts a rollout if the group has none."""
+    if ota_rollout.configure(db, cat_id, wave_size, max_inflight, order_by, pause_fail_rate):
+        db.commit()
+        scheduler.trigger("ota_rollout")
+    return RedirectResponse(url="/ota", status_code=303)
+
+
+@router.post("/ota/rollout/{cat_id}/{action}")
+async def ota_rollout_pause(cat_id: int, action: str, db: Session = Depends(get_db)):
+    """Pause or resume a group's rollout."""
+    if action in ("pause", "resume") and ota_rollout.set_paused(db, cat_id, action == "pause"):
+        db.commit()
+        scheduler.trigger("ota_rollout")
+    return RedirectResponse(url="/ota", status_code=303)
+
+
 @router.post("/station/{stn_id}/ota")
 async def station_individual_ota(
     stn_id: str,
@@ -124,22 +206,16 @@ async def station_individual_ota(
     filename = f"FW_CUSTOM_{stn_id}.bin"
     dest     = os.path.join(BUILDS_DIR, filename)
     tmp      = dest + ".tmp"
-    
-    with open(tmp, "wb") as b:
-        size = 0
-        while True:
-            chunk = await file.read(64 * 1024)
-            if not chunk:
-                break
-            size += len(chunk)
-            if size > 2.5 * 1024 * 1024:
-                b.close()
-                if os.path.exists(tmp): os.remove(tmp)
-                raise HTTPException(status_code=413, detail="Payload too large. Max 2.5MB strict ceiling.")
-            b.write(chunk)
-            
-    shutil.move(tmp, dest)
+
+    hasher = await build_store.receive(file, tmp)
+    if hasher is None:
+        raise HTTPException(status_code=413, detail="Payload too large. Max 2.5MB strict ceiling.")
+    manifest = hasher.manifest(filename)
+    sha, _   = build_store.store(tmp, manifest, BUILDS_DIR)
+    build_store.point(dest, sha, BUILDS_DIR)
+    build_store.record(db, sha, manifest["size"], filename, ver, stn_id=stn_id)
     # Queue an OTA command specifically for this station
     db.add(CommandQueue(stn_id=stn_id, cmd="OTA_CHECK", cmd_param=filename))
+    bump_ota_cache(db)      # new file in BUILDS_DIR
     db.commit()
     return RedirectResponse(url=f"/station/{stn_id}", status_code=303)
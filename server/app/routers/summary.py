@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Request, Depends
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import SessionLocal
+from app.database import ReadSessionLocal
 from app.models import HealthReport, FirmwareRegistry
-from app.services.health_eval import ist_filter, evaluate
+from app.services.health_eval import ist_filter, evaluate_stored
 from app.services.ota_service import get_numeric_ver
+from app.services.station_latest import latest_reports_query
+from app.services.offload import run_read
+from app.services.maintenance import scheduler
 import datetime, os
 BUILDS_DIR = "/app/builds"
 
@@ -17,7 +19,8 @@ templates.env.filters["ist"] = ist_filter
 
 
 def get_db():
-    db = SessionLocal()
+    # /summary and /help only read — use the read-only pool
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -34,6 +37,10 @@ async def fleet_summary(request: Request, db: Session = Depends(get_db)):
       - Health breakdown (OK / FAIL counts)
       - Last active station in each group
     """
+    return await run_read(_render_summary, request, db)
+
+
+def _render_summary(request: Request, db: Session):
     try:
         fws = db.query(FirmwareRegistry).all()
         
@@ -59,25 +66,18 @@ async def fleet_summary(request: Request, db: Session = Depends(get_db)):
 
             fw.file_exists = os.path.exists(os.path.join(BUILDS_DIR, f"FW_S{fw.category_id}_{fw.unit_type}.bin"))
 
-            # Get latest report per station within this group
-            subq = (
-                db.query(HealthReport.stn_id, func.max(HealthReport.reported_at).label("m"))
+            # Latest report of every station currently reporting in this group
+            latest_reports = (
+                latest_reports_query(db)
                 .filter(HealthReport.unit_type == fw.unit_type,
                         HealthReport.system == fw.system_mode)
-                .group_by(HealthReport.stn_id)
-                .subquery()
-            )
-            latest_reports = (
-                db.query(HealthReport)
-                .join(subq, (HealthReport.stn_id == subq.c.stn_id) &
-                      (HealthReport.reported_at == subq.c.m))
                 .order_by(HealthReport.reported_at.desc())
                 .all()
             )
 
             now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
             for r in latest_reports:
-                r.eval = evaluate(r, now) # Populate server evaluation
+                r.eval = evaluate_stored(r, now) # Populate server evaluation
                 if r.reported_at:
                     delta = now - r.reported_at
                     mins = int(delta.total_seconds() / 60)
@@ -124,3 +124,10 @@ async def fleet_summary(request: Request, db: Session = Depends(get_db)):
 async def help_page(request: Request):
     """Static help and legend page."""
     return templates.TemplateResponse(request, "help.html", {"request": request})
+
+
+@router.get("/maintenance")
+async def maintenance_page(request: Request, db: Session = Depends(get_db)):
+    """Maintenance scheduler status: leader, job schedule, run times, last errors."""
+    status = await run_read(scheduler.status, db)
+    return templates.TemplateResponse(request, "maintenance.html", {"request": request, "status": status})
@@ -0,0 +1,261 @@
+"""
+build_store.py — Content-addressed firmware store
+=================================================
+/ota/upload overwrote FW_S<cat>_<unit>.bin in place. The build it replaced
+survived only as a delta_ota archive link under its version string,
+re-uploading bytes the server already had hashed and encoded them again, and
+going back to last week's build meant finding the old .bin and uploading it
+once more.
+
+Every image is now stored once, under its SHA-256:
+
+    BUILDS_DIR/objects/<sha[:2]>/<sha>.bin     (+ its .manifest.json / .hs / .hs.json)
+
+and the names devices fetch are aliases, each a copy of one object:
+
+    FW_S5_KSNDMC_TRG.bin   = objects/3f/3f9c….bin     firmware_registry.sha256
+    FW_CUSTOM_KA1234.bin   = objects/a0/a04e….bin
+
+/builds, firmware_store and the sidecar stamps work on the alias as before.
+An alias never shares an inode with its object (no hard links): deploy
+scripts (scp, docker cp) overwrite FW_*.bin in place, and through a link
+that would rewrite the stored build too. An alias costs one extra copy of
+its current image (2.5 MB at most); the history is stored once.
+
+Upload (receive() + store()): the request body is written to a temp file
+and fed to ota_manifest.Hasher in the same pass — SHA-256, MD5, image and
+chunk CRC32s are done when the last byte lands, nothing is read back to
+hash. Bytes already in the store are not kept twice: the temp file is
+dropped and the object, manifest and heatshrink variant reused as they are.
+Every upload is an ota_builds row (group or station, version, hash).
+
+point() swaps an alias to another object: it reads the object, checks that
+the bytes still hash to its name (and refuses if not), writes them to a temp
+name and renames that over the alias, sidecars first — no hashing of chunks
+or heatshrink encoding. rollback() is that plus the group's target version and hash, so the rollout
+and delta patches follow as after an upload. A station already running the
+newer version keeps it (needs_ota only moves stations up); the rollback
+stops the build from reaching anyone else.
+
+Images that reached BUILDS_DIR some other way (deployed before this
+existed, copied in by a deploy script) are adopted by the leader job
+"build_store": copied into objects/ and recorded as a build.
+Objects are never deleted: /ota/delete removes the alias, and the history
+is what rollback works from. Each group's last BUILD_HISTORY_SHOWN builds
+(with a rollback button) are on /ota; GET /metrics/builds has the totals.
+"""
+
+import hashlib, os, shutil
+
+from app.models import FirmwareRegistry, OtaBuild
+from app.services import ota_encoding, ota_manifest
+from app.services.firmware_store import firmware_store
+
+BUILDS_DIR    = "/app/builds"
+OBJECTS       = "objects"
+MAX_UPLOAD    = int(2.5 * 1024 * 1024)
+READ_SIZE     = 64 * 1024
+INTERVAL_H    = float(os.getenv("BUILD_STORE_INTERVAL_H", "1"))
+HISTORY_SHOWN = int(os.getenv("BUILD_HISTORY_SHOWN", "5"))      # builds per group on /ota
+
+
+def object_path(sha256: str, builds_dir: str = BUILDS_DIR) -> str:
+    return os.path.join(builds_dir, OBJECTS, sha256[:2], f"{sha256}.bin")
+
+
+def _alias(name: str) -> bool:
+    return name.startswith("FW_") and ota_encoding.applies(name)
+
+
+def _tmp(dest: str) -> str:
+    return f"{dest}.{os.getpid()}.tmp"
+
+
+def _write(dest: str, data) -> str:
+    """Writes `data` to a temp file next to `dest`; returns its path for the caller to rename."""
+    tmp = _tmp(dest)
+    with open(tmp, "wb") as f:
+        f.write(data)
+    return tmp
+
+
+def _copy(src: str, dest: str):
+    """Atomically replaces `dest` with a copy of `src` (its own inode)."""
+    tmp = _tmp(dest)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def receive(upload, tmp: str, limit: int = MAX_UPLOAD):
+    """
+    Streams an UploadFile to `tmp`, hashing as it goes. Returns the
+    ota_manifest.Hasher, or None (temp file removed) past `limit` bytes.
+    """
+    hasher = ota_manifest.Hasher()
+    with open(tmp, "wb") as f:
+        while True:
+            chunk = await upload.read(READ_SIZE)
+            if not chunk:
+                break
+            if hasher.size + len(chunk) > limit:
+                f.close()
+                _remove(tmp)
+                return None
+            f.write(chunk)
+            hasher.update(chunk)
+    return hasher
+
+
+def store(tmp: str, manifest: dict, builds_dir: str = BUILDS_DIR) -> tuple:
+    """
+    Moves the uploaded temp file into the store (or drops it: already there).
+    An object whose bytes no longer match its name is replaced by the upload.
+    Returns (sha256, new).
+    """
+    sha = manifest["sha256"]
+    obj = object_path(sha, builds_dir)
+    if os.path.exists(obj) and _sha256(obj) == sha:
+        _remove(tmp)
+        return sha, False
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    os.replace(tmp, obj)
+    ota_manifest.write(obj, dict(manifest, file=os.path.basename(obj)))
+    ota_encoding.write_for(obj)     # heatshrink variant, once per object
+    return sha, True
+
+
+def point(alias: str, sha256: str, builds_dir: str = BUILDS_DIR):
+    """
+    Makes the image at `alias` a copy of the stored object `sha256`, sidecars
+    included. Raises ValueError if the object no longer hashes to its name.
+    """
+    obj = object_path(sha256, builds_dir)
+    with open(obj, "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != sha256:
+        raise ValueError(f"object {sha256[:12]} no longer matches its SHA-256")
+    manifest = ota_manifest.load(obj, data)
+    index    = ota_encoding.load(obj, data)
+    tmp      = _write(alias, data)
+    # Sidecars first, stamped from the temp copy: they match the alias once the rename lands
+    ota_manifest.write(alias, dict(manifest, file=os.path.basename(alias)), like=tmp)
+    if index is not None:
+        if index["used"]:
+            _copy(ota_encoding.variant_path(obj), ota_encoding.variant_path(alias))
+        else:
+            _remove(ota_encoding.variant_path(alias))
+        ota_encoding.write_index(alias, index, like=tmp)
+    os.replace(tmp, alias)
+    firmware_store.invalidate(alias)
+
+
+def record(db, sha256: str, size: int, filename: str, ver: str, category_id: int = None,
+           stn_id: str = None, source: str = "upload") -> OtaBuild:
+    build = OtaBuild(sha256=sha256, size=size, filename=filename, ver=ver or "",
+                     category_id=category_id, stn_id=stn_id, source=source)
+    db.add(build)
+    return build
+
+
+def history(db, category_id: int, limit: int = HISTORY_SHOWN) -> list:
+    """The group's builds, newest first — one row per distinct (hash, version)."""
+    seen, out = set(), []
+    for b in (db.query(OtaBuild).filter_by(category_id=category_id)
+              .order_by(OtaBuild.id.desc()).limit(limit * 4)):
+        if (b.sha256, b.ver) not in seen:
+            seen.add((b.sha256, b.ver))
+            out.append(b)
+    return out[:limit]
+
+
+def rollback(db, category_id: int, build_id: int, builds_dir: str = BUILDS_DIR):
+    """
+    Points the group's image back at an earlier build: alias flip, target
+    version and hash. Returns the FirmwareRegistry row, or None if the build
+    is not the group's, or its object is gone or no longer matches its hash.
+    Caller commits.
+    """
+    fw    = db.get(FirmwareRegistry, category_id)
+    build = db.get(OtaBuild, build_id)
+    if fw is None or build is None or build.category_id != category_id \
+            or not os.path.exists(object_path(build.sha256, builds_dir)):
+        return None
+    old_ver = fw.current_ver
+    try:
+        point(os.path.join(builds_dir, build.filename), build.sha256, builds_dir)
+    except ValueError as e:
+        print(f"[Builds] ✗ S{category_id} rollback to {build.ver} refused: {e}")
+        return None
+    fw.current_ver, fw.sha256, fw.filename = build.ver, build.sha256, build.filename
+    print(f"[Builds] S{category_id} rolled back {old_ver} → {build.ver} ({build.sha256[:12]})")
+    return fw
+
+
+def adopt(db, builds_dir: str = BUILDS_DIR) -> dict:
+    """Leader job: copies aliases not backed by an object yet into the store and records them."""
+    totals = {"aliases": 0, "adopted": 0, "stored": 0}
+    if not os.path.isdir(builds_dir):
+        return totals
+    groups = {f"FW_S{fw.category_id}_{fw.unit_type}.bin": fw for fw in db.query(FirmwareRegistry)}
+    for name in sorted(os.listdir(builds_dir)):
+        path = os.path.join(builds_dir, name)
+        if not _alias(name) or not os.path.isfile(path):
+            continue
+        totals["aliases"] += 1
+        manifest = ota_manifest.load(path)      # the sidecar, normally: no hashing
+        sha      = manifest["sha256"]
+        obj      = object_path(sha, builds_dir)
+        fw       = groups.get(name)
+        if not os.path.exists(obj):
+            with open(path, "rb") as f:
+                data = f.read()
+            if hashlib.sha256(data).hexdigest() != sha:
+                continue                        # rewritten since its manifest was read: next pass
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            os.replace(_write(obj, data), obj)
+            ota_manifest.write(obj, dict(manifest, file=os.path.basename(obj)))
+            ota_encoding.load(obj, data)
+            totals["stored"] += 1
+        if fw is not None and fw.sha256 != sha:
+            fw.sha256 = sha
+        if db.query(OtaBuild.id).filter_by(filename=name, sha256=sha).first() is None:
+            stn_id = name[len("FW_CUSTOM_"):-len(".bin")] if name.startswith("FW_CUSTOM_") else None
+            record(db, sha, manifest["size"], name, fw.current_ver if fw is not None else "",
+                   category_id=fw.category_id if fw is not None else None, stn_id=stn_id, source="adopted")
+            totals["adopted"] += 1
+            print(f"[Builds] Adopted {name} as {sha[:12]}")
+    return totals
+
+
+def report(db, builds_dir: str = BUILDS_DIR) -> dict:
+    """Store size vs what the builds would take as separate files (GET /metrics/builds)."""
+    objects, stored = 0, 0
+    for root, _, files in os.walk(os.path.join(builds_dir, OBJECTS)):
+        for name in files:
+            if name.endswith(".bin"):
+                objects += 1
+                stored  += os.path.getsize(os.path.join(root, name))
+    builds = db.query(OtaBuild).all()
+    return {
+        "builds": len(builds),
+        "objects": objects,
+        "stored_kb": round(stored / 1024, 1),
+        "uploaded_kb": round(sum(b.size or 0 for b in builds) / 1024, 1),
+        "groups": {fw.category_id: {"ver": fw.current_ver, "sha256": fw.sha256}
+                   for fw in db.query(FirmwareRegistry).order_by(FirmwareRegistry.category_id)},
+    }
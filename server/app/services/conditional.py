@@ -0,0 +1,77 @@
+"""
+conditional.py — Validators and conditional requests (RFC 9110 §13)
+===================================================================
+Shared by /builds (strong ETag from the manifest's SHA-256, written at
+upload) and /csv/summary (a validator over the fleet's latest reports).
+
+    not_modified(request, etag, last_modified)
+        GET / HEAD: If-None-Match (weak comparison, "*" matches) decides when
+        present; otherwise If-Modified-Since against Last-Modified.
+    range_still_valid(request, etag)
+        If-Range: the entity tag must match strongly; no If-Range header =
+        valid. When it fails the Range is ignored and the whole current
+        representation is sent, so a client resuming against a replaced file
+        restarts instead of stitching two files together. A date never
+        matches: with one-second resolution it can't tell apart two uploads
+        in the same second, and a restart is cheaper than a mixed image.
+
+last_modified is a POSIX timestamp, compared floored to whole seconds.
+"""
+
+import email.utils
+
+
+def http_date(ts: float) -> str:
+    return email.utils.formatdate(int(ts), usegmt=True)
+
+
+def parse_http_date(value: str):
+    """POSIX seconds for an HTTP date, or None if it does not parse."""
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return parsed.timestamp() if parsed.tzinfo else None
+
+
+def _tags(header: str) -> list:
+    return [t.strip() for t in header.split(",") if t.strip()]
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def validators(etag: str = None, last_modified: float = None) -> dict:
+    """ETag / Last-Modified response headers."""
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(request, etag: str = None, last_modified: float = None) -> bool:
+    """True if a GET / HEAD can be answered 304 Not Modified."""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    inm = request.headers.get("If-None-Match")
+    if inm is not None:
+        if not etag:
+            return False
+        return any(t == "*" or _opaque(t) == _opaque(etag) for t in _tags(inm))
+    ims = request.headers.get("If-Modified-Since")
+    if ims is None or last_modified is None:
+        return False
+    since = parse_http_date(ims)
+    return since is not None and int(last_modified) <= since
+
+
+def range_still_valid(request, etag: str = None) -> bool:
+    """False if If-Range no longer matches (send the full representation)."""
+    value = (request.headers.get("If-Range") or "").strip()
+    if not value:
+        return True
+    # Strong comparison: weak tags and dates never match
+    return bool(etag) and value.startswith('"') and not etag.startswith("W/") and value == etag
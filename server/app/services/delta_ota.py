@@ -0,0 +1,226 @@
+"""
+delta_ota.py — Binary patches between firmware versions
+=======================================================
+Every OTA pulled the full ~1.5 MB image over 2G, even though two releases
+of the same configuration share almost all of their bytes. A patch from the
+version a station runs to the group's new target is usually a few percent
+of that — fewer Range requests, fewer chances for a download to die.
+
+Archive: the image uploaded through /ota/upload is also kept as
+
+    BUILDS_DIR/archive/<stem>@<ver>.bin       (a copy, not served)
+
+and the image it replaces is archived under the old target version first.
+Groups deployed before this existed get their current image archived on
+the first refresh().
+
+Patches: refresh() takes the versions each group's stations report (their
+latest health_reports row) and, for every older version with an archived
+image, builds
+
+    <stem>_<from>-<to>.patch.bin              detools sequential patch, heatshrink
+
+— the format esp_delta_ota applies on the device. It lives in BUILDS_DIR,
+so /builds serves it with the usual Range / manifest handling. A patch
+larger than DELTA_MAX_RATIO of the image is not kept. Each (image, from, to)
+gets an ota_patches row with both sizes (the ratio on /ota and
+GET /metrics/delta); patches for an older target are deleted. Runs in the
+background after an upload and as the leader job "delta_patches" (versions
+appear in the fleet over time).
+
+OTA_CHECK hands out the patch only to a station that reports
+"ota_delta": 1 (its firmware can apply one) with no OTA failures on its
+current version. A patch built against different bytes (a custom build
+with the same version string) fails verification once, ota_fails goes up,
+and the next check-in gets the full image.
+
+detools is optional: without it no patches are built and every station
+gets the full image.
+"""
+
+import os, shutil, time
+
+from app.models import FirmwareRegistry, HealthReport, OtaPatch
+from app.services import ota_manifest
+from app.services.firmware_store import firmware_store
+from app.services.ota_cache import bump
+from app.services.ota_service import get_numeric_ver, needs_ota
+from app.services.station_latest import latest_reports_query
+
+try:
+    import detools
+except ImportError:   # optional dependency
+    detools = None
+
+BUILDS_DIR  = "/app/builds"
+MAX_RATIO   = float(os.getenv("DELTA_MAX_RATIO", "0.6"))
+COMPRESSION = "heatshrink"      # what esp_delta_ota decompresses on the device
+
+
+def available() -> bool:
+    return detools is not None
+
+
+def ver_key(ver):
+    """'5.82' / 'KSNDMC-5.82' / '5.82-TRG' → '5.82' (the needs_ota parse); None without a version."""
+    major, minor = get_numeric_ver(ver)
+    return None if major < 0 else f"{major}.{minor}"
+
+
+def _stem(filename: str) -> str:
+    return filename[:-4] if filename.endswith(".bin") else filename
+
+
+def archive_path(image: str, ver) -> str:
+    """Where version `ver` of the image at path `image` is kept."""
+    folder, filename = os.path.split(image)
+    return os.path.join(folder, "archive", f"{_stem(filename)}@{ver_key(ver)}.bin")
+
+
+def patch_name(filename: str, from_ver: str, to_ver: str) -> str:
+    return f"{_stem(filename)}_{from_ver}-{to_ver}.patch.bin"
+
+
+def archive(path: str, ver, replace: bool = False) -> bool:
+    """
+    Keeps the image at `path` as version `ver`. replace=False leaves an
+    existing archive alone (the image being replaced at upload);
+    replace=True records a re-upload of the same version.
+    """
+    if ver_key(ver) is None or not os.path.exists(path):
+        return False
+    dest = archive_path(path, ver)
+    if os.path.exists(dest) and not replace:
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    # A copy, not a link: a deploy script rewriting the image in place must not change the archive
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, dest)
+    return True
+
+
+def build_patch(base: str, image: str, dest: str) -> int:
+    """Writes the base → image patch to dest (atomic); returns its size."""
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    with open(base, "rb") as ffrom, open(image, "rb") as fto, open(tmp, "wb") as fpatch:
+        detools.create_patch(ffrom, fto, fpatch, compression=COMPRESSION)
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
+
+
+def _remove_file(builds_dir: str, name: str):
+    path = os.path.join(builds_dir, name)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    ota_manifest.remove(path)
+    firmware_store.invalidate(path)
+
+
+def discard(db, category_id: int, builds_dir: str = BUILDS_DIR) -> int:
+    """Deletes every patch of a group (new target uploaded, or the target reverted)."""
+    rows = db.query(OtaPatch).filter_by(category_id=category_id).all()
+    for row in rows:
+        if row.patch_file:
+            _remove_file(builds_dir, row.patch_file)
+        db.delete(row)
+    if rows:
+        bump(db)
+    return len(rows)
+
+
+def _fleet_versions(db, fw) -> set:
+    rows = (latest_reports_query(db)
+            .with_entities(HealthReport.ver)
+            .filter(HealthReport.unit_type == fw.unit_type, HealthReport.system == fw.system_mode)
+            .distinct())
+    return {ver_key(ver) for (ver,) in rows} - {None}
+
+
+def refresh(db, category_id: int = None, builds_dir: str = BUILDS_DIR) -> dict:
+    """
+    Brings the patches of one group (or all) up to date. Patches are built
+    before anything is written, so the SQLite write lock is only held for
+    the final row changes, not for the diffing.
+    """
+    totals = {"built": 0, "skipped": 0, "removed": 0, "no_base": 0}
+    query  = db.query(FirmwareRegistry)
+    if category_id is not None:
+        query = query.filter_by(category_id=category_id)
+    new_rows, stale = [], []
+
+    for fw in query.all():
+        to_key = ver_key(fw.current_ver)
+        image  = os.path.join(builds_dir, fw.filename) if fw.filename else None
+        rows   = db.query(OtaPatch).filter_by(category_id=fw.category_id).all()
+        keep   = {}
+        for row in rows:
+            if (row.to_ver == to_key and row.filename == fw.filename
+                    and (row.patch_file is None or os.path.exists(os.path.join(builds_dir, row.patch_file)))):
+                keep[row.from_ver] = row
+            else:
+                stale.append(row)
+        if detools is None or to_key is None or image is None or not os.path.isfile(image):
+            continue
+        archive(image, fw.current_ver)
+
+        for from_key in sorted(_fleet_versions(db, fw)):
+            if from_key in keep or not needs_ota(from_key, fw.current_ver):
+                continue
+            base = archive_path(image, from_key)
+            if not os.path.exists(base):
+                totals["no_base"] += 1
+                continue
+            name = patch_name(fw.filename, from_key, to_key)
+            dest = os.path.join(builds_dir, name)
+            t0   = time.perf_counter()
+            size = build_patch(base, image, dest)
+            full = os.path.getsize(image)
+            if size > MAX_RATIO * full:
+                # Not worth it: keep the row (and its ratio) so it is not rebuilt every pass
+                _remove_file(builds_dir, name)
+                name = None
+                totals["skipped"] += 1
+            else:
+                ota_manifest.write_for(dest)
+                totals["built"] += 1
+            new_rows.append(OtaPatch(category_id=fw.category_id, filename=fw.filename, from_ver=from_key,
+                                     to_ver=to_key, patch_file=name, image_size=full, patch_size=size,
+                                     seconds=round(time.perf_counter() - t0, 3)))
+            print(f"[Delta] S{fw.category_id} {from_key} → {to_key}: {size // 1024} KB of {full // 1024} KB "
+                  f"({size / full:.1%}){'' if name else ' — over DELTA_MAX_RATIO, full image instead'}")
+
+    rebuilt = {row.patch_file for row in new_rows}
+    for row in stale:
+        if row.patch_file and row.patch_file not in rebuilt:
+            _remove_file(builds_dir, row.patch_file)
+        db.delete(row)
+    db.flush()      # deletes first: a rebuilt pair reuses the unique key
+    db.add_all(new_rows)
+    totals["removed"] = len(stale)
+    if stale or new_rows:
+        bump(db)
+    return totals
+
+
+def report(db) -> list:
+    """Per group: the target and every patch with its size and compression ratio."""
+    groups = []
+    for fw in db.query(FirmwareRegistry).order_by(FirmwareRegistry.category_id):
+        rows = (db.query(OtaPatch).filter_by(category_id=fw.category_id)
+                .order_by(OtaPatch.from_ver).all())
+        patches = [{
+            "from_ver": r.from_ver, "to_ver": r.to_ver, "patch_file": r.patch_file,
+            "image_kb": round(r.image_size / 1024, 1), "patch_kb": round(r.patch_size / 1024, 1),
+            "ratio": round(r.patch_size / r.image_size, 4) if r.image_size else None,
+            "used": r.patch_file is not None, "build_seconds": r.seconds,
+        } for r in rows]
+        used = [p for p in patches if p["used"]]
+        groups.append({
+            "category_id": fw.category_id, "unit_type": fw.unit_type, "system_mode": fw.system_mode,
+            "target_ver": fw.current_ver, "patches": patches,
+            "mean_ratio": round(sum(p["ratio"] for p in used) / len(used), 4) if used else None,
+        })
+    return groups
@@ -0,0 +1,161 @@
+"""
+eval_store.py — Stored health verdicts on health_reports
+=========================================================
+Every page view and CSV export used to re-run health_eval.evaluate() on every
+row it showed, although a historical verdict never changes. Now the verdict,
+score and reasons are computed once when the row is written (stamp_rows(),
+called from insert_reports()) and saved in the eval_* columns, tagged with
+health_eval.RULES_VERSION.
+
+When the rules change, RULES_VERSION is bumped: reads recompute stale rows on
+the fly (health_eval.evaluate_stored()) while the maintenance leader's "rescore" job
+(Rescorer) walks health_reports in id order and rewrites them in small
+batches, so the next read is a plain column fetch again. It saves its cursor
+with every batch and steps aside while maintenance.writes_held().
+"""
+
+import asyncio, os, time
+
+from sqlalchemy import select, update, or_
+
+from app.models import HealthReport
+from app.services.maintenance import load_cursor, save_cursor, writes_held
+from app.services.health_eval import (
+    EVAL_FIELDS, RULES_VERSION, evaluate_at_report, stored_fields,
+)
+
+RESCORE_BATCH      = int(os.getenv("EVAL_RESCORE_BATCH", "1000"))
+RESCORE_PAUSE_MS   = int(os.getenv("EVAL_RESCORE_PAUSE_MS", "50"))
+RESCORE_INTERVAL_S = float(os.getenv("EVAL_RESCORE_INTERVAL_S", "600"))   # leader job: resume / new stale rows
+
+def _score(row: dict):
+    """eval_* values for one row, or None if the rules cannot score it."""
+    if row.get("reported_at") is None:
+        return None
+    try:
+        return stored_fields(evaluate_at_report(row))
+    except Exception as e:
+        # Never lose a report over its verdict — it is scored on read instead
+        print(f"[Eval] ⚠️  Could not score report for {row.get('stn_id')}: {e}")
+        return None
+
+
+def stamp_rows(rows: list) -> list:
+    """Adds eval_* values to HealthReport kwargs dicts before they are inserted."""
+    for row in rows:
+        if "eval_rev" not in row:
+            fields = _score(row)
+            if fields:
+                row.update(fields)
+    return rows
+
+
+def _stale_filter():
+    return or_(HealthReport.eval_rev.is_(None), HealthReport.eval_rev != RULES_VERSION)
+
+
+def rescore_batch(db, after_id: int = 0, limit: int = RESCORE_BATCH):
+    """
+    Re-scores up to `limit` stale rows with id > after_id. Caller commits.
+    Returns (rows_rescored, last_id_seen) — last_id_seen is None when done.
+    """
+    cols = [HealthReport.id] + [getattr(HealthReport, f) for f in EVAL_FIELDS]
+    rows = db.execute(
+        select(*cols)
+        .where(HealthReport.id > after_id, _stale_filter())
+        .order_by(HealthReport.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return 0, None
+    updates = []
+    for row in rows:
+        fields = _score(dict(row._mapping))
+        if fields:
+            updates.append({"id": row.id, **fields})
+    if updates:
+        db.execute(update(HealthReport), updates)
+    return len(updates), rows[-1].id
+
+
+def stale_count(db) -> int:
+    return db.query(HealthReport.id).filter(_stale_filter()).count()
+
+
+class Rescorer:
+    """
+    The leader job "rescore": brings stale rows up to RULES_VERSION in id
+    order. The cursor is saved with every batch, so a pass stopped by a
+    restart, a lost lease, a write hold or an error resumes at the next run.
+    """
+
+    JOB = "rescore"
+
+    def __init__(self, batch=RESCORE_BATCH, pause_ms=RESCORE_PAUSE_MS):
+        self.batch    = batch
+        self.pause_ms = pause_ms
+        self.passes   = 0
+        self.rescored = 0
+        self.last     = {}
+
+    def _cursor(self, db) -> int:
+        cursor = load_cursor(db, self.JOB) or {}
+        # A rules bump makes every row stale again: start over from id 0
+        return cursor.get("last_id", 0) if cursor.get("rules_version") == RULES_VERSION else 0
+
+    def _step(self, session_factory):
+        """One batch: (rows_rescored, last_id or None when done, hold reason or None)."""
+        db = session_factory()
+        try:
+            held = writes_held(db)
+            if held:
+                return 0, None, held
+            count, last_id = rescore_batch(db, self._cursor(db), self.batch)
+            if last_id is not None:
+                save_cursor(db, self.JOB, {"rules_version": RULES_VERSION, "last_id": last_id})
+            db.commit()
+            return count, last_id, None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run_pass(self, session_factory, should_stop=None) -> dict:
+        loop  = asyncio.get_running_loop()
+        t0    = time.perf_counter()
+        stats = {"rules_version": RULES_VERSION, "rescored": 0}
+        while not (should_stop and should_stop()):
+            count, last_id, held = await loop.run_in_executor(None, self._step, session_factory)
+            if held:
+                # The holder has the write lock for minutes; resume at the next run
+                stats["held"] = held
+                break
+            if last_id is None:
+                stats["done"] = True
+                break
+            stats["rescored"] += count
+            stats["last_id"]   = last_id
+            # Short pause so check-ins are not starved of the write lock
+            await asyncio.sleep(self.pause_ms / 1000)
+        stats["seconds"] = round(time.perf_counter() - t0, 1)
+        self.passes   += 1
+        self.rescored += stats["rescored"]
+        self.last      = stats
+        if stats["rescored"]:
+            print(f"[Eval] Re-scored {stats['rescored']} reports to rules v{RULES_VERSION} "
+                  f"in {stats['seconds']}s{' (paused: writes held)' if 'held' in stats else ''}")
+        return stats
+
+    def stats(self, db) -> dict:
+        """Any worker: the saved cursor; this worker's passes if it has been the leader."""
+        return {
+            "rules_version": RULES_VERSION,
+            "last_id": self._cursor(db),
+            "passes": self.passes,
+            "rescored": self.rescored,
+            "last_pass": self.last,
+        }
+
+
+rescorer = Rescorer()
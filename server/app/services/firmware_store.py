@@ -0,0 +1,201 @@
+"""
+firmware_store.py — Hot firmware images for /builds downloads
+=============================================================
+serve_firmware used to open the .bin with aiofiles for every request and
+push it through a Python generator 32 KB at a time — a thread hop per read.
+When a whole group starts OTA together, dozens of devices pull the same
+~1.5 MB image in 32 KB Range requests, so the server did thousands of
+open / seek / read round trips for identical bytes.
+
+FirmwareResponse now picks the cheapest path the ASGI server offers:
+
+    http.response.zerocopy   sendfile() from the open file, any range
+    http.response.pathsend   the server sends the whole file by path
+    (otherwise)              slices of the image held in memory
+
+uvicorn supports neither extension, so in production the in-memory path is
+what runs: each hot image is read once per worker and every Range is a
+memoryview slice — no file I/O, no copy in Python.
+
+The image is read into the worker, not mmap'ed: a deploy script (scp, docker
+cp) rewrites a .bin in place, and a live mapping of a file rewritten under
+it serves a mix of old and new bytes, or SIGBUS once it is truncated. A
+copy costs at most HOT_IMAGES_MB per worker; images are 2.5 MB at most.
+
+A cached image is keyed on the file's (inode, size, mtime, ctime), taken
+before the read, so any later write — rename or in place — gives the next
+request a new key and a fresh read; downloads already streaming keep the
+bytes they started with. invalidate() drops an entry straight away (upload /
+delete). At most HOT_IMAGES_MB of images stay cached per worker (least
+recently used out first).
+"""
+
+import collections, os, threading, zlib
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.services import ota_encoding, ota_manifest
+
+HOT_IMAGES_MB = int(os.getenv("HOT_IMAGES_MB", "32"))
+SEND_CHUNK    = 64 * 1024    # per ASGI message: lets the server apply backpressure
+
+
+class HotImage:
+    def __init__(self, path: str, key: tuple):
+        self.path = path
+        self.key  = key
+        with open(path, "rb") as f:
+            self.data = memoryview(f.read())
+        self.size = len(self.data)          # not key[1]: the file may have changed since the stat
+        self._manifest = None
+        self._encoding = None
+
+    @property
+    def manifest(self) -> dict:
+        """Chunk CRCs + whole-image hashes (services/ota_manifest.py); may hash the image on first use."""
+        if self._manifest is None:
+            self._manifest = ota_manifest.load(self.path, self.data)
+        return self._manifest
+
+    @property
+    def encoding(self):
+        """Heatshrink variant index (services/ota_encoding.py) or None; may encode the image on first use."""
+        if self._encoding is None:
+            self._encoding = ota_encoding.load(self.path, self.data) or {"used": False}
+        return self._encoding
+
+    @property
+    def changed(self) -> float:
+        """Last-Modified: mtime, or ctime if later — an alias pointed back at an older build keeps its mtime."""
+        return max(self.key[2], self.key[3]) / 1e9
+
+    def crc32(self, start: int, end: int) -> str:
+        """CRC32 (hex) of bytes [start, end] — from the manifest, once loaded, for the whole image or a chunk."""
+        cached = ota_manifest.chunk_crc(self._manifest, start, end) if self._manifest else None
+        return cached or f"{zlib.crc32(self.data[start:end + 1]):08x}"
+
+
+def _stat_key(path: str):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+def _fstat_key(fd: int):
+    st = os.fstat(fd)
+    return (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+
+
+class FirmwareStore:
+    def __init__(self, max_mb: int = HOT_IMAGES_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self._images   = collections.OrderedDict()     # path -> HotImage, oldest first
+        self._lock     = threading.Lock()
+        self.hits      = 0
+        self.loads     = 0
+
+    def cached(self, path: str, key: tuple = None):
+        """The cached image for `path` if it is still current, else None — a stat, never a read."""
+        key = key or _stat_key(path)
+        with self._lock:
+            image = self._images.get(path)
+            if image is not None and image.key == key:
+                self._images.move_to_end(path)
+                self.hits += 1
+                return image
+        return None
+
+    def get(self, path: str) -> HotImage:
+        """The cached image for `path`, read in on a miss (blocking); raises FileNotFoundError."""
+        key   = _stat_key(path)
+        image = self.cached(path, key)
+        if image is not None:
+            return image
+        image = HotImage(path, key)
+        with self._lock:
+            self._images[path] = image
+            self._images.move_to_end(path)
+            self.loads += 1
+            # Evicted images are freed once their last in-flight download lets go
+            while sum(i.size for i in self._images.values()) > self.max_bytes and len(self._images) > 1:
+                self._images.popitem(last=False)
+        return image
+
+    async def load(self, path: str) -> HotImage:
+        """get() for async handlers: a cache miss reads the file on a worker thread, not the event loop."""
+        return self.cached(path) or await run_in_threadpool(self.get, path)
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._images.pop(os.path.realpath(path), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": len(self._images),
+                "cached_mb": round(sum(i.size for i in self._images.values()) / 1048576, 2),
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+firmware_store = FirmwareStore()
+
+
+class FirmwareResponse(Response):
+    """Sends bytes [start, end] of a firmware image (status 200 or 206)."""
+
+    media_type = "application/octet-stream"
+
+    def __init__(self, image: HotImage, start: int = 0, end: int = None, status_code: int = 200,
+                 headers: dict = None, on_sent=None):
+        self.image   = image
+        self.start   = start
+        self.end     = image.size - 1 if end is None else end
+        self.on_sent = on_sent      # called with the bytes handed to the server (download telemetry)
+        self.sent    = 0
+        length       = self.end - self.start + 1
+        headers      = dict(headers or {}, **{"Content-Length": str(length), "Accept-Ranges": "bytes"})
+        if status_code == 206:
+            headers["Content-Range"] = f"bytes {self.start}-{self.end}/{image.size}"
+        super().__init__(status_code=status_code, headers=headers, media_type=self.media_type)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        try:
+            await self._send_body(scope, send)
+        finally:
+            # A client that went away mid-range still counts what got out
+            if self.on_sent is not None:
+                self.on_sent(self.sent)
+
+    async def _send_body(self, scope, send):
+        extensions = scope.get("extensions") or {}
+        length     = self.end - self.start + 1
+
+        if "http.response.zerocopy" in extensions and length:
+            with open(self.image.path, "rb") as f:
+                # Replaced or rewritten since the headers were built: send the copy in memory
+                if _fstat_key(f.fileno()) == self.image.key:
+                    await send({"type": "http.response.zerocopy", "file": f.fileno(),
+                                "offset": self.start, "count": length, "more_body": False})
+                    self.sent = length
+                    return
+        if "http.response.pathsend" in extensions and length == self.image.size:
+            await send({"type": "http.response.pathsend", "path": self.image.path})
+            self.sent = length
+            return
+
+        view = self.image.data
+        pos  = self.start
+        stop = self.end + 1
+        while True:
+            nxt = min(pos + SEND_CHUNK, stop)
+            await send({"type": "http.response.body", "body": view[pos:nxt], "more_body": nxt < stop})
+            pos = nxt
+            self.sent = pos - self.start
+            if pos >= stop:
+                break
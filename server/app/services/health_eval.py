@@ -11,9 +11,16 @@ The result is a dict:
     "reasons":  ["reason1", "reason2", ...],
     "score":    0-100   (100 = perfect, 0 = completely broken)
   }
+
+evaluate() scores one row. Apart from the OFFLINE cut-off, a verdict depends
+only on the row itself, so it is computed once at ingest (stored_fields()) and
+saved on health_reports as eval_verdict / eval_score / eval_reasons, tagged
+with RULES_VERSION. Fleet pages and CSV exports use evaluate_stored(), which
+reads those columns back and only re-runs the rules for rows scored under an
+older RULES_VERSION (see services/eval_store.py).
 """
 
-import datetime
+import datetime, functools, json
 
 def ist_filter(dt):
     """Jinja2 filter to convert UTC datetime to IST string."""
@@ -32,6 +39,10 @@ MAX_HTTP_FAILS_DAY   = 30     # Increase threshold for 2G networks
 MIN_PREV_STORED_PCT  = 0.90   # yesterday should have at least 90% (86/96)
 MIN_TODAY_SENT_PCT   = 0.85   # today sent ≥ 85% so far = OK
 
+# Bump whenever a threshold or rule in this file changes: stored verdicts with
+# an older eval_rev are recomputed on read and re-scored in the background.
+RULES_VERSION        = 1
+
 # Slots per day
 SLOTS_PER_DAY = 96
 
@@ -59,31 +70,97 @@ def _expected_slots_today(reported_at: datetime.datetime) -> int:
     return min(slots, SLOTS_PER_DAY)
 
 
-def evaluate(r, now: datetime.datetime = None) -> dict:
+# Map internal codes to short friendly names
+# v7.75: Use exact matching to avoid "Rain_J" matching "Rain_JUMP" incorrectly
+FLAG_MAP = {
+    "Temp_E": "TH-Er", "Temp_CV": "TH-Er", "Temp_ERV": "TH-Er", "TEMP_STUCK": "TH-Er", "TEMP_UNREAL": "TH-Er",
+    "Humi_E": "TH-Er", "Humi_CV": "TH-Er", "Humi_ERV": "TH-Er", "HUM_STUCK": "TH-Er", "HUM_UNREAL": "TH-Er",
+    "Rain_R": "RF-Er", "Rain_J": "RF-Er", "RAIN_SPIKE": "RF-Er", "RAIN_RESET": "RF-Er", "RAIN_CALC": "RF-Er",
+    "WD_E": "WD-Er", "WD_FAIL": "WD-Er",
+    "WS_E": "WS-Er", "WS_CV": "WS-Er", "WS_ERV": "WS-Er", "WS_STUCK": "WS-Er", "WS_UNREAL": "WS-Er",
+    "RTC_F": "RTC-Er", "SPIFF": "SYS-Er", "FAIL": "SYS-Er",
+    "WDOG": "SYS-Er", "BROWNOUT": "SYS-Er"
+}
+
+# Row attributes the evaluator reads, in the order _evaluate_values() takes them.
+# Value = default when the attribute is missing (column not yet in the DB model).
+EVAL_FIELDS = {
+    "reported_at": None, "bat_v": None, "signal": None,
+    "net_cnt_prev": None, "prev_stored": None, "http_ret_cnt_prev": 0,
+    "ndm_cnt": 0, "cdm_sts": "", "reg_fails": None, "health_sts": None,
+    "system": -1, "sensor_sts": None,
+    "http_present_fails": 0, "http_backlog_cnt": 0, "mutex_fail": 0,
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _sensor_rules(sys_type: int, sens_sts: str, fw_sts: str, flag_penalty: int) -> tuple:
     """
-    r       : a HealthReport ORM row (or any object with the same attributes)
-    now     : current datetime (defaults to datetime.datetime.now())
-    returns : {"verdict": str, "reasons": [str], "score": int}
+    Sensor-status checks and firmware health flags. These are the costly string
+    scans, and they depend only on a handful of low-cardinality values, so they
+    are memoised. Returns (sensor_reasons, sensor_demerits, flag_reasons,
+    flag_demerits, sensor_tags).
     """
-    if now is None:
-        now = datetime.datetime.now()
-
     reasons  = []
-    demerits = 0   # each issue adds demerits; score = 100 - demerits (clamped to 0)
-    verdict  = "OK"
+    demerits = 0
 
-    # ── 1. Basic check ───────────────────────────────────────────────────────
-    if r.reported_at is None:
+    # v5.57: System-Aware Sensor Checks
+    # TH, WS, WD error checks (Applicable to Systems 1, 2, or unknown)
+    if sys_type in (1, 2, -1):
+        if "TH-FAIL" in sens_sts or "TH-ERR" in sens_sts: reasons.append("TH-Er"); demerits += 10
+        if "WS-FAIL" in sens_sts or "WS-ERR" in sens_sts: reasons.append("WS-Er"); demerits += 10
+        if "WD-FAIL" in sens_sts or "WD-ERR" in sens_sts: reasons.append("WD-Er"); demerits += 10
+
+    # RF error checks (Applicable to Systems 0, 2, or unknown)
+    if sys_type in (0, 2, -1):
+        if "RF-FAIL" in sens_sts or "RF-ERR" in sens_sts: reasons.append("RF-Er"); demerits += 10
+
+    if "RTC-FAIL" in sens_sts: reasons.append("RTC-Er"); demerits += 10
+
+    flags        = []
+    flag_demerit = 0
+    sensor_tags  = []
+    for code, friendly_name in FLAG_MAP.items():
+        # Use underscore boundary or start/end to avoid partial matches
+        # e.g. "Rain_R" should not match "Rain_RESET"
+        if f"_{code}" in f"_{fw_sts}" or f"{code}_" in f"{fw_sts}_":
+            if friendly_name not in reasons and friendly_name not in flags:
+                flags.append(friendly_name)
+                flag_demerit += flag_penalty
+                if friendly_name not in sensor_tags:
+                    sensor_tags.append(friendly_name)
+    return tuple(reasons), demerits, tuple(flags), flag_demerit, tuple(sensor_tags)
+
+
+def _offline(now, reported_at):
+    """The only clock-dependent rule: OFFLINE result, or None if the row is recent enough."""
+    if reported_at is None:
         return {"verdict": "OFFLINE", "reasons": ["No report received"], "score": 0}
 
-    delta_mins = (now - r.reported_at).total_seconds() / 60
+    delta_mins = (now - reported_at).total_seconds() / 60
     if delta_mins > OFFLINE_MINS:
         return {"verdict": "OFFLINE",
                 "reasons": [f"No report for {int(delta_mins/60)}h"],
                 "score": 0}
+    return None
+
+
+def _evaluate_values(now, reported_at, bat_v, signal, net_cnt_prev, prev_stored,
+                     http_ret_cnt_prev, ndm_cnt, cdm_sts, reg_fails, health_sts,
+                     system, sensor_sts, http_present_fails, http_backlog_cnt,
+                     mutex_fail) -> dict:
+    """The rule set, on raw column values (one per EVAL_FIELDS entry)."""
+    reasons  = []
+    demerits = 0   # each issue adds demerits; score = 100 - demerits (clamped to 0)
+    verdict  = "OK"
+
+    # ── 1. Basic check ───────────────────────────────────────────────────────
+    offline = _offline(now, reported_at)
+    if offline:
+        return offline
 
     # ── 2. Battery ───────────────────────────────────────────────────────────
-    bat = r.bat_v or 0
+    bat = bat_v or 0
     if bat < CRITICAL_BAT and bat > 0:
         reasons.append(f"BATT_CRIT ({bat:.2f}V)")
         demerits += 40
@@ -92,14 +169,14 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
         demerits += 15
 
     # ── 3. Signal ────────────────────────────────────────────────────────────
-    sig = r.signal or 0
+    sig = signal or 0
     if sig < WEAK_SIGNAL and sig != 0:
         reasons.append(f"WEAK_SIGNAL ({sig} dBm)")
         demerits += 10
 
     # ── 4. Previous day completeness & Labels ────────────────────────────────
-    prev_sent   = r.net_cnt_prev or 0
-    prev_stored = r.prev_stored  or 0
+    prev_sent   = net_cnt_prev or 0
+    prev_stored = prev_stored  or 0
 
     # ── PD: Partial Data (Previous Day records missing) ──
     # net_cnt_prev = confirmed records (Live + Backlog)
@@ -109,7 +186,7 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
 
     # v5.65 P4 Improvement: If net_cnt_prev is low, but we see significant 
     # recovery (http_ret_cnt_prev), then the station is 'Catching Up'.
-    recov_p   = int(getattr(r, "http_ret_cnt_prev", 0) or 0)
+    recov_p   = int(http_ret_cnt_prev or 0)
     is_catching_up = (is_pd and recov_p > 5)
 
     # GPRS-Er: Data was stored locally but never reached the server
@@ -122,14 +199,14 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
     # Night window = 21:00 to 06:00 = 9 hours = 36 slots. 50% threshold = 18.
     # Firmware tracks this as `ndm_cnt` (diag_ndm_count).
     # NDM is INDEPENDENT of PD — a data-complete station can still have NDM.
-    ndm_cnt = int(getattr(r, "ndm_cnt", 0) or 0)
+    ndm_cnt = int(ndm_cnt or 0)
     is_ndm  = ndm_cnt > 18    # >50% of 36 night slots missed live
 
     # ── CDM: Closing Data Missing ──
     # The 8:30 AM closing record for yesterday not received on server,
     # neither via that slot's HTTP nor any subsequent backlog retry.
     # Sourced directly from firmware's cdm_sts field.
-    cdm_sts_val = str(getattr(r, "cdm_sts", "") or "").strip().upper()
+    cdm_sts_val = str(cdm_sts or "").strip().upper()
     is_cdm      = cdm_sts_val in ("FAIL", "PENDING")
 
     historical_tags = []
@@ -177,7 +254,7 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
 
 
     # ── 6. Registration failures ─────────────────────────────────────────────
-    reg_f = r.reg_fails or 0
+    reg_f = reg_fails or 0
     if reg_f > 0:
         reasons.append(f"REGF({reg_f})")
         if reg_f >= MAX_REG_FAILS_DAY:
@@ -186,41 +263,24 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
             demerits += 10
 
     # ── 7. Health Status specific overrides ──────────────────────────────────
-    fw_sts = r.health_sts or "OK"
-    
-    # Map internal codes to short friendly names per USER request
-    # Map internal codes to short friendly names
-    # v7.75: Use exact matching to avoid "Rain_J" matching "Rain_JUMP" incorrectly
-    FLAG_MAP = {
-        "Temp_E": "TH-Er", "Temp_CV": "TH-Er", "Temp_ERV": "TH-Er", "TEMP_STUCK": "TH-Er", "TEMP_UNREAL": "TH-Er",
-        "Humi_E": "TH-Er", "Humi_CV": "TH-Er", "Humi_ERV": "TH-Er", "HUM_STUCK": "TH-Er", "HUM_UNREAL": "TH-Er",
-        "Rain_R": "RF-Er", "Rain_J": "RF-Er", "RAIN_SPIKE": "RF-Er", "RAIN_RESET": "RF-Er", "RAIN_CALC": "RF-Er",
-        "WD_E": "WD-Er", "WD_FAIL": "WD-Er",
-        "WS_E": "WS-Er", "WS_CV": "WS-Er", "WS_ERV": "WS-Er", "WS_STUCK": "WS-Er", "WS_UNREAL": "WS-Er",
-        "RTC_F": "RTC-Er", "SPIFF": "SYS-Er", "FAIL": "SYS-Er",
-        "WDOG": "SYS-Er", "BROWNOUT": "SYS-Er"
-    }
+    fw_sts = health_sts or "OK"
 
-    # v5.57: System-Aware Sensor Checks
-    sys_type = int(getattr(r, "system", -1))
-    sens_sts = (r.sensor_sts or "").upper()
+    sys_type = int(system)
+    sens_sts = (sensor_sts or "").upper()
 
-    # TH, WS, WD error checks (Applicable to Systems 1, 2, or unknown)
-    if sys_type in (1, 2, -1):
-        if "TH-FAIL" in sens_sts or "TH-ERR" in sens_sts: reasons.append("TH-Er"); demerits += 10
-        if "WS-FAIL" in sens_sts or "WS-ERR" in sens_sts: reasons.append("WS-Er"); demerits += 10
-        if "WD-FAIL" in sens_sts or "WD-ERR" in sens_sts: reasons.append("WD-Er"); demerits += 10
+    # If the station stored a perfect 96 records yesterday, we are much more
+    # forgiving of sensor flags
+    flag_penalty = 2 if prev_stored >= 96 else 10
 
-    # RF error checks (Applicable to Systems 0, 2, or unknown)
-    if sys_type in (0, 2, -1):
-        if "RF-FAIL" in sens_sts or "RF-ERR" in sens_sts: reasons.append("RF-Er"); demerits += 10
-    
-    if "RTC-FAIL" in sens_sts: reasons.append("RTC-Er"); demerits += 10
+    sensor_reasons, sensor_demerits, flag_reasons, flag_demerits, sensor_tags = \
+        _sensor_rules(sys_type, sens_sts, fw_sts, flag_penalty)
+    reasons.extend(sensor_reasons)
+    demerits += sensor_demerits
 
     # HTTP Live Performance (Present Fails)
     # v7.70: Tracked LIVE current-slot failures.
-    h_pres = int(getattr(r, "http_present_fails", 0) or 0)
-    h_back = int(getattr(r, "http_backlog_cnt", 0) or 0)
+    h_pres = int(http_present_fails or 0)
+    h_back = int(http_backlog_cnt or 0)
     
     if h_pres > 3:
         # Live transmission is failing, forcing backlog.
@@ -233,25 +293,13 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
         demerits += 5
 
     # Resource Contention (v5.55)
-    m_fail = int(getattr(r, "mutex_fail", 0) or 0)
+    m_fail = int(mutex_fail or 0)
     if m_fail > 0:
         reasons.append(f"MUTEX-Er({m_fail})")
         demerits += 5
 
-    # If the station stored a perfect 96 records yesterday, we are much more
-    # forgiving of sensor flags
-    flag_penalty = 2 if prev_stored >= 96 else 10
-    
-    sensor_tags = []
-    for code, friendly_name in FLAG_MAP.items():
-        # Use underscore boundary or start/end to avoid partial matches
-        # e.g. "Rain_R" should not match "Rain_RESET"
-        if f"_{code}" in f"_{fw_sts}" or f"{code}_" in f"{fw_sts}_":
-            if friendly_name not in reasons:
-                reasons.append(friendly_name)
-                demerits += flag_penalty
-                if friendly_name not in sensor_tags:
-                    sensor_tags.append(friendly_name)
+    reasons.extend(flag_reasons)
+    demerits += flag_demerits
     
     # Deduplicate reasons (especially since we check two sources now)
     reasons = list(dict.fromkeys(reasons))
@@ -274,7 +322,7 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
         base_verdict = "CRITICAL" # Red
 
     # Build final verdict string from tags + sensor flags
-    combined_tags = historical_tags + sensor_tags
+    combined_tags = historical_tags + list(sensor_tags)
     if combined_tags:
         # Special case: NDM alone (data count OK, no PD, no CDM) → "OK (NDM)"
         # Shows that the station is data-complete but has a night battery concern.
@@ -294,4 +342,68 @@ def evaluate(r, now: datetime.datetime = None) -> dict:
     }
 
 
+def evaluate(r, now: datetime.datetime = None) -> dict:
+    """
+    r       : a HealthReport ORM row (or any object with the same attributes)
+    now     : current datetime (defaults to datetime.datetime.now())
+    returns : {"verdict": str, "reasons": [str], "score": int}
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    return _evaluate_values(now, *(getattr(r, f, d) for f, d in EVAL_FIELDS.items()))
+
+
+def evaluate_stored(r, now: datetime.datetime = None) -> dict:
+    """
+    evaluate() for a health_reports row read back from the database: the
+    verdict stored under the current RULES_VERSION (plus the OFFLINE cut-off),
+    or the rules re-run for a row the "rescore" job has not reached yet.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    if getattr(r, "eval_rev", None) == RULES_VERSION:
+        return _offline(now, r.reported_at) or _from_stored(r)
+    return evaluate(r, now)
+
+
+def evaluate_at_report(row: dict) -> dict:
+    """Scores a HealthReport kwargs dict as of its own reported_at (ingest / re-score)."""
+    values = [row.get(f, d) for f, d in EVAL_FIELDS.items()]
+    return _evaluate_values(row["reported_at"], *values)
+
+
+def stored_fields(ev: dict) -> dict:
+    """evaluate() result -> eval_* column values for health_reports."""
+    return {
+        "eval_verdict": ev["verdict"],
+        "eval_score":   ev["score"],
+        "eval_reasons": json.dumps(ev["reasons"]),
+        "eval_rev":     RULES_VERSION,
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_reasons(raw: str) -> tuple:
+    # Few distinct reason lists across a fleet — decode each JSON string once
+    return tuple(json.loads(raw))
+
 
+def _from_stored(r) -> dict:
+    """eval_* columns -> the dict evaluate() would have returned."""
+    return {
+        "verdict": r.eval_verdict,
+        "reasons": list(_decode_reasons(r.eval_reasons)) if r.eval_reasons else [],
+        "score":   r.eval_score,
+        "fw_sts":  r.health_sts or "OK",
+    }
+
+
+def historical_now(reported_at, now: datetime.datetime, today: datetime.date):
+    """
+    Evaluation clock for history views: records from before today are judged
+    at report time + 1h (the verdict as filed, instead of always OFFLINE);
+    today's records use the real wall clock.
+    """
+    if reported_at and reported_at.date() < today:
+        return reported_at + datetime.timedelta(hours=1)
+    return now
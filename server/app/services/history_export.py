@@ -0,0 +1,141 @@
+"""
+history_export.py — Columnar (Parquet / Arrow IPC) export of health_reports
+============================================================================
+/csv/full_history turns every number into text that analysts then re-parse
+in pandas. GET /export/history writes the same columns with their native
+types instead: the CSV header names, Integer -> int64, Float -> float64,
+String -> string, and the report time as an IST-zoned timestamp. With
+verdict=1 the server verdict is added as Verdict / Health_Score / Reasons.
+
+It consumes the same chunked row stream as the CSV export: every chunk of
+rows becomes one record batch (Parquet row group) and the encoded bytes are
+handed to the response as soon as they are written, so memory stays bounded.
+
+pyarrow is optional. Without it the endpoint answers 501; with a pyarrow
+build that lacks Parquet support, format=parquet falls back to a compressed
+Arrow IPC stream.
+"""
+
+import datetime
+
+from sqlalchemy import Integer, Float, DateTime
+
+try:
+    import pyarrow as pa
+except ImportError:   # optional dependency
+    pa = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+FORMATS = ("parquet", "arrow")
+
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow":   "application/vnd.apache.arrow.stream",
+}
+
+# zstd keeps files ~5-10x smaller than the CSV at similar write speed
+COMPRESSION = "zstd"
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def resolve_format(fmt: str) -> str:
+    """The format actually written for a requested one (parquet -> arrow without pyarrow.parquet)."""
+    if fmt == "parquet" and pq is None:
+        return "arrow"
+    return fmt
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def build_schema(fields: list, table, with_verdict: bool):
+    """
+    fields : [(header_name, attr)] — the CSV columns after the timestamp
+    table  : HealthReport.__table__ (column types come from the model)
+    """
+    cols = [pa.field("Timestamp_IST", pa.timestamp("us", tz="Asia/Kolkata"))]
+    cols += [pa.field(name, _arrow_type(table.c[attr])) for name, attr in fields]
+    if with_verdict:
+        cols += [pa.field("Verdict", pa.string()),
+                 pa.field("Health_Score", pa.int64()),
+                 pa.field("Reasons", pa.list_(pa.string()))]
+    return pa.schema(cols)
+
+
+def _utc_aware(ts):
+    return ts.replace(tzinfo=datetime.timezone.utc) if ts is not None else None
+
+
+class _ChunkSink:
+    """Write-only file object: collects encoded bytes until the response takes them."""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def stream_columnar(chunks, fields: list, table, fmt: str, with_verdict: bool):
+    """
+    chunks : iterable of (keys, rows, evals) from the shared history row stream
+             (evals may be None when with_verdict is False)
+    yields : encoded bytes of one Parquet file / Arrow IPC stream
+    """
+    schema = build_schema(fields, table, with_verdict)
+    sink   = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression=COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(sink, schema,
+                                   options=pa.ipc.IpcWriteOptions(compression=COMPRESSION))
+    try:
+        # Parquet magic / IPC schema message go out before the first query returns
+        data = sink.take()
+        if data:
+            yield data
+        for keys, rows, evals in chunks:
+            columns = [[_utc_aware(r.reported_at) for r in rows]]
+            for _, attr in fields:
+                i = keys.index(attr)
+                columns.append([r[i] for r in rows])
+            if with_verdict:
+                columns.append([ev.get("verdict") for ev in evals])
+                columns.append([ev.get("score") for ev in evals])
+                columns.append([ev.get("reasons") or [] for ev in evals])
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema
+            )
+            writer.write_batch(batch)
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
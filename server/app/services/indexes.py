@@ -0,0 +1,121 @@
+"""
+indexes.py — Managed composite indexes for command_queue / health_reports
+==========================================================================
+Both tables only had single-column indexes, so every check-in's command
+lookups and every station history page picked the stn_id index and then
+filtered / sorted the station's rows by hand. The composite indexes
+declared on the models match the shapes the hot queries actually use:
+
+    ix_command_queue_stn_pending       (stn_id, executed_at)
+        health._decide_command pending command, commands.py queue clears
+    ix_command_queue_stn_cmd_created   (stn_id, cmd, created_at)
+        GET_GPS cooldown (newest GET_GPS), OTA_CHECK clears
+    ix_command_queue_stn_unacked       (stn_id, result, completed_at, executed_at)
+        3h SENT-without-feedback retry: equality on the first three,
+        range + ORDER BY on executed_at
+    ix_command_queue_pending           (id) WHERE executed_at IS NULL
+        dashboard get_pending_commands — partial, so only unsent rows
+    ix_health_reports_stn_reported     (stn_id, reported_at DESC)
+        station page, station CSV, full-history export order, the
+        GROUP BY stn_id / MAX(reported_at) rebuild of station_latest
+    ix_health_reports_reported_at      (reported_at)
+        /export/history start / end range without a station
+
+create_all() only creates indexes together with a new table, so existing
+deployments get them from ensure_indexes(): run by migrate.py, and by the
+maintenance leader as the "build_indexes" job (one worker, not every one).
+Reads keep going in WAL mode, but a CREATE INDEX holds the write lock for
+the whole build — minutes on a large health_reports, far past
+busy_timeout — so each build runs under maintenance.holding_writes(): the
+write-behind queues keep their rows until it is done instead of flushing
+into the lock. A synchronous insert (queue full or write-behind off) still
+waits on busy_timeout and can fail. The old single-column stn_id indexes are
+covered by the composites' leading column and are dropped once their
+replacement exists.
+
+benchmarks.py plans runs EXPLAIN QUERY PLAN over these query shapes and
+fails if one of them falls back to a table scan.
+"""
+
+import os, time
+
+from sqlalchemy import text
+
+from app.models import HealthReport, CommandQueue
+from app.services.maintenance import holding_writes, writes_held
+
+INTERVAL_H = float(os.getenv("INDEX_CHECK_INTERVAL_H", "24"))     # leader re-check for missing indexes
+
+MANAGED_TABLES = (CommandQueue.__table__, HealthReport.__table__)
+
+# Superseded by a composite with the same leading column: {name: replaced_by}
+RETIRED_INDEXES = {
+    "ix_health_reports_stn_id": "ix_health_reports_stn_reported",
+    "ix_command_queue_stn_id":  "ix_command_queue_stn_pending",
+}
+
+
+def managed_indexes() -> list:
+    return [ix for table in MANAGED_TABLES for ix in sorted(table.indexes, key=lambda ix: ix.name)]
+
+
+def existing_indexes(conn) -> set:
+    return {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+
+def missing_indexes(engine) -> list:
+    with engine.connect() as conn:
+        existing = existing_indexes(conn)
+    return [ix for ix in managed_indexes() if ix.name not in existing]
+
+
+def build_index(engine, ix) -> float:
+    """CREATE INDEX IF NOT EXISTS for one managed index; returns seconds taken."""
+    t0 = time.perf_counter()
+    ix.create(bind=engine, checkfirst=True)
+    return time.perf_counter() - t0
+
+
+def drop_retired(engine) -> list:
+    """Drops superseded single-column indexes whose replacement exists. Returns those dropped."""
+    dropped = []
+    with engine.begin() as conn:
+        existing = existing_indexes(conn)
+        for name, replaced_by in RETIRED_INDEXES.items():
+            if name in existing and replaced_by in existing:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+                dropped.append(name)
+        if dropped:
+            # Refresh planner statistics for the new index set
+            conn.execute(text("PRAGMA optimize"))
+    if dropped:
+        print(f"[Index] Dropped superseded indexes: {', '.join(dropped)}")
+    return dropped
+
+
+def ensure_indexes(engine) -> dict:
+    """
+    Builds every missing managed index, one at a time, each under a write
+    hold; then drops the superseded ones. migrate.py and the leader job
+    "build_indexes". Returns the names built / dropped.
+    """
+    built = []
+    for ix in missing_indexes(engine):
+        print(f"[Index] Building {ix.name} ...")
+        with holding_writes(engine, f"index {ix.name}"):
+            secs = build_index(engine, ix)
+        print(f"[Index] Built {ix.name} in {secs:.1f}s")
+        built.append(ix.name)
+    return {"built": built, "dropped": drop_retired(engine)}
+
+
+def status(engine) -> dict:
+    """What is still to build / drop, read from the database (any worker)."""
+    with engine.connect() as conn:
+        existing = existing_indexes(conn)
+        held     = writes_held(conn)
+    return {
+        "pending": [ix.name for ix in managed_indexes() if ix.name not in existing],
+        "retired_present": sorted(name for name in RETIRED_INDEXES if name in existing),
+        "building": held[len("index "):] if held and held.startswith("index ") else None,
+    }
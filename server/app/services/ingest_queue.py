@@ -0,0 +1,256 @@
+"""
+ingest_queue.py — Write-behind stage for health report rows
+============================================================
+POST /health used to INSERT + COMMIT its own row on the request path, so a
+burst (every station waking on the same 15-min slot) serialized on SQLite's
+single writer lock and the slowest check-in set everyone's latency.
+
+Now the handler only computes the command decision synchronously and hands
+the row to this queue. One writer task per worker drains it and flushes rows
+to health_reports (and station_latest) in group commits of up to INGEST_GROUP_ROWS rows or every
+INGEST_GROUP_MS milliseconds, whichever comes first.
+
+If the writer is not running (scripts, one-off tools) or the queue is full,
+submit() returns False and the caller falls back to a synchronous insert.
+submit() is safe to call from the ingest worker threads (services/offload.py).
+
+Queued rows were acknowledged to the device ("stored": true), so a flush
+only ever drops a row the database rejects for itself (IntegrityError /
+DataError). "database is locked" (a migration swap, the vacuum job) and
+anything else keeps the rows, and the writer tries again after
+INGEST_RETRY_MIN_S, doubling up to INGEST_RETRY_MAX_S. Rows waiting
+for a retry still count toward INGEST_QUEUE_MAX, so a long outage turns
+into synchronous inserts (back-pressure) rather than unbounded memory.
+While the maintenance leader holds writes (maintenance.hold_writes(), e.g.
+around a CREATE INDEX that outlasts busy_timeout) a flush does not even
+try: the rows wait the same way.
+"""
+
+import asyncio, collections, os, threading, time
+
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+
+from app.database import SessionLocal
+from app.services.maintenance import writes_held
+from app.services.station_latest import insert_reports
+
+WRITE_BEHIND  = os.getenv("INGEST_WRITE_BEHIND", "1") == "1"
+GROUP_ROWS    = int(os.getenv("INGEST_GROUP_ROWS", "200"))
+GROUP_MS      = int(os.getenv("INGEST_GROUP_MS", "250"))
+QUEUE_MAX     = int(os.getenv("INGEST_QUEUE_MAX", "20000"))
+RETRY_MIN_S   = float(os.getenv("INGEST_RETRY_MIN_S", "0.5"))
+RETRY_MAX_S   = float(os.getenv("INGEST_RETRY_MAX_S", "10"))
+STOP_RETRY_S  = float(os.getenv("INGEST_STOP_RETRY_S", "30"))    # shutdown gives up on a locked DB after this
+
+# How many recent flushes the latency / batch-size percentiles are computed over
+_HISTORY = 500
+
+
+def _busy(e) -> bool:
+    """SQLite's write lock is held by someone else (busy_timeout ran out)."""
+    msg = str(getattr(e, "orig", e)).lower()
+    return isinstance(e, OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+def _pct(values, q):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class IngestQueue:
+    def __init__(self, group_rows=GROUP_ROWS, group_ms=GROUP_MS, maxsize=QUEUE_MAX):
+        self.group_rows = group_rows
+        self.group_ms   = group_ms
+        self.maxsize    = maxsize
+        self._queue     = None
+        self._loop      = None
+        self._task      = None
+        self._lock      = threading.Lock()
+        self._stopping  = False
+        self._held      = None       # reason of the write hold last seen, for logging once
+        self._depth     = 0          # rows (not submissions) waiting in the queue
+        self._flush_ms  = collections.deque(maxlen=_HISTORY)
+        self._batch     = collections.deque(maxlen=_HISTORY)
+        self.rows_written = 0
+        self.flushes      = 0
+        self.failed_rows  = 0
+        self.retries      = 0
+        self.sync_fallbacks = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue    = asyncio.Queue()
+        self._loop     = asyncio.get_running_loop()
+        self._stopping = False
+        self._task     = asyncio.create_task(self._run())
+        print(f"[Ingest] Write-behind started (group={self.group_rows} rows / {self.group_ms} ms)")
+
+    async def stop(self):
+        """Flushes everything still queued, then stops the writer."""
+        if not self.running:
+            return
+        self._stopping = True
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        # Rows a worker thread handed over just before the sentinel
+        await asyncio.sleep(0)
+        leftover = []
+        while not self._queue.empty():
+            leftover.extend(self._queue.get_nowait() or [])
+        if leftover:
+            await self._write(leftover)
+        print(f"[Ingest] Write-behind stopped ({self.rows_written} rows written)")
+
+    def submit(self, rows: list) -> bool:
+        """
+        Queues `rows` (HealthReport kwargs dicts) to be written in ONE transaction.
+        Returns False if the caller must write them synchronously instead.
+        """
+        if not self.running or self._stopping:
+            return False
+        with self._lock:
+            if self._depth + len(rows) > self.maxsize:
+                # Back-pressure: the writer is falling behind, let the request commit itself
+                self.sync_fallbacks += 1
+                return False
+            self._depth += len(rows)
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._queue.put_nowait(rows)
+        else:
+            # asyncio.Queue is not thread-safe: hand the rows over on the loop
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, rows)
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            pending  = list(item)
+            deadline = loop.time() + self.group_ms / 1000
+            # Group commit: keep collecting until N rows or T ms
+            while len(pending) < self.group_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                pending.extend(item)
+            await self._write(pending)
+
+    async def _write(self, rows: list):
+        """Flushes `rows`, retrying what is left with back-off; never raises."""
+        loop     = asyncio.get_running_loop()
+        total    = len(rows)
+        delay    = RETRY_MIN_S
+        deadline = None
+        while rows:
+            try:
+                # The flush itself is blocking SQLAlchemy I/O — keep it off the event loop
+                rows = await loop.run_in_executor(None, self._flush, rows)
+            except Exception as e:
+                print(f"[Ingest] ⚠️  Flush of {len(rows)} rows failed ({e}); retrying")
+            if not rows:
+                break
+            if self._stopping:
+                deadline = deadline or loop.time() + STOP_RETRY_S
+                if loop.time() > deadline:
+                    self.failed_rows += len(rows)
+                    print(f"[Ingest] ✗ Shutting down: dropped {len(rows)} rows, database still unavailable")
+                    break
+            self.retries += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_S)
+        with self._lock:
+            self._depth -= total
+
+    def _flush(self, rows: list) -> list:
+        """Writes `rows`; returns the ones to try again later (database locked, not the rows' fault)."""
+        t0 = time.perf_counter()
+        done, written = 0, 0        # rows written or dropped / written
+        db = None
+        try:
+            db = SessionLocal()
+            held = writes_held(db)
+            if held != self._held:
+                print(f"[Ingest] ⏸  Writes held ({held}); queueing rows" if held else "[Ingest] ▶  Write hold released")
+                self._held = held
+            if held:
+                return rows
+            try:
+                insert_reports(db, rows)
+                db.commit()
+                done = written = len(rows)
+            except Exception as e:
+                db.rollback()
+                if _busy(e):
+                    print(f"[Ingest] ⚠️  Database busy ({getattr(e, 'orig', e)}); keeping {len(rows)} rows for a retry")
+                else:
+                    # One poisoned row must not lose the whole group — retry row by row
+                    print(f"[Ingest] ⚠️  Group insert of {len(rows)} rows failed ({e}); retrying individually")
+                    for row in rows:
+                        try:
+                            insert_reports(db, [row])
+                            db.commit()
+                            written += 1
+                        except (IntegrityError, DataError) as row_err:
+                            db.rollback()
+                            self.failed_rows += 1
+                            print(f"[Ingest] ✗ Dropped row for {row.get('stn_id')}: {row_err}")
+                        except Exception as row_err:
+                            db.rollback()
+                            print(f"[Ingest] ⚠️  Keeping {len(rows) - done} rows for a retry: {row_err}")
+                            break
+                        done += 1
+        except Exception as e:
+            # No session, or the rollback itself failed: keep what was not written
+            print(f"[Ingest] ⚠️  Flush failed ({e}); keeping {len(rows) - done} rows for a retry")
+        finally:
+            if db is not None:
+                db.close()
+        self.rows_written += written
+        self.flushes      += 1
+        self._batch.append(len(rows))
+        self._flush_ms.append((time.perf_counter() - t0) * 1000)
+        return rows[done:]
+
+    def stats(self) -> dict:
+        flush_ms = list(self._flush_ms)
+        batch    = list(self._batch)
+        return {
+            "running":         self.running,
+            "queue_depth":     self._depth,
+            "rows_written":    self.rows_written,
+            "flushes":         self.flushes,
+            "failed_rows":     self.failed_rows,
+            "retries":         self.retries,
+            "sync_fallbacks":  self.sync_fallbacks,
+            "flush_ms_p50":    round(_pct(flush_ms, 0.50), 3),
+            "flush_ms_p99":    round(_pct(flush_ms, 0.99), 3),
+            "flush_ms_max":    round(max(flush_ms, default=0), 3),
+            "batch_rows_mean": round(sum(batch) / len(batch), 1) if batch else 0,
+            "batch_rows_max":  max(batch, default=0),
+        }
+
+
+# One writer per worker process
+ingest_queue = IngestQueue()
@@ -0,0 +1,440 @@
+"""
+maintenance.py — In-process maintenance scheduler with leader election
+=======================================================================
+Housekeeping used to hang off startup hooks and request handlers: the
+command_queue prune only ran when the container restarted, and expired
+login sessions were only purged inside login_submit. A server that stays up
+for months never pruned anything.
+
+Scheduler runs registered jobs on fixed intervals inside the server process:
+
+    scope "leader"  DB housekeeping (prunes, rollups, ANALYZE, vacuum). Runs
+                    on one worker only — whichever holds the maintenance_lease
+                    row. The holder renews it every LEASE_S / 3 seconds; if
+                    it dies, another worker takes over once the lease expires.
+                    Run history is kept in maintenance_jobs, so a restart or
+                    failover does not re-run a daily job early, and any worker
+                    can show the status page.
+    scope "worker"  Process-local cache warmers. Run on every worker; their
+                    stats live in memory.
+
+Sync jobs run on the default executor thread; async jobs (RetentionJob's
+pass, which paces itself) run on the loop. Every due job runs in its own
+task, so an hour-long index build or retention pass does not hold back the
+cache warmers or the OTA rollout tick; a job is never started again while
+its previous run is still going. Leader jobs can overlap: SQLite serialises
+their writes, and one that runs out of busy_timeout behind a long one fails
+and runs again at its next interval.
+
+hold_writes() / release_writes() (or `with holding_writes(...)`) put a
+"hold:<key>" maintenance_lease row up around work that keeps the write lock
+for longer than busy_timeout (a CREATE INDEX on health_reports, a migration
+swap). Every worker's write-behind queue checks for any live hold before a
+flush and keeps its rows meanwhile.
+
+Long leader jobs (the verdict re-score) save_cursor() in the same
+transaction as each batch, so the next run resumes there — on this worker
+or on the next leader.
+
+The lease is a single UPDATE ... WHERE holder = me OR expires_at < now —
+atomic under SQLite's write lock, so two workers can never both win it.
+
+GET /metrics/maintenance (JSON) and /maintenance (page) show the leader,
+each job's schedule, last / max run time, result and last error.
+"""
+
+import asyncio, contextlib, datetime, json, os, socket, time, uuid
+
+from sqlalchemy import text
+
+from app.models import MaintenanceJob
+
+MAINTENANCE   = os.getenv("MAINTENANCE", "1") == "1"       # 0 = no scheduler in this process
+TICK_S        = float(os.getenv("MAINT_TICK_S", "30"))
+LEASE_S       = float(os.getenv("MAINT_LEASE_S", "90"))
+ANALYZE_LIMIT = int(os.getenv("MAINT_ANALYZE_LIMIT", "1000"))  # rows sampled per index
+VACUUM_PAGES  = int(os.getenv("MAINT_VACUUM_PAGES", "2000"))   # pages returned to the OS per run
+
+LEASE_NAME  = "maintenance"
+HOLD_PREFIX = "hold:"                                          # + one key per hold
+HOLD_MAX_S  = float(os.getenv("MAINT_HOLD_MAX_S", "1800"))     # a hold whose holder died lapses after this
+
+
+# ── Leader-only DB jobs ───────────────────────────────────────────────────────
+
+def analyze(engine, limit: int = ANALYZE_LIMIT) -> dict:
+    """
+    Refreshes planner statistics. analysis_limit bounds the work per index,
+    so this stays a sub-second job on a multi-GB health_reports. (PRAGMA
+    optimize alone does nothing on a fresh connection in SQLite < 3.46.)
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"PRAGMA analysis_limit={int(limit)}"))
+        conn.execute(text("ANALYZE"))
+        stats = conn.execute(text("SELECT COUNT(*) FROM sqlite_stat1")).scalar()
+    return {"stat_rows": stats}
+
+
+def incremental_vacuum(engine, pages: int = VACUUM_PAGES) -> dict:
+    """
+    Returns up to `pages` freelist pages to the filesystem. Only possible on
+    databases created with auto_vacuum=INCREMENTAL (new installs — see
+    database.SQLITE_PRAGMAS); older files keep reusing their freelist.
+    """
+    with engine.connect() as conn:
+        mode      = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+        page_size = conn.execute(text("PRAGMA page_size")).scalar()
+        before    = conn.execute(text("PRAGMA freelist_count")).scalar()
+    if mode != 2:
+        return {"auto_vacuum": "off", "freelist_mb": round(before * page_size / 1048576, 1)}
+    # pysqlite steps a statement without result columns only once, and each
+    # step of incremental_vacuum frees one page — executescript runs it to the end
+    raw = engine.raw_connection()
+    try:
+        raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+    finally:
+        raw.close()
+    with engine.connect() as conn:
+        after = conn.execute(text("PRAGMA freelist_count")).scalar()
+    return {"released_mb": round((before - after) * page_size / 1048576, 1),
+            "freelist_mb": round(after * page_size / 1048576, 1)}
+
+
+def in_session(session_factory, fn, *args):
+    """Wraps fn(db, *args) as a job: own session, commit on success."""
+    def job():
+        db = session_factory()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    job.__name__ = getattr(fn, "__name__", "job")
+    return job
+
+
+# ── Write hold ────────────────────────────────────────────────────────────────
+
+def hold_writes(engine, reason: str, seconds: float = HOLD_MAX_S) -> str:
+    """
+    Asks every worker's write-behind queue to keep its rows until
+    release_writes(engine, key). Each hold is its own maintenance_lease row,
+    so two holders (an index build and a migration swap) cannot release each
+    other's hold. Returns the hold's key.
+    """
+    key = f"{HOLD_PREFIX}{uuid.uuid4().hex[:12]}"
+    now = time.time()
+    with engine.begin() as conn:
+        # Holds whose holder died without releasing them
+        conn.execute(text("DELETE FROM maintenance_lease WHERE name LIKE :p AND expires_at < :now"),
+                     {"p": HOLD_PREFIX + "%", "now": now})
+        conn.execute(text(
+            "INSERT INTO maintenance_lease (name, holder, expires_at, acquired_at) VALUES (:n, :why, :exp, :now)"
+        ), {"n": key, "why": reason, "exp": now + seconds, "now": now})
+    return key
+
+
+def release_writes(engine, key: str):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM maintenance_lease WHERE name = :n"), {"n": key})
+
+
+@contextlib.contextmanager
+def holding_writes(engine, reason: str, seconds: float = HOLD_MAX_S):
+    """with holding_writes(engine, "index ix_x"): ... — hold_writes() / release_writes() around the block."""
+    key = hold_writes(engine, reason, seconds)
+    try:
+        yield key
+    finally:
+        release_writes(engine, key)
+
+
+def writes_held(db):
+    """The reason of the oldest live hold, or None. `db` is a Session or Connection."""
+    row = db.execute(text(
+        "SELECT holder FROM maintenance_lease WHERE name LIKE :p AND expires_at > :now ORDER BY acquired_at LIMIT 1"
+    ), {"p": HOLD_PREFIX + "%", "now": time.time()}).first()
+    return row[0] if row else None
+
+
+# ── Job cursors ───────────────────────────────────────────────────────────────
+
+def load_cursor(db, name: str):
+    """The resume point leader job `name` last saved with save_cursor(), or None."""
+    raw = db.execute(text("SELECT cursor FROM maintenance_jobs WHERE name = :n"), {"n": name}).scalar()
+    return json.loads(raw) if raw else None
+
+
+def save_cursor(db, name: str, value):
+    """
+    Saves a leader job's resume point in the caller's transaction, so it
+    commits together with the work it covers — whichever worker is leader
+    next picks up from there.
+    """
+    db.execute(text(
+        "INSERT INTO maintenance_jobs (name, runs, failures, cursor) VALUES (:n, 0, 0, :c) "
+        "ON CONFLICT(name) DO UPDATE SET cursor = :c"
+    ), {"n": name, "c": json.dumps(value)})
+
+
+# ── Scheduler ─────────────────────────────────────────────────────────────────
+
+class Job:
+    def __init__(self, name: str, every_s: float, fn, scope: str = "leader"):
+        self.name    = name
+        self.every_s = every_s
+        self.fn      = fn
+        self.scope   = scope
+        self.running = False
+        # Local stats: the only record for worker jobs, a mirror for leader jobs
+        self.state   = {"runs": 0, "failures": 0, "last_started": None, "last_seconds": None,
+                        "max_seconds": None, "last_result": None, "last_error": None}
+
+
+def _jsonable(result):
+    try:
+        json.dumps(result)
+        return result
+    except TypeError:
+        return str(result)
+
+
+class Scheduler:
+    def __init__(self, tick_s: float = TICK_S, lease_s: float = LEASE_S):
+        self.tick_s    = tick_s
+        self.lease_s   = lease_s
+        self.holder    = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs      = {}
+        self.engine    = None
+        self._won      = False
+        self._until    = 0.0        # local lease deadline
+        self._tasks    = []
+        self._runs     = set()      # job runs in flight (keeps the tasks referenced)
+
+    def add(self, name: str, every_s: float, fn, scope: str = "leader"):
+        """Registers a job. fn is a no-arg callable (run on a thread) or coroutine function."""
+        if every_s > 0:
+            self.jobs[name] = Job(name, every_s, fn, scope)
+
+    def trigger(self, name: str) -> bool:
+        """
+        Runs a registered job soon (e.g. delta_patches right after an upload).
+        Worker jobs, and leader jobs on the leader, start here and now. On
+        any other worker a leader job is only marked requested in
+        maintenance_jobs and the leader runs it on its next tick — never a
+        second run beside the leader's. False if unknown or already running.
+        """
+        job = self.jobs.get(name)
+        if job is None or job.running:
+            return False
+        if job.scope == "leader" and not self.is_leader:
+            if self.engine is None:
+                return False
+            future = asyncio.get_running_loop().run_in_executor(None, self._request, name)
+            self._runs.add(future)
+            future.add_done_callback(self._requested)
+            return True
+        self._spawn(job)
+        return True
+
+    def _request(self, name: str):
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO maintenance_jobs (name, runs, failures, requested_at) VALUES (:n, 0, 0, :now) "
+                "ON CONFLICT(name) DO UPDATE SET requested_at = :now"
+            ), {"n": name, "now": time.time()})
+
+    def _requested(self, future):
+        self._runs.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[Maintenance] ⚠️  Job request failed: {future.exception()}")
+
+    def _spawn(self, job: Job):
+        job.running = True          # before the task starts: the next tick / trigger() must see it
+        task = asyncio.create_task(self.run_job(job))
+        self._runs.add(task)
+        task.add_done_callback(self._runs.discard)
+
+    @property
+    def is_leader(self) -> bool:
+        # A worker whose loop stalled past its lease stops acting before the next heartbeat
+        return self._won and time.time() < self._until
+
+    @property
+    def running(self) -> bool:
+        return any(not t.done() for t in self._tasks)
+
+    def start(self, engine):
+        if self.running:
+            return
+        self.engine = engine
+        self._tasks = [asyncio.create_task(self._heartbeat()), asyncio.create_task(self._run())]
+
+    async def stop(self):
+        # A sync job already on its executor thread still finishes there
+        tasks = self._tasks + list(self._runs)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self.is_leader:
+            # Hand over now instead of making the next worker wait out the lease
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._release)
+            except Exception as e:
+                print(f"[Maintenance] ⚠️  Lease release failed: {e}")
+        self._won = False
+
+    # ── Lease ──
+
+    def _try_acquire(self) -> bool:
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT OR IGNORE INTO maintenance_lease (name, holder, expires_at, acquired_at) "
+                              "VALUES (:n, '', 0, 0)"), {"n": LEASE_NAME})
+            deadline = now + self.lease_s
+            won = conn.execute(text(
+                "UPDATE maintenance_lease SET holder = :me, expires_at = :exp, "
+                "acquired_at = CASE WHEN holder = :me THEN acquired_at ELSE :now END "
+                "WHERE name = :n AND (holder = :me OR expires_at < :now)"
+            ), {"n": LEASE_NAME, "me": self.holder, "exp": deadline, "now": now}).rowcount
+        if won == 1:
+            self._until = deadline
+        return won == 1
+
+    def _release(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE maintenance_lease SET expires_at = 0 WHERE name = :n AND holder = :me"),
+                         {"n": LEASE_NAME, "me": self.holder})
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                leader = await loop.run_in_executor(None, self._try_acquire)
+            except Exception as e:
+                print(f"[Maintenance] ⚠️  Lease check failed: {e}")
+                leader = False
+            if leader != self._won:
+                print(f"[Maintenance] {self.holder} {'is now' if leader else 'is no longer'} the maintenance leader")
+            self._won = leader
+            await asyncio.sleep(self.lease_s / 3)
+
+    # ── Job runs ──
+
+    def _load_history(self) -> dict:
+        with self.engine.connect() as conn:
+            return {row.name: row for row in conn.execute(text("SELECT * FROM maintenance_jobs"))}
+
+    def _save_run(self, job: Job, error):
+        s = job.state
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO maintenance_jobs (name, runs, failures, last_started, last_seconds, max_seconds, "
+                "last_result, last_error, holder) VALUES (:name, 1, :failed, :started, :secs, :secs, :result, :error, :me) "
+                "ON CONFLICT(name) DO UPDATE SET runs = runs + 1, failures = failures + :failed, "
+                "last_started = :started, last_seconds = :secs, max_seconds = MAX(COALESCE(max_seconds, 0), :secs), "
+                "last_result = :result, last_error = COALESCE(:error, last_error), holder = :me"
+            ), {"name": job.name, "failed": int(error is not None), "started": s["last_started"],
+                "secs": s["last_seconds"], "result": json.dumps(s["last_result"]), "error": error,
+                "me": self.holder})
+
+    async def run_job(self, job: Job):
+        """Runs one job now and records the outcome."""
+        loop  = asyncio.get_running_loop()
+        s     = job.state
+        error = None
+        job.running = True
+        s["last_started"] = time.time()
+        t0 = time.perf_counter()
+        try:
+            try:
+                if asyncio.iscoroutinefunction(job.fn):
+                    result = await job.fn()
+                else:
+                    result = await loop.run_in_executor(None, job.fn)
+                s["last_result"] = _jsonable(result)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                s["failures"] += 1
+                s["last_error"] = error
+                print(f"[Maintenance] ⚠️  {job.name} failed: {e}")
+            s["runs"] += 1
+            s["last_seconds"] = round(time.perf_counter() - t0, 3)
+            s["max_seconds"]  = max(s["max_seconds"] or 0, s["last_seconds"])
+            if job.scope == "leader" and self.engine is not None:
+                try:
+                    await loop.run_in_executor(None, self._save_run, job, error)
+                except Exception as e:
+                    print(f"[Maintenance] ⚠️  Could not record the {job.name} run: {e}")
+        finally:
+            # Only now: the next tick reads last_started from the row saved above
+            job.running = False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(1)          # let the first heartbeat settle the lease
+        while True:
+            try:
+                history = await loop.run_in_executor(None, self._load_history) if self.is_leader else {}
+                for job in list(self.jobs.values()):
+                    if job.scope == "leader":
+                        if not self.is_leader:
+                            continue
+                        row = history.get(job.name)
+                        last = row.last_started if row else None
+                        # trigger() on another worker since the last run
+                        requested = row is not None and (row.requested_at or 0) > (last or 0)
+                    else:
+                        last, requested = job.state["last_started"], False
+                    if not job.running and (requested or last is None or time.time() - last >= job.every_s):
+                        self._spawn(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Maintenance] ⚠️  Scheduler tick failed: {e}")
+            await asyncio.sleep(self.tick_s)
+
+    # ── Status ──
+
+    def status(self, db) -> dict:
+        """Leader, lease and per-job schedule / history. Works on any worker."""
+        lease = db.execute(text("SELECT holder, expires_at, acquired_at FROM maintenance_lease WHERE name = :n"),
+                           {"n": LEASE_NAME}).first()
+        rows  = {r.name: r for r in db.query(MaintenanceJob).all()}
+        now   = time.time()
+        iso   = lambda t: datetime.datetime.utcfromtimestamp(t).isoformat(timespec="seconds") if t else None
+        jobs  = []
+        for job in self.jobs.values():
+            if job.scope == "leader":
+                row = rows.get(job.name)
+                s = {"runs": row.runs, "failures": row.failures, "last_started": row.last_started,
+                     "last_seconds": row.last_seconds, "max_seconds": row.max_seconds,
+                     "last_result": json.loads(row.last_result) if row.last_result else None,
+                     "last_error": row.last_error, "ran_on": row.holder} if row else {"runs": 0, "failures": 0}
+            else:
+                s = dict(job.state, ran_on="this worker")
+            last = s.get("last_started")
+            jobs.append(dict(s, name=job.name, scope=job.scope, every_s=job.every_s,
+                             running=job.running, last_started=iso(last),
+                             next_due=iso(last + job.every_s) if last else "now"))
+        return {
+            "enabled": MAINTENANCE,
+            "this_worker": self.holder,
+            "is_leader": self.is_leader,
+            "leader": lease.holder if lease and lease.expires_at > now else None,
+            "leader_since": iso(lease.acquired_at) if lease and lease.expires_at > now else None,
+            "write_hold": writes_held(db),
+            "jobs": jobs,
+        }
+
+
+scheduler = Scheduler()
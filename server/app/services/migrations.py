@@ -0,0 +1,598 @@
+"""
+migrations.py — Versioned schema migrations
+============================================
+Schema changes used to live in three places (migrate.py, drop_unnecessary_cols.py
+and the eval_store column check), each probing PRAGMA table_info and catching
+"duplicate column" errors, and dropping a column rebuilt the whole of
+health_reports in one transaction with the server stopped.
+
+Every change is now one numbered step in MIGRATIONS, recorded in the
+schema_migrations table when applied, and never run twice:
+
+    AddColumns   ALTER TABLE ... ADD COLUMN — SQLite only rewrites the schema,
+                 so these run synchronously at startup (apply_light()).
+    DropColumns  copies the table into <table>__rebuild without the columns,
+                 in id-ordered chunks of MIGRATE_BATCH_ROWS, each its own short
+                 transaction. Triggers mirror every INSERT / UPDATE / DELETE on
+                 the live table into the copy, so ingest and the re-scorer keep
+                 running. The cursor is saved in schema_migrations after every
+                 chunk: a restart (or Ctrl-C of migrate.py) resumes where it
+                 stopped. The swap — drop the old table, rename the copy — is
+                 one short transaction; indexes are re-created afterwards, one
+                 per transaction. (SQLite cannot rename an index, so they
+                 cannot be built on the copy ahead of time under their final
+                 names.) Until the last one is back, reads that need them
+                 scan the table — seconds to minutes on a multi-GB
+                 health_reports. Each CREATE INDEX keeps the write lock for
+                 its whole build, so the swap and every build run under
+                 maintenance.holding_writes(): the write-behind queues keep
+                 their rows instead of running into busy_timeout.
+
+Steps apply strictly in version order. At startup the light steps run inline;
+the first step that needs a rebuild (and everything after it) is left to
+the maintenance leader's "migrations" job (MigrationRunner; MIGRATE_ONLINE=1,
+the default) — one worker, resuming from the saved cursor on every run and
+on whichever worker takes the lease over — or to `python3 migrate.py`.
+`python3 migrate.py --dry-run` prints the pending steps with row counts and
+an estimated time measured on a sample of the table.
+
+The runtime _auto_migrate() in routers/health.py still adds whitelisted
+device fields on first sight — a single ADD COLUMN, never a rebuild — but
+not while a copy is in progress (rebuilding()): the copy and its triggers
+only carry the columns read when the rebuild started. If a column gets in
+anyway, the swap sees it, throws the copy away and the rebuild starts over.
+"""
+
+import asyncio, contextlib, datetime, json, os, time
+
+from sqlalchemy import text
+
+from app.models import SchemaMigration
+from app.services.maintenance import holding_writes
+
+MIGRATE_BATCH_ROWS = int(os.getenv("MIGRATE_BATCH_ROWS", "5000"))
+MIGRATE_PAUSE_MS   = int(os.getenv("MIGRATE_PAUSE_MS", "50"))
+MIGRATE_ONLINE     = os.getenv("MIGRATE_ONLINE", "1") == "1"
+MIGRATE_INTERVAL_S = float(os.getenv("MIGRATE_INTERVAL_S", "600"))   # leader job: resume / pick up pending steps
+
+# Rows copied into a TEMP table by --dry-run to measure this machine's copy rate
+_SAMPLE_ROWS = 5000
+
+
+@contextlib.contextmanager
+def _immediate(engine):
+    """
+    Write transaction that takes the lock up front. pysqlite only opens a
+    transaction implicitly before DML, so DDL (CREATE / DROP / ALTER) would
+    otherwise autocommit statement by statement.
+    """
+    with engine.begin() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        yield conn
+
+
+def _table_exists(conn, table: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :t"), {"t": table}
+    ).first() is not None
+
+
+def _table_info(conn, table: str) -> list:
+    return conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+
+
+def _column_names(conn, table: str) -> list:
+    return [row[1] for row in _table_info(conn, table)]
+
+
+def rebuilding(conn, table: str) -> bool:
+    """A DropColumns copy of `table` is in progress. `conn` is a Session or Connection."""
+    return _table_exists(conn, f"{table}__rebuild")
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class AddColumns:
+    """ALTER TABLE ADD COLUMN for every listed column the table does not have yet."""
+
+    def __init__(self, version: int, name: str, table: str, columns: list):
+        self.version = version
+        self.name    = name
+        self.table   = table
+        self.columns = columns          # [(column, sql_type, default SQL or None)]
+
+    def todo(self, conn) -> list:
+        if not _table_exists(conn, self.table):
+            return []                   # create_all() makes it with every column
+        existing = set(_column_names(conn, self.table))
+        return [c for c in self.columns if c[0] not in existing]
+
+    def needs_rebuild(self, conn) -> bool:
+        return False
+
+    def plan(self, engine) -> dict:
+        with engine.connect() as conn:
+            todo = self.todo(conn)
+        return {"action": f"add {len(todo)} column(s) to {self.table}" if todo else "nothing to do",
+                "rows": 0, "est_seconds": 0.0}
+
+    def apply(self, engine, record, batch=None, pause=None, should_stop=None):
+        with _immediate(engine) as conn:
+            for col, dtype, default in self.todo(conn):
+                ddl = f"ALTER TABLE {self.table} ADD COLUMN {col} {dtype}"
+                if default is not None:
+                    ddl += f" DEFAULT {default}"
+                conn.exec_driver_sql(ddl)
+                print(f"[Migrate] v{self.version}: added {self.table}.{col}")
+        return True
+
+
+class DropColumns:
+    """Online, resumable table rebuild without the listed columns."""
+
+    KEY = "id"
+
+    def __init__(self, version: int, name: str, table: str, columns: list):
+        self.version = version
+        self.name    = name
+        self.table   = table
+        self.columns = columns
+        self.copy    = f"{table}__rebuild"
+
+    def todo(self, conn) -> list:
+        if not _table_exists(conn, self.table):
+            return []
+        existing = set(_column_names(conn, self.table))
+        return [c for c in self.columns if c in existing]
+
+    def needs_rebuild(self, conn) -> bool:
+        return bool(self.todo(conn)) or _table_exists(conn, self.copy)
+
+    # ── Building blocks ───────────────────────────────────────────────────────
+
+    def _keep(self, conn) -> list:
+        drop = set(self.columns)
+        return [row for row in _table_info(conn, self.table) if row[1] not in drop]
+
+    def _create_sql(self, keep: list) -> str:
+        cols = []
+        for _, name, dtype, notnull, default, pk in keep:
+            col = f"{_q(name)} {dtype}".rstrip()
+            if pk:
+                col += " PRIMARY KEY"       # the INTEGER rowid alias
+            elif notnull:
+                col += " NOT NULL"
+            if default is not None:
+                col += f" DEFAULT {default}"
+            cols.append(col)
+        return f"CREATE TABLE {self.copy} ({', '.join(cols)})"
+
+    def _trigger_sql(self, names: list) -> list:
+        cols = ", ".join(_q(n) for n in names)
+        new  = ", ".join(f"NEW.{_q(n)}" for n in names)
+        mirror = f"INSERT OR REPLACE INTO {self.copy} ({cols}) VALUES ({new});"
+        return [
+            f"CREATE TRIGGER {self.copy}_ins AFTER INSERT ON {self.table} BEGIN {mirror} END",
+            f"CREATE TRIGGER {self.copy}_upd AFTER UPDATE ON {self.table} BEGIN {mirror} END",
+            f"CREATE TRIGGER {self.copy}_del AFTER DELETE ON {self.table} "
+            f"BEGIN DELETE FROM {self.copy} WHERE {self.KEY} = OLD.{self.KEY}; END",
+        ]
+
+    def _index_sql(self, conn) -> list:
+        """CREATE INDEX statements of the live table that survive the drop."""
+        drop, keep = set(self.columns), []
+        for name, sql in conn.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+        ), {"t": self.table}):
+            used = {row[2] for row in conn.execute(text(f"PRAGMA index_info({_q(name)})"))}
+            if not used & drop:
+                keep.append(sql)
+        return keep
+
+    # ── Steps ─────────────────────────────────────────────────────────────────
+
+    def _begin(self, engine):
+        """Creates the copy and its mirror triggers, and snapshots the id to copy up to."""
+        with _immediate(engine) as conn:
+            if _table_exists(conn, self.copy):
+                return                  # resuming
+            keep  = self._keep(conn)
+            names = [row[1] for row in keep]
+            conn.exec_driver_sql(self._create_sql(keep))
+            for sql in self._trigger_sql(names):
+                conn.exec_driver_sql(sql)
+            target = conn.execute(text(f"SELECT COALESCE(MAX({self.KEY}), 0) FROM {self.table}")).scalar()
+            conn.execute(text(
+                "UPDATE schema_migrations SET cursor_id = 0, target_id = :t, rows_done = 0, detail = :d "
+                "WHERE version = :v"
+            ), {"t": target, "d": json.dumps({"columns": names}), "v": self.version})
+        print(f"[Migrate] v{self.version}: copying {self.table} up to id {target} "
+              f"without {', '.join(self.columns)}")
+
+    def _copy_chunk(self, engine, batch: int) -> int:
+        """Copies the next id range; returns rows copied, or -1 when the copy is complete."""
+        with _immediate(engine) as conn:
+            cursor_id, target, detail = conn.execute(text(
+                "SELECT cursor_id, target_id, detail FROM schema_migrations WHERE version = :v"
+            ), {"v": self.version}).one()
+            if cursor_id >= target:
+                return -1
+            hi = conn.execute(text(
+                f"SELECT {self.KEY} FROM {self.table} WHERE {self.KEY} > :c AND {self.KEY} <= :t "
+                f"ORDER BY {self.KEY} LIMIT 1 OFFSET :o"
+            ), {"c": cursor_id, "t": target, "o": batch - 1}).scalar() or target
+            cols = ", ".join(_q(n) for n in json.loads(detail)["columns"])
+            # OR IGNORE: rows already mirrored by a trigger are newer than this copy
+            copied = conn.execute(text(
+                f"INSERT OR IGNORE INTO {self.copy} ({cols}) SELECT {cols} FROM {self.table} "
+                f"WHERE {self.KEY} > :c AND {self.KEY} <= :hi"
+            ), {"c": cursor_id, "hi": hi}).rowcount
+            conn.execute(text(
+                "UPDATE schema_migrations SET cursor_id = :hi, rows_done = rows_done + :n WHERE version = :v"
+            ), {"hi": hi, "n": max(copied, 0), "v": self.version})
+        return max(copied, 0)
+
+    def _swap(self, engine) -> bool:
+        """Replaces the live table with the copy. Short: no row is moved here."""
+        with holding_writes(engine, f"migration v{self.version} swap"):
+            return self._swap_tables(engine)
+
+    def _swap_tables(self, engine) -> bool:
+        """False if the live table changed shape since _begin() and the copy was thrown away."""
+        with _immediate(engine) as conn:
+            if not _table_exists(conn, self.copy):
+                return True
+            detail = json.loads(conn.execute(text(
+                "SELECT detail FROM schema_migrations WHERE version = :v"
+            ), {"v": self.version}).scalar())
+            # The copy and its triggers only carry the columns read at _begin()
+            added = [row[1] for row in self._keep(conn) if row[1] not in detail["columns"]]
+            if added:
+                self._discard(conn)
+                print(f"[Migrate] ⚠️  v{self.version}: {self.table} gained {', '.join(added)} "
+                      f"during the rebuild — copying again")
+                return False
+            indexes = self._index_sql(conn)
+            detail["indexes"] = indexes
+            for suffix in ("ins", "upd", "del"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {self.copy}_{suffix}")
+            conn.exec_driver_sql(f"DROP TABLE {self.table}")
+            conn.exec_driver_sql(f"ALTER TABLE {self.copy} RENAME TO {self.table}")
+            conn.execute(text("UPDATE schema_migrations SET detail = :d WHERE version = :v"),
+                         {"d": json.dumps(detail), "v": self.version})
+        print(f"[Migrate] v{self.version}: swapped in the rebuilt {self.table}")
+        return True
+
+    def _discard(self, conn):
+        """Drops the copy and its triggers; the next _begin() starts over from id 0."""
+        for suffix in ("ins", "upd", "del"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {self.copy}_{suffix}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {self.copy}")
+        conn.execute(text(
+            "UPDATE schema_migrations SET cursor_id = 0, target_id = 0, rows_done = 0, detail = NULL "
+            "WHERE version = :v"
+        ), {"v": self.version})
+
+    def _reindex(self, engine):
+        with engine.connect() as conn:
+            detail = json.loads(conn.execute(text(
+                "SELECT detail FROM schema_migrations WHERE version = :v"
+            ), {"v": self.version}).scalar() or "{}")
+        start = time.perf_counter()
+        for sql in detail.get("indexes", []):
+            name = sql.split(" ON ")[0].split()[-1]
+            t0 = time.perf_counter()
+            with holding_writes(engine, f"migration v{self.version} index {name}"), _immediate(engine) as conn:
+                conn.exec_driver_sql(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+                                        .replace("CREATE UNIQUE INDEX", "CREATE UNIQUE INDEX IF NOT EXISTS", 1))
+            print(f"[Migrate] v{self.version}: {name} rebuilt in {time.perf_counter() - t0:.1f}s")
+        if detail.get("indexes"):
+            print(f"[Migrate] v{self.version}: {self.table} indexes back after "
+                  f"{time.perf_counter() - start:.1f}s")
+
+    def apply(self, engine, record, batch=MIGRATE_BATCH_ROWS, pause=None, should_stop=None):
+        """
+        Runs (or resumes) the rebuild. pause(seconds) is called between chunks;
+        returns False if should_stop() asked to stop before the swap, or the
+        copy had to be started over.
+        """
+        with engine.connect() as conn:
+            todo, have_copy = self.todo(conn), _table_exists(conn, self.copy)
+        if todo or have_copy:
+            self._begin(engine)
+            while True:
+                if should_stop and should_stop():
+                    return False
+                if self._copy_chunk(engine, batch) < 0:
+                    break
+                record.update(_row(engine, self.version))
+                if pause:
+                    pause(MIGRATE_PAUSE_MS / 1000)
+            if not self._swap(engine):
+                return False
+        self._reindex(engine)
+        return True
+
+    def plan(self, engine) -> dict:
+        with engine.connect() as conn:
+            todo = self.todo(conn)
+            if not todo and not _table_exists(conn, self.copy):
+                return {"action": "nothing to do", "rows": 0, "est_seconds": 0.0}
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {self.table}")).scalar()
+            names = ", ".join(_q(row[1]) for row in self._keep(conn))
+            index_cols = []
+            for (sql,) in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+            ), {"t": self.table}):
+                cols = [row[2] for row in conn.execute(text(f"PRAGMA index_info({_q(sql)})"))]
+                if cols and not set(cols) & set(self.columns):
+                    index_cols.append(cols)
+
+            # Time the copy and the index builds on a sample, in TEMP (never the live file)
+            n = min(rows, _SAMPLE_ROWS)
+            conn.exec_driver_sql(f"CREATE TEMP TABLE _migrate_sample AS SELECT {names} FROM {self.table} LIMIT 0")
+            try:
+                t0 = time.perf_counter()
+                conn.exec_driver_sql(f"INSERT INTO _migrate_sample SELECT {names} FROM {self.table} "
+                                     f"ORDER BY {self.KEY} LIMIT {n}")
+                t_copy = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                for i, cols in enumerate(index_cols):
+                    conn.exec_driver_sql(f"CREATE INDEX temp._migrate_sample_{i} ON _migrate_sample "
+                                         f"({', '.join(_q(c) for c in cols)})")
+                t_index = time.perf_counter() - t0
+            finally:
+                conn.rollback()
+                conn.exec_driver_sql("DROP TABLE IF EXISTS temp._migrate_sample")
+        scale  = rows / n if n else 0
+        chunks = -(-rows // MIGRATE_BATCH_ROWS)
+        return {
+            "action": f"rebuild {self.table} without {', '.join(todo) or '(resume)'}",
+            "rows": rows,
+            "est_seconds": round(t_copy * scale + chunks * MIGRATE_PAUSE_MS / 1000, 1),
+            "est_index_seconds": round(t_index * scale, 1),
+            "indexes": len(index_cols),
+        }
+
+
+# ── The migrations, in order. Append only; never renumber. ────────────────────
+
+MIGRATIONS = [
+    AddColumns(1, "health_reports columns from migrate.py (v7.59 and earlier)", "health_reports", [
+        ("ota_fails",          "INTEGER", "0"),
+        ("ota_fail_reason",    "TEXT",    "'NONE'"),
+        ("prev_stored",        "INTEGER", "0"),
+        ("http_suc_cnt",       "INTEGER", "0"),
+        ("http_suc_cnt_prev",  "INTEGER", "0"),
+        ("http_ret_cnt",       "INTEGER", "0"),
+        ("http_ret_cnt_prev",  "INTEGER", "0"),
+        ("ftp_suc_cnt",        "INTEGER", "0"),
+        ("ftp_suc_cnt_prev",   "INTEGER", "0"),
+        ("http_fails",         "INTEGER", "0"),
+        ("http_fail_reason",   "TEXT",    "'NONE'"),
+        ("net_cnt",            "INTEGER", "0"),
+        ("net_cnt_prev",       "INTEGER", "0"),
+        ("first_http",         "INTEGER", "0"),
+        ("spiffs_kb",          "INTEGER", "0"),
+        ("spiffs_total_kb",    "INTEGER", "4640"),
+        ("calib",              "TEXT",    "'NA'"),
+        ("ndm_cnt",            "INTEGER", "0"),
+        ("pd_cnt",             "INTEGER", "0"),
+        ("cdm_sts",            "TEXT",    "'PENDING'"),
+        ("reg_fails",          "INTEGER", "0"),
+        ("reg_fail_reason",    "TEXT",    "'NONE'"),
+        ("reset_reason",       "INTEGER", "0"),
+        ("http_present_fails", "INTEGER", "0"),
+        ("http_cum_fails",     "INTEGER", "0"),
+        ("consec_reg_fails",   "INTEGER", "0"),
+        ("consec_http_fails",  "INTEGER", "0"),
+        ("consec_sim_fails",   "INTEGER", "0"),
+        ("unsent_count",       "INTEGER", "0"),
+        ("http_backlog_cnt",   "INTEGER", "0"),
+        ("mutex_fail",         "INTEGER", "0"),
+    ]),
+    AddColumns(2, "command_queue feedback loop (v7.92)", "command_queue", [
+        ("result",       "TEXT",     "'SENT'"),
+        ("completed_at", "DATETIME", "NULL"),
+    ]),
+    AddColumns(3, "stored health verdict (services/eval_store.py)", "health_reports", [
+        ("eval_verdict", "TEXT",    None),
+        ("eval_score",   "INTEGER", None),
+        ("eval_reasons", "TEXT",    None),
+        ("eval_rev",     "INTEGER", None),
+    ]),
+    DropColumns(4, "drop retired health_reports columns (drop_unnecessary_cols.py)", "health_reports", [
+        "cur_stored", "spiffs_free_kb", "slot_no", "reg_avg",
+        "reg_worst", "reg_fail_type", "http_avg", "ws_same_cnt",
+    ]),
+    AddColumns(5, "content-addressed firmware store (services/build_store.py)", "firmware_registry", [
+        ("sha256", "VARCHAR(64)", None),
+    ]),
+    AddColumns(6, "leader job requests from other workers (services/maintenance.py)", "maintenance_jobs", [
+        ("requested_at", "FLOAT", None),
+    ]),
+    AddColumns(7, "resume point of long leader jobs (services/maintenance.py)", "maintenance_jobs", [
+        ("cursor", "TEXT", None),
+    ]),
+]
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+def ensure_table(engine):
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+
+
+def _row(engine, version: int) -> dict:
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT * FROM schema_migrations WHERE version = :v"), {"v": version}).first()
+    return dict(row._mapping) if row else {}
+
+
+def _done_versions(engine) -> set:
+    with engine.connect() as conn:
+        return {v for (v,) in conn.execute(text("SELECT version FROM schema_migrations WHERE state = 'done'"))}
+
+
+def pending(engine) -> list:
+    ensure_table(engine)
+    done = _done_versions(engine)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def _start(engine, m):
+    with _immediate(engine) as conn:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO schema_migrations (version, name, state, cursor_id, target_id, rows_done, started_at) "
+            "VALUES (:v, :n, 'running', 0, 0, 0, :t)"
+        ), {"v": m.version, "n": m.name, "t": datetime.datetime.utcnow()})
+
+
+def _finish(engine, m):
+    with _immediate(engine) as conn:
+        conn.execute(text(
+            "UPDATE schema_migrations SET state = 'done', applied_at = :t WHERE version = :v"
+        ), {"t": datetime.datetime.utcnow(), "v": m.version})
+    print(f"[Migrate] v{m.version} applied: {m.name}")
+
+
+def run(engine, m, record=None, pause=None, should_stop=None, batch=MIGRATE_BATCH_ROWS) -> bool:
+    """Applies one migration (resuming a partial rebuild). Returns False if stopped early."""
+    _start(engine, m)
+    if not m.apply(engine, record if record is not None else {}, batch=batch,
+                   pause=pause, should_stop=should_stop):
+        return False
+    _finish(engine, m)
+    return True
+
+
+def apply_light(engine) -> list:
+    """
+    Startup: applies pending migrations in order up to the first one that has
+    to rebuild a table. Returns the migrations still pending.
+    """
+    todo = pending(engine)
+    while todo:
+        with engine.connect() as conn:
+            if todo[0].needs_rebuild(conn):
+                break
+        run(engine, todo[0])
+        todo.pop(0)
+    if todo:
+        print(f"[Migrate] {len(todo)} migration(s) pending from v{todo[0].version} "
+              f"({'running online' if MIGRATE_ONLINE else 'run python3 migrate.py'})")
+    return todo
+
+
+def apply_all(engine, batch=MIGRATE_BATCH_ROWS) -> int:
+    """Foreground: every pending migration, rebuilds included. Returns the count applied."""
+    count = 0
+    for m in pending(engine):
+        while not run(engine, m, pause=time.sleep, batch=batch):
+            pass                        # the copy was thrown away at the swap — copy again
+        count += 1
+    return count
+
+
+def dry_run(engine) -> list:
+    """[{version, name, action, rows, est_seconds, ...}] for every pending migration. Writes nothing."""
+    ensure_table(engine)
+    done = _done_versions(engine)
+    return [dict(version=m.version, name=m.name, **m.plan(engine))
+            for m in MIGRATIONS if m.version not in done]
+
+
+def status(engine) -> list:
+    ensure_table(engine)
+    with engine.connect() as conn:
+        rows = {r.version: dict(r._mapping) for r in conn.execute(text("SELECT * FROM schema_migrations"))}
+    out = []
+    for m in MIGRATIONS:
+        r = rows.get(m.version, {})
+        out.append({"version": m.version, "name": m.name, "state": r.get("state", "pending"),
+                    "rows_done": r.get("rows_done", 0), "target_id": r.get("target_id", 0),
+                    "cursor_id": r.get("cursor_id", 0)})
+    return out
+
+
+class MigrationRunner:
+    """
+    The leader job "migrations": applies the pending migrations (rebuilds
+    included) chunk by chunk, resuming a partial rebuild from the cursor
+    saved in schema_migrations — after a restart, or on whichever worker
+    takes over the maintenance lease.
+    """
+
+    def __init__(self):
+        self._active  = None            # executor future of the pass in flight
+        self._stop    = False
+        self.current  = None
+        self.progress = {}
+        self.error    = None
+        self.done     = False
+
+    @property
+    def running(self) -> bool:
+        return self._active is not None and not self._active.done()
+
+    async def run_pass(self, engine, should_stop=None) -> dict:
+        """
+        One pass over the pending migrations. should_stop() (e.g. "no longer
+        the leader") is checked between chunks like stop(); a stopped or
+        failed pass resumes at the job's next run.
+        """
+        if self.running:
+            return {"skipped": "previous pass still stopping"}
+        self._stop = False
+        stop = lambda: self._stop or bool(should_stop and should_stop())
+        self._active = asyncio.get_running_loop().run_in_executor(None, self._apply, engine, stop)
+        try:
+            return await asyncio.shield(self._active)
+        except asyncio.CancelledError:
+            # Scheduler shutdown: the thread stops after the chunk in flight
+            self._stop = True
+            raise
+
+    async def stop(self):
+        """Stops the pass in flight after its current chunk. The cursor is saved."""
+        if self.running:
+            self._stop = True
+            try:
+                await self._active
+            except Exception:
+                pass
+
+    def _apply(self, engine, should_stop) -> dict:
+        applied = []
+        try:
+            for m in pending(engine):
+                self.current, self.progress = m.version, {}
+                if not run(engine, m, record=self.progress, pause=time.sleep, should_stop=should_stop):
+                    print(f"[Migrate] v{m.version} paused at id {self.progress.get('cursor_id', 0)} "
+                          f"— resumes on the next run")
+                    return {"applied": applied, "paused": m.version,
+                            "cursor_id": self.progress.get("cursor_id", 0)}
+                applied.append(m.version)
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Migrate] ⚠️  Migration stopped: {e}")
+            raise
+        self.current, self.error, self.done = None, None, True
+        return {"applied": applied}
+
+    def stats(self) -> dict:
+        """This worker's view; only the leader runs the job. status() has every worker's."""
+        return {
+            "running": self.running,
+            "done": self.done,
+            "current": self.current,
+            "rows_done": self.progress.get("rows_done", 0),
+            "target_id": self.progress.get("target_id", 0),
+            "cursor_id": self.progress.get("cursor_id", 0),
+            "error": self.error,
+        }
+
+
+migration_runner = MigrationRunner()
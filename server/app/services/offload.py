@@ -0,0 +1,58 @@
+"""
+offload.py — Run blocking DB work off the event loop
+=====================================================
+The check-in and page handlers are `async def`, but everything they do with
+SQLAlchemy is synchronous. Run inline, one slow /dashboard render stalled
+every device check-in and firmware download on the same worker.
+
+Handlers now read the request asynchronously, then hand the DB work (and
+template rendering) to a worker thread. The two kinds of work get separate
+thread limits, so heavy pages can never take the threads check-ins need:
+
+    INGEST_THREADS  (default 4)   /health, /health/batch
+    READ_THREADS    (default 1)   /dashboard, /station, /summary, /ota
+
+Keep READ_THREADS low: renders are pure-Python CPU work sharing one GIL with
+check-ins, so every extra concurrent render slows ingest down. Extra renders
+queue behind each other instead (benchmarks.py concurrency).
+"""
+
+import asyncio, os
+
+import anyio.to_thread
+from anyio import CapacityLimiter
+
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", "4"))
+READ_THREADS   = int(os.getenv("READ_THREADS", "1"))
+
+# Created on first use: a CapacityLimiter binds to the running event loop
+_limiters = {}
+_loop     = None
+
+
+def _limiter(kind: str, tokens: int) -> CapacityLimiter:
+    global _loop
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:          # new loop (tests, scripts) — start fresh
+        _limiters.clear()
+        _loop = loop
+    if kind not in _limiters:
+        _limiters[kind] = CapacityLimiter(tokens)
+    return _limiters[kind]
+
+
+async def run_ingest(fn, *args):
+    """Runs fn(*args) on an ingest worker thread."""
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_limiter("ingest", INGEST_THREADS))
+
+
+async def run_read(fn, *args):
+    """Runs fn(*args) on a page-render worker thread."""
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_limiter("read", READ_THREADS))
+
+
+def stats() -> dict:
+    return {
+        kind: {"threads": lim.total_tokens, "busy": lim.borrowed_tokens, "waiting": lim.statistics().tasks_waiting}
+        for kind, lim in _limiters.items()
+    }
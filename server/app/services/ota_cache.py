@@ -0,0 +1,227 @@
+"""
+ota_cache.py — Worker-local firmware targets, OTA locks and builds listing
+==========================================================================
+With no command pending, every /health check-in read station_settings
+(twice: once for the auto-lock, once for the exemption), looked up
+firmware_registry by (unit_type, system_mode) and stat()ed the firmware
+file. Those only change when an operator uses /ota/upload, /ota/delete,
+/station/{id}/ota or /toggle-ota-lock, or when a station auto-locks itself.
+
+OtaCache keeps one immutable snapshot per worker:
+
+    firmware   {(unit_type, system_mode): (current_ver, filename)}
+    exempt     stn_ids with ota_exempt = 1
+    builds     *.bin files present in BUILDS_DIR
+    patches    {(filename, from_ver, to_ver): patch_file} (services/delta_ota.py)
+    rollouts   {(unit_type, system_mode): in-flight stn_ids} for groups in a
+               staged rollout (services/ota_rollout.py) — empty while paused
+    pins       {file: SHA-256 prefix} from the manifest sidecars, for the v=
+               pin in the OTA_CHECK parameter (services/ota_manifest.py)
+
+so the OTA decision is a handful of dict / set lookups.
+
+Coherence: every writer calls bump(db) in the same transaction as its
+change. That increments cache_generation['ota'] and, once the transaction
+commits, drops this worker's snapshot. Other workers compare the counter (and
+BUILDS_DIR's mtime, for builds copied in by deploy scripts) at most every
+OTA_CACHE_CHECK_S seconds, so they pick up a change within that window.
+"""
+
+import os, threading, time
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import (CacheGeneration, FirmwareRegistry, OtaPatch, OtaRollout, OtaRolloutStation,
+                        StationSettings)
+from app.services import ota_manifest
+
+CHECK_S    = float(os.getenv("OTA_CACHE_CHECK_S", "2"))
+BUILDS_DIR = "/app/builds"
+GENERATION = "ota"
+
+
+class OtaView:
+    """One consistent snapshot; never mutated after it is built."""
+
+    def __init__(self, generation, firmware: dict, exempt: frozenset, builds: frozenset, dir_mtime,
+                 patches: dict = None, rollouts: dict = None, pins: dict = None):
+        self.generation = generation
+        self.firmware   = firmware
+        self.exempt     = exempt
+        self.builds     = builds
+        self.dir_mtime  = dir_mtime
+        self.patches    = patches or {}
+        self.rollouts   = rollouts or {}
+        self.pins       = pins or {}
+
+    def target(self, unit_type: str, system_mode: int):
+        """(current_ver, filename) for the group, or None."""
+        return self.firmware.get((unit_type, system_mode))
+
+    def is_exempt(self, stn_id: str) -> bool:
+        return stn_id in self.exempt
+
+    def has_build(self, filename: str) -> bool:
+        return filename in self.builds
+
+    def admitted(self, unit_type: str, system_mode: int, stn_id: str) -> bool:
+        """False while the group's rollout has not let this station in (yet)."""
+        gate = self.rollouts.get((unit_type, system_mode))
+        return gate is None or stn_id in gate
+
+    def patch(self, filename: str, from_ver: str, to_ver: str):
+        """Patch file taking `filename` from from_ver to to_ver (delta_ota.ver_key form), or None."""
+        return self.patches.get((filename, from_ver, to_ver))
+
+    def pin(self, filename: str):
+        """SHA-256 prefix of the file's current bytes, or None if its manifest is not written yet."""
+        return self.pins.get(filename)
+
+
+def _generation(db) -> int:
+    return db.execute(select(CacheGeneration.gen).where(CacheGeneration.name == GENERATION)).scalar() or 0
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _list_builds(path) -> frozenset:
+    try:
+        return frozenset(name for name in os.listdir(path) if name.endswith(".bin"))
+    except OSError:
+        return frozenset()
+
+
+class OtaCache:
+    def __init__(self, builds_dir: str = BUILDS_DIR, check_s: float = CHECK_S):
+        self.builds_dir = builds_dir
+        self.check_s    = check_s
+        self._view      = None
+        self._checked   = 0.0
+        self._lock      = threading.Lock()      # one reload at a time across ingest threads
+        self.hits       = 0
+        self.checks     = 0
+        self.reloads    = 0
+        self._pins      = {}        # file -> ((inode, size, mtime), pin); sidecars re-read only on change
+
+    def invalidate(self):
+        self._view = None
+
+    def _load_pins(self, builds: frozenset) -> dict:
+        pins = {}
+        for name in builds:
+            path = os.path.join(self.builds_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key    = (st.st_ino, st.st_size, st.st_mtime_ns)
+            cached = self._pins.get(name)
+            if cached is None or cached[0] != key:
+                manifest = ota_manifest.cached(path)
+                if manifest is None:
+                    continue        # written on the first /builds request; picked up on a later reload
+                cached = self._pins[name] = (key, ota_manifest.pin(manifest))
+            pins[name] = cached[1]
+        for name in set(self._pins) - builds:
+            del self._pins[name]
+        return pins
+
+    def _load(self, db, generation, mtime) -> OtaView:
+        firmware = {
+            (fw.unit_type, fw.system_mode): (fw.current_ver, fw.filename)
+            for fw in db.execute(select(FirmwareRegistry.unit_type, FirmwareRegistry.system_mode,
+                                        FirmwareRegistry.current_ver, FirmwareRegistry.filename))
+        }
+        exempt = frozenset(db.execute(select(StationSettings.stn_id).where(StationSettings.ota_exempt == 1)).scalars())
+        patches = {
+            (p.filename, p.from_ver, p.to_ver): p.patch_file
+            for p in db.execute(select(OtaPatch.filename, OtaPatch.from_ver, OtaPatch.to_ver, OtaPatch.patch_file)
+                                .where(OtaPatch.patch_file.isnot(None)))
+        }
+        rollouts, groups = {}, {}
+        for category_id, state, unit_type, system_mode in db.execute(
+                select(OtaRollout.category_id, OtaRollout.state, FirmwareRegistry.unit_type, FirmwareRegistry.system_mode)
+                .join(FirmwareRegistry, FirmwareRegistry.category_id == OtaRollout.category_id)
+                .where(OtaRollout.state != "done")):
+            rollouts[(unit_type, system_mode)] = set()
+            if state == "active":
+                groups[category_id] = rollouts[(unit_type, system_mode)]
+        for category_id, stn_id in db.execute(
+                select(OtaRolloutStation.category_id, OtaRolloutStation.stn_id)
+                .join(OtaRollout, (OtaRollout.category_id == OtaRolloutStation.category_id)
+                      & (OtaRollout.to_ver == OtaRolloutStation.to_ver))
+                .where(OtaRolloutStation.outcome.is_(None))):
+            if category_id in groups:
+                groups[category_id].add(stn_id)
+        rollouts = {key: frozenset(stns) for key, stns in rollouts.items()}
+        builds = _list_builds(self.builds_dir)
+        pins   = self._load_pins(builds) if ota_manifest.PIN else {}
+        return OtaView(generation, firmware, exempt, builds, mtime, patches, rollouts, pins)
+
+    def view(self, db) -> OtaView:
+        """The current snapshot; re-validated against the DB at most every check_s seconds."""
+        view = self._view
+        now  = time.monotonic()
+        if view is not None and now - self._checked < self.check_s:
+            self.hits += 1
+            return view
+        with self._lock:
+            view = self._view
+            if view is not None and time.monotonic() - self._checked < self.check_s:
+                self.hits += 1
+                return view
+            self.checks += 1
+            generation, mtime = _generation(db), _dir_mtime(self.builds_dir)
+            if view is None or view.generation != generation or view.dir_mtime != mtime:
+                view = self._load(db, generation, mtime)
+                self._view = view
+                self.reloads += 1
+            self._checked = time.monotonic()
+            return view
+
+    def stats(self) -> dict:
+        view = self._view
+        return {
+            "generation": view.generation if view else None,
+            "groups": len(view.firmware) if view else 0,
+            "exempt_stations": len(view.exempt) if view else 0,
+            "builds": len(view.builds) if view else 0,
+            "patches": len(view.patches) if view else 0,
+            "rollout_in_flight": sum(len(s) for s in view.rollouts.values()) if view else 0,
+            "hits": self.hits,
+            "checks": self.checks,
+            "reloads": self.reloads,
+        }
+
+
+ota_cache = OtaCache()
+
+
+def bump(db):
+    """
+    Marks the OTA inputs changed, in the caller's transaction. Call with any
+    firmware_registry / station_settings / ota_patches / ota_rollouts /
+    BUILDS_DIR change.
+    """
+    stmt = sqlite_insert(CacheGeneration).values(name=GENERATION, gen=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={"gen": CacheGeneration.gen + 1}))
+    # Invalidate after commit: a reload inside the open transaction would
+    # cache the old committed state under the old generation
+    event.listen(db, "after_commit", lambda _session: ota_cache.invalidate(), once=True)
+
+
+def warm() -> dict:
+    """Maintenance job (every worker): loads / re-validates the snapshot off the check-in path."""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        ota_cache.view(db)
+        return ota_cache.stats()
+    finally:
+        db.close()
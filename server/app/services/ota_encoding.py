@@ -0,0 +1,157 @@
+"""
+ota_encoding.py — Precompressed firmware images for /builds downloads
+======================================================================
+/builds sent every image uncompressed. ESP32 application images shrink by
+roughly a third under heatshrink with a 1 KB window, and heatshrink decodes
+in streaming mode in about that much RAM on the device.
+
+Next to each image, upload time writes
+
+    <file>.hs          the image in OTA_CHUNK_KB chunks, each heatshrink-encoded on its own
+    <file>.hs.json     {"encoding": "heatshrink", "window_sz2": 10, "lookahead_sz2": 5,
+                        "chunk_size": 32768, "raw_size": ..., "size": <encoded bytes>,
+                        "blocks": [0, 22187, ...], "used": true, "stamp": {...}}
+
+Block k starts at blocks[k] and decodes, with a fresh decoder, to exactly
+chunk k of the image — the chunk whose CRC32 is crc32[k] in the manifest
+(ota_manifest.py). A device resuming after a reboot restarts at a block
+boundary instead of from byte 0.
+
+Served by content negotiation on the same URL: a request with
+"Accept-Encoding: heatshrink" gets Content-Encoding: heatshrink and
+X-Decoded-Length, and Content-Length / Range / X-Content-CRC32 refer to
+the encoded bytes. Anything that doesn't ask (the devices in the field
+today, curl) gets the plain image. The block offsets are under "encodings"
+in GET /builds/{file}/manifest.
+
+No variant is kept when it saves less than OTA_ENCODING_MIN_SAVING
+(used: false is remembered so it is not retried), nor for delta patches,
+which are heatshrink-compressed already. Like the manifest, a stale index
+(an image copied in by a deploy script) is rebuilt on first request.
+heatshrink2 is optional (it comes with detools); without it every download
+is plain.
+"""
+
+import json, os
+
+from app.services.ota_manifest import CHUNK_SIZE, stamp
+
+try:
+    import heatshrink2
+except ImportError:   # optional dependency
+    heatshrink2 = None
+
+ENCODING      = "heatshrink"
+SUFFIX        = ".hs"
+WINDOW_SZ2    = int(os.getenv("OTA_HS_WINDOW", "10"))      # 2^10 = 1 KB decoder window
+LOOKAHEAD_SZ2 = int(os.getenv("OTA_HS_LOOKAHEAD", "5"))
+MIN_SAVING    = float(os.getenv("OTA_ENCODING_MIN_SAVING", "0.1"))
+
+
+def available() -> bool:
+    return heatshrink2 is not None
+
+
+def applies(filename: str) -> bool:
+    return filename.endswith(".bin") and not filename.endswith(".patch.bin")
+
+
+def variant_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def index_path(path: str) -> str:
+    return path + SUFFIX + ".json"
+
+
+def encode(data, chunk_size: int = CHUNK_SIZE,
+           window_sz2: int = WINDOW_SZ2, lookahead_sz2: int = LOOKAHEAD_SZ2) -> tuple:
+    """(encoded bytes, block start offsets) — one independent block per chunk."""
+    view = memoryview(data)
+    parts, blocks, pos = [], [], 0
+    for i in range(0, len(view), chunk_size):
+        block = heatshrink2.compress(view[i:i + chunk_size].tobytes(),
+                                     window_sz2=window_sz2, lookahead_sz2=lookahead_sz2)
+        blocks.append(pos)
+        parts.append(block)
+        pos += len(block)
+    return b"".join(parts), blocks
+
+
+def decode_block(encoded, index: dict, k: int) -> bytes:
+    """Chunk k of the image, from the encoded bytes (what a resuming device does)."""
+    blocks = index["blocks"]
+    end    = blocks[k + 1] if k + 1 < len(blocks) else index["size"]
+    return heatshrink2.decompress(bytes(encoded[blocks[k]:end]),
+                                  window_sz2=index["window_sz2"], lookahead_sz2=index["lookahead_sz2"])
+
+
+def write_for(path: str, data=None):
+    """Encodes the image at `path` and stores variant + index; returns the index (None if not applicable)."""
+    if heatshrink2 is None or not applies(os.path.basename(path)):
+        return None
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    encoded, blocks = encode(data)
+    index = {"encoding": ENCODING, "window_sz2": WINDOW_SZ2, "lookahead_sz2": LOOKAHEAD_SZ2,
+             "chunk_size": CHUNK_SIZE, "raw_size": len(data), "size": len(encoded), "blocks": blocks,
+             "used": len(data) > 0 and len(encoded) <= (1 - MIN_SAVING) * len(data)}
+    if index["used"]:
+        tmp = variant_path(path) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(encoded)
+        os.replace(tmp, variant_path(path))
+    else:
+        _remove(variant_path(path))
+    write_index(path, index)
+    return index
+
+
+def write_index(path: str, index: dict, like: str = None):
+    """Stores the index next to the image, stamped like ota_manifest.write()."""
+    tmp = index_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(index, stamp=stamp(like or path)), f)
+    os.replace(tmp, index_path(path))
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove(path: str):
+    _remove(variant_path(path))
+    _remove(index_path(path))
+
+
+def load(path: str, data=None):
+    """
+    The index for the image at `path`: from disk if it still matches the
+    image and the codec settings, else re-encoded from `data` (or the file).
+    None when heatshrink2 is missing or the file is a patch.
+    """
+    if heatshrink2 is None or not applies(os.path.basename(path)):
+        return None
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        if (index.pop("stamp", None) == stamp(path) and index.get("chunk_size") == CHUNK_SIZE
+                and (index["window_sz2"], index["lookahead_sz2"]) == (WINDOW_SZ2, LOOKAHEAD_SZ2)
+                and (not index["used"] or os.path.exists(variant_path(path)))):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        return write_for(path, data)
+    except OSError as e:
+        print(f"[OTA] ⚠️  Could not store {ENCODING} variant of {os.path.basename(path)}: {e}")
+        return None
+
+
+def public(index: dict) -> dict:
+    """What devices need from an index (manifest "encodings" entry)."""
+    return {k: index[k] for k in ("window_sz2", "lookahead_sz2", "chunk_size", "size", "blocks")}
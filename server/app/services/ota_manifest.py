@@ -0,0 +1,172 @@
+"""
+ota_manifest.py — Per-chunk integrity manifest for resumable OTA downloads
+==========================================================================
+Devices on 2G pull firmware in 32 KB Range requests and write each one
+straight to flash. A corrupted burst was only noticed after the whole image
+had arrived — a failed OTA, an ota_fails tick, eventually the 3-failure
+auto-lock — and the device started over from byte 0.
+
+Every image in BUILDS_DIR now has a manifest:
+
+    {"file": "FW_S5_KSNDMC_TRG.bin", "size": 1572864,
+     "sha256": "...", "md5": "...",               whole image (md5 = Update.setMD5)
+     "image_crc32": "...",
+     "chunk_size": 32768,                          = the devices' Range size
+     "crc32": ["9a3c01f2", ...]}                   one per chunk, zlib / esp_rom_crc32_le
+
+GET /builds/{file}/manifest returns it, and every /builds response carries
+X-Content-CRC32 for the bytes it holds, so a device can check a chunk before
+writing it and re-fetch only that range.
+
+Computed once at /ota/upload (and /station/{id}/ota) — by Hasher, while the
+upload streams in (build_store.py) — and written next to the image as
+<file>.manifest.json, so all workers share it. A sidecar whose
+size / mtime no longer match the image (a build copied in by a deploy
+script) is rebuilt on first use.
+
+The SHA-256 doubles as the image's strong ETag on /builds (etag()), and its
+first PIN_LEN hex digits as the v= pin in the OTA_CHECK parameter
+(ota_service.download_param): a download pinned to an image that has since
+been replaced gets 412 instead of bytes from the new build.
+"""
+
+import hashlib, json, os, zlib
+
+CHUNK_SIZE = int(os.getenv("OTA_CHUNK_KB", "32")) * 1024
+SUFFIX     = ".manifest.json"
+PIN        = os.getenv("OTA_PIN", "1") == "1"     # v= in OTA_CHECK parameters
+PIN_LEN    = 16
+
+
+class Hasher:
+    """build() over a stream: update() with the bytes as they arrive, in pieces of any size."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.size       = 0
+        self._sha256    = hashlib.sha256()
+        self._md5       = hashlib.md5()
+        self._crc       = 0
+        self._crcs      = []
+        self._chunk_crc = 0       # the chunk being filled
+        self._chunk_len = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        self._sha256.update(view)
+        self._md5.update(view)
+        self._crc  = zlib.crc32(view, self._crc)
+        self.size += len(view)
+        pos = 0
+        while pos < len(view):
+            take = min(self.chunk_size - self._chunk_len, len(view) - pos)
+            self._chunk_crc  = zlib.crc32(view[pos:pos + take], self._chunk_crc)
+            self._chunk_len += take
+            pos             += take
+            if self._chunk_len == self.chunk_size:
+                self._crcs.append(f"{self._chunk_crc:08x}")
+                self._chunk_crc, self._chunk_len = 0, 0
+
+    def manifest(self, name: str) -> dict:
+        return {
+            "file": name,
+            "size": self.size,
+            "sha256": self._sha256.hexdigest(),
+            "md5": self._md5.hexdigest(),
+            "image_crc32": f"{self._crc:08x}",
+            "chunk_size": self.chunk_size,
+            "crc32": self._crcs + ([f"{self._chunk_crc:08x}"] if self._chunk_len else []),
+        }
+
+
+def build(data, name: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Manifest for the image bytes `data` (bytes / memoryview)."""
+    hasher = Hasher(chunk_size)
+    hasher.update(data)
+    return hasher.manifest(name)
+
+
+def sidecar_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def stamp(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write(path: str, manifest: dict, like: str = None):
+    """
+    Stores the manifest next to the image (atomic rename), stamped with the
+    image's size / mtime — or those of `like`, a temp copy about to be
+    renamed over `path` (build_store.point).
+    """
+    tmp = sidecar_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(manifest, stamp=stamp(like or path)), f)
+    os.replace(tmp, sidecar_path(path))
+
+
+def write_for(path: str) -> dict:
+    """Builds and stores the manifest for the image at `path` (upload time)."""
+    with open(path, "rb") as f:
+        manifest = build(f.read(), os.path.basename(path))
+    write(path, manifest)
+    return manifest
+
+
+def remove(path: str):
+    try:
+        os.remove(sidecar_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def cached(path: str):
+    """The sidecar manifest if it still matches the image at `path`, else None (never hashes)."""
+    try:
+        with open(sidecar_path(path)) as f:
+            manifest = json.load(f)
+        if manifest.pop("stamp", None) == stamp(path) and manifest.get("chunk_size") == CHUNK_SIZE:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def etag(manifest: dict, variant: str = "") -> str:
+    """Strong ETag of the image (or of a variant derived from it, e.g. "hs10.5.32")."""
+    return f'"{manifest["sha256"][:32]}{"-" + variant if variant else ""}"'
+
+
+def pin(manifest: dict) -> str:
+    return manifest["sha256"][:PIN_LEN]
+
+
+def load(path: str, data=None) -> dict:
+    """
+    The manifest for the image at `path`: from its sidecar if that still
+    matches the file, else rebuilt from `data` (or the file) and re-stored.
+    """
+    manifest = cached(path)
+    if manifest is not None:
+        return manifest
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    manifest = build(data, os.path.basename(path))
+    try:
+        write(path, manifest)
+    except OSError as e:
+        print(f"[OTA] ⚠️  Could not store manifest for {os.path.basename(path)}: {e}")
+    return manifest
+
+
+def chunk_crc(manifest: dict, start: int, end: int):
+    """Cached CRC32 (hex) when [start, end] is the whole image or exactly one chunk, else None."""
+    size = manifest["chunk_size"]
+    if start == 0 and end == manifest["size"] - 1:
+        return manifest.get("image_crc32")
+    if start % size == 0 and end == min(start + size, manifest["size"]) - 1:
+        return manifest["crc32"][start // size]
+    return None
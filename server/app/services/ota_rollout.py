@@ -0,0 +1,229 @@
+"""
+ota_rollout.py — Staged OTA rollouts: waves, in-flight cap, auto-pause
+======================================================================
+Every non-exempt station below its group's target got OTA_CHECK on its next
+check-in, so one upload started the whole group downloading within a
+reporting interval — the server uplink and busy towers saturated, and a bad
+build reached every station before the first failure came back.
+
+A rollout (one ota_rollouts row per group, started by /ota/upload) lets
+stations in by wave:
+
+    wave_size        stations per wave                       OTA_WAVE_SIZE
+    max_inflight     admitted stations not finished yet      OTA_MAX_INFLIGHT
+    order_by         "signal" (strongest first) or "battery" OTA_WAVE_ORDER
+                     (fullest first), from the latest report
+    pause_fail_rate  failed / admitted in a wave at which    OTA_PAUSE_FAIL_RATE
+                     the rollout pauses itself
+
+The leader job "ota_rollout" (every OTA_ROLLOUT_TICK_S, and right after an
+upload) does all the work. It finishes admitted stations — latest report on
+the target: ok; ota_fails up since admission: failed; still going after
+OTA_ROLLOUT_TIMEOUT_H: timeout (frees the slot, not counted as a failure) —
+pauses the rollout when a wave fails too often, and admits more stations:
+the rest of the wave while slots are free, the next wave once this one has
+finished. Resuming after an auto-pause starts a new wave.
+
+/health never queries any of this: the in-flight stations of active
+rollouts are part of the OTA snapshot (ota_cache.py), so the check is a set
+lookup. A group without a rollout row (OTA_ROLLOUT=0, or targets set before
+rollouts existed) and a finished rollout let everyone in, as before.
+Settings / pause / resume: /ota page. State: GET /metrics/rollout.
+"""
+
+import datetime, os
+
+from sqlalchemy import func
+
+from app.models import FirmwareRegistry, HealthReport, OtaRollout, OtaRolloutStation, StationSettings
+from app.services.ota_cache import bump
+from app.services.ota_service import needs_ota
+from app.services.station_latest import latest_reports_query
+
+ENABLED         = os.getenv("OTA_ROLLOUT", "1") == "1"      # 0 = uploads go to everyone at once
+WAVE_SIZE       = int(os.getenv("OTA_WAVE_SIZE", "20"))
+MAX_INFLIGHT    = int(os.getenv("OTA_MAX_INFLIGHT", "10"))
+ORDER_BY        = os.getenv("OTA_WAVE_ORDER", "signal")
+PAUSE_FAIL_RATE = float(os.getenv("OTA_PAUSE_FAIL_RATE", "0.25"))
+TIMEOUT_H       = float(os.getenv("OTA_ROLLOUT_TIMEOUT_H", "6"))
+TICK_S          = float(os.getenv("OTA_ROLLOUT_TICK_S", "60"))
+
+ORDERS = ("signal", "battery")
+
+
+def _rank(order_by: str):
+    if order_by == "battery":
+        return lambda r: (-(r.bat_v or 0), r.stn_id)
+    # dBm: -60 beats -90; 0 / missing means no reading, so last
+    return lambda r: (-(r.signal or -999), r.stn_id)
+
+
+def _new(category_id: int, to_ver: str) -> OtaRollout:
+    return OtaRollout(category_id=category_id, to_ver=to_ver, state="active", wave=0,
+                      wave_size=WAVE_SIZE, max_inflight=MAX_INFLIGHT, order_by=ORDER_BY,
+                      pause_fail_rate=PAUSE_FAIL_RATE)
+
+
+def start(db, fw: FirmwareRegistry):
+    """A new target for the group (upload): a fresh rollout that keeps the group's settings."""
+    if not ENABLED:
+        return None
+    rollout = db.get(OtaRollout, fw.category_id)
+    if rollout is None:
+        rollout = _new(fw.category_id, fw.current_ver)
+        db.add(rollout)
+    rollout.to_ver        = fw.current_ver
+    rollout.state         = "active"
+    rollout.wave          = 0
+    rollout.paused_reason = None
+    rollout.started_at    = datetime.datetime.utcnow()
+    db.query(OtaRolloutStation).filter_by(category_id=fw.category_id).delete()
+    bump(db)
+    return rollout
+
+
+def stop(db, category_id: int):
+    """Target reverted: no rollout, no members."""
+    db.query(OtaRolloutStation).filter_by(category_id=category_id).delete()
+    db.query(OtaRollout).filter_by(category_id=category_id).delete()
+    bump(db)
+
+
+def configure(db, category_id: int, wave_size: int, max_inflight: int, order_by: str, pause_fail_rate: float):
+    """Updates a group's settings; starts a rollout of its current target if it has none."""
+    fw = db.get(FirmwareRegistry, category_id)
+    if fw is None:
+        return None
+    rollout = db.get(OtaRollout, category_id)
+    if rollout is None:
+        rollout = _new(category_id, fw.current_ver)
+        db.add(rollout)
+    rollout.wave_size       = max(1, wave_size)
+    rollout.max_inflight    = max(1, max_inflight)
+    rollout.order_by        = order_by if order_by in ORDERS else ORDER_BY
+    rollout.pause_fail_rate = min(max(pause_fail_rate, 0.0), 1.0)
+    bump(db)
+    return rollout
+
+
+def set_paused(db, category_id: int, paused: bool):
+    rollout = db.get(OtaRollout, category_id)
+    if rollout is None or rollout.state == "done":
+        return None
+    if paused:
+        rollout.state, rollout.paused_reason = "paused", "paused by operator"
+    else:
+        if (rollout.paused_reason or "").startswith("auto"):
+            rollout.wave += 1       # the failed wave stays failed; judge the next one on its own
+        rollout.state, rollout.paused_reason = "active", None
+    bump(db)
+    return rollout
+
+
+def _group_latest(db, fw) -> dict:
+    rows = (latest_reports_query(db)
+            .with_entities(HealthReport.stn_id, HealthReport.ver, HealthReport.signal, HealthReport.bat_v,
+                           HealthReport.ota_fails, HealthReport.reported_at)
+            .filter(HealthReport.unit_type == fw.unit_type, HealthReport.system == fw.system_mode))
+    return {r.stn_id: r for r in rows}
+
+
+def tick(db, now: datetime.datetime = None) -> dict:
+    """Leader job: finish, pause, admit — for every rollout still running."""
+    now     = now or datetime.datetime.utcnow()
+    cutoff  = now - datetime.timedelta(hours=TIMEOUT_H)
+    totals  = {"admitted": 0, "ok": 0, "failed": 0, "timeout": 0, "paused": 0, "done": 0}
+    changed = False
+    exempt  = {s for (s,) in db.query(StationSettings.stn_id).filter(StationSettings.ota_exempt == 1)}
+
+    rollouts = (db.query(OtaRollout, FirmwareRegistry)
+                .join(FirmwareRegistry, FirmwareRegistry.category_id == OtaRollout.category_id)
+                .filter(OtaRollout.state != "done").all())
+    for rollout, fw in rollouts:
+        latest  = _group_latest(db, fw)
+        members = db.query(OtaRolloutStation).filter_by(category_id=rollout.category_id,
+                                                        to_ver=rollout.to_ver).all()
+        # ── 1. Finish in-flight stations ──
+        for m in members:
+            if m.outcome:
+                continue
+            r = latest.get(m.stn_id)
+            if r is not None and not needs_ota(r.ver, rollout.to_ver):
+                m.outcome = "ok"
+            elif r is not None and int(r.ota_fails or 0) > m.fails_at_admit:
+                m.outcome = "failed"
+            elif m.admitted_at < cutoff:
+                m.outcome = "timeout"
+            else:
+                continue
+            m.finished_at = now
+            totals[m.outcome] += 1
+            changed = True
+
+        # ── 2. Auto-pause on a failing wave ──
+        wave   = [m for m in members if m.wave == rollout.wave]
+        failed = sum(1 for m in wave if m.outcome == "failed")
+        if rollout.state == "active" and failed and failed >= rollout.pause_fail_rate * len(wave):
+            rollout.state         = "paused"
+            rollout.paused_reason = f"auto: {failed}/{len(wave)} failed in wave {rollout.wave}"
+            totals["paused"] += 1
+            changed = True
+            print(f"[Rollout] S{rollout.category_id} → {rollout.to_ver} paused: {rollout.paused_reason}")
+        if rollout.state != "active":
+            continue
+
+        # ── 3. Admit: fill the wave while slots are free, then the next wave ──
+        inflight   = sum(1 for m in members if m.outcome is None)
+        known      = {m.stn_id for m in members}
+        candidates = sorted((r for stn_id, r in latest.items()
+                             if stn_id not in known and stn_id not in exempt and needs_ota(r.ver, rollout.to_ver)),
+                            key=_rank(rollout.order_by))
+        if not candidates:
+            # wave 0: nobody below the target has reported yet — keep waiting for them
+            if not inflight and rollout.wave:
+                rollout.state = "done"
+                totals["done"] += 1
+                changed = True
+                print(f"[Rollout] S{rollout.category_id} → {rollout.to_ver} done after {rollout.wave} wave(s)")
+            continue
+        if rollout.wave == 0 or (len(wave) >= rollout.wave_size and all(m.outcome for m in wave)):
+            rollout.wave += 1
+            wave = []
+        room = min(rollout.wave_size - len(wave), rollout.max_inflight - inflight)
+        for r in candidates[:max(room, 0)]:
+            db.add(OtaRolloutStation(category_id=rollout.category_id, to_ver=rollout.to_ver, stn_id=r.stn_id,
+                                     wave=rollout.wave, admitted_at=now, fails_at_admit=int(r.ota_fails or 0)))
+            totals["admitted"] += 1
+            changed = True
+
+    if changed:
+        bump(db)
+    return totals
+
+
+def status(db) -> dict:
+    """{category_id: rollout settings, state and member counts} for the /ota page and metrics."""
+    counts = {}
+    for category_id, wave, outcome, n in (db.query(OtaRolloutStation.category_id, OtaRolloutStation.wave,
+                                                    OtaRolloutStation.outcome, func.count())
+                                          .join(OtaRollout, (OtaRollout.category_id == OtaRolloutStation.category_id)
+                                                & (OtaRollout.to_ver == OtaRolloutStation.to_ver))
+                                          .group_by(OtaRolloutStation.category_id, OtaRolloutStation.wave,
+                                                    OtaRolloutStation.outcome)):
+        c = counts.setdefault(category_id, {"in_flight": 0, "ok": 0, "failed": 0, "timeout": 0, "waves": {}})
+        c["in_flight" if outcome is None else outcome] += n
+        w = c["waves"].setdefault(wave, {"admitted": 0, "failed": 0})
+        w["admitted"] += n
+        w["failed"]   += n if outcome == "failed" else 0
+    result = {}
+    for r in db.query(OtaRollout).order_by(OtaRollout.category_id):
+        c = counts.get(r.category_id, {"in_flight": 0, "ok": 0, "failed": 0, "timeout": 0, "waves": {}})
+        result[r.category_id] = {
+            "to_ver": r.to_ver, "state": r.state, "wave": r.wave, "paused_reason": r.paused_reason,
+            "wave_size": r.wave_size, "max_inflight": r.max_inflight, "order_by": r.order_by,
+            "pause_fail_rate": r.pause_fail_rate,
+            "started_at": r.started_at.isoformat(timespec="seconds") if r.started_at else None,
+            **{k: c[k] for k in ("in_flight", "ok", "failed", "timeout")},
+            "waves": [dict(w, wave=n) for n, w in sorted(c["waves"].items())],
+        }
+    return result
@@ -1,4 +1,7 @@
 import re
+from urllib.parse import quote
+
+PARAM_MAX = 127     # ota_cmd_param[128] on the device
 
 def get_numeric_ver(ver_str: str) -> tuple:
     """
@@ -25,3 +28,26 @@ def needs_ota(device_ver: str, target_ver: str) -> bool:
     if not target_ver:
         return False
     return get_numeric_ver(device_ver) < get_numeric_ver(target_ver)
+
+
+def download_param(filename: str, stn_id: str = None, pin: str = None) -> str:
+    """
+    OTA_CHECK parameter for `filename`. Devices copy it verbatim into
+    /builds/<param>, so a query string rides along with no firmware change:
+    v= pins the image it was issued for (services/ota_manifest.py), stn=
+    attributes the download (services/ota_telemetry.py). Parts that would
+    overflow the device buffer are dropped, stn= first.
+    """
+    if not filename or "?" in filename:
+        return filename
+    query = []
+    if pin:
+        query.append(f"v={pin}")
+    if stn_id:
+        query.append(f"stn={quote(stn_id, safe='')}")
+    while query:
+        param = f"{filename}?{'&'.join(query)}"
+        if len(param) <= PARAM_MAX:
+            return param
+        query.pop()
+    return filename
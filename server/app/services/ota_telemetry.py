@@ -0,0 +1,201 @@
+"""
+ota_telemetry.py — Firmware download telemetry per station
+==========================================================
+/builds served bytes and forgot about them: how an OTA went only showed up
+later as ota_fails in a health report. Chunk size and rollout waves
+(ota_rollout.py) were tuned blind.
+
+Attribution: devices fetch whatever OTA_CHECK hands them as
+/builds/<cmd_param>, so the check-in now tags the parameter with the
+station — "FW_S5_KSNDMC_TRG.bin?stn=KA1234" (ota_service.download_param).
+Firmware in the field copies the string into the URL as-is; the query never
+reaches the filename.
+X-Station-Id works too, for clients that set it. Untagged requests (curl,
+an old queued command) are served but not recorded.
+
+Each worker buffers its /builds requests in memory (download_stats.record,
+one tuple per request — the byte count is what the response actually handed
+to the server, so a dropped connection counts what got out). The worker job
+"ota_telemetry" merges the buffer into ota_downloads every
+OTA_TELEMETRY_FLUSH_S; shutdown flushes what is left. One row per
+(station, file):
+
+    attempts      downloads started: first request, a HEAD / offset 0 after
+                  a finished download, or a different variant (size / encoding)
+    resumes       a HEAD mid-download (the device re-ran the OTA, e.g. after
+                  a reboot) or a Range continuing after OTA_RESUME_GAP_S of silence
+    requests      GETs, bytes_sent (re-sends included)
+    covered       byte spans of the current attempt; complete when it is [0, size-1]
+    seconds       first request → last byte of the attempt
+
+Requests of one download land on any worker, so spans are merged, not
+assumed sequential; the resume gap is measured against whatever was flushed
+first, which can miss a gap that straddles two workers' buffers.
+
+GET /metrics/downloads and the panel on /ota group completed downloads by
+the carrier of each station's latest report: throughput percentiles,
+duration, resumes per attempt, requests per download and bytes sent per byte
+needed. Rows idle for OTA_TELEMETRY_DAYS are pruned.
+"""
+
+import collections, datetime, json, os, threading, time
+
+from app.models import HealthReport, OtaDownload
+from app.services.station_latest import latest_reports_query
+
+ENABLED      = os.getenv("OTA_TELEMETRY", "1") == "1"
+FLUSH_S      = float(os.getenv("OTA_TELEMETRY_FLUSH_S", "30"))
+RESUME_GAP_S = float(os.getenv("OTA_RESUME_GAP_S", "120"))
+KEEP_DAYS    = int(os.getenv("OTA_TELEMETRY_DAYS", "30"))
+MAX_KEYS     = int(os.getenv("OTA_TELEMETRY_MAX_KEYS", "5000"))  # (station, file) pairs buffered per worker
+PRUNE_S      = 3600
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _merge(spans: list, start: int, end: int) -> list:
+    """Adds [start, end] to sorted, disjoint byte spans (adjacent spans join)."""
+    out = []
+    for s, e in sorted(spans + [[start, end]]):
+        if out and s <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+def _apply(row: OtaDownload, at: datetime.datetime, head: bool, start: int, sent: int, encoding: str, size: int):
+    spans = json.loads(row.covered or "[]")
+    if (row.started_at is None or row.size != size or (row.encoding or "") != encoding
+            or (row.completed_at is not None and (head or start == 0))):
+        row.attempts     = (row.attempts or 0) + 1
+        row.size, row.encoding = size, encoding
+        row.started_at   = at
+        row.completed_at = None
+        row.seconds      = None
+        spans = []
+    elif row.completed_at is None and spans and (
+            head or (start > 0 and (at - row.last_at).total_seconds() > RESUME_GAP_S)):
+        row.resumes = (row.resumes or 0) + 1
+    if not head:
+        row.requests   = (row.requests or 0) + 1
+        row.bytes_sent = (row.bytes_sent or 0) + sent
+        if sent:
+            spans = _merge(spans, start, start + sent - 1)
+        if row.completed_at is None and size and spans == [[0, size - 1]]:
+            row.completed_at = at
+            row.seconds      = round((at - row.started_at).total_seconds(), 3)
+    row.covered = json.dumps(spans)
+    row.last_at = max(row.last_at or at, at)
+
+
+class DownloadStats:
+    """Per-worker buffer of /builds requests; flush() merges it into ota_downloads."""
+
+    def __init__(self):
+        self._events  = collections.defaultdict(list)   # (stn_id, filename) -> [(t, head, start, sent, encoding, size)]
+        self._lock    = threading.Lock()
+        self._pruned  = 0.0
+        self.recorded = 0
+        self.dropped  = 0
+        self.flushes  = 0
+
+    def record(self, stn_id: str, filename: str, encoding: str, size: int, start: int, sent: int,
+               head: bool = False):
+        if not ENABLED or not stn_id:
+            return
+        key = (stn_id, filename)
+        with self._lock:
+            if key not in self._events and len(self._events) >= MAX_KEYS:
+                self.dropped += 1       # flush is behind; better a gap than unbounded memory
+                return
+            self._events[key].append((time.time(), head, start, sent, encoding, size))
+            self.recorded += 1
+
+    def flush(self, db) -> dict:
+        """Merges the buffered requests into ota_downloads (caller commits); prunes old rows hourly."""
+        with self._lock:
+            events, self._events = self._events, collections.defaultdict(list)
+        totals = {"requests": sum(len(v) for v in events.values()), "rows": len(events), "pruned": 0}
+        if events:
+            stations = {stn_id for stn_id, _ in events}
+            rows = {(r.stn_id, r.filename): r
+                    for r in db.query(OtaDownload).filter(OtaDownload.stn_id.in_(stations))}
+            for key, items in events.items():
+                row = rows.get(key)
+                if row is None:
+                    row = OtaDownload(stn_id=key[0], filename=key[1])
+                    db.add(row)
+                for t, head, start, sent, encoding, size in sorted(items):
+                    _apply(row, datetime.datetime.utcfromtimestamp(t), head, start, sent, encoding, size)
+            self.flushes += 1
+        if time.monotonic() - self._pruned > PRUNE_S:
+            self._pruned = time.monotonic()
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=KEEP_DAYS)
+            totals["pruned"] = db.query(OtaDownload).filter(OtaDownload.last_at < cutoff).delete()
+        return totals
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buffered_requests": sum(len(v) for v in self._events.values()),
+                    "buffered_downloads": len(self._events),
+                    "recorded": self.recorded, "dropped": self.dropped, "flushes": self.flushes}
+
+
+download_stats = DownloadStats()
+
+
+def _summary(rows: list) -> dict:
+    done  = [r for r in rows if r.completed_at is not None and r.seconds]
+    kbps  = [r.size / 1024 / r.seconds for r in done]
+    tries = sum(r.attempts or 0 for r in rows)
+    return {
+        "downloads": len(done),
+        "in_progress": sum(1 for r in rows if r.completed_at is None),
+        "kbps_p10": _round(_pct(kbps, 0.10)), "kbps_p50": _round(_pct(kbps, 0.50)),
+        "kbps_p90": _round(_pct(kbps, 0.90)),
+        "minutes_p50": _round(_pct([r.seconds / 60 for r in done], 0.50)),
+        "minutes_p90": _round(_pct([r.seconds / 60 for r in done], 0.90)),
+        "resumes_per_attempt": round(sum(r.resumes or 0 for r in rows) / tries, 2) if tries else None,
+        "requests_p50": _pct([r.requests for r in done], 0.50),
+        # > 1.0: bytes sent again (retried chunks, restarted downloads)
+        "sent_per_needed": round(sum(r.bytes_sent or 0 for r in rows)
+                                 / sum(r.size * (r.attempts or 1) for r in rows), 3) if rows else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def report(db, days: int = KEEP_DAYS, stn_id: str = None) -> dict:
+    """Download summary per carrier (and overall) for rows active in the last `days`; one station's rows on request."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    rows  = db.query(OtaDownload).filter(OtaDownload.last_at >= since).all()
+    carrier = {s: (c or "UNKNOWN").strip().upper() or "UNKNOWN" for s, c in
+               latest_reports_query(db).with_entities(HealthReport.stn_id, HealthReport.carrier)}
+    groups = collections.defaultdict(list)
+    for r in rows:
+        groups[carrier.get(r.stn_id, "UNKNOWN")].append(r)
+    result = {
+        "days": days,
+        "all": _summary(rows),
+        "carriers": [dict(_summary(g), carrier=c) for c, g in sorted(groups.items())],
+        "worker": download_stats.stats(),
+    }
+    if stn_id is not None:
+        result["station"] = [{
+            "filename": r.filename, "encoding": r.encoding or "plain", "size": r.size,
+            "attempts": r.attempts, "resumes": r.resumes, "requests": r.requests, "bytes_sent": r.bytes_sent,
+            "covered": json.loads(r.covered or "[]"),
+            "started_at": r.started_at.isoformat(timespec="seconds") if r.started_at else None,
+            "completed_at": r.completed_at.isoformat(timespec="seconds") if r.completed_at else None,
+            "seconds": r.seconds,
+            "kbps": round(r.size / 1024 / r.seconds, 2) if r.completed_at and r.seconds else None,
+        } for r in rows if r.stn_id == stn_id]
+    return result
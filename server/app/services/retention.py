@@ -0,0 +1,268 @@
+"""
+retention.py — Raw-report retention and daily rollups
+======================================================
+health_reports used to grow forever; the only retention was the 30-day
+command_queue prune at startup. With RETENTION_RAW_DAYS set, raw reports
+are kept for that many days; older ones are folded into health_daily — one
+row per station per UTC day holding that day's last report (counters,
+version, stored verdict) plus min / max / mean battery and signal — and
+deleted. The fold cannot be undone, so the default is 0: nothing is
+compacted until a deployment opts in.
+
+The station page, the station / full-history CSVs and /export/history read
+both tiers (routers/dashboard.py), so older history is still there, one row
+per day instead of ~96.
+
+The maintenance scheduler (services/maintenance.py) runs a RetentionJob pass
+every RETENTION_INTERVAL_H hours and prune_commands every
+COMMAND_PRUNE_INTERVAL_H, on the leader worker only. A pass compacts one
+day at a time, oldest first, in transactions of about RETENTION_BATCH_ROWS
+raw rows (whole stations of one day each), pausing between them so
+check-ins keep the write lock. A row station_latest points
+at is never compacted: the dashboard keeps showing silent stations. Reports
+that arrive late for an already-compacted day are merged into its row.
+
+SQLite does not shrink the file on DELETE; freed pages go to the freelist
+and are reused by new reports before the file grows again. Each pass
+reports how much space it freed that way (GET /metrics/retention).
+"""
+
+import asyncio, datetime, os, time
+
+from sqlalchemy import select, delete, text, func, type_coerce, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import HealthReport, HealthDaily, StationLatest
+
+RAW_DAYS      = int(os.getenv("RETENTION_RAW_DAYS", "0"))        # 0 = keep raw reports forever (opt in: e.g. 180)
+COMMAND_DAYS  = int(os.getenv("RETENTION_COMMAND_DAYS", "30"))
+BATCH_ROWS    = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))
+INTERVAL_H    = float(os.getenv("RETENTION_INTERVAL_H", "6"))
+PRUNE_INTERVAL_H = float(os.getenv("COMMAND_PRUNE_INTERVAL_H", "1"))
+PAUSE_MS      = int(os.getenv("RETENTION_PAUSE_MS", "50"))
+
+# The day's last report is copied into these health_daily columns
+_COPIED = [c.name for c in HealthReport.__table__.columns if c.name not in ("id", "stn_id")]
+
+
+def raw_cutoff(now=None, raw_days: int = RAW_DAYS):
+    """Reports before this (UTC midnight, raw_days ago) belong in health_daily. Whole days only."""
+    now = now or datetime.datetime.utcnow()
+    return datetime.datetime.combine(now.date() - datetime.timedelta(days=raw_days), datetime.time())
+
+
+def _day_str(value):
+    """
+    'YYYY-MM-DD' bound for reported_at. Compares correctly against both stored
+    forms ('... HH:MM:SS' from CURRENT_TIMESTAMP, '... HH:MM:SS.ffffff' from
+    the ORM); a datetime bind would skip rows stamped exactly at midnight.
+    """
+    return type_coerce(value.strftime("%Y-%m-%d"), String)
+
+
+def _compactable(cutoff):
+    # Never fold away the row a station's latest pointer uses
+    return (HealthReport.reported_at < _day_str(cutoff),
+            HealthReport.id.notin_(select(StationLatest.report_id).where(StationLatest.report_id.isnot(None))))
+
+
+def _next_day(db, cutoff):
+    oldest = db.execute(select(func.min(HealthReport.reported_at)).where(*_compactable(cutoff))).scalar()
+    if oldest is None:
+        return None
+    if isinstance(oldest, str):         # rows written by raw SQL
+        oldest = datetime.datetime.fromisoformat(oldest)
+    return oldest.date()
+
+
+def _day_bounds(day, cutoff):
+    """[start, end) of `day`, clipped to the cutoff, as reported_at bounds."""
+    end = min(day + datetime.timedelta(days=1), cutoff.date())
+    return _day_str(day), _day_str(end)
+
+
+def _station_groups(db, day, cutoff, batch: int) -> list:
+    """Stations with compactable rows on `day`, packed into groups of about `batch` rows."""
+    start, end = _day_bounds(day, cutoff)
+    counts = db.execute(
+        select(HealthReport.stn_id, func.count())
+        .where(HealthReport.reported_at >= start, HealthReport.reported_at < end,
+               *_compactable(cutoff))
+        .group_by(HealthReport.stn_id)
+    ).all()
+    groups, group, size = [], [], 0
+    for stn_id, n in counts:
+        if group and size + n > batch:
+            groups.append(group)
+            group, size = [], 0
+        group.append(stn_id)
+        size += n
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _fold(rows: list, existing) -> dict:
+    """health_daily values for one station-day from its raw rows (+ the row already there)."""
+    last = rows[-1]
+    bats = [r.bat_v for r in rows if r.bat_v is not None]
+    sigs = [r.signal for r in rows if r.signal is not None]
+    out  = {
+        "reports":     len(rows),
+        "first_at":    rows[0].reported_at,
+        "bat_v_min":   min(bats, default=None),
+        "bat_v_max":   max(bats, default=None),
+        "bat_v_mean":  sum(bats) / len(bats) if bats else None,
+        "signal_min":  min(sigs, default=None),
+        "signal_max":  max(sigs, default=None),
+        "signal_mean": sum(sigs) / len(sigs) if sigs else None,
+    }
+    newer = existing is None or existing.reported_at is None or last.reported_at >= existing.reported_at
+    if newer:
+        out["report_id"] = last.id
+        out.update({name: getattr(last, name) for name in _COPIED})
+    if existing is not None:
+        # Late reports for a day compacted before: merge, weighting the means
+        n_old, n_new = existing.reports or 0, len(rows)
+        for key, pick in (("bat_v_min", min), ("bat_v_max", max), ("signal_min", min), ("signal_max", max)):
+            vals = [v for v in (out[key], getattr(existing, key)) if v is not None]
+            out[key] = pick(vals) if vals else None
+        for key, n in (("bat_v_mean", len(bats)), ("signal_mean", len(sigs))):
+            old = getattr(existing, key)
+            if old is not None and out[key] is not None:
+                out[key] = (old * n_old + out[key] * n) / (n_old + n)
+            elif out[key] is None:
+                out[key] = old
+        out["reports"]  = n_old + n_new
+        out["first_at"] = min(t for t in (existing.first_at, out["first_at"]) if t is not None)
+    return out
+
+
+def compact_stations(db, day, stn_ids: list, cutoff) -> tuple:
+    """
+    Folds the compactable rows of `stn_ids` on `day` into health_daily and
+    deletes them, in the caller's transaction. Returns (raw_rows_removed, daily_rows_written).
+    """
+    start, end = _day_bounds(day, cutoff)
+    rows = db.execute(
+        select(HealthReport.__table__)
+        .where(HealthReport.stn_id.in_(stn_ids),
+               HealthReport.reported_at >= start, HealthReport.reported_at < end,
+               *_compactable(cutoff))
+        .order_by(HealthReport.stn_id, HealthReport.reported_at, HealthReport.id)
+    ).all()
+    if not rows:
+        return 0, 0
+    existing = {d.stn_id: d for d in db.execute(
+        select(HealthDaily.__table__).where(HealthDaily.stn_id.in_(stn_ids), HealthDaily.day == day)
+    )}
+    by_station = {}
+    for r in rows:
+        by_station.setdefault(r.stn_id, []).append(r)
+
+    values = [dict(_fold(group, existing.get(stn_id)), stn_id=stn_id, day=day)
+              for stn_id, group in by_station.items()]
+    for v in values:
+        stmt = sqlite_insert(HealthDaily).values(v)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["stn_id", "day"],
+            set_={k: stmt.excluded[k] for k in v if k not in ("stn_id", "day")},
+        ))
+    ids = [r.id for r in rows]
+    for i in range(0, len(ids), 500):
+        db.execute(delete(HealthReport).where(HealthReport.id.in_(ids[i:i + 500])))
+    return len(ids), len(values)
+
+
+def prune_commands(db, days: int = COMMAND_DAYS) -> int:
+    """Phase 8/9 Fix: stop command_queue from growing infinitely over years of operation."""
+    return db.execute(text(
+        "DELETE FROM command_queue WHERE created_at < datetime('now', :age)"
+    ), {"age": f"-{days} days"}).rowcount
+
+
+def free_bytes(db) -> int:
+    """Bytes in SQLite's freelist — space new rows reuse before the file grows."""
+    return (db.execute(text("PRAGMA freelist_count")).scalar()
+            * db.execute(text("PRAGMA page_size")).scalar())
+
+
+def compact_step(db, cutoff, batch: int = BATCH_ROWS):
+    """
+    One bounded unit of work: the next group of stations on the oldest
+    compactable day. Caller commits. Returns (raw_removed, daily_written),
+    or None when nothing older than `cutoff` is left.
+    """
+    day = _next_day(db, cutoff)
+    if day is None:
+        return None
+    groups = _station_groups(db, day, cutoff, batch)
+    if not groups:
+        return None
+    return compact_stations(db, day, groups[0], cutoff)
+
+
+class RetentionJob:
+    """Raw → daily compaction pass; scheduled by services/maintenance.py."""
+
+    def __init__(self, raw_days=RAW_DAYS, batch=BATCH_ROWS, pause_ms=PAUSE_MS):
+        self.raw_days   = raw_days
+        self.batch      = batch
+        self.pause_ms   = pause_ms
+        self.passes     = 0
+        self.last       = {}
+        self.totals     = {"raw_removed": 0, "daily_written": 0, "freed_bytes": 0}
+
+    def _in_session(self, session_factory, fn, *args):
+        db = session_factory()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def run_pass(self, session_factory, cutoff=None) -> dict:
+        loop = asyncio.get_running_loop()
+        call = lambda fn, *a: loop.run_in_executor(None, self._in_session, session_factory, fn, *a)
+        t0   = time.perf_counter()
+        stats = {"started_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+                 "raw_removed": 0, "daily_written": 0, "longest_step_ms": 0}
+        free_before = await call(free_bytes)
+        if self.raw_days > 0:
+            cutoff = cutoff or raw_cutoff(raw_days=self.raw_days)
+            stats["cutoff"] = cutoff.isoformat()
+            while True:
+                t_step = time.perf_counter()
+                step = await call(compact_step, cutoff, self.batch)
+                stats["longest_step_ms"] = max(stats["longest_step_ms"],
+                                               round((time.perf_counter() - t_step) * 1000))
+                if not step or step == (0, 0):
+                    break
+                stats["raw_removed"]   += step[0]
+                stats["daily_written"] += step[1]
+                await asyncio.sleep(self.pause_ms / 1000)
+        stats["freed_bytes"] = max(await call(free_bytes) - free_before, 0)
+        stats["seconds"]     = round(time.perf_counter() - t0, 1)
+        for key in self.totals:
+            self.totals[key] += stats[key]
+        self.passes += 1
+        self.last = stats
+        if stats["raw_removed"]:
+            print(f"[Retention] Folded {stats['raw_removed']} reports into {stats['daily_written']} daily rows, "
+                  f"freed {stats['freed_bytes'] / 1048576:.1f} MB in {stats['seconds']}s")
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "raw_days": self.raw_days,
+            "passes": self.passes,
+            "last_pass": self.last,
+            "totals": self.totals,
+        }
+
+
+retention_job = RetentionJob()
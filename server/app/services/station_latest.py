@@ -0,0 +1,247 @@
+"""
+station_latest.py — Materialized "latest report per station" pointer table
+==========================================================================
+The dashboard, /summary, /csv/summary and clear_locks.py used to find each
+station's newest report with GROUP BY stn_id, MAX(reported_at) joined back to
+health_reports — a cost that grows with total history, not fleet size.
+
+Every ingest path now writes health rows through insert_reports(), which
+upserts station_latest in the SAME transaction, so reads become a join
+against one row per station.
+
+The same upsert keeps station_gps — the last known good fix per station as
+numeric lat/lon — so the map view and the GET_GPS cooldown never scan history
+for a coordinate.
+
+refresh_station_latest() recomputes pointers from health_reports (the slow
+query) and is used after deletes, for the one-shot backfill, and by
+check_consistency().
+"""
+
+import re
+
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import HealthReport, StationLatest, StationGps
+from app.services.eval_store import stamp_rows
+
+# GPS strings firmware sends when it has no fix
+NO_GPS = ("NA", "0.000000,0.000000", "", "0,0")
+
+# Same extraction the dashboard map has always used: first two decimals in the string
+_GPS_NUM = re.compile(r"-?\d+\.\d+")
+
+
+def parse_gps(val):
+    """Returns (lat, lon) floats for a usable fix, else None."""
+    if val is None or str(val).strip() in NO_GPS:
+        return None
+    nums = _GPS_NUM.findall(str(val))
+    if len(nums) < 2:
+        return None
+    lat, lon = float(nums[0]), float(nums[1])
+    if lat == 0 or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def _upsert(db, latest: dict):
+    """latest: {stn_id: (report_id, reported_at)} — only moves pointers forward."""
+    if not latest:
+        return
+    stmt = sqlite_insert(StationLatest).values([
+        {"stn_id": stn_id, "report_id": rid, "reported_at": ts}
+        for stn_id, (rid, ts) in latest.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["stn_id"],
+        set_={"report_id": stmt.excluded.report_id, "reported_at": stmt.excluded.reported_at},
+        # Backlogged reports (/health/batch "ts") can be older than what we hold
+        where=(stmt.excluded.reported_at > StationLatest.reported_at) |
+              ((stmt.excluded.reported_at == StationLatest.reported_at) &
+               (stmt.excluded.report_id > StationLatest.report_id)),
+    )
+    db.execute(stmt)
+
+
+def _upsert_gps(db, fixes: dict):
+    """fixes: {stn_id: (lat, lon, fix_at)} — a fix never replaces a newer one."""
+    if not fixes:
+        return
+    stmt = sqlite_insert(StationGps).values([
+        {"stn_id": stn_id, "lat": lat, "lon": lon, "fix_at": ts}
+        for stn_id, (lat, lon, ts) in fixes.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["stn_id"],
+        set_={"lat": stmt.excluded.lat, "lon": stmt.excluded.lon, "fix_at": stmt.excluded.fix_at},
+        where=StationGps.fix_at.is_(None) | (stmt.excluded.fix_at >= StationGps.fix_at),
+    )
+    db.execute(stmt)
+
+
+def mark_gps_requested(db, stn_id: str, when):
+    """Records an auto GET_GPS dispatch so the 24h cooldown can see it."""
+    stmt = sqlite_insert(StationGps).values(stn_id=stn_id, requested_at=when)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["stn_id"], set_={"requested_at": stmt.excluded.requested_at}
+    ))
+
+
+def insert_reports(db, rows: list) -> list:
+    """
+    Bulk-inserts HealthReport kwargs dicts and upserts station_latest and
+    station_gps in the caller's transaction (the caller commits). Each row is
+    scored first, so the stored verdict lands in the same INSERT.
+    Returns the new report ids.
+    """
+    stamp_rows(rows)
+    inserted = db.execute(
+        insert(HealthReport).returning(
+            HealthReport.id, HealthReport.stn_id, HealthReport.reported_at,
+            sort_by_parameter_order=True,
+        ),
+        rows,
+    ).all()
+
+    latest, fixes = {}, {}
+    for (rid, stn_id, ts), row in zip(inserted, rows):
+        best = latest.get(stn_id)
+        if best is None or (ts, rid) > (best[1], best[0]):
+            latest[stn_id] = (rid, ts)
+        fix = parse_gps(row.get("gps"))
+        if fix and (stn_id not in fixes or ts >= fixes[stn_id][2]):
+            fixes[stn_id] = (fix[0], fix[1], ts)
+    _upsert(db, latest)
+    _upsert_gps(db, fixes)
+    return [row[0] for row in inserted]
+
+
+def _slow_latest(db, stn_ids=None) -> dict:
+    """The original GROUP BY query: {stn_id: (report_id, reported_at)}."""
+    subq = db.query(
+        HealthReport.stn_id,
+        func.max(HealthReport.reported_at).label("m")
+    )
+    if stn_ids is not None:
+        subq = subq.filter(HealthReport.stn_id.in_(list(stn_ids)))
+    subq = subq.group_by(HealthReport.stn_id).subquery()
+    rows = db.query(HealthReport.stn_id, HealthReport.id, HealthReport.reported_at).join(
+        subq,
+        (HealthReport.stn_id == subq.c.stn_id) &
+        (HealthReport.reported_at == subq.c.m)
+    ).all()
+    latest = {}
+    for stn_id, rid, ts in rows:
+        # Same-timestamp duplicates: the highest id wins, as at ingest
+        if stn_id not in latest or rid > latest[stn_id][0]:
+            latest[stn_id] = (rid, ts)
+    return latest
+
+
+def _slow_gps(db, stn_ids=None) -> dict:
+    """Newest valid fix per station from history: {stn_id: (lat, lon, fix_at)}."""
+    # Walk each station's reports newest first until one parses — as at ingest,
+    # a garbled string must not hide an older good fix
+    q = db.query(HealthReport.stn_id, HealthReport.gps, HealthReport.reported_at).filter(
+        HealthReport.gps.isnot(None),
+        HealthReport.gps.notin_(NO_GPS)
+    )
+    if stn_ids is not None:
+        q = q.filter(HealthReport.stn_id.in_(list(stn_ids)))
+    fixes = {}
+    for stn_id, gps, ts in q.order_by(HealthReport.stn_id, HealthReport.reported_at.desc(),
+                                      HealthReport.id.desc()).yield_per(5000):
+        if stn_id in fixes:
+            continue
+        fix = parse_gps(gps)
+        if fix:
+            fixes[stn_id] = (fix[0], fix[1], ts)
+    return fixes
+
+
+def refresh_station_gps(db, stn_ids=None) -> int:
+    """Rebuilds last-known fixes from history; keeps requested_at. Caller commits."""
+    fixes = _slow_gps(db, stn_ids)
+    q = db.query(StationGps)
+    if stn_ids is not None:
+        q = q.filter(StationGps.stn_id.in_(list(stn_ids)))
+    q.update({"lat": None, "lon": None, "fix_at": None}, synchronize_session=False)
+    _upsert_gps(db, fixes)
+    return len(fixes)
+
+
+def refresh_station_latest(db, stn_ids=None) -> int:
+    """
+    Rebuilds pointers (and GPS fixes) from health_reports for `stn_ids` (or
+    every station). Stations with no reports left are removed. Caller commits.
+    """
+    latest = _slow_latest(db, stn_ids)
+    q = db.query(StationLatest)
+    if stn_ids is not None:
+        q = q.filter(StationLatest.stn_id.in_(list(stn_ids)))
+    q.delete(synchronize_session=False)
+    db.bulk_insert_mappings(StationLatest, [
+        {"stn_id": stn_id, "report_id": rid, "reported_at": ts}
+        for stn_id, (rid, ts) in latest.items()
+    ])
+    refresh_station_gps(db, stn_ids)
+    gone = db.query(StationGps).filter(~StationGps.stn_id.in_(db.query(StationLatest.stn_id)))
+    if stn_ids is not None:
+        gone = gone.filter(StationGps.stn_id.in_(list(stn_ids)))
+    gone.delete(synchronize_session=False)
+    return len(latest)
+
+
+def latest_reports_query(db):
+    """Query of HealthReport rows — exactly one (the latest) per station."""
+    return db.query(HealthReport).join(
+        StationLatest, StationLatest.report_id == HealthReport.id
+    )
+
+
+def check_consistency(db) -> list:
+    """Returns [(stn_id, expected, actual)] where station_latest / station_gps disagree with history."""
+    mismatches = []
+    expected = _slow_latest(db)
+    actual   = {s.stn_id: (s.report_id, s.reported_at) for s in db.query(StationLatest).all()}
+    for stn_id in sorted(set(expected) | set(actual)):
+        exp, act = expected.get(stn_id), actual.get(stn_id)
+        if exp is None or act is None or exp[0] != act[0]:
+            mismatches.append((stn_id, exp, act))
+
+    expected = _slow_gps(db)
+    actual   = {g.stn_id: (g.lat, g.lon, g.fix_at) for g in db.query(StationGps).filter(StationGps.fix_at.isnot(None))}
+    for stn_id in sorted(set(expected) | set(actual)):
+        exp, act = expected.get(stn_id), actual.get(stn_id)
+        if exp != act:
+            mismatches.append((f"{stn_id} (gps)", exp, act))
+    return mismatches
+
+
+def ensure_backfilled(db) -> bool:
+    """First start after upgrade: populate station_latest / station_gps if still empty."""
+    if db.query(HealthReport.id).first() is None:
+        return False
+    done = False
+    if db.query(StationLatest.stn_id).first() is None:
+        count = refresh_station_latest(db)
+        print(f"[StationLatest] Backfilled {count} stations")
+        done = True
+    elif db.query(StationGps.stn_id).first() is None:
+        count = refresh_station_gps(db)
+        print(f"[StationLatest] Backfilled GPS fixes for {count} stations")
+        done = True
+    db.commit()
+    return done
+
+
+def stations_in_bbox(db, south: float, west: float, north: float, east: float) -> list:
+    """Last known fixes inside a lat/lon box (served by ix_station_gps_lat_lon)."""
+    return (
+        db.query(StationGps)
+        .filter(StationGps.lat.between(south, north), StationGps.lon.between(west, east))
+        .order_by(StationGps.stn_id)
+        .all()
+    )
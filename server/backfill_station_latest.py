@@ -0,0 +1,33 @@
+"""
+backfill_station_latest.py — Rebuild / verify the station_latest pointer table.
+The server backfills an EMPTY table on startup by itself; run this after manual
+DB surgery (sqlite3 deletes, restores) or to audit the ingest-time upserts.
+
+Usage (on Contabo):
+    docker exec -i spatika-health python3 /app/backfill_station_latest.py          # rebuild
+    docker exec -i spatika-health python3 /app/backfill_station_latest.py --check  # verify only
+"""
+import sys
+
+from app.database import SessionLocal, engine
+from app.models import Base
+from app.services.station_latest import refresh_station_latest, check_consistency
+
+Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+
+if "--check" in sys.argv:
+    mismatches = check_consistency(db)
+    for stn_id, expected, actual in mismatches:
+        print(f"  ✗ {stn_id}: expected {expected}, station_latest has {actual}")
+    db.close()
+    if mismatches:
+        print(f"\n{len(mismatches)} station(s) out of sync. Re-run without --check to rebuild.")
+        sys.exit(1)
+    print("✓ station_latest matches health_reports.")
+    sys.exit(0)
+
+count = refresh_station_latest(db)
+db.commit()
+db.close()
+print(f"✓ Rebuilt station_latest for {count} stations.")
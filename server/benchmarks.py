@@ -0,0 +1,1586 @@
+"""
+benchmarks.py — Micro-benchmarks for the server hot paths.
+Every run works on a throw-away SQLite file in a temp dir, never the live DB.
+Timings and perf gates only; behaviour checks live in tests/ (python -m pytest).
+
+Usage:
+    python3 benchmarks.py automigrate [--n 2000]
+    python3 benchmarks.py burst [--stations 1000]
+    python3 benchmarks.py dashboard [--stations 300]
+    python3 benchmarks.py eval [--rows 1000000]
+    python3 benchmarks.py csv [--rows 2000000]
+    python3 benchmarks.py concurrency [--posts 200] [--stations 3000] [--interval-ms 10]
+    python3 benchmarks.py sqlite [--seconds 8] [--writers 4] [--history 200000]
+    python3 benchmarks.py plans [--history 200000]
+    python3 benchmarks.py migrate [--history 500000] [--batch 5000]
+    python3 benchmarks.py retention [--history 500000] [--keep-days 3]
+    python3 benchmarks.py maintenance [--workers 4] [--seconds 12] [--history 300000]
+    python3 benchmarks.py otacache [--checkins 2000] [--stations 3000]
+    python3 benchmarks.py firmware [--devices 50] [--image-kb 1536]
+    python3 benchmarks.py manifest [--image-kb 1536] [--loss 0.02]
+    python3 benchmarks.py delta [--image-kb 1536] [--stations 30]
+    python3 benchmarks.py encoding [--image-kb 1536]
+    python3 benchmarks.py rollout [--stations 200] [--checkins 2000]
+    python3 benchmarks.py downloads [--stations 300] [--image-kb 1536]
+    python3 benchmarks.py conditional [--image-kb 1536] [--stations 2000]
+    python3 benchmarks.py builds [--image-kb 1536]
+"""
+import argparse, asyncio, contextlib, datetime, io, os, random, resource, sqlite3, statistics, subprocess, sys, tempfile, time, types
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, HealthReport
+
+
+# A representative v5.8x check-in payload
+SAMPLE_REPORT = {
+    "stn_id": "BENCH001", "unit_type": "KSNDMC_TRG", "system": 0, "ver": "5.82",
+    "bat_v": 4.05, "sol_v": 5.1, "signal": -81, "reg_fails": 0, "http_fails": 1,
+    "net_cnt": 40, "net_cnt_prev": 95, "prev_stored": 96, "ndm_cnt": 0,
+    "cdm_sts": "OK", "health_sts": "OK", "sensor_sts": "RF-OK",
+    "gps": "12.971600,77.594600", "carrier": "AIRTEL", "iccid": "8991100000000000000",
+    "ota_fails": 0, "unsent_count": 0, "last_cmd_id": 0, "last_cmd_res": "N/A",
+}
+
+
+def _temp_engine(profile=None):
+    from app.database import make_engine
+    tmp    = tempfile.mkdtemp(prefix="spatika_bench_")
+    engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _temp_session_factory():
+    return sessionmaker(autocommit=False, autoflush=False, bind=_temp_engine())
+
+
+def _bind_app_to_temp_db(profile=None):
+    """Points the app's write and read sessions at a throw-away DB; returns (engine, read_engine)."""
+    from app.database import SessionLocal, ReadSessionLocal, make_engine
+    engine      = _temp_engine(profile)
+    read_engine = make_engine(str(engine.url), read_only=True, profile=profile)
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    return engine, read_engine
+
+
+def _router_app(*routers):
+    """Just the given routers — no auth, no startup hooks."""
+    from fastapi import FastAPI
+    app = FastAPI()
+    for router in routers:
+        app.include_router(router)
+    return app
+
+
+def _health_app():
+    from app.routers import health
+    return _router_app(health.router)
+
+
+def _quiet():
+    """Swallows stdout: one "[Health] Raw Body" line per check-in would bury the numbers."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _seed_fleet(engine, stations, reports_per_station=4):
+    """Fleet where the latest GPS is NA (forces fallback) and half have a pending command."""
+    from app.models import CommandQueue
+    from app.services.station_latest import insert_reports, refresh_station_latest
+    Session = sessionmaker(bind=engine)
+    db  = Session()
+    now = datetime.datetime.utcnow()
+    rows = []
+    for i in range(stations):
+        for k in range(reports_per_station):
+            rows.append(dict(SAMPLE_REPORT, stn_id=f"STN{i:04d}",
+                             gps=SAMPLE_REPORT["gps"] if k == 0 else "NA",
+                             reported_at=now - datetime.timedelta(minutes=15 * (reports_per_station - k))))
+        if i % 2:
+            db.add(CommandQueue(stn_id=f"STN{i:04d}", cmd="REBOOT"))
+    insert_reports(db, rows)
+    db.commit()
+    db.close()
+
+
+def _count_queries(engine):
+    """Attaches a statement counter to `engine`; returns the mutable counter."""
+    from sqlalchemy import event
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        counter["n"] += 1
+    return counter
+
+
+def _report(results, label, samples):
+    samples.sort()
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1000
+    results.append((label, p50, p99))
+    print(f"  {label:<28} p50={p50:7.3f} ms   p99={p99:7.3f} ms   (n={len(samples)})")
+
+
+def bench_automigrate(n):
+    """Per-request ingest latency: inspector-per-request vs cached schema map."""
+    from app.routers import health as h
+
+    Session = _temp_session_factory()
+    payload = dict(SAMPLE_REPORT)
+    results = []
+    print(f"[automigrate] {n} inserts per variant")
+
+    def ingest(db, cols):
+        kwargs = {k: v for k, v in payload.items() if k in cols}
+        kwargs["reported_at"] = datetime.datetime.utcnow()
+        db.add(HealthReport(**kwargs))
+        db.commit()
+
+    def legacy_columns(db):
+        inspector = sa_inspect(db.bind)
+        return {col["name"] for col in inspector.get_columns("health_reports")}
+
+    for label, columns in (
+        ("before (inspector/request)", legacy_columns),
+        ("after  (schema cache)",      lambda db: h._auto_migrate(db, payload)),
+    ):
+        h._COLUMN_CACHE.clear()
+        db = Session()
+        samples = []
+        try:
+            for _ in range(n):
+                t0 = time.perf_counter()
+                ingest(db, columns(db))
+                samples.append(time.perf_counter() - t0)
+        finally:
+            db.close()
+        _report(results, label, samples)
+    return results
+
+
+def bench_burst(stations):
+    """1,000 stations hitting the same 15-min slot: sync commit vs write-behind. Durability: tests/test_ingest_queue.py."""
+    import httpx
+    from app.services.ingest_queue import ingest_queue
+
+    results = []
+    print(f"[burst] {stations} concurrent check-ins per variant")
+
+    async def fire(client, i):
+        body = dict(SAMPLE_REPORT, stn_id=f"STN{i:04d}")
+        t0 = time.perf_counter()
+        resp = await client.post("/health", json=body)
+        assert resp.json()["status"] == "ok", resp.text
+        return time.perf_counter() - t0
+
+    async def run(write_behind):
+        _bind_app_to_temp_db()
+        app = _health_app()
+        if write_behind:
+            await ingest_queue.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            with _quiet():
+                t0 = time.perf_counter()
+                samples = await asyncio.gather(*(fire(client, i) for i in range(stations)))
+                wall = time.perf_counter() - t0
+        if write_behind:
+            await ingest_queue.stop()
+        return list(samples), wall
+
+    for label, write_behind in (("sync commit", False), ("write-behind", True)):
+        samples, wall = asyncio.run(run(write_behind))
+        _report(results, label, samples)
+        print(f"  {'':<28} wall={wall:.2f} s")
+    print(f"  queue metrics: {ingest_queue.stats()}")
+    return results
+
+
+def bench_dashboard(stations):
+    """Asserts /dashboard issues the same number of queries for any fleet size."""
+    from fastapi.testclient import TestClient
+    from app.routers import dashboard
+
+    print(f"[dashboard] query count and render time, 10 vs {stations} stations")
+    seen = []
+    for size in (10, stations):
+        engine, read_engine = _bind_app_to_temp_db()
+        _seed_fleet(engine, size)
+        counter = _count_queries(read_engine)
+        client  = TestClient(_router_app(dashboard.router))
+        t0 = time.perf_counter()
+        resp = client.get("/dashboard")
+        ms = (time.perf_counter() - t0) * 1000
+        assert resp.status_code == 200, resp.status_code
+        print(f"  {size:>5} stations   queries={counter['n']:<4} render={ms:8.2f} ms")
+        seen.append(counter["n"])
+    assert seen[0] == seen[1], f"/dashboard is O(N) in queries: {seen}"
+    print("  ✓ query count independent of fleet size")
+    return seen
+
+
+def _synthetic_columns(rows, seed=7):
+    """Fleet-like evaluator inputs: mostly healthy, with every rule branch represented."""
+    rnd = random.Random(seed)
+    now = datetime.datetime(2026, 1, 15, 12, 0)
+    pick = rnd.choice
+    return now, {
+        "reported_at":  [now - datetime.timedelta(minutes=rnd.randint(0, 2000)) for _ in range(rows)],
+        "bat_v":        [round(rnd.uniform(3.2, 4.2), 2) for _ in range(rows)],
+        "signal":       [rnd.randint(-110, -55) for _ in range(rows)],
+        "net_cnt_prev": [pick((96, 95, 90, 80, 40, 0)) for _ in range(rows)],
+        "prev_stored":  [pick((96, 96, 90, 0)) for _ in range(rows)],
+        "http_ret_cnt_prev":  [pick((0, 0, 8)) for _ in range(rows)],
+        "ndm_cnt":      [pick((0, 0, 0, 20)) for _ in range(rows)],
+        "cdm_sts":      [pick(("OK", "OK", "FAIL", "PENDING", None)) for _ in range(rows)],
+        "reg_fails":    [pick((0, 0, 2, 6, 30)) for _ in range(rows)],
+        "health_sts":   [pick(("OK", "OK", "OK", "Temp_E", "Rain_R_WDOG", "RAIN_RESET", "NO_GPS")) for _ in range(rows)],
+        "system":       [pick((0, 1, 2)) for _ in range(rows)],
+        "sensor_sts":   [pick(("OK", "OK", "TH-FAIL", "RF-ERR,RTC-FAIL")) for _ in range(rows)],
+        "http_present_fails": [pick((0, 0, 5)) for _ in range(rows)],
+        "http_backlog_cnt":   [pick((0, 0, 12)) for _ in range(rows)],
+        "mutex_fail":   [pick((0, 0, 0, 1)) for _ in range(rows)],
+    }
+
+
+def bench_eval(rows):
+    """Scalar evaluate() vs stored verdicts read back by evaluate_stored(). Parity: tests/test_health_eval.py."""
+    from app.services.health_eval import evaluate, evaluate_stored, evaluate_at_report, stored_fields, EVAL_FIELDS
+
+    print(f"[eval] {rows} synthetic rows")
+    now, cols = _synthetic_columns(rows)
+    objs = [types.SimpleNamespace(**{f: cols[f][i] for f in EVAL_FIELDS}) for i in range(rows)]
+
+    t0 = time.perf_counter()
+    for r in objs:
+        evaluate(r, now)
+    t_scalar = time.perf_counter() - t0
+
+    # Stored verdicts: the eval_* columns written at ingest
+    for r in objs:
+        r.__dict__.update(stored_fields(evaluate_at_report(vars(r))))
+    t0 = time.perf_counter()
+    for r in objs:
+        evaluate_stored(r, now)
+    t_stored = time.perf_counter() - t0
+
+    print(f"  scalar evaluate()       {t_scalar:7.2f} s   ({t_scalar / rows * 1e6:5.2f} µs/row)")
+    print(f"  stored eval_* columns   {t_stored:7.2f} s   ({t_stored / rows * 1e6:5.2f} µs/row)   "
+          f"x{t_scalar / t_stored:.2f}")
+    return t_scalar, t_stored
+
+
+def _seed_history(engine, rows, stations=200):
+    """Bulk-loads `rows` health reports (15-min cadence) straight through sqlite3."""
+    from app.services.health_eval import evaluate_at_report, stored_fields
+    start  = datetime.datetime(2020, 1, 1)
+    sample = dict(SAMPLE_REPORT, reported_at=start)
+    sample.update(stored_fields(evaluate_at_report(sample)))
+    cols   = list(sample)
+    sql    = f"INSERT INTO health_reports ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    base   = [sample[c] for c in cols]
+    i_stn, i_ts = cols.index("stn_id"), cols.index("reported_at")
+    conn = sqlite3.connect(engine.url.database)
+    batch = []
+    for n in range(rows):
+        row = list(base)
+        row[i_stn] = f"STN{n % stations:04d}"
+        row[i_ts]  = str(start + datetime.timedelta(minutes=15 * (n // stations)))
+        batch.append(row)
+        if len(batch) == 50000:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+    conn.commit()
+    conn.close()
+
+
+def _csv_worker(db_path, endpoint):
+    """Child process: streams one CSV export, prints 'bytes ttfb_s total_s peak_rss_kb'."""
+    from app.database import ReadSessionLocal, make_engine
+    from app.routers import dashboard
+    ReadSessionLocal.configure(bind=make_engine(f"sqlite:///{db_path}", read_only=True))
+    if endpoint == "full":
+        resp = dashboard.csv_full_history()
+    elif endpoint == "station":
+        resp = dashboard.station_csv("STN0000")
+    else:
+        resp = dashboard.export_history(format="parquet", verdict=1)
+
+    async def drain():
+        size, ttfb, t0 = 0, None, time.perf_counter()
+        async for chunk in resp.body_iterator:
+            if ttfb is None:
+                ttfb = time.perf_counter() - t0
+            size += len(chunk)
+        return size, ttfb, time.perf_counter() - t0
+
+    size, ttfb, total = asyncio.run(drain())
+    print(size, ttfb, total, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def bench_csv(rows):
+    """Peak RSS of the streaming CSV / Parquet exports must not grow with history size."""
+    from app.services import history_export
+    endpoints = ("full", "station") + (("parquet",) if history_export.available() else ())
+    print(f"[csv] full-history export, {rows // 10} vs {rows} rows (each in a fresh process)")
+    # SQLite's page cache and mmap window are bounded by config but would show
+    # up as RSS growth here — shrink them so only the export itself is measured
+    worker_env = dict(os.environ, SQLITE_CACHE_KB="2000", SQLITE_MMAP_MB="0")
+    peaks = {}
+    for size in (rows // 10, rows):
+        engine = _temp_engine()
+        t0 = time.perf_counter()
+        _seed_history(engine, size)
+        print(f"  seeded {size} rows in {time.perf_counter() - t0:.1f} s")
+        for endpoint in endpoints:
+            out = subprocess.run(
+                [sys.executable, __file__, "_csv_worker", engine.url.database, endpoint],
+                capture_output=True, text=True, check=True, env=worker_env,
+            ).stdout.split()
+            nbytes, ttfb, total, rss_kb = int(out[0]), float(out[1]), float(out[2]), int(out[3])
+            print(f"  {size:>8} rows  {endpoint:<8} out={nbytes / 1e6:8.1f} MB   ttfb={ttfb * 1000:7.1f} ms"
+                  f"   total={total:6.1f} s   peak_rss={rss_kb / 1024:6.1f} MB")
+            peaks.setdefault(endpoint, []).append(rss_kb)
+    for endpoint in ("full", "parquet"):
+        if endpoint in peaks:
+            growth = (peaks[endpoint][1] - peaks[endpoint][0]) / 1024
+            assert growth < 64, f"{endpoint}: peak RSS grew {growth:.1f} MB with 10x history — export is not streaming"
+            print(f"  ✓ {endpoint}: peak RSS grew {growth:.1f} MB for 10x history")
+    return peaks
+
+
+def bench_concurrency(posts, stations, interval_ms=10):
+    """p99 /health latency while /dashboard renders a large fleet: inline DB work vs thread offload."""
+    import httpx
+    from app.routers import health, dashboard
+    from app.services import offload
+    from app.services.ingest_queue import ingest_queue
+
+    results = []
+    print(f"[concurrency] {posts} /health posts ({interval_ms:g} ms apart) during back-to-back "
+          f"/dashboard renders of {stations} stations")
+
+    async def inline(fn, *args):
+        return fn(*args)
+
+    async def run(offloaded):
+        engine, _ = _bind_app_to_temp_db()
+        _seed_fleet(engine, stations)
+        health.run_ingest   = offload.run_ingest if offloaded else inline
+        dashboard.run_read  = offload.run_read   if offloaded else inline
+        app = _router_app(health.router, dashboard.router)
+        await ingest_queue.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            done, renders = asyncio.Event(), []
+
+            async def dashboards():
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    resp = await client.get("/dashboard")
+                    assert resp.status_code == 200, resp.status_code
+                    renders.append(time.perf_counter() - t0)
+
+            async def post(i):
+                await asyncio.sleep(i * interval_ms / 1000)   # staggered wake-ups; 0 = one burst
+                t0 = time.perf_counter()
+                resp = await client.post("/health", json=dict(SAMPLE_REPORT, stn_id=f"NEW{i:04d}"))
+                assert resp.json()["status"] == "ok", resp.text
+                return time.perf_counter() - t0
+
+            readers = [asyncio.create_task(dashboards()) for _ in range(2)]
+            await asyncio.sleep(0.05)     # renders already in flight
+            samples = await asyncio.gather(*(post(i) for i in range(posts)))
+            done.set()
+            await asyncio.gather(*readers)
+        await ingest_queue.stop()
+        health.run_ingest, dashboard.run_read = offload.run_ingest, offload.run_read
+        return list(samples), renders
+
+    for label, offloaded in (("inline (event loop)", False), ("thread offload", True)):
+        samples, renders = asyncio.run(run(offloaded))
+        _report(results, label, samples)
+        print(f"  {'':<28} dashboard renders={len(renders)}   "
+              f"render p50={statistics.median(renders) * 1000:.0f} ms")
+    return results
+
+
+def bench_sqlite(seconds, writers, history):
+    """Mixed load per SQLite profile: ingest writers vs dashboard reads vs a full-history export."""
+    import threading
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+    from app.database import make_engine
+    from app.services.health_eval import evaluate_stored
+    from app.services.station_latest import insert_reports, latest_reports_query, refresh_station_latest
+
+    results = []
+    print(f"[sqlite] {seconds}s mixed load: {writers} ingest writers, 1 dashboard reader, "
+          f"1 export reader over {history} rows")
+    for profile in ("legacy", "wal"):
+        engine = _temp_engine(profile)
+        _seed_history(engine, history)
+        Session     = sessionmaker(bind=engine)
+        ReadSession = sessionmaker(bind=make_engine(str(engine.url), read_only=True, profile=profile))
+        db = Session()
+        refresh_station_latest(db)
+        db.commit()
+        db.close()
+
+        stop     = threading.Event()
+        commits  = []
+        reads    = []
+        errors   = {"locked": 0}
+        exports  = [0]
+
+        def writer(w):
+            n = 0
+            while not stop.is_set():
+                db = Session()
+                t0 = time.perf_counter()
+                try:
+                    insert_reports(db, [dict(SAMPLE_REPORT, stn_id=f"W{w}_{n % 50}",
+                                             reported_at=datetime.datetime.utcnow())])
+                    db.commit()
+                    commits.append(time.perf_counter() - t0)
+                except OperationalError:
+                    db.rollback()
+                    errors["locked"] += 1
+                finally:
+                    db.close()
+                n += 1
+
+        def dashboard_reader():
+            while not stop.is_set():
+                db = ReadSession()
+                t0 = time.perf_counter()
+                now = datetime.datetime.utcnow()
+                for r in latest_reports_query(db).all():
+                    evaluate_stored(r, now)
+                reads.append(time.perf_counter() - t0)
+                db.close()
+                time.sleep(0.05)
+
+        def export_reader():
+            from app.models import HealthReport
+            while not stop.is_set():
+                db = ReadSession()
+                result = db.execute(select(HealthReport.__table__).execution_options(yield_per=2000))
+                for _ in result.partitions():
+                    if stop.is_set():
+                        break
+                db.close()
+                exports[0] += 1
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+        threads += [threading.Thread(target=dashboard_reader), threading.Thread(target=export_reader)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        print(f"  profile={profile}")
+        _report(results, f"{profile}: ingest commit", commits)
+        _report(results, f"{profile}: dashboard read", reads)
+        print(f"  {'':<28} ingest={len(commits) / seconds:7.0f} rows/s   "
+              f"'database is locked'={errors['locked']}   exports completed={exports[0]}")
+    return results
+
+
+def _hot_queries():
+    """(label, statement, must_avoid_sort) — the command / history query shapes services/indexes.py serves."""
+    from sqlalchemy import select, delete, func
+    from app.models import CommandQueue as C, HealthReport as H, StationLatest
+    stn, ago = "STN0001", datetime.datetime.utcnow() - datetime.timedelta(hours=3)
+    return [
+        ("check-in: pending command",
+         select(C).where(C.stn_id == stn, C.executed_at.is_(None)).limit(1), False),
+        ("check-in: 3h unacked retry",
+         select(C).where(C.stn_id == stn, C.executed_at.isnot(None), C.completed_at.is_(None),
+                         C.result == "SENT", C.executed_at < ago)
+                  .order_by(C.executed_at.asc()).limit(1), True),
+        ("check-in: last GET_GPS",
+         select(C).where(C.stn_id == stn, C.cmd == "GET_GPS").order_by(C.created_at.desc()).limit(1), True),
+        ("commands: clear pending",
+         delete(C).where(C.stn_id == stn, C.executed_at.is_(None)), False),
+        ("commands: clear OTA_CHECK",
+         delete(C).where(C.stn_id == stn, C.cmd == "OTA_CHECK", C.executed_at.is_(None)), False),
+        ("dashboard: fleet pending",
+         select(C).where(C.executed_at.is_(None)).order_by(C.id), True),
+        ("station: last 10 commands",
+         select(C).where(C.stn_id == stn).order_by(C.created_at.desc()).limit(10), False),
+        ("station: history page",
+         select(H).where(H.stn_id == stn).order_by(H.reported_at.desc()).limit(400), True),
+        ("csv: station history",
+         select(H.__table__).where(H.stn_id == stn).order_by(H.reported_at.desc()), True),
+        ("csv: full history",
+         select(H.__table__).order_by(H.stn_id, H.reported_at.desc()), True),
+        ("export: date range",
+         select(H.__table__).where(H.reported_at >= ago - datetime.timedelta(days=2),
+                                   H.reported_at < ago), False),
+        ("latest: station_latest join",
+         select(H).join(StationLatest, StationLatest.report_id == H.id), False),
+        ("latest: GROUP BY rebuild",
+         select(H.stn_id, func.max(H.reported_at)).group_by(H.stn_id), True),
+    ]
+
+
+def _explain(conn, stmt):
+    """EXPLAIN QUERY PLAN detail lines for a SQLAlchemy statement."""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params   = compiled.construct_params()
+    args     = tuple(str(params[k]) if isinstance(params[k], datetime.datetime) else params[k]
+                     for k in compiled.positiontup)
+    return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), args)]
+
+
+def _plan_problems(detail, must_avoid_sort):
+    bad = [d for d in detail
+           if d.startswith("SCAN") and d.split()[1] in ("health_reports", "command_queue")
+           and "INDEX" not in d]
+    if must_avoid_sort:
+        bad += [d for d in detail if "TEMP B-TREE" in d]
+    return bad
+
+
+def bench_plans(history):
+    """EXPLAIN QUERY PLAN regression: no hot query may fall back to a full table scan. Builds: tests/test_indexes.py."""
+    from sqlalchemy import text
+    from app.services.indexes import ensure_indexes, managed_indexes
+    engine = _temp_engine()
+    _seed_fleet(engine, 200)
+    _seed_history(engine, history)
+    # A month of already-acknowledged commands, as the 30-day prune leaves it
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO command_queue (stn_id, cmd, cmd_param, created_at, executed_at, result, completed_at) "
+                 "VALUES (:s, 'GET_GPS', '', :t, :t, 'OK', :t)"),
+            [{"s": f"STN{i % 200:04d}", "t": str(datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=i))}
+             for i in range(20000)],
+        )
+
+    # Roll back to the pre-composite schema, as an existing deployment has it
+    with engine.begin() as conn:
+        for ix in managed_indexes():
+            conn.execute(text(f"DROP INDEX {ix.name}"))
+        conn.execute(text("CREATE INDEX ix_health_reports_stn_id ON health_reports (stn_id)"))
+        conn.execute(text("CREATE INDEX ix_command_queue_stn_id ON command_queue (stn_id)"))
+
+    def check(title):
+        print(f"[plans] {title}")
+        failures = 0
+        with engine.connect() as conn:
+            for label, stmt, must_avoid_sort in _hot_queries():
+                detail = _explain(conn, stmt)
+                bad    = _plan_problems(detail, must_avoid_sort)
+                failures += bool(bad)
+                print(f"  {'✗' if bad else '✓'} {label:<30} {' | '.join(detail)}")
+        return failures
+
+    before = check("single-column indexes only")
+
+    t0 = time.perf_counter()
+    result = ensure_indexes(engine)
+    print(f"[plans] build of {len(result['built'])} indexes over {history} reports: "
+          f"{time.perf_counter() - t0:.1f}s")
+
+    after = check("managed composite indexes")
+    print(f"[plans] problem plans: {before} before -> {after} after")
+    assert after == 0, f"{after} hot queries fall back to a scan / sort"
+    print("  ✓ every hot query uses an index")
+
+
+def _legacy_history_db(history):
+    """Temp DB whose health_reports still has the retired columns (migration v4 pending)."""
+    from sqlalchemy import text
+    from app.services import migrations
+    engine = _temp_engine()
+    drop   = next(m for m in migrations.MIGRATIONS if isinstance(m, migrations.DropColumns))
+    with engine.begin() as conn:
+        for col in drop.columns:
+            conn.execute(text(f"ALTER TABLE health_reports ADD COLUMN {col} INTEGER DEFAULT 7"))
+    _seed_history(engine, history)
+    migrations.ensure_table(engine)
+    with engine.begin() as conn:
+        for m in migrations.MIGRATIONS:
+            if m is not drop:
+                conn.execute(text("INSERT INTO schema_migrations (version, name, state) VALUES (:v, :n, 'done')"),
+                             {"v": m.version, "n": m.name})
+    return engine, drop
+
+
+def bench_migrate(history, batch):
+    """Online DropColumns rebuild vs ALTER TABLE DROP COLUMN: write stalls. Parity / resume: tests/test_migrations.py."""
+    import shutil, threading
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app.database import make_engine
+    from app.services import migrations
+    from app.services.station_latest import insert_reports
+
+    engine, drop = _legacy_history_db(history)
+    src = engine.url.database
+
+    # Baseline: what the old drop_unnecessary_cols.py did, timed on a copy of the file
+    copy = src + ".baseline"
+    shutil.copy(src, copy)
+    conn = sqlite3.connect(copy)
+    t0 = time.perf_counter()
+    for col in drop.columns:
+        conn.execute(f"ALTER TABLE health_reports DROP COLUMN {col}")
+    conn.commit()
+    baseline = time.perf_counter() - t0
+    conn.close()
+    print(f"[migrate] {history} rows, ALTER TABLE DROP COLUMN x{len(drop.columns)}: "
+          f"write lock held {baseline:.2f}s")
+
+    for step in migrations.dry_run(engine):
+        print(f"  dry-run v{step['version']}: {step['action']}  rows={step['rows']}  "
+              f"est={step.get('est_seconds', 0)}s + index {step.get('est_index_seconds', 0)}s")
+
+    # Live writers while the rebuild runs: inserts, verdict updates, deletes
+    Session  = sessionmaker(bind=make_engine(str(engine.url)))
+    stop     = threading.Event()
+    commits, errors = [], {"locked": 0}
+
+    def writer():
+        rng, n = random.Random(3), 0
+        while not stop.is_set():
+            db = Session()
+            t0 = time.perf_counter()
+            try:
+                if n % 3 == 0:
+                    insert_reports(db, [dict(SAMPLE_REPORT, stn_id=f"MIG{n % 40}",
+                                             reported_at=datetime.datetime.utcnow())])
+                elif n % 3 == 1:
+                    db.execute(text("UPDATE health_reports SET eval_score = :s WHERE id = :i"),
+                               {"s": n, "i": rng.randint(1, history)})
+                else:
+                    db.execute(text("DELETE FROM health_reports WHERE id = :i"), {"i": rng.randint(1, history)})
+                db.commit()
+                commits.append(time.perf_counter() - t0)
+            except OperationalError:
+                db.rollback()
+                errors["locked"] += 1
+            finally:
+                db.close()
+            n += 1
+            time.sleep(0.002)
+
+    w = threading.Thread(target=writer)
+    w.start()
+    t0 = time.perf_counter()
+    migrations.run(engine, drop, batch=batch)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    w.join()
+
+    results = []
+    print(f"  online rebuild: {elapsed:.2f}s, writer kept committing during it")
+    _report(results, "write commit during rebuild", commits)
+    print(f"  {'':<28} writes={len(commits)}   'database is locked'={errors['locked']}")
+
+    # The index rebuild after the swap holds the write lock per index; at this
+    # size each build must still fit in busy_timeout for synchronous writers
+    assert errors["locked"] == 0, f"{errors['locked']} writes failed with 'database is locked'"
+    print(f"  longest write commit {max(commits) * 1000:.0f} ms vs {baseline * 1000:.0f} ms lock for DROP COLUMN")
+    return results
+
+
+def bench_retention(history, keep_days):
+    """Daily rollup pass: bounded steps, freed pages, station CSV across both tiers. Parity: tests/test_retention.py."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    from app.routers import dashboard
+    from app.services.retention import RetentionJob
+    from app.services.station_latest import refresh_station_latest
+
+    engine, _ = _bind_app_to_temp_db()
+    _seed_history(engine, history)
+    Session = sessionmaker(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE health_reports SET bat_v = 3.5 + (id % 70) / 100.0, signal = -60 - (id % 40)"))
+    db = Session()
+    refresh_station_latest(db)
+    db.commit()
+    db.close()
+
+    with engine.connect() as conn:
+        first, last = [datetime.datetime.fromisoformat(v) for v in conn.execute(
+            text("SELECT MIN(reported_at), MAX(reported_at) FROM health_reports")).one()]
+    cutoff = datetime.datetime.combine(last.date() - datetime.timedelta(days=keep_days), datetime.time())
+    client = TestClient(_router_app(dashboard.router))
+    size_before = os.path.getsize(engine.url.database)
+
+    def station_csv():
+        t0 = time.perf_counter()
+        rows = client.get("/station/STN0001/csv").text.count("\n") - 1
+        return rows, (time.perf_counter() - t0) * 1000
+
+    print(f"[retention] {history} reports {first:%Y-%m-%d}..{last:%Y-%m-%d}, keep raw from {cutoff:%Y-%m-%d}")
+    rows, ms = station_csv()
+    print(f"  station CSV before: {rows} rows in {ms:.0f} ms")
+    job = RetentionJob(raw_days=keep_days, pause_ms=0)
+    stats = asyncio.run(job.run_pass(Session, cutoff))
+    print(f"  folded {stats['raw_removed']} reports into {stats['daily_written']} daily rows "
+          f"in {stats['seconds']}s, longest transaction {stats['longest_step_ms']} ms")
+    print(f"  freed {stats['freed_bytes'] / 1048576:.1f} MB to the freelist "
+          f"(file {size_before / 1048576:.1f} MB, reused before it grows)")
+    rows, ms = station_csv()
+    print(f"  station CSV after:  {rows} rows in {ms:.0f} ms (raw + daily)")
+
+
+def _maint_worker(db_path, seconds, lease_s):
+    """Child process: one server worker's scheduler with a leader-only probe job that logs its runs."""
+    from sqlalchemy import text
+    from app.database import make_engine
+    from app.services.maintenance import Scheduler
+    engine = make_engine(f"sqlite:///{db_path}")
+    sched  = Scheduler(tick_s=0.1, lease_s=lease_s)
+
+    def probe():
+        started = time.time()
+        time.sleep(0.1)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO probe_runs VALUES (:h, :s, :e)"),
+                         {"h": sched.holder, "s": started, "e": time.time()})
+
+    sched.add("probe", 0.3, probe)
+
+    async def run():
+        sched.start(engine)
+        await asyncio.sleep(seconds)
+        await sched.stop()
+
+    asyncio.run(run())
+
+
+def bench_maintenance(workers, seconds, history):
+    """Leader failover time across worker processes, then ANALYZE / vacuum cost. Election: tests/test_maintenance.py."""
+    import signal
+    from sqlalchemy import text
+    from app.services.maintenance import analyze, incremental_vacuum, LEASE_NAME, Scheduler
+
+    lease_s = 1.5
+    engine  = _temp_engine()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE probe_runs (holder TEXT, started REAL, ended REAL)"))
+    print(f"[maintenance] {workers} worker processes for {seconds}s, lease {lease_s}s; leader killed at {seconds / 3:.0f}s")
+    procs = [subprocess.Popen([sys.executable, __file__, "_maint_worker", engine.url.database, str(seconds), str(lease_s)])
+             for _ in range(workers)]
+    time.sleep(seconds / 3)
+    with engine.connect() as conn:
+        leader = conn.execute(text("SELECT holder FROM maintenance_lease WHERE name = :n"), {"n": LEASE_NAME}).scalar()
+    killed_at = time.time()
+    os.kill(int(leader.rsplit(":", 1)[1]), signal.SIGKILL)     # no lease release
+    for proc in procs:
+        proc.wait()
+
+    with engine.connect() as conn:
+        runs = conn.execute(text("SELECT holder, started, ended FROM probe_runs ORDER BY started")).all()
+    holders  = [h for i, (h, _, _) in enumerate(runs) if i == 0 or h != runs[i - 1][0]]
+    overlaps = sum(1 for a, b in zip(runs, runs[1:]) if b.started < a.ended)
+    gap      = min((b.started for b in runs if b.started > killed_at), default=killed_at) - killed_at
+    print(f"  {len(runs)} probe runs, leaders in order: {' -> '.join(holders)}, {overlaps} overlapping")
+    print(f"  failover took {gap:.1f}s after the leader was killed (lease {lease_s}s)")
+
+    # A long leader job must not hold back the others, nor start twice
+    sched = Scheduler(tick_s=0.05, lease_s=lease_s)
+    sched.add("slow", 0.1, lambda: time.sleep(1.5))
+    sched.add("fast", 0.1, lambda: None, scope="worker")
+
+    async def overlap():
+        sched.start(engine)
+        await asyncio.sleep(3)
+        await sched.stop()
+
+    asyncio.run(overlap())
+    slow, fast = sched.jobs["slow"].state["runs"], sched.jobs["fast"].state["runs"]
+    print(f"  1.5s leader job + 0.1s worker job for 3s: slow ran {slow}x, fast ran {fast}x")
+
+    _seed_history(engine, history)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM health_reports WHERE id % 2 = 0"))   # what a retention pass frees
+    size = os.path.getsize(engine.url.database)
+    t0 = time.perf_counter()
+    result = analyze(engine)
+    print(f"  analyze on {history} rows: {(time.perf_counter() - t0) * 1000:.0f} ms {result}")
+    t0 = time.perf_counter()
+    result = incremental_vacuum(engine, pages=10 ** 9)
+    with engine.begin() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    print(f"  incremental_vacuum: {(time.perf_counter() - t0) * 1000:.0f} ms {result}, "
+          f"file {size / 1048576:.1f} -> {os.path.getsize(engine.url.database) / 1048576:.1f} MB")
+
+
+def bench_otacache(checkins, stations):
+    """Check-in OTA decision: per-request queries + stat() vs the worker snapshot. Decisions: tests/test_ota_cache.py."""
+    from app.models import FirmwareRegistry, StationSettings
+    from app.services import ota_cache as oc
+    from app.services.ota_service import needs_ota
+
+    engine, _ = _bind_app_to_temp_db()
+    Session   = sessionmaker(bind=engine)
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    filename  = "FW_S5_KSNDMC_TRG.bin"
+    open(os.path.join(builds, filename), "wb").write(b"\0" * 1024)
+    db = Session()
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.90", filename=filename))
+    db.add_all(StationSettings(stn_id=f"STN{i:04d}", ota_exempt=i % 2) for i in range(stations))
+    db.commit()
+    oc.ota_cache.builds_dir = builds
+    print(f"[otacache] {checkins} OTA decisions, {stations} station_settings rows")
+
+    def legacy(db, stn_id):
+        setting = db.query(StationSettings).filter_by(stn_id=stn_id).first()
+        if setting and setting.ota_exempt == 1:
+            return ""
+        fw = db.query(FirmwareRegistry).filter_by(unit_type="KSNDMC_TRG", system_mode=0).first()
+        if fw and needs_ota("5.82", fw.current_ver) and os.path.exists(os.path.join(builds, fw.filename)):
+            return fw.filename
+        return ""
+
+    def cached(db, stn_id):
+        ota = oc.ota_cache.view(db)
+        if ota.is_exempt(stn_id):
+            return ""
+        target = ota.target("KSNDMC_TRG", 0)
+        return target[1] if target and needs_ota("5.82", target[0]) and ota.has_build(target[1]) else ""
+
+    results, counter = [], _count_queries(engine)
+    for label, decide in (("before (2 queries + stat)", legacy), ("after  (worker snapshot)", cached)):
+        samples, picks = [], []
+        counter["n"] = 0
+        for i in range(checkins):
+            t0 = time.perf_counter()
+            picks.append(decide(db, f"STN{i % stations:04d}"))
+            samples.append(time.perf_counter() - t0)
+        _report(results, label, samples)
+        print(f"  {'':<28} {counter['n']} statements, {sum(1 for p in picks if p)} OTA_CHECK")
+    db.close()
+    return results
+
+def _fw_server(port, builds_dir, db_path):
+    """Child process: the full app under uvicorn, plus the pre-v3.2 aiofiles handler at /legacy."""
+    import uvicorn
+    from fastapi import Request
+    from fastapi.responses import StreamingResponse
+    os.environ.update(SPATIKA_DB_URL=f"sqlite:///{db_path}", MAINTENANCE="0")
+    os.environ.setdefault("ADMIN_PASS", "bench")
+    os.environ.setdefault("GUEST_PASS", "bench")
+    from app.main import app
+    from app.routers import builds
+    builds.BUILDS_DIR = builds_dir
+
+    @app.get("/legacy/{filename}")
+    async def legacy(filename: str, request: Request):
+        import aiofiles
+        filepath = os.path.join(builds_dir, filename)
+        file_size = os.path.getsize(filepath)
+        start_str, end_str = request.headers["Range"].replace("bytes=", "").split("-")
+        start, end = int(start_str), min(int(end_str), file_size - 1)
+
+        async def iter_file():
+            async with aiofiles.open(filepath, "rb") as f:
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = await f.read(min(32768, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+        return StreamingResponse(iter_file(), status_code=206, headers={
+            "Content-Range": f"bytes {start}-{end}/{file_size}", "Content-Length": str(end - start + 1)})
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _cpu_seconds(pid) -> float:
+    fields = open(f"/proc/{pid}/stat").read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_firmware(devices, image_kb):
+    """A firmware group OTAs at once: concurrent 32 KB Range downloads, old handler vs hot images.
+    Replaced / rewritten images: tests/test_firmware_store.py."""
+    import hashlib, socket
+    import httpx
+
+    builds = tempfile.mkdtemp(prefix="spatika_builds_")
+    image  = os.urandom(image_kb * 1024)
+    open(os.path.join(builds, "FW_S5_KSNDMC_TRG.bin"), "wb").write(image)
+    digest = hashlib.sha256(image).hexdigest()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    db_path = os.path.join(tempfile.mkdtemp(prefix="spatika_bench_"), "bench.db")
+    server  = subprocess.Popen([sys.executable, __file__, "_fw_server", str(port), builds, db_path])
+    base    = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            assert server.poll() is None, "bench server exited"
+            try:
+                httpx.head(f"{base}/builds/FW_S5_KSNDMC_TRG.bin")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        print(f"[firmware] {devices} devices each pulling a {image_kb} KB image in 32 KB Range requests (uvicorn)")
+
+        async def device(client, path, latencies):
+            parts = []
+            for start in range(0, len(image), 32768):
+                t0 = time.perf_counter()
+                resp = await client.get(path, headers={"Range": f"bytes={start}-{start + 32767}"})
+                latencies.append(time.perf_counter() - t0)
+                assert resp.status_code == 206, resp.status_code
+                parts.append(resp.content)
+            return hashlib.sha256(b"".join(parts)).hexdigest()
+
+        async def fleet(path):
+            latencies = []
+            limits = httpx.Limits(max_connections=devices, max_keepalive_connections=devices)
+            async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+                digests = await asyncio.gather(*(device(client, path, latencies) for _ in range(devices)))
+            assert set(digests) == {digest}, "a device received a corrupted image"
+            return latencies
+
+        results = []
+        for label, path in (("before (aiofiles 32 KB reads)", "/legacy/FW_S5_KSNDMC_TRG.bin"),
+                            ("after  (hot image)",             "/builds/FW_S5_KSNDMC_TRG.bin")):
+            cpu0, t0 = _cpu_seconds(server.pid), time.perf_counter()
+            latencies = asyncio.run(fleet(path))
+            wall, cpu = time.perf_counter() - t0, _cpu_seconds(server.pid) - cpu0
+            _report(results, label, latencies)
+            print(f"  {'':<28} {devices * len(image) / wall / 1048576:6.1f} MB/s   wall {wall:5.2f} s   "
+                  f"server CPU {cpu:5.2f} s")
+
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_manifest(image_kb, loss):
+    """Per-chunk CRC manifest: build cost, per-range header cost, airtime on a lossy link.
+    Header correctness: tests/test_builds.py."""
+    from fastapi.testclient import TestClient
+    from app.routers import builds
+    from app.services import ota_manifest
+
+    builds.BUILDS_DIR = tempfile.mkdtemp(prefix="spatika_builds_")
+    path  = os.path.join(builds.BUILDS_DIR, "FW_S5_KSNDMC_TRG.bin")
+    image = os.urandom(image_kb * 1024)
+    open(path, "wb").write(image)
+    chunk = ota_manifest.CHUNK_SIZE
+    print(f"[manifest] {image_kb} KB image, {chunk // 1024} KB chunks")
+
+    t0 = time.perf_counter()
+    manifest = ota_manifest.write_for(path)
+    print(f"  build + store at upload        {(time.perf_counter() - t0) * 1000:7.2f} ms")
+    t0 = time.perf_counter()
+    ota_manifest.load(path)
+    print(f"  load from sidecar              {(time.perf_counter() - t0) * 1000:7.2f} ms")
+    os.utime(path, ns=(time.time_ns(), time.time_ns()))      # a deploy script touched the image
+    t0 = time.perf_counter()
+    ota_manifest.load(path)
+    print(f"  rebuild a stale sidecar        {(time.perf_counter() - t0) * 1000:7.2f} ms")
+
+    client  = TestClient(_router_app(builds.router))
+    results = []
+    for label, size in (("aligned chunk (manifest CRC)", chunk), ("unaligned range (computed)", chunk - 1000)):
+        samples = []
+        for start in range(0, len(image), chunk):
+            start += chunk - size
+            t0 = time.perf_counter()
+            client.get("/builds/FW_S5_KSNDMC_TRG.bin", headers={"Range": f"bytes={start}-{start + size - 1}"})
+            samples.append(time.perf_counter() - t0)
+        _report(results, label, samples)
+
+    # Airtime: each chunk arrives corrupted with probability `loss`. Without the
+    # manifest the device only finds out at the final MD5 and starts over from
+    # byte 0; with it, it re-fetches just the bad chunk.
+    rng, devices, chunks = random.Random(7), 1000, len(manifest["crc32"])
+    whole = per_chunk = 0
+    for _ in range(devices):
+        while True:
+            whole += chunks
+            if all(rng.random() >= loss for _ in range(chunks)):
+                break
+        for _ in range(chunks):
+            per_chunk += 1
+            while rng.random() < loss:
+                per_chunk += 1
+    print(f"  {devices} devices, {loss:.1%} of chunks corrupted:")
+    print(f"    restart on bad image   {whole / devices * chunk / 1048576:7.2f} MB per device")
+    print(f"    re-fetch bad chunks    {per_chunk / devices * chunk / 1048576:7.2f} MB per device")
+
+
+def _firmware_image(rng, image_kb):
+    """Bytes that compress like an ESP32 app image (gzip ~0.5): modules of code
+    reusing their own instruction sequences, log / AT strings, tables, padding."""
+    snippets = [rng.randbytes(rng.randrange(4, 24)) for _ in range(5000)]
+    weights  = [(i + 1) ** -0.8 for i in range(len(snippets))]
+    words    = ["[OTA]", "[GPRS]", "AT+HTTPPARA", "AT+CGATT?", "ERROR", "OK", "station", "failed", "retry",
+                "%s:%d", "health", "ftp", "sensor", "rain", "wind", "timeout", "modem", "sim", "%02d/%02d", "\r\n"]
+    out, size = bytearray(), image_kb * 1024
+    while len(out) < size:
+        kind = rng.random()
+        if kind < 0.7:
+            local = rng.choices(snippets, weights, k=48)
+            for op in rng.choices(local, k=rng.randrange(20, 120)):
+                out += op if rng.random() < .3 else op[:-3] + rng.randbytes(3)
+        elif kind < 0.9:
+            out += " ".join(rng.choice(words) for _ in range(rng.randrange(2, 8))).encode() + b"\0"
+        else:
+            out += bytes(rng.randrange(4, 64)) if rng.random() < .5 else rng.randbytes(rng.randrange(8, 64))
+    return bytes(out[:size])
+
+
+def _firmware_versions(seed, image_kb, count):
+    """`count` successive builds of one configuration: each release inserts
+    functions and relocates scattered addresses."""
+    rng    = random.Random(seed)
+    image  = _firmware_image(rng, image_kb)
+    builds = [image]
+    for _ in range(count - 1):
+        new = bytearray(builds[-1])
+        for _ in range(40):
+            pos = rng.randrange(len(new))
+            new[pos:pos] = rng.randbytes(rng.randrange(16, 800))
+        for _ in range(3000):
+            pos = rng.randrange(len(new) - 4)
+            new[pos:pos + 4] = rng.randbytes(4)
+        builds.append(bytes(new[:len(image) + 64 * 1024]))
+    return builds
+
+
+def bench_delta(image_kb, stations):
+    """Delta OTA: per-group patch ratio and refresh cost, bytes over the air vs the full image.
+    Offer and apply: tests/test_delta_ota.py."""
+    import io
+    from fastapi.testclient import TestClient
+    from app.models import FirmwareRegistry
+    from app.routers import builds as builds_router
+    from app.services import delta_ota, ota_cache as oc
+    from app.services.station_latest import insert_reports
+
+    if not delta_ota.available():
+        print("[delta] detools is not installed — pip install detools")
+        return
+    import detools
+
+    engine, _ = _bind_app_to_temp_db()
+    Session   = sessionmaker(bind=engine)
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    oc.ota_cache.builds_dir  = builds
+    builds_router.BUILDS_DIR = builds
+    groups = [(5, 0, "KSNDMC_TRG"), (6, 0, "BIHAR_TRG"), (1, 2, "SPATIKA_GEN"),
+              (3, 1, "KSNDMC_TWS"), (2, 2, "KSNDMC_ADDON")]
+    versions = ["5.80", "5.81", "5.82"]
+    images   = {}
+    db  = Session()
+    now = datetime.datetime.utcnow()
+    for cat_id, mode, unit in groups:
+        filename = f"FW_S{cat_id}_{unit}.bin"
+        path     = os.path.join(builds, filename)
+        for ver, image in zip(versions, _firmware_versions(cat_id, image_kb, len(versions))):
+            images[(cat_id, ver)] = image
+            open(path + ".tmp", "wb").write(image)
+            os.replace(path + ".tmp", path)         # as /ota/upload does
+            delta_ota.archive(path, ver)
+        db.add(FirmwareRegistry(category_id=cat_id, name=unit, unit_type=unit, system_mode=mode,
+                                current_ver=versions[-1], filename=filename))
+        insert_reports(db, [dict(SAMPLE_REPORT, stn_id=f"S{cat_id}_{i:03d}", unit_type=unit, system=mode,
+                                 ver=versions[i % len(versions)], reported_at=now)
+                            for i in range(stations)])
+    db.commit()
+    print(f"[delta] {len(groups)} groups, ~{image_kb} KB images, fleet on {versions[:-1]} -> target {versions[-1]}")
+
+    t0 = time.perf_counter()
+    totals = delta_ota.refresh(db, builds_dir=builds)
+    db.commit()
+    print(f"  refresh: {totals} in {time.perf_counter() - t0:.2f} s")
+    print(f"  {'group':<22} {'from':>5} {'image KB':>9} {'patch KB':>9} {'ratio':>7}")
+    for group in delta_ota.report(db):
+        for p in group["patches"]:
+            print(f"  S{group['category_id']} {group['unit_type']:<19} {p['from_ver']:>5} {p['image_kb']:>9.0f} "
+                  f"{p['patch_kb']:>9.1f} {p['ratio']:>7.1%}")
+    t0 = time.perf_counter()
+    delta_ota.refresh(db, builds_dir=builds)
+    db.commit()
+    print(f"  refresh with nothing new: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    # The device: 32 KB Range requests, then patched against its running image
+    health = TestClient(_health_app())
+    files  = TestClient(_router_app(builds_router.router))
+    report = dict(SAMPLE_REPORT, stn_id="S5_NEW", unit_type="KSNDMC_TRG", system=0, ver="5.80", ota_delta=1)
+    with _quiet():
+        patch = health.post("/health", json=report).json()["p"].split("?")[0]
+    size   = int(files.head(f"/builds/{patch}").headers["content-length"])
+    parts  = [files.get(f"/builds/{patch}", headers={"Range": f"bytes={start}-{start + 32767}"}).content
+              for start in range(0, size, 32768)]
+    t0 = time.perf_counter()
+    detools.apply_patch(io.BytesIO(images[(5, "5.80")]), io.BytesIO(b"".join(parts)), io.BytesIO())
+    applied = time.perf_counter() - t0
+    target  = len(images[(5, "5.82")])
+    print(f"  {patch}: {-(-size // 32768)} Range requests instead of {-(-target // 32768)} "
+          f"({size / 1024:.0f} KB vs {target / 1024:.0f} KB over the air), apply {applied * 1000:.0f} ms")
+    db.close()
+
+
+def bench_encoding(image_kb):
+    """Bytes on the wire per group: plain vs the heatshrink variant. Decode / resume: tests/test_ota_encoding.py."""
+    import zlib
+    from fastapi.testclient import TestClient
+    from app.routers import builds as builds_router
+    from app.services import ota_encoding, ota_manifest
+
+    if not ota_encoding.available():
+        print("[encoding] heatshrink2 is not installed — pip install detools (or heatshrink2)")
+        return
+    builds_router.BUILDS_DIR = tempfile.mkdtemp(prefix="spatika_builds_")
+    client = TestClient(_router_app(builds_router.router))
+    chunk  = ota_manifest.CHUNK_SIZE
+    groups = [(5, "KSNDMC_TRG"), (6, "BIHAR_TRG"), (1, "SPATIKA_GEN"), (3, "KSNDMC_TWS"), (2, "KSNDMC_ADDON")]
+    print(f"[encoding] heatshrink w={ota_encoding.WINDOW_SZ2} l={ota_encoding.LOOKAHEAD_SZ2}, "
+          f"{chunk // 1024} KB blocks, ~{image_kb} KB code-like images")
+    print(f"  {'group':<18} {'plain KB':>9} {'heatshrink':>11} {'saved':>6} {'encode':>8}   "
+          f"{'deflate w10':>11} {'gzip (ref)':>10}   (saved)")
+    wire = {"plain": 0, "encoded": 0}
+    for cat_id, unit in groups:
+        filename = f"FW_S{cat_id}_{unit}.bin"
+        path     = os.path.join(builds_router.BUILDS_DIR, filename)
+        image    = _firmware_image(random.Random(cat_id), image_kb)
+        open(path, "wb").write(image)
+        t0    = time.perf_counter()
+        index = ota_encoding.write_for(path)
+        secs  = time.perf_counter() - t0
+        # What a small-window zlib would give with the same independent blocks, and an unbounded gzip
+        deflate = sum(len((lambda c: c.compress(image[i:i + chunk]) + c.flush())(
+            zlib.compressobj(9, zlib.DEFLATED, -10))) for i in range(0, len(image), chunk))
+        gzip    = len(zlib.compress(image, 9))
+
+        # Device download in 32 KB Ranges, plain and negotiated
+        for label, headers in (("plain", {}), ("encoded", {"Accept-Encoding": ota_encoding.ENCODING})):
+            total = int(client.head(f"/builds/{filename}", headers=headers).headers["content-length"])
+            got   = bytearray()
+            for start in range(0, total, 32768):
+                got += client.get(f"/builds/{filename}",
+                                  headers=dict(headers, Range=f"bytes={start}-{start + 32767}")).content
+            wire[label] += len(got)
+        print(f"  S{cat_id} {unit:<15} {len(image) / 1024:>9.0f} {index['size'] / 1024:>8.0f} KB "
+              f"{1 - index['size'] / len(image):>6.1%} {secs * 1000:>6.0f} ms   "
+              f"{1 - deflate / len(image):>11.1%} {1 - gzip / len(image):>10.1%}")
+
+    print(f"  5 groups on the wire: {wire['plain'] / 1048576:.2f} MB plain -> {wire['encoded'] / 1048576:.2f} MB "
+          f"({1 - wire['encoded'] / wire['plain']:.1%} less)")
+
+
+def bench_rollout(stations, checkins):
+    """Staged rollout: waves over simulated ticks, check-in gate cost. Order / caps / pause: tests/test_ota_rollout.py."""
+    from fastapi.testclient import TestClient
+    from app.models import FirmwareRegistry, StationSettings
+    from app.services import ota_cache as oc, ota_rollout
+    from app.services.station_latest import insert_reports
+
+    engine, _ = _bind_app_to_temp_db()
+    Session   = sessionmaker(bind=engine)
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    filename  = "FW_S5_KSNDMC_TRG.bin"
+    open(os.path.join(builds, filename), "wb").write(b"\0" * 1024)
+    oc.ota_cache.builds_dir = builds
+    rng  = random.Random(5)
+    db   = Session()
+    now  = datetime.datetime.utcnow()
+    fleet = {f"S5_{i:04d}": dict(SAMPLE_REPORT, stn_id=f"S5_{i:04d}", unit_type="KSNDMC_TRG", system=0, ver="5.82",
+                                 signal=rng.choice([0] + list(range(-113, -51))), reported_at=now)
+             for i in range(stations)}
+    fw = FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                          current_ver="5.90", filename=filename)
+    db.add(fw)
+    db.add(StationSettings(stn_id="S5_0000", ota_exempt=1))
+    insert_reports(db, [dict(r) for r in fleet.values()])      # it adds the verdict columns
+    ota_rollout.start(db, fw)
+    db.commit()
+    ota_rollout.configure(db, 5, wave_size=25, max_inflight=10, order_by="signal", pause_fail_rate=0.25)
+    db.commit()
+    print(f"[rollout] {stations} stations on 5.82 -> 5.90, waves of 25, at most 10 in flight, strongest signal first")
+
+    health = TestClient(_health_app())
+
+    def offered():
+        with _quiet():
+            return {stn for stn, r in fleet.items()
+                    if health.post("/health", json=dict(r, reported_at=None)).json()["cmd"] == "OTA_CHECK"}
+
+    def report(stn, **changes):
+        fleet[stn] = dict(fleet[stn], reported_at=datetime.datetime.utcnow(), **changes)
+        insert_reports(db, [dict(fleet[stn])])
+
+    ticks, upgraded = 0, 0
+    # Waves 1-2: everyone admitted upgrades; one device in three lags a tick
+    while True:
+        ota_rollout.tick(db)
+        db.commit()
+        ticks += 1
+        state = ota_rollout.status(db)[5]
+        got   = offered()
+        if state["wave"] > 2:
+            break
+        for stn in sorted(got):
+            if rng.random() < 0.67:
+                report(stn, ver="5.90")
+                upgraded += 1
+        db.commit()
+    first = [w["admitted"] for w in state["waves"]]
+    print(f"  {ticks} ticks: waves {first}, {upgraded} upgraded")
+
+    # The check-in gate itself: snapshot lookups, no rollout queries
+    counter = _count_queries(engine)
+    stns, samples = list(fleet), []
+    for i in range(checkins):
+        t0 = time.perf_counter()
+        oc.ota_cache.view(db).admitted("KSNDMC_TRG", 0, stns[i % len(stns)])
+        samples.append(time.perf_counter() - t0)
+    _report([], "gate (snapshot lookup)", samples)
+    print(f"  {'':<28} {counter['n']} statements for {checkins} decisions")
+    db.close()
+
+
+def bench_downloads(stations, image_kb):
+    """Download telemetry: per-carrier report, record + flush cost. Attribution: tests/test_ota_telemetry.py."""
+    from fastapi.testclient import TestClient
+    from app.models import FirmwareRegistry, OtaDownload
+    from app.routers import builds as builds_router
+    from app.services import ota_cache as oc, ota_telemetry
+    from app.services.ota_telemetry import download_stats
+    from app.services.station_latest import insert_reports
+
+    engine, _ = _bind_app_to_temp_db()
+    Session   = sessionmaker(bind=engine)
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    oc.ota_cache.builds_dir  = builds
+    builds_router.BUILDS_DIR = builds
+    filename = "FW_S5_KSNDMC_TRG.bin"
+    image    = _firmware_image(random.Random(5), image_kb)
+    open(os.path.join(builds, filename), "wb").write(image)
+    db = Session()
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.90", filename=filename))
+    carriers = ["AIRTEL", "JIO", "BSNL", "VI"]
+    insert_reports(db, [dict(SAMPLE_REPORT, stn_id=f"D{i:02d}", carrier=carriers[i % 4],
+                             reported_at=datetime.datetime.utcnow()) for i in range(8)])
+    db.commit()
+    health = TestClient(_health_app())
+    files  = TestClient(_router_app(builds_router.router))
+    print(f"[downloads] {len(image) // 1024} KB image, 32 KB Range requests, 4 carriers")
+
+    # Devices: HEAD, then Ranges; D01 reboots half-way and resumes, D02 retries every 4th chunk
+    for i in range(8):
+        stn   = f"D{i:02d}"
+        with _quiet():
+            param = health.post("/health", json=dict(SAMPLE_REPORT, stn_id=stn, carrier=carriers[i % 4])).json()["p"]
+        size  = int(files.head(f"/builds/{param}").headers["content-length"])
+        for n, start in enumerate(range(0, size, 32768)):
+            if stn == "D01" and start == size // 2 // 32768 * 32768:
+                files.head(f"/builds/{param}")
+            for _ in range(2 if stn == "D02" and n % 4 == 0 else 1):
+                files.get(f"/builds/{param}", headers={"Range": f"bytes={start}-{start + 32767}"})
+    files.get(f"/builds/{filename}", headers={"Range": "bytes=0-32767"})       # untagged: not recorded
+    t0     = time.perf_counter()
+    totals = download_stats.flush(db)
+    db.commit()
+    print(f"  flush: {totals} in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    rep = ota_telemetry.report(db)
+    print(f"  {'carrier':<8} {'done':>5} {'KB/s p50':>9} {'req p50':>8} {'resumes':>8} {'sent/needed':>12}")
+    for row in rep["carriers"] + [dict(rep["all"], carrier="ALL")]:
+        print(f"  {row['carrier']:<8} {row['downloads']:>5} {row['kbps_p50']:>9} {row['requests_p50']:>8} "
+              f"{row['resumes_per_attempt']:>8} {row['sent_per_needed']:>12}")
+
+    # Buffer + flush at fleet scale: every station pulling the image in 32 KB Ranges
+    chunks = -(-len(image) // 32768)
+    t0 = time.perf_counter()
+    for i in range(stations):
+        stn = f"F{i:04d}"
+        download_stats.record(stn, filename, "", len(image), 0, 0, head=True)
+        for k in range(chunks):
+            download_stats.record(stn, filename, "", len(image), k * 32768, min(32768, len(image) - k * 32768))
+    per = (time.perf_counter() - t0) / (stations * (chunks + 1))
+    t0 = time.perf_counter()
+    totals = download_stats.flush(db)
+    db.commit()
+    secs = time.perf_counter() - t0
+    done = db.query(OtaDownload).filter(OtaDownload.stn_id.like("F%"), OtaDownload.completed_at.isnot(None)).count()
+    print(f"  record(): {per * 1e6:.2f} µs per request on the /builds path")
+    print(f"  flush of {totals['requests']} requests / {totals['rows']} downloads: {secs * 1000:.0f} ms, "
+          f"{done} completed rows")
+    db.close()
+
+
+def bench_conditional(image_kb, stations):
+    """200 vs 304 on /builds and /csv/summary. Validators, If-Range and the v= pin: tests/test_builds.py."""
+    from fastapi.testclient import TestClient
+    from app.routers import builds as builds_router, dashboard
+    from app.services import ota_cache as oc, ota_manifest
+
+    engine, _ = _bind_app_to_temp_db()
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    oc.ota_cache.builds_dir  = builds
+    builds_router.BUILDS_DIR = builds
+    filename = "FW_S5_KSNDMC_TRG.bin"
+    path     = os.path.join(builds, filename)
+    open(path, "wb").write(_firmware_image(random.Random(5), image_kb))
+    ota_manifest.write_for(path)
+    print(f"[conditional] {image_kb} KB image, {stations} stations")
+
+    def timed(client, url, validators, n=50):
+        results = []
+        for label, headers in (("200 (full body)", {}), ("304 (validator)", validators)):
+            samples = []
+            for _ in range(n):
+                t0 = time.perf_counter()
+                client.get(url, headers=headers)
+                samples.append(time.perf_counter() - t0)
+            _report(results, f"{url} {label}", samples)
+        return results
+
+    files = TestClient(_router_app(builds_router.router))
+    etag  = files.head(f"/builds/{filename}").headers["etag"]
+    results = timed(files, f"/builds/{filename}", {"If-None-Match": etag})
+
+    _seed_fleet(engine, stations, reports_per_station=1)
+    client = TestClient(_router_app(dashboard.router))
+    full   = client.get("/csv/summary")
+    results += timed(client, "/csv/summary", {"If-None-Match": full.headers["etag"]}, n=10)
+    print(f"  {'':<28} /csv/summary body {len(full.content) // 1024} KB")
+    return results
+
+
+def bench_builds(image_kb):
+    """Content-addressed store: one-pass upload vs write-then-hash, dedup, rollback flip, adoption.
+    Rollback / adoption behaviour: tests/test_build_store.py."""
+    from fastapi.testclient import TestClient
+    from app.models import FirmwareRegistry, OtaBuild
+    from app.routers import builds as builds_router, ota as ota_router
+    from app.services import build_store, ota_cache as oc, ota_manifest
+
+    engine, _ = _bind_app_to_temp_db()
+    Session   = sessionmaker(bind=engine)
+    builds    = tempfile.mkdtemp(prefix="spatika_builds_")
+    oc.ota_cache.builds_dir  = builds
+    builds_router.BUILDS_DIR = builds
+    ota_router.BUILDS_DIR    = builds
+    filename = "FW_S5_KSNDMC_TRG.bin"
+    alias    = os.path.join(builds, filename)
+    db = Session()
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.82", filename=filename))
+    db.commit()
+    rng    = random.Random(25)
+    images = {ver: _firmware_image(rng, image_kb) for ver in ("5.90", "5.91", "5.92")}
+    client = TestClient(_router_app(ota_router.router, builds_router.router))
+    print(f"[builds] {image_kb} KB images, uploads through /ota/upload")
+
+    def upload(ver, data):
+        t0 = time.perf_counter()
+        r  = client.post("/ota/upload/5", data={"ver": ver}, files={"file": ("fw.bin", data)}, follow_redirects=False)
+        assert r.status_code == 303, r.status_code
+        return time.perf_counter() - t0
+
+    # Write, then read back to hash (before) vs hashing while the body streams in
+    plain = os.path.join(builds, "plain.tmp")
+    t0 = time.perf_counter()
+    with open(plain, "wb") as f:
+        for i in range(0, len(images["5.90"]), 64 * 1024):
+            f.write(images["5.90"][i:i + 64 * 1024])
+    ota_manifest.write_for(plain)
+    t_two = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    hasher = ota_manifest.Hasher()
+    with open(plain, "wb") as f:
+        for i in range(0, len(images["5.90"]), 64 * 1024):
+            f.write(images["5.90"][i:i + 64 * 1024])
+            hasher.update(images["5.90"][i:i + 64 * 1024])
+    t_one = time.perf_counter() - t0
+    os.remove(plain)
+    ota_manifest.remove(plain)
+    print(f"  write + hash pass: {t_two * 1000:.1f} ms  →  one pass: {t_one * 1000:.1f} ms")
+
+    times = {ver: upload(ver, data) for ver, data in images.items()}
+    print(f"  upload (new bytes): " + ", ".join(f"{v} {t * 1000:.0f} ms" for v, t in times.items()))
+
+    t_dup = upload("5.93", images["5.90"])
+    db.expire_all()
+    rep = build_store.report(db, builds)
+    print(f"  re-upload of 5.90's bytes as 5.93: {t_dup * 1000:.0f} ms, stored once "
+          f"({rep['stored_kb']:.0f} KB kept for {rep['uploaded_kb']:.0f} KB uploaded)")
+
+    # Rollback: alias re-pointed, no re-upload
+    target = db.query(OtaBuild).filter_by(category_id=5, ver="5.91").one()
+    t0 = time.perf_counter()
+    client.post("/ota/rollback/5", data={"build_id": target.id}, follow_redirects=False)
+    t_rb = time.perf_counter() - t0
+    print(f"  rollback 5.93 → 5.91: {t_rb * 1000:.1f} ms request (vs {times['5.91'] * 1000:.0f} ms to upload it again)")
+
+    # Adoption: an image copied in by hand, and the same bytes under a second name
+    open(os.path.join(builds, "FW_CUSTOM_KA0001.bin"), "wb").write(images["5.92"])
+    open(os.path.join(builds, "FW_CUSTOM_KA0002.bin"), "wb").write(os.urandom(4096))
+    t0 = time.perf_counter()
+    totals = build_store.adopt(db, builds)
+    db.commit()
+    print(f"  adopt: {totals} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatika server micro-benchmarks")
+    sub    = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("automigrate", help="POST /health schema probe cost")
+    p.add_argument("--n", type=int, default=2000)
+
+    p = sub.add_parser("burst", help="Same-slot check-in burst, sync vs write-behind")
+    p.add_argument("--stations", type=int, default=1000)
+
+    p = sub.add_parser("dashboard", help="/dashboard query count must not grow with the fleet")
+    p.add_argument("--stations", type=int, default=300)
+
+    p = sub.add_parser("eval", help="Stored health verdicts vs scalar evaluate()")
+    p.add_argument("--rows", type=int, default=1000000)
+
+    p = sub.add_parser("csv", help="Peak RSS of streaming CSV / Parquet exports vs history size")
+    p.add_argument("--rows", type=int, default=2000000)
+
+    p = sub.add_parser("_csv_worker")   # internal: one export in a clean process
+    p.add_argument("db_path")
+    p.add_argument("endpoint", choices=("full", "station", "parquet"))
+
+    p = sub.add_parser("concurrency", help="/health p99 latency under concurrent /dashboard load")
+    p.add_argument("--posts", type=int, default=200)
+    p.add_argument("--stations", type=int, default=3000)
+    p.add_argument("--interval-ms", type=float, default=10, help="gap between check-ins (0 = one burst)")
+
+    p = sub.add_parser("sqlite", help="Ingest throughput / read latency per SQLite profile")
+    p.add_argument("--seconds", type=float, default=8)
+    p.add_argument("--writers", type=int, default=4)
+    p.add_argument("--history", type=int, default=200000)
+
+    p = sub.add_parser("plans", help="EXPLAIN QUERY PLAN check of the hot command / history queries")
+    p.add_argument("--history", type=int, default=200000)
+
+    p = sub.add_parser("migrate", help="Online resumable column-drop rebuild under live writes")
+    p.add_argument("--history", type=int, default=500000)
+    p.add_argument("--batch", type=int, default=5000)
+
+    p = sub.add_parser("retention", help="Raw -> daily rollup pass: parity, bounded steps, freed space")
+    p.add_argument("--history", type=int, default=500000)
+    p.add_argument("--keep-days", type=int, default=3)
+
+    p = sub.add_parser("maintenance", help="Scheduler leader election / failover, ANALYZE and vacuum cost")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--seconds", type=float, default=12)
+    p.add_argument("--history", type=int, default=300000)
+
+    p = sub.add_parser("otacache", help="Check-in OTA decision from the worker snapshot vs per-request queries")
+    p.add_argument("--checkins", type=int, default=2000)
+    p.add_argument("--stations", type=int, default=3000)
+
+    p = sub.add_parser("firmware", help="Concurrent OTA Range downloads: aiofiles handler vs hot images")
+    p.add_argument("--devices", type=int, default=50)
+    p.add_argument("--image-kb", type=int, default=1536)
+
+    p = sub.add_parser("manifest", help="OTA chunk manifest: build cost, CRC headers, lossy-link airtime")
+    p.add_argument("--image-kb", type=int, default=1536)
+    p.add_argument("--loss", type=float, default=0.02, help="fraction of chunks corrupted in transit")
+
+    p = sub.add_parser("delta", help="Delta OTA patches: per-group ratio, OTA_CHECK choice, device apply")
+    p.add_argument("--image-kb", type=int, default=1536)
+    p.add_argument("--stations", type=int, default=30)
+
+    p = sub.add_parser("encoding", help="Precompressed (heatshrink) firmware: bytes on the wire per group")
+    p.add_argument("--image-kb", type=int, default=1536)
+
+    p = sub.add_parser("rollout", help="Staged OTA rollout: wave order / caps, auto-pause, check-in gate cost")
+    p.add_argument("--stations", type=int, default=200)
+    p.add_argument("--checkins", type=int, default=2000)
+
+    p = sub.add_parser("downloads", help="Firmware download telemetry: attribution, resumes, record / flush cost")
+    p.add_argument("--stations", type=int, default=300)
+    p.add_argument("--image-kb", type=int, default=1536)
+
+    p = sub.add_parser("conditional", help="ETag / 304 / If-Range on /builds and /csv/summary, replace mid-download")
+    p.add_argument("--image-kb", type=int, default=1536)
+    p.add_argument("--stations", type=int, default=2000)
+
+    p = sub.add_parser("builds", help="Content-addressed firmware store: one-pass upload, dedup, rollback flip")
+    p.add_argument("--image-kb", type=int, default=1536)
+
+    p = sub.add_parser("_fw_server")   # internal: the app under uvicorn
+    p.add_argument("port", type=int)
+    p.add_argument("builds_dir")
+    p.add_argument("db_path")
+
+    p = sub.add_parser("_maint_worker")   # internal: one worker's scheduler
+    p.add_argument("db_path")
+    p.add_argument("seconds", type=float)
+    p.add_argument("lease_s", type=float)
+
+    args = parser.parse_args()
+    if args.bench == "automigrate":
+        bench_automigrate(args.n)
+    elif args.bench == "burst":
+        bench_burst(args.stations)
+    elif args.bench == "dashboard":
+        bench_dashboard(args.stations)
+    elif args.bench == "eval":
+        bench_eval(args.rows)
+    elif args.bench == "csv":
+        bench_csv(args.rows)
+    elif args.bench == "concurrency":
+        bench_concurrency(args.posts, args.stations, args.interval_ms)
+    elif args.bench == "sqlite":
+        bench_sqlite(args.seconds, args.writers, args.history)
+    elif args.bench == "plans":
+        bench_plans(args.history)
+    elif args.bench == "migrate":
+        bench_migrate(args.history, args.batch)
+    elif args.bench == "retention":
+        bench_retention(args.history, args.keep_days)
+    elif args.bench == "maintenance":
+        bench_maintenance(args.workers, args.seconds, args.history)
+    elif args.bench == "otacache":
+        bench_otacache(args.checkins, args.stations)
+    elif args.bench == "firmware":
+        bench_firmware(args.devices, args.image_kb)
+    elif args.bench == "manifest":
+        bench_manifest(args.image_kb, args.loss)
+    elif args.bench == "delta":
+        bench_delta(args.image_kb, args.stations)
+    elif args.bench == "encoding":
+        bench_encoding(args.image_kb)
+    elif args.bench == "rollout":
+        bench_rollout(args.stations, args.checkins)
+    elif args.bench == "downloads":
+        bench_downloads(args.stations, args.image_kb)
+    elif args.bench == "conditional":
+        bench_conditional(args.image_kb, args.stations)
+    elif args.bench == "builds":
+        bench_builds(args.image_kb)
+    elif args.bench == "_fw_server":
+        _fw_server(args.port, args.builds_dir, args.db_path)
+    elif args.bench == "_csv_worker":
+        _csv_worker(args.db_path, args.endpoint)
+    elif args.bench == "_maint_worker":
+        _maint_worker(args.db_path, args.seconds, args.lease_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,63 @@
-import sqlite3
-import os
+"""
+migrate.py — Apply pending schema migrations (services/migrations.py)
+
+    python3 migrate.py              # apply every pending step, table rebuilds included
+    python3 migrate.py --dry-run    # list pending steps with row counts and estimated time
+    python3 migrate.py --status     # applied / running / pending per version
+
+Safe while the server is running: table rebuilds copy in short batches, and
+an interrupted rebuild resumes from its saved cursor on the next run.
+Missing managed indexes (services/indexes.py) are built afterwards, with the
+server's write-behind queues holding their rows while each one builds.
+Also works piped into the container (DEPLOY_NOW.sh: `python3 -`).
+"""
+import argparse
 import sys
 
 # Dynamically find the correct database path from the server's own config
 try:
     from app.database import engine
-    db = engine.url.database
+    from app.models import Base
+    from app.services import indexes, migrations
 except ImportError:
     print("Could not import app.database. Ensure you are running this in the correct environment.")
     sys.exit(1)
 
-def migrate():
-    print(f"Connecting to {db}...")
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
 
-    try:
-        print("Adding 'ota_fails' column to 'health_reports'...")
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN ota_fails INTEGER DEFAULT 0;")
-        print("✓ Column 'ota_fails' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("→ Column 'ota_fails' already exists.")
-        else:
-            print(f"Error adding 'ota_fails': {e}")
+def migrate(dry_run=False, batch=migrations.MIGRATE_BATCH_ROWS):
+    print(f"Connecting to {engine.url.database}...")
+    Base.metadata.create_all(bind=engine)
+    if dry_run:
+        plan = migrations.dry_run(engine)
+        if not plan:
+            print("→ Schema is up to date.")
+        for step in plan:
+            line = f"v{step['version']:<3} {step['name']}\n     {step['action']}"
+            if step["rows"]:
+                line += (f" — {step['rows']} rows, ~{step['est_seconds']}s copy"
+                         f" + ~{step['est_index_seconds']}s for {step['indexes']} index(es)")
+            print(line)
+        return
+    applied = migrations.apply_all(engine, batch=batch)
+    print(f"Migration complete ({applied} step(s) applied).")
+    built = indexes.ensure_indexes(engine)["built"]
+    print(f"Indexes: {len(built)} built." if built else "Indexes up to date.")
+
+
+def status():
+    for m in migrations.status(engine):
+        progress = f"  {m['rows_done']} rows (id {m['cursor_id']}/{m['target_id']})" if m["target_id"] else ""
+        print(f"v{m['version']:<3} {m['state']:<8} {m['name']}{progress}")
 
-    try:
-        print("Adding 'ota_fail_reason' column to 'health_reports'...")
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN ota_fail_reason TEXT DEFAULT 'NONE';")
-        print("✓ Column 'ota_fail_reason' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("→ Column 'ota_fail_reason' already exists.")
-        else:
-            print(f"Error adding 'ota_fail_reason': {e}")
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN prev_stored INTEGER DEFAULT 0;")
-        print("✓ Column 'prev_stored' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN http_suc_cnt INTEGER DEFAULT 0;")
-        print("✓ Column 'http_suc_cnt' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN http_suc_cnt_prev INTEGER DEFAULT 0;")
-        print("✓ Column 'http_suc_cnt_prev' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN http_ret_cnt INTEGER DEFAULT 0;")
-        print("✓ Column 'http_ret_cnt' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN http_ret_cnt_prev INTEGER DEFAULT 0;")
-        print("✓ Column 'http_ret_cnt_prev' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN ftp_suc_cnt INTEGER DEFAULT 0;")
-        print("✓ Column 'ftp_suc_cnt' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    try:
-        cursor.execute("ALTER TABLE health_reports ADD COLUMN ftp_suc_cnt_prev INTEGER DEFAULT 0;")
-        print("✓ Column 'ftp_suc_cnt_prev' added.")
-    except sqlite3.OperationalError as e:
-        if "duplicate" not in str(e): print(e)
-
-    # ── v7.59: Columns present in models.py but previously missing from migrate.py ──
-    for col, dtype, default in [
-        ("http_fails",       "INTEGER", "0"),
-        ("http_fail_reason", "TEXT",    "'NONE'"),
-        ("net_cnt",          "INTEGER", "0"),
-        ("net_cnt_prev",     "INTEGER", "0"),
-        ("first_http",       "INTEGER", "0"),
-        ("spiffs_kb",        "INTEGER", "0"),
-        ("spiffs_total_kb",  "INTEGER", "4640"),
-        ("calib",            "TEXT",    "'NA'"),
-        ("ndm_cnt",          "INTEGER", "0"),
-        ("pd_cnt",           "INTEGER", "0"),
-        ("cdm_sts",          "TEXT",    "'PENDING'"),
-        ("reg_fails",        "INTEGER", "0"),
-        ("reg_fail_reason",  "TEXT",    "'NONE'"),
-        ("reset_reason",     "INTEGER", "0"),
-        ("http_present_fails", "INTEGER", "0"),
-        ("http_cum_fails",   "INTEGER", "0"),
-        ("consec_reg_fails", "INTEGER", "0"),
-        ("consec_http_fails","INTEGER", "0"),
-        ("consec_sim_fails", "INTEGER", "0"),
-        ("unsent_count",     "INTEGER", "0"),
-        ("http_backlog_cnt", "INTEGER", "0"),
-        ("mutex_fail",       "INTEGER", "0"),
-    ]:
-        try:
-            cursor.execute(f"ALTER TABLE health_reports ADD COLUMN {col} {dtype} DEFAULT {default};")
-            print(f"✓ Column '{col}' added.")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e):
-                print(f"→ Column '{col}' already exists.")
-            else:
-                print(f"Error adding '{col}': {e}")
-    # ── v7.92: Command Feedback Loop ──
-    for col, dtype, default in [
-        ("result",       "TEXT",     "'SENT'"),
-        ("completed_at", "DATETIME", "NULL"),
-    ]:
-        try:
-            cursor.execute(f"ALTER TABLE command_queue ADD COLUMN {col} {dtype} DEFAULT {default};")
-            print(f"✓ Column '{col}' added to command_queue.")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e):
-                print(f"→ Column '{col}' already exists in command_queue.")
-            else:
-                print(f"Error adding '{col}' to command_queue: {e}")
-
-    conn.commit()
-    conn.close()
-    print("Migration complete.")
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description="Spatika schema migrations")
+    parser.add_argument("--dry-run", action="store_true", help="report pending steps and estimates only")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--batch", type=int, default=migrations.MIGRATE_BATCH_ROWS,
+                        help="rows copied per transaction in table rebuilds")
+    args = parser.parse_args()
+    if args.status:
+        status()
+    else:
+        migrate(dry_run=args.dry_run, batch=args.batch)
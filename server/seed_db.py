@@ -7,6 +7,7 @@ Usage (on Contabo):
 """
 from app.database import SessionLocal, engine
 from app.models import Base, FirmwareRegistry
+from app.services.ota_cache import bump as bump_ota_cache
 
 Base.metadata.create_all(bind=engine)
 db = SessionLocal()
@@ -35,6 +36,8 @@ for g in GROUPS:
     else:
         print(f"  → Exists : {g['display_name']} (skipped)")
 
+# Running server workers reload their firmware targets (services/ota_cache.py)
+bump_ota_cache(db)
 db.commit()
 db.close()
 print("\nDone. All firmware groups are ready.")
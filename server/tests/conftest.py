@@ -0,0 +1,152 @@
+"""
+Shared fixtures for the server test suite. Run from server/:
+
+    python -m pytest
+
+Every test works on a throw-away SQLite file under pytest's tmp_path, never
+the live SpatikaHealth.db: SPATIKA_DB_URL is pointed at a temp dir before
+any app module is imported, and app_db / builds_dir rebind the app's
+sessions, caches and BUILDS_DIR per test. Timings live in benchmarks.py.
+"""
+
+import datetime, os, random, tempfile
+
+os.environ.setdefault("SPATIKA_DB_URL",
+                      f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='spatika_test_'), 'import.db')}")
+os.environ.setdefault("ADMIN_PASS", "test")
+os.environ.setdefault("GUEST_PASS", "test")
+os.environ.setdefault("MAINTENANCE", "0")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.database import ReadSessionLocal, SessionLocal, make_engine
+from app.models import Base
+
+# A representative v5.8x check-in payload
+SAMPLE_REPORT = {
+    "stn_id": "TEST001", "unit_type": "KSNDMC_TRG", "system": 0, "ver": "5.82",
+    "bat_v": 4.05, "sol_v": 5.1, "signal": -81, "reg_fails": 0, "http_fails": 1,
+    "net_cnt": 40, "net_cnt_prev": 95, "prev_stored": 96, "ndm_cnt": 0,
+    "cdm_sts": "OK", "health_sts": "OK", "sensor_sts": "RF-OK",
+    "gps": "12.971600,77.594600", "carrier": "AIRTEL", "iccid": "8991100000000000000",
+    "ota_fails": 0, "unsent_count": 0, "last_cmd_id": 0, "last_cmd_res": "N/A",
+}
+
+
+def report(**changes) -> dict:
+    """SAMPLE_REPORT with `changes` applied."""
+    return dict(SAMPLE_REPORT, **changes)
+
+
+def router_client(*routers) -> TestClient:
+    """Just the given routers — no auth, no startup hooks."""
+    app = FastAPI()
+    for router in routers:
+        app.include_router(router)
+    return TestClient(app)
+
+
+def firmware_image(rng: random.Random, image_kb: int = 96) -> bytes:
+    """Bytes that compress like an ESP32 app image (gzip ~0.5): modules of code
+    reusing their own instruction sequences, log / AT strings, tables, padding."""
+    snippets = [rng.randbytes(rng.randrange(4, 24)) for _ in range(5000)]
+    weights  = [(i + 1) ** -0.8 for i in range(len(snippets))]
+    words    = ["[OTA]", "[GPRS]", "AT+HTTPPARA", "AT+CGATT?", "ERROR", "OK", "station", "failed", "retry",
+                "%s:%d", "health", "ftp", "sensor", "rain", "wind", "timeout", "modem", "sim", "%02d/%02d", "\r\n"]
+    out, size = bytearray(), image_kb * 1024
+    while len(out) < size:
+        kind = rng.random()
+        if kind < 0.7:
+            local = rng.choices(snippets, weights, k=48)
+            for op in rng.choices(local, k=rng.randrange(20, 120)):
+                out += op if rng.random() < .3 else op[:-3] + rng.randbytes(3)
+        elif kind < 0.9:
+            out += " ".join(rng.choice(words) for _ in range(rng.randrange(2, 8))).encode() + b"\0"
+        else:
+            out += bytes(rng.randrange(4, 64)) if rng.random() < .5 else rng.randbytes(rng.randrange(8, 64))
+    return bytes(out[:size])
+
+
+def firmware_versions(seed: int, count: int, image_kb: int = 96) -> list:
+    """`count` successive builds of one configuration: each release inserts
+    functions and relocates scattered addresses."""
+    rng    = random.Random(seed)
+    image  = firmware_image(rng, image_kb)
+    builds = [image]
+    for _ in range(count - 1):
+        new = bytearray(builds[-1])
+        for _ in range(40):
+            pos = rng.randrange(len(new))
+            new[pos:pos] = rng.randbytes(rng.randrange(16, 800))
+        for _ in range(200):
+            pos = rng.randrange(len(new) - 4)
+            new[pos:pos + 4] = rng.randbytes(4)
+        builds.append(bytes(new[:len(image) + 64 * 1024]))
+    return builds
+
+
+def seed_history(engine, rows: int, stations: int = 10, start=datetime.datetime(2020, 1, 1)):
+    """`rows` scored reports at a 15-min cadence, round-robin over `stations`."""
+    from app.services.station_latest import insert_reports
+    db = sessionmaker(bind=engine)()
+    try:
+        insert_reports(db, [report(stn_id=f"STN{n % stations:04d}",
+                                   reported_at=start + datetime.timedelta(minutes=15 * (n // stations)))
+                            for n in range(rows)])
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(Session):
+    db = Session()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def app_db(engine):
+    """Points the app's write and read sessions at the test DB and drops what workers cached from the last one."""
+    from app.routers import health
+    from app.services import ota_cache
+    read_engine = make_engine(str(engine.url), read_only=True)
+    binds = SessionLocal.kw["bind"], ReadSessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    health._COLUMN_CACHE.clear()
+    ota_cache.ota_cache.invalidate()
+    yield engine
+    SessionLocal.configure(bind=binds[0])
+    ReadSessionLocal.configure(bind=binds[1])
+    read_engine.dispose()
+
+
+@pytest.fixture
+def builds_dir(tmp_path, monkeypatch):
+    """Empty BUILDS_DIR for the /builds and /ota routers and the check-in OTA cache."""
+    from app.routers import builds, ota
+    from app.services import ota_cache
+    path = tmp_path / "builds"
+    path.mkdir()
+    monkeypatch.setattr(builds, "BUILDS_DIR", str(path))
+    monkeypatch.setattr(ota, "BUILDS_DIR", str(path))
+    monkeypatch.setattr(ota_cache.ota_cache, "builds_dir", str(path))
+    ota_cache.ota_cache.invalidate()
+    return str(path)
@@ -0,0 +1,120 @@
+"""Content-addressed build store behind /ota/upload and /ota/rollback: copies, dedup, rollback, adoption."""
+
+import hashlib, os, random, time
+
+import pytest
+
+from app.models import FirmwareRegistry, OtaBuild, OtaRollout
+from app.routers import builds, ota
+from app.services import build_store, ota_manifest
+from app.services.conditional import parse_http_date
+from conftest import firmware_image, router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+
+
+@pytest.fixture
+def images():
+    rng = random.Random(25)
+    return {ver: firmware_image(rng) for ver in ("5.90", "5.91", "5.92")}
+
+
+@pytest.fixture
+def client(app_db, builds_dir, db):
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.82", filename=FILENAME))
+    db.commit()
+    return router_client(ota.router, builds.router)
+
+
+@pytest.fixture
+def uploaded(client, images):
+    for ver, data in images.items():
+        _upload(client, ver, data)
+    return {ver: hashlib.sha256(data).hexdigest() for ver, data in images.items()}
+
+
+def _upload(client, ver, data):
+    resp = client.post("/ota/upload/5", data={"ver": ver}, files={"file": ("fw.bin", data)}, follow_redirects=False)
+    assert resp.status_code == 303
+
+
+def _rollback(client, build_id):
+    resp = client.post("/ota/rollback/5", data={"build_id": build_id}, follow_redirects=False)
+    assert resp.status_code == 303
+
+
+def _build_id(db, ver):
+    return db.query(OtaBuild).filter_by(category_id=5, ver=ver).one().id
+
+
+def test_one_pass_hash_matches_the_manifest(images):
+    hasher = ota_manifest.Hasher()
+    for i in range(0, len(images["5.90"]), 64 * 1024):
+        hasher.update(images["5.90"][i:i + 64 * 1024])
+    assert hasher.manifest(FILENAME) == ota_manifest.build(images["5.90"], FILENAME)
+
+
+def test_alias_is_a_copy_of_its_object(builds_dir, uploaded, images):
+    alias = os.path.join(builds_dir, FILENAME)
+    obj   = build_store.object_path(uploaded["5.92"], builds_dir)
+    assert os.stat(alias).st_ino != os.stat(obj).st_ino
+    assert open(alias, "rb").read() == images["5.92"]
+    assert ota_manifest.cached(alias)["sha256"] == uploaded["5.92"]
+    assert ota_manifest.cached(alias)["file"] == FILENAME
+    # A deploy script overwriting the alias in place must leave the stored build alone
+    with open(alias, "r+b") as f:
+        f.write(b"\xff" * 64)
+    assert build_store._sha256(obj) == uploaded["5.92"]
+
+
+def test_same_bytes_are_stored_once(client, builds_dir, uploaded, images, db):
+    _upload(client, "5.93", images["5.90"])
+    rep = build_store.report(db, builds_dir)
+    assert rep["builds"] == 4 and rep["objects"] == 3
+
+
+def test_rollback_repoints_the_alias(client, uploaded, images, db):
+    before = client.get(f"/builds/{FILENAME}")
+    assert before.content == images["5.92"]
+    time.sleep(1.1)     # Last-Modified has one-second resolution
+    _rollback(client, _build_id(db, "5.91"))
+    db.expire_all()
+    fw = db.get(FirmwareRegistry, 5)
+    assert fw.current_ver == "5.91" and fw.sha256 == uploaded["5.91"]
+    assert db.get(OtaRollout, 5).to_ver == "5.91"
+    got = client.get(f"/builds/{FILENAME}")
+    assert got.content == images["5.91"]
+    assert got.headers["etag"] == ota_manifest.etag({"sha256": uploaded["5.91"]})
+    assert got.headers["x-firmware-sha256"] == uploaded["5.91"]
+    assert parse_http_date(got.headers["last-modified"]) > parse_http_date(before.headers["last-modified"])
+    assert client.get(f"/builds/{FILENAME}",
+                      headers={"If-Modified-Since": before.headers["last-modified"]}).status_code == 200
+
+
+def test_rollback_to_an_unknown_build_changes_nothing(client, uploaded, db):
+    _rollback(client, 9999)
+    db.expire_all()
+    assert db.get(FirmwareRegistry, 5).current_ver == "5.92"
+
+
+def test_rollback_refuses_a_corrupted_object(client, builds_dir, uploaded, images, db):
+    bad = build_store.object_path(uploaded["5.90"], builds_dir)
+    with open(bad, "r+b") as f:
+        f.write(b"\0" * 64)
+    _rollback(client, _build_id(db, "5.90"))
+    db.expire_all()
+    assert db.get(FirmwareRegistry, 5).current_ver == "5.92"
+    assert client.get(f"/builds/{FILENAME}").content == images["5.92"]
+
+
+def test_adopt_is_idempotent(builds_dir, uploaded, images, db):
+    open(os.path.join(builds_dir, "FW_CUSTOM_KA0001.bin"), "wb").write(images["5.92"])
+    open(os.path.join(builds_dir, "FW_CUSTOM_KA0002.bin"), "wb").write(os.urandom(4096))
+    totals = build_store.adopt(db, builds_dir)
+    db.commit()
+    assert totals == {"aliases": 3, "adopted": 2, "stored": 1}
+    alias   = os.path.join(builds_dir, "FW_CUSTOM_KA0002.bin")
+    adopted = build_store.object_path(build_store._sha256(alias), builds_dir)
+    assert os.stat(alias).st_ino != os.stat(adopted).st_ino
+    assert build_store.adopt(db, builds_dir) == {"aliases": 3, "adopted": 0, "stored": 0}
@@ -0,0 +1,166 @@
+"""GET/HEAD /builds: Range parsing, validators, If-Range, per-chunk CRCs and the v= pin."""
+
+import datetime, hashlib, os, zlib
+
+import pytest
+
+from app.models import FirmwareRegistry
+from app.routers import builds, dashboard, health
+from app.services import ota_encoding, ota_manifest
+from app.services.ota_cache import ota_cache
+from app.services.station_latest import insert_reports
+from conftest import firmware_versions, report, router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+URL      = f"/builds/{FILENAME}"
+
+
+@pytest.fixture
+def images():
+    return firmware_versions(5, 2)
+
+
+@pytest.fixture
+def upload(builds_dir):
+    """What /ota/upload does to the alias: atomic replace, then manifest + heatshrink variant."""
+    path = os.path.join(builds_dir, FILENAME)
+
+    def upload(image):
+        with open(path + ".tmp", "wb") as f:
+            f.write(image)
+        os.replace(path + ".tmp", path)
+        ota_manifest.write_for(path)
+        ota_encoding.write_for(path)
+    return upload
+
+
+@pytest.fixture
+def files(app_db, upload, images):
+    upload(images[0])
+    return router_client(builds.router)
+
+
+def _fetch(files, url, start, headers=None, size=32768):
+    return files.get(url, headers=dict(headers or {}, Range=f"bytes={start}-{start + size - 1}"))
+
+
+@pytest.mark.parametrize("header, status", [
+    ("bytes=abc", 400),
+    ("bytes=1-2-3", 400),
+    ("items=0-", 400),
+    ("bytes=5000-100", 416),
+    ("bytes=99999999-", 416),
+])
+def test_bad_range(files, header, status):
+    resp = files.get(URL, headers={"Range": header})
+    assert resp.status_code == status
+    if status == 416:
+        assert resp.headers["content-range"].startswith("bytes */")
+
+
+def test_range_is_clamped_to_the_image(files, images):
+    resp = files.get(URL, headers={"Range": f"bytes={len(images[0]) - 10}-99999999"})
+    assert resp.status_code == 206 and resp.content == images[0][-10:]
+
+
+def test_not_served(files):
+    assert files.get("/builds/FW_NONE.bin").status_code == 404
+    assert files.get("/builds/notes.txt").status_code == 403
+
+
+def test_validators_and_304(files, images):
+    head = files.head(URL)
+    etag, last_modified = head.headers["etag"], head.headers["last-modified"]
+    assert etag == f'"{hashlib.sha256(images[0]).hexdigest()[:32]}"'
+    for method in (files.head, files.get):
+        assert method(URL, headers={"If-None-Match": etag}).status_code == 304
+        assert method(URL, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert files.get(URL, headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}).status_code == 200
+
+
+def test_heatshrink_variant_has_its_own_tag(files):
+    pytest.importorskip("heatshrink2")
+    etag = files.head(URL).headers["etag"]
+    encoded = files.head(URL, headers={"Accept-Encoding": "heatshrink"})
+    assert encoded.headers["content-encoding"] == "heatshrink"
+    assert encoded.headers["etag"] != etag
+    assert files.head(URL, headers={"Accept-Encoding": "heatshrink", "If-None-Match": etag}).status_code == 200
+
+
+def test_if_range_after_a_replace_sends_the_new_image(files, upload, images):
+    etag = files.head(URL).headers["etag"]
+    assert _fetch(files, URL, 0, {"If-Range": etag}).status_code == 206
+    upload(images[1])
+    resp = _fetch(files, URL, 32768, {"If-Range": etag})
+    assert resp.status_code == 200 and resp.content == images[1] and resp.headers["etag"] != etag
+    # A date validator cannot tell two builds written in the same second apart
+    assert _fetch(files, URL, 0, {"If-Range": resp.headers["last-modified"]}).status_code == 200
+
+
+def test_chunk_crcs_match_the_manifest(files, images):
+    manifest = files.get(f"{URL}/manifest").json()
+    assert files.head(URL).headers["x-firmware-md5"] == hashlib.md5(images[0]).hexdigest()
+    chunk = manifest["chunk_size"]
+    for i, start in enumerate(range(0, len(images[0]), chunk)):
+        resp = _fetch(files, URL, start, size=chunk)
+        assert resp.headers["x-content-crc32"] == manifest["crc32"][i] == f"{zlib.crc32(resp.content):08x}"
+    resp = files.get(URL, headers={"Range": "bytes=1000-4999"})
+    assert resp.headers["x-content-crc32"] == f"{zlib.crc32(images[0][1000:5000]):08x}"
+
+
+def test_stale_sidecar_rebuilds_the_same_manifest(builds_dir, upload, images):
+    upload(images[0])
+    path = os.path.join(builds_dir, FILENAME)
+    manifest = ota_manifest.load(path)
+    mtime = os.stat(path).st_mtime_ns + 10**9
+    os.utime(path, ns=(mtime, mtime))        # a deploy script touched the image
+    assert ota_manifest.cached(path) is None
+    assert ota_manifest.load(path) == manifest
+    assert ota_manifest.cached(path) == manifest
+
+
+def test_pin_refuses_a_replaced_image(files, upload, images, db):
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.90", filename=FILENAME))
+    db.commit()
+    checkin = router_client(health.router)
+
+    def ota_param():
+        return checkin.post("/health", json=report(stn_id="PIN01")).json()["p"]
+
+    param = ota_param()
+    assert f"v={hashlib.sha256(images[0]).hexdigest()[:ota_manifest.PIN_LEN]}" in param
+    got = _fetch(files, f"/builds/{param}", 0).content
+    upload(images[1])        # replaced mid-download
+    pinned   = _fetch(files, f"/builds/{param}", len(got))
+    unpinned = _fetch(files, URL, len(got))
+    assert pinned.status_code == 412
+    # Without the pin the device would stitch two builds together
+    assert unpinned.status_code == 206 and unpinned.content == images[1][len(got):len(got) + 32768]
+
+    ota_cache.invalidate()
+    param = ota_param()
+    assert f"v={hashlib.sha256(images[1]).hexdigest()[:ota_manifest.PIN_LEN]}" in param
+    assert _fetch(files, f"/builds/{param}", 0).status_code == 206
+
+
+def test_csv_summary_validators(app_db, db):
+    now = datetime.datetime.utcnow()
+    insert_reports(db, [report(stn_id=f"STN{i:04d}", reported_at=now) for i in range(20)])
+    db.commit()
+    client = router_client(dashboard.router)
+    full = client.get("/csv/summary")
+    etag = full.headers["etag"]
+    again = client.get("/csv/summary", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and not again.content
+    assert client.get("/csv/summary", headers={"If-Modified-Since": full.headers["last-modified"]}).status_code == 304
+
+    insert_reports(db, [report(stn_id="STN0000", reported_at=datetime.datetime.utcnow())])
+    db.commit()
+    assert client.get("/csv/summary", headers={"If-None-Match": etag}).status_code == 200
+
+    # An offline station's "No report for Nh" ticking over changes the tag too
+    insert_reports(db, [report(stn_id="GONE01", reported_at=now - datetime.timedelta(hours=30))])
+    db.commit()
+    later = [dashboard._summary_etag(db, now + datetime.timedelta(minutes=m)) for m in (0, 30, 61)]
+    assert later[0] == later[1] != later[2]
@@ -0,0 +1,80 @@
+"""Delta OTA: patches built per group, offered to delta-capable firmware, and applying to the exact target."""
+
+import datetime, io, os, zlib
+
+import pytest
+
+from app.models import FirmwareRegistry
+from app.routers import builds, health
+from app.services import delta_ota
+from app.services.ota_cache import ota_cache
+from app.services.station_latest import insert_reports
+from conftest import firmware_versions, report, router_client
+
+detools = pytest.importorskip("detools")
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+VERSIONS = ["5.80", "5.81", "5.82"]
+
+
+@pytest.fixture
+def images(app_db, builds_dir, db):
+    path   = os.path.join(builds_dir, FILENAME)
+    images = dict(zip(VERSIONS, firmware_versions(5, len(VERSIONS))))
+    for ver, image in images.items():
+        open(path + ".tmp", "wb").write(image)
+        os.replace(path + ".tmp", path)         # as /ota/upload does
+        delta_ota.archive(path, ver)
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver=VERSIONS[-1], filename=FILENAME))
+    insert_reports(db, [report(stn_id=f"S5_{i:03d}", ver=VERSIONS[i % len(VERSIONS)],
+                               reported_at=datetime.datetime.utcnow()) for i in range(6)])
+    db.commit()
+    return images
+
+
+def test_refresh_builds_one_patch_per_fleet_version(images, builds_dir, db):
+    totals = delta_ota.refresh(db, builds_dir=builds_dir)
+    db.commit()
+    assert totals["built"] == len(VERSIONS) - 1
+    [group] = delta_ota.report(db)
+    assert sorted(p["from_ver"] for p in group["patches"]) == VERSIONS[:-1]
+    assert all(p["ratio"] <= delta_ota.MAX_RATIO for p in group["patches"])
+    again = delta_ota.refresh(db, builds_dir=builds_dir)
+    assert again["built"] == again["removed"] == 0
+
+
+def test_checkin_offers_the_patch_only_when_it_can_be_applied(images, builds_dir, db):
+    delta_ota.refresh(db, builds_dir=builds_dir)
+    db.commit()
+    ota_cache.invalidate()
+    checkin = router_client(health.router)
+    body = report(stn_id="S5_NEW", ver="5.80")
+
+    def offered(**changes):
+        return checkin.post("/health", json=dict(body, **changes)).json()["p"].split("?")[0]
+
+    assert offered() == FILENAME
+    assert offered(ota_delta=1).endswith(".patch.bin")
+    assert offered(ota_delta=1, ota_fails=1) == FILENAME        # full image after a failed attempt
+
+
+def test_downloaded_patch_rebuilds_the_target(images, builds_dir, db):
+    delta_ota.refresh(db, builds_dir=builds_dir)
+    db.commit()
+    ota_cache.invalidate()
+    patch = router_client(health.router).post(
+        "/health", json=report(stn_id="S5_NEW", ver="5.80", ota_delta=1)).json()["p"].split("?")[0]
+
+    # The device: 32 KB Range requests, CRC-checked, then patched against its running image
+    files = router_client(builds.router)
+    size  = int(files.head(f"/builds/{patch}").headers["content-length"])
+    parts = []
+    for start in range(0, size, 32768):
+        resp = files.get(f"/builds/{patch}", headers={"Range": f"bytes={start}-{start + 32767}"})
+        assert resp.headers["x-content-crc32"] == f"{zlib.crc32(resp.content):08x}"
+        parts.append(resp.content)
+    out = io.BytesIO()
+    detools.apply_patch(io.BytesIO(images["5.80"]), io.BytesIO(b"".join(parts)), out)
+    assert out.getvalue() == images["5.82"]
+    assert size < len(images["5.82"])
@@ -0,0 +1,81 @@
+"""The "rescore" leader job: resumes from its saved cursor, steps aside for write holds, restarts on a rules bump."""
+
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.services import eval_store, health_eval
+from app.services.eval_store import Rescorer, stale_count
+from app.services.maintenance import holding_writes, load_cursor
+from conftest import seed_history
+
+ROWS = 1000
+
+
+@pytest.fixture
+def stale(engine, db):
+    seed_history(engine, ROWS)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE health_reports SET eval_rev = NULL, eval_verdict = NULL"))
+    return stale_count(db)
+
+
+def _pass(rescorer, Session, should_stop=None):
+    return asyncio.run(rescorer.run_pass(Session, should_stop=should_stop))
+
+
+def test_ingest_stores_a_current_verdict(engine, db):
+    seed_history(engine, 10)
+    assert stale_count(db) == 0
+
+
+def test_pass_rescores_every_stale_row(Session, db, stale):
+    assert stale == ROWS
+    stats = _pass(Rescorer(batch=100, pause_ms=0), Session)
+    assert stats["done"] and stats["rescored"] == ROWS
+    assert stale_count(db) == 0
+    assert load_cursor(db, Rescorer.JOB) == {"rules_version": health_eval.RULES_VERSION, "last_id": ROWS}
+
+
+def test_stopped_pass_resumes_from_the_cursor(Session, db, stale):
+    steps = []
+    first = _pass(Rescorer(batch=100, pause_ms=0), Session, should_stop=lambda: steps.append(1) or len(steps) > 3)
+    assert first["rescored"] == 300 and "done" not in first
+    # A new leader (fresh Rescorer) picks up where the saved cursor says
+    second = _pass(Rescorer(batch=100, pause_ms=0), Session)
+    assert second["done"] and second["rescored"] == ROWS - 300
+    assert stale_count(db) == 0
+
+
+def test_write_hold_pauses_the_pass(engine, Session, db, stale):
+    with holding_writes(engine, "index ix_test"):
+        stats = _pass(Rescorer(batch=100, pause_ms=0), Session)
+    assert stats["held"] == "index ix_test" and stats["rescored"] == 0
+    assert stale_count(db) == ROWS
+
+
+def test_failed_batch_keeps_the_cursor(Session, db, stale, monkeypatch):
+    real, calls = eval_store.rescore_batch, []
+
+    def flaky(db, after_id, limit):
+        calls.append(after_id)
+        if len(calls) == 3:
+            raise RuntimeError("disk I/O error")
+        return real(db, after_id, limit)
+    monkeypatch.setattr(eval_store, "rescore_batch", flaky)
+    with pytest.raises(RuntimeError):
+        _pass(Rescorer(batch=100, pause_ms=0), Session)
+    assert load_cursor(db, Rescorer.JOB)["last_id"] == 200
+    assert _pass(Rescorer(batch=100, pause_ms=0), Session)["rescored"] == ROWS - 200
+    assert calls[3] == 200
+
+
+def test_rules_bump_starts_over(Session, db, stale, monkeypatch):
+    _pass(Rescorer(batch=100, pause_ms=0), Session)
+    monkeypatch.setattr(health_eval, "RULES_VERSION", health_eval.RULES_VERSION + 1)
+    monkeypatch.setattr(eval_store, "RULES_VERSION", health_eval.RULES_VERSION)
+    assert stale_count(db) == ROWS
+    assert Rescorer().stats(db)["last_id"] == 0
+    stats = _pass(Rescorer(batch=100, pause_ms=0), Session)
+    assert stats["rescored"] == ROWS and stale_count(db) == 0
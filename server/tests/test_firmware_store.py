@@ -0,0 +1,53 @@
+"""Hot firmware images: a replaced, rewritten or truncated file is served fresh on the next request."""
+
+import os
+
+import pytest
+
+from app.routers import builds
+from conftest import router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+URL      = f"/builds/{FILENAME}"
+
+
+@pytest.fixture
+def image(builds_dir):
+    path = os.path.join(builds_dir, FILENAME)
+    open(path, "wb").write(os.urandom(128 * 1024))
+    return path
+
+
+@pytest.fixture
+def files(image):
+    return router_client(builds.router)
+
+
+def _get(files, start, end):
+    resp = files.get(URL, headers={"Range": f"bytes={start}-{end}"})
+    assert resp.status_code == 206
+    return resp.content
+
+
+def test_ranges_reassemble_the_image(files, image):
+    data = open(image, "rb").read()
+    assert b"".join(_get(files, start, start + 32767) for start in range(0, len(data), 32768)) == data
+
+
+def test_replaced_image_is_served(files, image):
+    _get(files, 0, 32767)
+    fresh = os.urandom(128 * 1024)
+    open(image + ".tmp", "wb").write(fresh)
+    os.replace(image + ".tmp", image)           # /ota/upload's atomic rename
+    assert _get(files, 0, 32767) == fresh[:32768]
+
+
+def test_in_place_rewrite_and_truncation_are_served(files, image):
+    _get(files, 0, 32767)
+    rewritten = os.urandom(128 * 1024)
+    with open(image, "r+b") as f:               # scp / docker cp onto the served file
+        f.write(rewritten)
+    assert files.get(URL).content == rewritten
+    with open(image, "r+b") as f:
+        f.truncate(32768)
+    assert files.get(URL).content == rewritten[:32768]
@@ -0,0 +1,87 @@
+"""POST /health: what the device is told about its report, and the auto-migrate path."""
+
+import asyncio, contextlib, io, sqlite3
+
+import httpx
+import pytest
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+
+from app.models import HealthReport
+from app.routers import health
+from app.services.ingest_queue import ingest_queue
+from conftest import report, router_client
+
+
+@pytest.fixture
+def client(app_db, builds_dir):
+    return router_client(health.router)
+
+
+def _stored(db):
+    return db.query(func.count(HealthReport.id)).scalar()
+
+
+def test_checkin_is_stored(client, db):
+    body = client.post("/health", json=report()).json()
+    assert body["status"] == "ok" and body["stored"] is True
+    assert _stored(db) == 1
+
+
+def test_failed_command_step_still_answers_stored(client, db, monkeypatch):
+    def locked(*_args, **_kw):
+        raise OperationalError("UPDATE", {}, sqlite3.OperationalError("database is locked"))
+    monkeypatch.setattr(health, "_decide_command", locked)
+    body = client.post("/health", json=report()).json()
+    # A "stored": false here would make the device resend a row we already have
+    assert body["stored"] is True and body["cmd"] == ""
+    assert _stored(db) == 1
+
+
+def test_failed_insert_answers_not_stored(client, db, monkeypatch):
+    def locked(*_args):
+        raise OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+    monkeypatch.setattr(health, "insert_reports", locked)
+    body = client.post("/health", json=report()).json()
+    assert body["stored"] is False
+    assert _stored(db) == 0
+
+
+def test_burst_through_write_behind_stores_every_row(app_db, builds_dir, db):
+    stations = 200
+
+    async def run():
+        await ingest_queue.start()
+        transport = httpx.ASGITransport(app=router_client(health.router).app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            with contextlib.redirect_stdout(io.StringIO()):
+                answers = await asyncio.gather(*(client.post("/health", json=report(stn_id=f"STN{i:04d}"))
+                                                 for i in range(stations)))
+        await ingest_queue.stop()
+        return answers
+
+    answers = asyncio.run(run())
+    assert all(resp.json()["stored"] is True for resp in answers)
+    assert _stored(db) == stations
+
+
+def test_whitelisted_field_becomes_a_column(db):
+    db.execute(text("ALTER TABLE health_reports DROP COLUMN mutex_fail"))
+    db.commit()
+    health._COLUMN_CACHE.clear()
+    assert "mutex_fail" in health._auto_migrate(db, report(mutex_fail=1))
+
+
+def test_unknown_field_is_not_a_column(db):
+    health._COLUMN_CACHE.clear()
+    assert "evil; DROP TABLE x" not in health._auto_migrate(db, report(**{"evil; DROP TABLE x": 1}))
+
+
+def test_new_field_waits_for_a_rebuild(db):
+    db.execute(text("ALTER TABLE health_reports DROP COLUMN mutex_fail"))
+    db.execute(text("CREATE TABLE health_reports__rebuild (id INTEGER PRIMARY KEY)"))
+    db.commit()
+    health._COLUMN_CACHE.clear()
+    # The rebuild's copy would not carry the new column: leave it to a later check-in
+    assert "mutex_fail" not in health._auto_migrate(db, report(mutex_fail=1))
+    assert "mutex_fail" not in health._get_db_columns(db, "health_reports")
@@ -0,0 +1,57 @@
+"""Stored verdicts (eval_* columns) must read back exactly as evaluate() scores the row."""
+
+import datetime, random, types
+
+import pytest
+
+from app.services.health_eval import (
+    EVAL_FIELDS, RULES_VERSION, evaluate, evaluate_at_report, evaluate_stored, stored_fields,
+)
+
+NOW = datetime.datetime(2026, 1, 15, 12, 0)
+
+
+def _fleet_row(rnd: random.Random) -> dict:
+    """Fleet-like evaluator input: mostly healthy, every rule branch represented."""
+    pick = rnd.choice
+    row = {f: d for f, d in EVAL_FIELDS.items()}
+    row.update({
+        "reported_at":  NOW - datetime.timedelta(minutes=rnd.randint(0, 2000)),
+        "bat_v":        round(rnd.uniform(3.2, 4.2), 2),
+        "signal":       rnd.randint(-110, -55),
+        "net_cnt_prev": pick((96, 95, 90, 80, 40, 0)),
+        "prev_stored":  pick((96, 96, 90, 0)),
+        "http_ret_cnt_prev": pick((0, 0, 8)),
+        "ndm_cnt":      pick((0, 0, 0, 20)),
+        "cdm_sts":      pick(("OK", "OK", "FAIL", "PENDING", None)),
+        "reg_fails":    pick((0, 0, 2, 6, 30)),
+        "health_sts":   pick(("OK", "OK", "OK", "Temp_E", "Rain_R_WDOG", "RAIN_RESET", "NO_GPS")),
+        "system":       pick((0, 1, 2)),
+        "sensor_sts":   pick(("OK", "OK", "TH-FAIL", "RF-ERR,RTC-FAIL")),
+        "http_present_fails": pick((0, 0, 5)),
+        "http_backlog_cnt":   pick((0, 0, 12)),
+        "mutex_fail":   pick((0, 0, 0, 1)),
+    })
+    return row
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stored_verdict_matches_evaluate(seed):
+    rnd = random.Random(seed)
+    for _ in range(2000):
+        row = _fleet_row(rnd)
+        stored = types.SimpleNamespace(**row, **stored_fields(evaluate_at_report(row)))
+        # Any read clock from the report itself to long past the OFFLINE cut-off
+        now = row["reported_at"] + datetime.timedelta(minutes=rnd.randint(0, 3000))
+        assert evaluate_stored(stored, now) == evaluate(types.SimpleNamespace(**row), now), row
+
+
+def test_stale_or_unscored_rows_are_evaluated():
+    row = _fleet_row(random.Random(1))
+    fields = stored_fields(evaluate_at_report(row))
+    fields.update(eval_verdict="BOGUS", eval_score=-1, eval_rev=RULES_VERSION - 1)
+    stale = types.SimpleNamespace(**row, **fields)
+    unscored = types.SimpleNamespace(**row)
+    expected = evaluate(types.SimpleNamespace(**row), NOW)
+    assert evaluate_stored(stale, NOW) == expected
+    assert evaluate_stored(unscored, NOW) == expected
@@ -0,0 +1,50 @@
+"""Managed composite indexes: built on an existing deployment, each under a write hold, old ones retired."""
+
+from sqlalchemy import text
+
+from app.services import indexes
+from app.services.indexes import RETIRED_INDEXES, ensure_indexes, existing_indexes, managed_indexes
+from app.services.maintenance import writes_held
+from conftest import seed_history
+
+
+def _legacy(engine):
+    """Pre-composite schema, as an existing deployment has it."""
+    with engine.begin() as conn:
+        for ix in managed_indexes():
+            conn.execute(text(f"DROP INDEX {ix.name}"))
+        conn.execute(text("CREATE INDEX ix_health_reports_stn_id ON health_reports (stn_id)"))
+        conn.execute(text("CREATE INDEX ix_command_queue_stn_id ON command_queue (stn_id)"))
+
+
+def test_builds_the_missing_and_drops_the_retired(engine):
+    seed_history(engine, 500)
+    _legacy(engine)
+    assert indexes.status(engine)["retired_present"] == sorted(RETIRED_INDEXES)
+    result = ensure_indexes(engine)
+    assert sorted(result["built"]) == sorted(ix.name for ix in managed_indexes())
+    assert sorted(result["dropped"]) == sorted(RETIRED_INDEXES)
+    with engine.connect() as conn:
+        assert not existing_indexes(conn) & set(RETIRED_INDEXES)
+        assert writes_held(conn) is None
+    assert indexes.status(engine) == {"pending": [], "retired_present": [], "building": None}
+
+
+def test_each_build_holds_writes(engine, monkeypatch):
+    _legacy(engine)
+    seen = []
+    real = indexes.build_index
+
+    def build(engine, ix):
+        with engine.connect() as conn:
+            seen.append(writes_held(conn))
+        assert indexes.status(engine)["building"] == ix.name
+        return real(engine, ix)
+    monkeypatch.setattr(indexes, "build_index", build)
+    ensure_indexes(engine)
+    assert seen == [f"index {ix.name}" for ix in managed_indexes()]
+
+
+def test_second_run_is_a_no_op(engine):
+    ensure_indexes(engine)
+    assert ensure_indexes(engine) == {"built": [], "dropped": []}
@@ -0,0 +1,114 @@
+"""Write-behind queue: acknowledged rows are only dropped when the database rejects the row itself."""
+
+import asyncio, datetime, sqlite3
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+
+from app.models import HealthReport
+from app.services import ingest_queue as iq
+from app.services.maintenance import holding_writes
+from conftest import report
+
+
+@pytest.fixture
+def queue(app_db, monkeypatch):
+    monkeypatch.setattr(iq, "RETRY_MIN_S", 0.01)
+    monkeypatch.setattr(iq, "RETRY_MAX_S", 0.05)
+    return iq.IngestQueue(group_rows=50, group_ms=10)
+
+
+def _rows(n, **changes):
+    now = datetime.datetime(2026, 1, 15, 12, 0)
+    return [report(stn_id=f"STN{i:04d}", reported_at=now, **changes) for i in range(n)]
+
+
+def _stored(db):
+    return db.query(func.count(HealthReport.id)).scalar()
+
+
+def _failing(times, error):
+    """insert_reports that raises `error` for the first `times` calls, then writes."""
+    calls = {"n": 0}
+
+    def insert(db, rows):
+        calls["n"] += 1
+        if calls["n"] <= times:
+            raise error
+        return real(db, rows)
+    real = iq.insert_reports
+    return insert, calls
+
+
+def _drain(queue, *batches, during=None):
+    async def run():
+        await queue.start()
+        for rows in batches:
+            assert queue.submit(rows)
+        if during:
+            await during()
+        await queue.stop()
+    asyncio.run(run())
+
+
+def test_busy_database_keeps_rows_for_a_retry(queue, db, monkeypatch):
+    locked = OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+    insert, calls = _failing(3, locked)
+    monkeypatch.setattr(iq, "insert_reports", insert)
+    _drain(queue, _rows(20))
+    assert _stored(db) == 20
+    assert queue.retries == 3 and queue.failed_rows == 0
+
+
+@pytest.mark.parametrize("error", [
+    IntegrityError("INSERT", {}, sqlite3.IntegrityError("NOT NULL constraint failed")),
+    DataError("INSERT", {}, Exception("bad value")),
+])
+def test_only_the_rejected_row_is_dropped(queue, db, monkeypatch, error):
+    real = iq.insert_reports
+
+    def insert(db, rows):
+        if any(r["stn_id"] == "STN0003" for r in rows):
+            raise error
+        return real(db, rows)
+    monkeypatch.setattr(iq, "insert_reports", insert)
+    _drain(queue, _rows(10))
+    assert _stored(db) == 9
+    assert queue.failed_rows == 1
+    assert db.query(HealthReport).filter_by(stn_id="STN0003").count() == 0
+
+
+def test_other_errors_keep_the_rows(queue, db, monkeypatch):
+    insert, calls = _failing(4, RuntimeError("connection reset"))
+    monkeypatch.setattr(iq, "insert_reports", insert)
+    _drain(queue, _rows(10))
+    assert _stored(db) == 10
+    assert queue.failed_rows == 0 and queue.retries >= 1
+
+
+def test_write_hold_defers_the_flush(queue, db, app_db):
+    async def held():
+        with holding_writes(app_db, "test"):
+            await asyncio.sleep(0.2)
+            assert _stored(db) == 0
+            assert queue.stats()["queue_depth"] == 15
+    _drain(queue, _rows(15), during=held)
+    assert _stored(db) == 15
+    assert queue.stats()["queue_depth"] == 0
+
+
+def test_not_running_falls_back_to_the_caller():
+    assert iq.IngestQueue().submit(_rows(1)) is False
+
+
+def test_full_queue_pushes_back(queue):
+    queue.maxsize = 5
+
+    async def run():
+        await queue.start()
+        assert queue.submit(_rows(5))
+        assert not queue.submit(_rows(1))
+        await queue.stop()
+    asyncio.run(run())
+    assert queue.sync_fallbacks == 1
@@ -0,0 +1,153 @@
+"""Write holds, job cursors and the leader-elected scheduler (two in one process, distinct holders)."""
+
+import asyncio, time
+
+import pytest
+from sqlalchemy import text
+
+from app.services.maintenance import (
+    Scheduler, hold_writes, holding_writes, load_cursor, release_writes, save_cursor, writes_held,
+)
+
+LEASE_S = 0.6
+
+
+def _held(engine):
+    with engine.connect() as conn:
+        return writes_held(conn)
+
+
+def test_holds_release_independently(engine):
+    first  = hold_writes(engine, "index ix_a")
+    second = hold_writes(engine, "migration v4")
+    release_writes(engine, first)
+    assert _held(engine) == "migration v4"
+    release_writes(engine, second)
+    assert _held(engine) is None
+
+
+def test_holding_writes_releases_on_error(engine):
+    with pytest.raises(RuntimeError):
+        with holding_writes(engine, "index ix_a"):
+            assert _held(engine) == "index ix_a"
+            raise RuntimeError("build failed")
+    assert _held(engine) is None
+
+
+def test_lapsed_hold_is_ignored_and_cleared(engine):
+    hold_writes(engine, "dead holder", seconds=-1)
+    assert _held(engine) is None
+    release_writes(engine, hold_writes(engine, "next"))
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM maintenance_lease")).scalar() == 0
+
+
+def test_cursor_commits_with_the_callers_transaction(db):
+    assert load_cursor(db, "rescore") is None
+    save_cursor(db, "rescore", {"rev": 3, "id": 1200})
+    db.rollback()
+    assert load_cursor(db, "rescore") is None
+    save_cursor(db, "rescore", {"rev": 3, "id": 1200})
+    db.commit()
+    assert load_cursor(db, "rescore") == {"rev": 3, "id": 1200}
+
+
+def _scheduler(name, **jobs):
+    sched = Scheduler(tick_s=0.05, lease_s=LEASE_S)
+    sched.holder = name
+    for job, (every_s, fn, scope) in jobs.items():
+        sched.add(job, every_s, fn, scope)
+    return sched
+
+
+def _probe(log, name):
+    def probe():
+        started = time.time()
+        time.sleep(0.05)
+        log.append((name, started, time.time()))
+    return probe
+
+
+async def _kill(sched):
+    """Stops a scheduler the way a killed worker does: no lease release."""
+    tasks = sched._tasks + list(sched._runs)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_one_leader_and_failover(engine):
+    log = []
+    a = _scheduler("a", probe=(0.1, _probe(log, "a"), "leader"))
+    b = _scheduler("b", probe=(0.1, _probe(log, "b"), "leader"))
+
+    async def run():
+        a.start(engine)
+        await asyncio.sleep(0.2)
+        b.start(engine)
+        await asyncio.sleep(1.5)
+        assert a.is_leader and not b.is_leader
+        killed = time.time()
+        await _kill(a)
+        await asyncio.sleep(LEASE_S + 1.5)
+        assert b.is_leader
+        await b.stop()
+        return killed
+
+    killed = asyncio.run(run())
+    runs = sorted(log, key=lambda r: r[1])
+    assert {name for name, started, _ in runs if started < killed} == {"a"}
+    assert any(name == "b" for name, _, _ in runs)
+    assert all(nxt[1] >= prev[2] for prev, nxt in zip(runs, runs[1:])), "two leaders at once"
+
+
+def test_stop_hands_over_the_lease(engine):
+    a, b = _scheduler("a"), _scheduler("b")
+
+    async def run():
+        a.start(engine)
+        await asyncio.sleep(0.1)
+        b.start(engine)
+        await asyncio.sleep(0.1)
+        await a.stop()
+        await asyncio.sleep(LEASE_S / 3 + 0.1)      # b's next heartbeat, not the lease running out
+        leader = b.is_leader
+        await b.stop()
+        return leader
+
+    assert asyncio.run(run())
+
+
+def test_jobs_run_side_by_side(engine):
+    sched = _scheduler("a", slow=(0.1, lambda: time.sleep(1.5), "leader"),
+                       fast=(0.1, lambda: None, "worker"))
+
+    async def run():
+        sched.start(engine)
+        await asyncio.sleep(3)
+        await sched.stop()
+
+    asyncio.run(run())
+    # The slow job never started twice at once, and did not hold the fast one back
+    assert 1 <= sched.jobs["slow"].state["runs"] <= 2
+    assert sched.jobs["fast"].state["runs"] >= 10
+
+
+def test_trigger_on_a_follower_runs_on_the_leader(engine):
+    runs = []
+    a = _scheduler("a", delta=(3600, lambda: runs.append("a"), "leader"))
+    b = _scheduler("b", delta=(3600, lambda: runs.append("b"), "leader"))
+
+    async def run():
+        a.start(engine)
+        await asyncio.sleep(0.1)
+        b.start(engine)
+        await asyncio.sleep(1.5)                    # a's first run of the hourly job
+        assert runs == ["a"]
+        assert b.trigger("delta")
+        await asyncio.sleep(0.5)
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(run())
+    assert runs == ["a", "a"]
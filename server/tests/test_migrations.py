@@ -0,0 +1,154 @@
+"""Online DropColumns rebuild: nothing lost across chunks, concurrent writes, restarts and schema drift."""
+
+import asyncio, datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.models import HealthReport
+from app.services import migrations
+from app.services.station_latest import insert_reports
+from conftest import report, seed_history
+
+ROWS  = 2000
+BATCH = 250
+
+
+@pytest.fixture
+def drop(engine):
+    """health_reports still has the retired columns; every other migration is recorded as done."""
+    drop = next(m for m in migrations.MIGRATIONS if isinstance(m, migrations.DropColumns))
+    with engine.begin() as conn:
+        for col in drop.columns:
+            conn.execute(text(f"ALTER TABLE health_reports ADD COLUMN {col} INTEGER DEFAULT 7"))
+    seed_history(engine, ROWS)
+    migrations.ensure_table(engine)
+    with engine.begin() as conn:
+        for m in migrations.MIGRATIONS:
+            if m is not drop:
+                conn.execute(text("INSERT INTO schema_migrations (version, name, state) VALUES (:v, :n, 'done')"),
+                             {"v": m.version, "n": m.name})
+    return drop
+
+
+def _snapshot(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT id, eval_score FROM health_reports")).all())
+
+
+def _columns(engine):
+    with engine.connect() as conn:
+        return migrations._column_names(conn, "health_reports")
+
+
+def _assert_swapped(engine, drop):
+    with engine.connect() as conn:
+        names = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"))}
+        idx   = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                                 "AND tbl_name = 'health_reports'"))}
+    assert not set(_columns(engine)) & set(drop.columns)
+    assert not any(n.startswith("health_reports__rebuild") for n in names)
+    assert {ix.name for ix in HealthReport.__table__.indexes} <= idx
+    assert migrations.pending(engine) == []
+
+
+def test_interrupted_rebuild_resumes_without_loss(engine, drop):
+    before = _snapshot(engine)
+    chunks = []
+    progress = {}
+    assert not migrations.run(engine, drop, record=progress, batch=BATCH,
+                              should_stop=lambda: chunks.append(1) or len(chunks) > ROWS // BATCH // 2)
+    assert 0 < progress["cursor_id"] < progress["target_id"]
+    with engine.connect() as conn:
+        assert migrations.rebuilding(conn, "health_reports")
+    assert migrations.run(engine, drop, record=progress, batch=BATCH)
+    assert _snapshot(engine) == before
+    _assert_swapped(engine, drop)
+
+
+def test_writes_during_the_copy_are_kept(engine, drop, Session):
+    before = _snapshot(engine)
+    inserted, updated, deleted = [], {}, []
+
+    def write_between_chunks():
+        db = Session()
+        n = len(inserted)
+        inserted.extend(insert_reports(db, [report(stn_id=f"MIG{n}", reported_at=datetime.datetime.utcnow())]))
+        # One row behind the copy cursor, one ahead of it
+        for rid in (1 + n * 97 % ROWS, ROWS - n * 89 % ROWS):
+            if db.execute(text("UPDATE health_reports SET eval_score = :s WHERE id = :i"),
+                          {"s": 1000 + n, "i": rid}).rowcount:
+                updated[rid] = 1000 + n
+        rid = 2 + n * 131 % (ROWS - 2)
+        db.execute(text("DELETE FROM health_reports WHERE id = :i"), {"i": rid})
+        deleted.append(rid)
+        updated.pop(rid, None)
+        db.commit()
+        db.close()
+        return False
+
+    assert migrations.run(engine, drop, batch=BATCH, should_stop=write_between_chunks)
+    after = _snapshot(engine)
+    assert set(after) == (set(before) | set(inserted)) - set(deleted)
+    assert all(after[i] == s for i, s in updated.items())
+    _assert_swapped(engine, drop)
+
+
+def test_column_added_during_the_copy_restarts_it(engine, drop):
+    calls = []
+
+    def add_column():
+        calls.append(1)
+        if len(calls) == 2:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ALTER TABLE health_reports ADD COLUMN newfield INTEGER DEFAULT 0")
+                conn.exec_driver_sql("UPDATE health_reports SET newfield = 7 WHERE id = 5")
+        return False
+
+    # The copy would have lost the new column at the swap: it is thrown away instead
+    assert not migrations.run(engine, drop, should_stop=add_column, batch=BATCH)
+    with engine.connect() as conn:
+        assert not migrations.rebuilding(conn, "health_reports")
+    assert migrations.run(engine, drop, batch=BATCH)
+    assert "newfield" in _columns(engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT newfield FROM health_reports WHERE id = 5").scalar() == 7
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM health_reports").scalar() == ROWS
+    _assert_swapped(engine, drop)
+
+
+def test_apply_light_stops_at_a_rebuild(engine, drop):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_migrations"))
+    todo = migrations.apply_light(engine)
+    assert todo and todo[0] is drop
+    assert set(drop.columns) <= set(_columns(engine))
+
+
+def test_runner_stops_and_resumes(engine, drop, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATE_PAUSE_MS", 500)
+    runner = migrations.MigrationRunner()
+
+    async def run():
+        task = asyncio.create_task(runner.run_pass(engine))
+        await asyncio.sleep(0.2)            # inside the pause after the first chunk
+        await runner.stop()
+        paused = await task
+        return paused, await runner.run_pass(engine)
+
+    paused, resumed = asyncio.run(run())
+    assert paused["paused"] == drop.version and paused["cursor_id"] > 0
+    assert resumed == {"applied": [drop.version]}
+    assert runner.done
+    _assert_swapped(engine, drop)
+
+
+def test_dry_run_writes_nothing(engine, drop):
+    with engine.connect() as conn:
+        before = conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar()
+    plan = migrations.dry_run(engine)
+    assert [step["version"] for step in plan] == [drop.version]
+    assert plan[0]["rows"] == ROWS
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar() == before
+        assert not migrations.rebuilding(conn, "health_reports")
@@ -0,0 +1,71 @@
+"""Per-worker OTA snapshot: same decisions as the per-check-in queries, invalidated across workers."""
+
+import os, time
+
+import pytest
+
+from app.models import FirmwareRegistry, StationSettings
+from app.routers import commands
+from app.services import ota_cache as oc
+from app.services.ota_service import needs_ota
+from conftest import router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+STATIONS = 40
+
+
+@pytest.fixture
+def fleet(app_db, builds_dir, db):
+    open(os.path.join(builds_dir, FILENAME), "wb").write(b"\0" * 1024)
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.90", filename=FILENAME))
+    db.add_all(StationSettings(stn_id=f"STN{i:04d}", ota_exempt=i % 2) for i in range(STATIONS))
+    db.commit()
+    return builds_dir
+
+
+def _queried(db, builds_dir, stn_id, ver):
+    """The decision as check-ins made it before the snapshot: two queries and a stat()."""
+    setting = db.query(StationSettings).filter_by(stn_id=stn_id).first()
+    if setting and setting.ota_exempt == 1:
+        return ""
+    fw = db.query(FirmwareRegistry).filter_by(unit_type="KSNDMC_TRG", system_mode=0).first()
+    if fw and needs_ota(ver, fw.current_ver) and os.path.exists(os.path.join(builds_dir, fw.filename)):
+        return fw.filename
+    return ""
+
+
+def _cached(db, stn_id, ver):
+    ota = oc.ota_cache.view(db)
+    if ota.is_exempt(stn_id):
+        return ""
+    target = ota.target("KSNDMC_TRG", 0)
+    return target[1] if target and needs_ota(ver, target[0]) and ota.has_build(target[1]) else ""
+
+
+@pytest.mark.parametrize("ver", ["5.82", "5.90", "6.01"])
+def test_snapshot_decides_like_the_queries(fleet, db, ver):
+    for i in range(STATIONS + 5):
+        stn_id = f"STN{i:04d}"
+        assert _cached(db, stn_id, ver) == _queried(db, fleet, stn_id, ver), stn_id
+
+
+def test_lock_change_reaches_every_worker(fleet, db):
+    other = oc.OtaCache(builds_dir=fleet, check_s=0.2)
+    assert not other.view(db).is_exempt("STN0000")
+    router_client(commands.router).post("/toggle-ota-lock/STN0000", follow_redirects=False)
+    db.rollback()
+    # The writer's own worker at once, another one within its check window
+    assert oc.ota_cache.view(db).is_exempt("STN0000")
+    assert not other.view(db).is_exempt("STN0000")
+    time.sleep(0.25)
+    assert other.view(db).is_exempt("STN0000")
+
+
+def test_build_copied_in_is_picked_up(fleet, db):
+    other = oc.OtaCache(builds_dir=fleet, check_s=0.2)
+    assert not other.view(db).has_build("FW_S9_NEW.bin")
+    time.sleep(0.01)
+    open(os.path.join(fleet, "FW_S9_NEW.bin"), "wb").close()   # by a deploy script, no generation bump
+    time.sleep(0.25)
+    assert other.view(db).has_build("FW_S9_NEW.bin")
@@ -0,0 +1,69 @@
+"""Heatshrink variant of /builds images: same chunks on the wire, and resumable from any block boundary."""
+
+import os, random, zlib
+
+import pytest
+
+from app.routers import builds
+from app.services import ota_encoding
+from conftest import firmware_image, router_client
+
+pytest.importorskip("heatshrink2")
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+URL      = f"/builds/{FILENAME}"
+HS       = {"Accept-Encoding": ota_encoding.ENCODING}
+
+
+@pytest.fixture
+def image(builds_dir):
+    image = firmware_image(random.Random(5), 192)
+    path  = os.path.join(builds_dir, FILENAME)
+    open(path, "wb").write(image)
+    ota_encoding.write_for(path)
+    return image
+
+
+@pytest.fixture
+def files(image):
+    return router_client(builds.router)
+
+
+def _download(files, headers):
+    total = int(files.head(URL, headers=headers).headers["content-length"])
+    got   = bytearray()
+    for start in range(0, total, 32768):
+        resp = files.get(URL, headers=dict(headers, Range=f"bytes={start}-{start + 32767}"))
+        assert resp.status_code == 206 and resp.headers["x-content-crc32"] == f"{zlib.crc32(resp.content):08x}"
+        got += resp.content
+    return bytes(got)
+
+
+def test_encoded_download_is_smaller_and_decodes(files, image):
+    plain   = _download(files, {})
+    encoded = _download(files, HS)
+    enc     = files.get(f"{URL}/manifest").json()["encodings"][ota_encoding.ENCODING]
+    assert plain == image
+    assert len(encoded) == enc["size"] < len(image)
+    decoded = b"".join(ota_encoding.decode_block(encoded, enc, k) for k in range(len(enc["blocks"])))
+    assert decoded == image
+
+
+def test_plain_when_not_asked_for(files):
+    assert "content-encoding" not in files.head(URL).headers
+    assert "content-encoding" not in files.head(URL, headers={"Accept-Encoding": "heatshrink;q=0"}).headers
+    encoded = files.head(URL, headers=HS).headers
+    assert encoded["content-encoding"] == ota_encoding.ENCODING and int(encoded["x-decoded-length"]) > 0
+
+
+def test_resume_at_a_block_boundary(files, image):
+    manifest = files.get(f"{URL}/manifest").json()
+    enc      = manifest["encodings"][ota_encoding.ENCODING]
+    chunk    = manifest["chunk_size"]
+    k        = len(enc["blocks"]) // 2
+    resp     = files.get(URL, headers=dict(HS, Range=f"bytes={enc['blocks'][k]}-"))
+    # A fresh decoder after a reboot: block offsets relative to where the download resumed
+    shifted  = dict(enc, blocks=[b - enc["blocks"][k] for b in enc["blocks"][k:]], size=enc["size"] - enc["blocks"][k])
+    block    = ota_encoding.decode_block(resp.content, shifted, 0)
+    assert block == image[k * chunk:(k + 1) * chunk]
+    assert f"{zlib.crc32(block):08x}" == manifest["crc32"][k]
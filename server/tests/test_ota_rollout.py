@@ -0,0 +1,104 @@
+"""Staged rollout: admission order and caps per tick, auto-pause on a failing wave, resume."""
+
+import datetime, os, random
+
+import pytest
+
+from app.models import FirmwareRegistry, OtaRolloutStation, StationSettings
+from app.routers import health
+from app.services import ota_rollout
+from app.services.station_latest import insert_reports
+from conftest import report, router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+STATIONS = 60
+WAVE     = 10
+INFLIGHT = 5
+
+
+@pytest.fixture
+def fleet(app_db, builds_dir, db):
+    open(os.path.join(builds_dir, FILENAME), "wb").write(b"\0" * 1024)
+    rng   = random.Random(5)
+    now   = datetime.datetime.utcnow()
+    fleet = {f"S5_{i:04d}": report(stn_id=f"S5_{i:04d}", signal=rng.choice([0] + list(range(-113, -51))),
+                                   reported_at=now)
+             for i in range(STATIONS)}
+    fw = FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                          current_ver="5.90", filename=FILENAME)
+    db.add(fw)
+    db.add(StationSettings(stn_id="S5_0000", ota_exempt=1))
+    insert_reports(db, [dict(r) for r in fleet.values()])
+    ota_rollout.start(db, fw)
+    db.commit()
+    ota_rollout.configure(db, 5, wave_size=WAVE, max_inflight=INFLIGHT, order_by="signal", pause_fail_rate=0.25)
+    db.commit()
+    return fleet
+
+
+class Fleet:
+    def __init__(self, fleet, db):
+        self.fleet   = fleet
+        self.db      = db
+        self.checkin = router_client(health.router)
+
+    def offered(self) -> set:
+        return {stn for stn, r in self.fleet.items()
+                if self.checkin.post("/health", json=dict(r, reported_at=None)).json()["cmd"] == "OTA_CHECK"}
+
+    def report(self, stn, **changes):
+        self.fleet[stn] = dict(self.fleet[stn], reported_at=datetime.datetime.utcnow(), **changes)
+        insert_reports(self.db, [dict(self.fleet[stn])])
+        self.db.commit()
+
+    def tick(self) -> dict:
+        ota_rollout.tick(self.db)
+        self.db.commit()
+        return ota_rollout.status(self.db)[5]
+
+
+def _first_two_waves(f):
+    rng = random.Random(7)
+    while True:
+        state = f.tick()
+        got   = f.offered()
+        assert len(got) == state["in_flight"] <= INFLIGHT
+        assert all(w["admitted"] <= WAVE for w in state["waves"])
+        if state["wave"] > 2:
+            return state
+        for stn in sorted(got):
+            if rng.random() < 0.67:         # one device in three lags a tick
+                f.report(stn, ver="5.90")
+
+
+def test_nothing_offered_before_the_first_tick(fleet, db):
+    assert not Fleet(fleet, db).offered()
+
+
+def test_waves_admit_strongest_signal_first_within_the_caps(fleet, db):
+    f = Fleet(fleet, db)
+    _first_two_waves(f)
+    rank = sorted((r for stn, r in fleet.items() if stn != "S5_0000"),
+                  key=lambda r: (-(r["signal"] or -999), r["stn_id"]))
+    admitted = [stn for (stn,) in db.query(OtaRolloutStation.stn_id).order_by(OtaRolloutStation.id)]
+    assert admitted == [r["stn_id"] for r in rank[:len(admitted)]]
+    assert "S5_0000" not in admitted
+
+
+def test_failing_wave_pauses_the_rollout(fleet, db):
+    f = Fleet(fleet, db)
+    _first_two_waves(f)
+    got = sorted(f.offered())
+    for stn in got[:2]:
+        f.report(stn, ota_fails=1)
+    for stn in got[2:]:
+        f.report(stn, ver="5.90")
+    state = f.tick()
+    assert state["state"] == "paused" and state["paused_reason"]
+    assert not f.offered()
+
+    ota_rollout.set_paused(db, 5, False)
+    db.commit()
+    state = f.tick()
+    assert state["state"] == "active" and state["wave"] == 4
+    assert len(f.offered()) == state["in_flight"] > 0
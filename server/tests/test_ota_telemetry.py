@@ -0,0 +1,68 @@
+"""Download telemetry: attribution from the tagged OTA_CHECK parameter, resumes and re-sent bytes."""
+
+import datetime, os, random
+
+import pytest
+
+from app.models import FirmwareRegistry, OtaDownload
+from app.routers import builds, health
+from app.services.ota_telemetry import DownloadStats
+from app.services.station_latest import insert_reports
+from conftest import firmware_image, report, router_client
+
+FILENAME = "FW_S5_KSNDMC_TRG.bin"
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = DownloadStats()
+    monkeypatch.setattr(builds, "download_stats", stats)
+    return stats
+
+
+@pytest.fixture
+def image(app_db, builds_dir, db, stats):
+    image = firmware_image(random.Random(5))
+    open(os.path.join(builds_dir, FILENAME), "wb").write(image)
+    db.add(FirmwareRegistry(category_id=5, name="KSNDMC_TRG", unit_type="KSNDMC_TRG", system_mode=0,
+                            current_ver="5.90", filename=FILENAME))
+    insert_reports(db, [report(stn_id=f"D{i:02d}", reported_at=datetime.datetime.utcnow()) for i in range(3)])
+    db.commit()
+    return image
+
+
+def test_downloads_are_attributed_and_accounted(image, stats, db):
+    checkin, files = router_client(health.router), router_client(builds.router)
+    for stn in ("D00", "D01", "D02"):
+        param = checkin.post("/health", json=report(stn_id=stn)).json()["p"]
+        assert param.startswith(f"{FILENAME}?") and param.endswith(f"stn={stn}")
+        size = int(files.head(f"/builds/{param}").headers["content-length"])
+        for n, start in enumerate(range(0, size, 32768)):
+            if stn == "D01" and start == size // 2 // 32768 * 32768:
+                files.head(f"/builds/{param}")          # rebooted half-way, resumes
+            for _ in range(2 if stn == "D02" and n % 4 == 0 else 1):
+                files.get(f"/builds/{param}", headers={"Range": f"bytes={start}-{start + 32767}"})
+    files.get(f"/builds/{FILENAME}", headers={"Range": "bytes=0-32767"})       # untagged: not recorded
+
+    totals = stats.flush(db)
+    db.commit()
+    assert totals["rows"] == 3
+    rows = {r.stn_id: r for r in db.query(OtaDownload)}
+    assert set(rows) == {"D00", "D01", "D02"}
+    assert all(r.completed_at and r.attempts == 1 for r in rows.values())
+    assert rows["D01"].resumes == 1 and rows["D00"].resumes == 0
+    assert rows["D02"].bytes_sent > len(image) == rows["D00"].bytes_sent
+
+
+def test_flush_merges_into_existing_rows(image, stats, db):
+    half = len(image) // 2
+    stats.record("D00", FILENAME, "", len(image), 0, 0, head=True)
+    stats.record("D00", FILENAME, "", len(image), 0, half)
+    stats.flush(db)
+    db.commit()
+    assert db.query(OtaDownload).one().completed_at is None
+    stats.record("D00", FILENAME, "", len(image), half, len(image) - half)
+    stats.flush(db)
+    db.commit()
+    row = db.query(OtaDownload).one()
+    assert row.completed_at and row.bytes_sent == len(image)
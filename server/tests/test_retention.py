@@ -0,0 +1,86 @@
+"""Raw → daily compaction: the daily rows must add up to the raw rows they replace."""
+
+import asyncio, datetime
+
+import pytest
+from sqlalchemy import text
+
+from app.models import HealthDaily, HealthReport
+from app.routers import commands, dashboard
+from app.services.retention import RetentionJob
+from conftest import router_client, seed_history
+
+KEEP_DAYS = 2
+
+
+@pytest.fixture
+def history(app_db):
+    seed_history(app_db, 6 * 96 * 4, stations=4)          # six days, four stations
+    with app_db.begin() as conn:
+        conn.execute(text("UPDATE health_reports SET bat_v = 3.5 + (id % 70) / 100.0, signal = -60 - (id % 40)"))
+        last = datetime.datetime.fromisoformat(conn.execute(text("SELECT MAX(reported_at) FROM health_reports")).scalar())
+    return datetime.datetime.combine(last.date() - datetime.timedelta(days=KEEP_DAYS), datetime.time())
+
+
+def _compact(Session, cutoff):
+    return asyncio.run(RetentionJob(raw_days=KEEP_DAYS, pause_ms=0).run_pass(Session, cutoff))
+
+
+def test_daily_rows_match_the_raw_rows(app_db, Session, history):
+    cutoff = history
+    with app_db.connect() as conn:
+        expect = {(s, d): (n, lo, hi, round(avg, 6)) for s, d, n, lo, hi, avg in conn.execute(text(
+            "SELECT stn_id, date(reported_at), COUNT(*), MIN(bat_v), MAX(bat_v), AVG(bat_v) FROM health_reports "
+            "WHERE reported_at < :c AND id NOT IN (SELECT report_id FROM station_latest) "
+            "GROUP BY stn_id, date(reported_at)"), {"c": str(cutoff)})}
+        raw_kept = conn.execute(text("SELECT COUNT(*) FROM health_reports WHERE reported_at >= :c "
+                                     "OR id IN (SELECT report_id FROM station_latest)"), {"c": str(cutoff)}).scalar()
+
+    stats = _compact(Session, cutoff)
+    assert stats["raw_removed"] == sum(n for n, *_ in expect.values())
+
+    with app_db.connect() as conn:
+        raw_left = conn.execute(text("SELECT COUNT(*) FROM health_reports")).scalar()
+        daily = {(s, d): (n, lo, hi, round(avg, 6)) for s, d, n, lo, hi, avg in conn.execute(text(
+            "SELECT stn_id, day, reports, bat_v_min, bat_v_max, bat_v_mean FROM health_daily"))}
+    assert raw_left == raw_kept
+    assert daily == expect
+
+
+def test_second_pass_is_a_no_op(Session, history):
+    _compact(Session, history)
+    assert _compact(Session, history)["raw_removed"] == 0
+
+
+def test_station_csv_spans_both_tiers_newest_first(Session, history, db):
+    _compact(Session, history)
+    body   = router_client(dashboard.router).get("/station/STN0001/csv").text.splitlines()
+    stamps = [line.split(",")[0] for line in body[1:]]
+    raw    = db.query(HealthReport).filter_by(stn_id="STN0001").count()
+    days   = db.query(HealthDaily).filter_by(stn_id="STN0001").count()
+    assert days and len(stamps) == raw + days
+    assert stamps == sorted(stamps, reverse=True)
+
+
+@pytest.mark.parametrize("request_", [
+    lambda c: c.post("/delete/STN0001", follow_redirects=False),
+    lambda c: c.post("/delete-category/STN0001/KSNDMC_TRG/0", follow_redirects=False),
+])
+def test_deleting_a_station_drops_its_daily_rows(Session, history, db, request_):
+    _compact(Session, history)
+    request_(router_client(commands.router))
+    _assert_only_stn0001_gone(db)
+
+
+def test_bulk_delete_drops_daily_rows(Session, history, db):
+    _compact(Session, history)
+    # Called directly: over HTTP, POST /delete/{stn_id} is matched first
+    with Session() as session:
+        commands.delete_bulk_stations(commands.BulkDeleteStations(stn_ids=["STN0001"]), session)
+    _assert_only_stn0001_gone(db)
+
+
+def _assert_only_stn0001_gone(db):
+    assert db.query(HealthDaily).filter_by(stn_id="STN0001").count() == 0
+    assert db.query(HealthReport).filter_by(stn_id="STN0001").count() == 0
+    assert db.query(HealthDaily).filter_by(stn_id="STN0002").count() > 0